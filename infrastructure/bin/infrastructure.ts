@@ -20,6 +20,7 @@ const goServicesStack = new GoServicesStack(app, 'IvrGoServicesStack', { env });
 const lambdaStack = new LambdaStack(app, 'IvrLambdaStack', { 
   env,
   appointmentServiceUrl: goServicesStack.appointmentServiceUrl,
+  tenantConfigUrl: goServicesStack.tenantConfigUrl,
 });
 
 // Deploy Bedrock Agent
@@ -28,6 +29,7 @@ const agentStack = new BedrockAgentStack(app, 'IvrBedrockAgentStack', {
   searchSlotsFunction: lambdaStack.searchSlotsFunction,
   confirmAppointmentFunction: lambdaStack.confirmAppointmentFunction,
   handoffHumanFunction: lambdaStack.handoffHumanFunction,
+  actionDispatcherFunction: lambdaStack.actionDispatcherFunction,
 });
 
 // Deploy Voice Processing Stack
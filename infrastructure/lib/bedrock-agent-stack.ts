@@ -8,8 +8,16 @@ interface BedrockAgentStackProps extends cdk.StackProps {
   searchSlotsFunction: lambda.Function;
   confirmAppointmentFunction: lambda.Function;
   handoffHumanFunction: lambda.Function;
+  actionDispatcherFunction: lambda.Function;
 }
 
+// Functions behind the per-function layout, one action group each
+const ACTION_GROUPS = [
+  { name: 'SearchActions', apiPath: '/searchSlots', fn: 'searchSlotsFunction' },
+  { name: 'BookingActions', apiPath: '/confirmAppointment', fn: 'confirmAppointmentFunction' },
+  { name: 'HandoffActions', apiPath: '/handoffToHuman', fn: 'handoffHumanFunction' },
+] as const;
+
 export class BedrockAgentStack extends cdk.Stack {
   public readonly agentId: string;
   public readonly agentAliasId: string;
@@ -47,7 +55,7 @@ BOOKING PROCESS:
 4. When they choose a slot, ask for their full name
 5. Then ask for their email address
 6. Use confirmAppointment action to book (only when you have slot_id, name, AND email)
-7. Tell them the confirmation number and say goodbye
+7. Tell them the confirmation number and say goodbye (if the status is PENDING, give the pending reference and say the confirmation email follows once it is booked)
 
 CRITICAL RULES:
 - NEVER provide medical advice - suggest they speak to a doctor
@@ -58,6 +66,8 @@ CRITICAL RULES:
 
 If you don't understand something, ask for clarification politely.`;
 
+    const perFunction = this.node.tryGetContext('actionLayout') === 'per-function';
+
     // Create the Bedrock Agent
     const agent = new bedrock.CfnAgent(this, 'AppointmentBookingAgent', {
       agentName: 'ivr-appointment-booking-agent',
@@ -67,28 +77,41 @@ If you don't understand something, ask for clarification politely.`;
       agentResourceRoleArn: agentRole.roleArn,
       idleSessionTtlInSeconds: 600, // 10 minutes
       
-      // Action Groups
-      actionGroups: [
-        {
-          actionGroupName: 'AppointmentActions',
-          description: 'Actions for searching and booking appointments',
-          actionGroupExecutor: {
-            lambda: props.searchSlotsFunction.functionArn,
-          },
-          apiSchema: {
-            payload: this.getOpenApiSchema(),
-          },
-        },
-      ],
+      // Action Groups: one dispatcher for every action (default), or one function per
+      // action with `cdk deploy -c actionLayout=per-function`
+      actionGroups: perFunction
+        ? ACTION_GROUPS.map(group => ({
+            actionGroupName: group.name,
+            description: `Appointment action ${group.apiPath}`,
+            actionGroupExecutor: {
+              lambda: props[group.fn].functionArn,
+            },
+            apiSchema: {
+              payload: this.getOpenApiSchema([group.apiPath]),
+            },
+          }))
+        : [
+            {
+              actionGroupName: 'AppointmentActions',
+              description: 'Actions for searching and booking appointments',
+              actionGroupExecutor: {
+                lambda: props.actionDispatcherFunction.functionArn,
+              },
+              apiSchema: {
+                payload: this.getOpenApiSchema(),
+              },
+            },
+          ],
     });
 
     // Grant Lambda invoke permissions to the agent
-    props.searchSlotsFunction.grantInvoke(agentRole);
-    props.confirmAppointmentFunction.grantInvoke(agentRole);
-    props.handoffHumanFunction.grantInvoke(agentRole);
+    const executors = perFunction
+      ? ACTION_GROUPS.map(group => props[group.fn])
+      : [props.actionDispatcherFunction];
+    executors.forEach(fn => fn.grantInvoke(agentRole));
 
     // Also grant Bedrock service permission to invoke Lambdas
-    [props.searchSlotsFunction, props.confirmAppointmentFunction, props.handoffHumanFunction].forEach(fn => {
+    executors.forEach(fn => {
       fn.addPermission('BedrockInvoke', {
         principal: new iam.ServicePrincipal('bedrock.amazonaws.com'),
         sourceArn: `arn:aws:bedrock:${this.region}:${this.account}:agent/*`,
@@ -122,7 +145,17 @@ If you don't understand something, ask for clarification politely.`;
     });
   }
 
-  private getOpenApiSchema(): string {
+  // The API schema, or only the given paths of it
+  private getOpenApiSchema(apiPaths?: string[]): string {
+    const schema = this.fullOpenApiSchema();
+    if (!apiPaths) {
+      return schema;
+    }
+    const [header, ...pathBlocks] = schema.split(/\n(?=  \/\w+:\n)/);
+    return [header, ...pathBlocks.filter(block => apiPaths.some(p => block.startsWith(`  ${p}:`)))].join('\n');
+  }
+
+  private fullOpenApiSchema(): string {
     return `
 openapi: 3.0.0
 info:
@@ -135,7 +168,7 @@ paths:
     post:
       operationId: searchSlots
       summary: Search for available appointment slots
-      description: Search for available appointment slots for a given date and time preference. Use this when the caller wants to book an appointment.
+      description: Search for available appointment slots. Accepts one or more dates or a date range and one or more time preferences. If nothing matches exactly, the search widens on its own (other times, the next business days, other doctors of the same specialty) and each slot says which relaxation produced it, so one call is usually enough.
       requestBody:
         required: true
         content:
@@ -149,10 +182,34 @@ paths:
                 date:
                   type: string
                   description: The preferred date (e.g., tomorrow, next monday, 2024-12-25)
+                dates:
+                  type: string
+                  description: Comma-separated list of acceptable dates, used instead of date
+                date_from:
+                  type: string
+                  description: Start of an acceptable date range (inclusive)
+                date_to:
+                  type: string
+                  description: End of an acceptable date range (inclusive)
                 time_preference:
                   type: string
-                  enum: [morning, afternoon, evening, any]
-                  description: Preferred time of day for the appointment
+                  description: Preferred time of day (morning, afternoon, evening, any), or a comma-separated list in order of preference
+                doctor:
+                  type: string
+                  description: Preferred doctor name or id, if the caller asked for one
+                specialty:
+                  type: string
+                  description: Required specialty, if the caller asked for one
+                max_results:
+                  type: integer
+                  description: Number of candidate slots wanted (default 3)
+                widen_days:
+                  type: integer
+                  description: How many business days ahead the search may widen (default 5)
+                response_format:
+                  type: string
+                  enum: [full, compact]
+                  description: compact returns short slot handles, a doctor list and a ready-to-speak summary
               required:
                 - tenant_id
                 - date
@@ -177,6 +234,15 @@ paths:
                           type: string
                         doctor_name:
                           type: string
+                        relaxation:
+                          type: string
+                          enum: [exact, other_time, next_days, other_doctor]
+                        stale:
+                          type: boolean
+                          description: From a recent copy of the schedule while the booking system is down
+                  unavailable:
+                    type: boolean
+                    description: The booking system is down and no recent schedule is available
 
   /confirmAppointment:
     post:
@@ -195,7 +261,7 @@ paths:
                   description: The clinic/tenant identifier
                 slot_id:
                   type: string
-                  description: The selected slot ID from searchSlots results
+                  description: The selected slot ID from searchSlots results, or its short handle (e.g. S2) when results were compact
                 patient_name:
                   type: string
                   description: Full name of the patient
@@ -217,9 +283,12 @@ paths:
                 properties:
                   status:
                     type: string
-                    enum: [BOOKED, FAILED]
+                    enum: [BOOKED, PENDING, FAILED]
                   confirmation_ref:
                     type: string
+                  pending_ref:
+                    type: string
+                    description: Reference for a booking saved while the booking system is down (status PENDING)
                   error:
                     type: string
 
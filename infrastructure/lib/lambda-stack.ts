@@ -1,28 +1,73 @@
 import * as cdk from 'aws-cdk-lib';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as iam from 'aws-cdk-lib/aws-iam';
+import * as s3 from 'aws-cdk-lib/aws-s3';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
+import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
 import { Construct } from 'constructs';
 import * as path from 'path';
 
 interface LambdaStackProps extends cdk.StackProps {
   appointmentServiceUrl?: string;
+  tenantConfigUrl?: string;
 }
 
 export class LambdaStack extends cdk.Stack {
   public readonly searchSlotsFunction: lambda.Function;
   public readonly confirmAppointmentFunction: lambda.Function;
   public readonly handoffHumanFunction: lambda.Function;
+  public readonly actionDispatcherFunction: lambda.Function;
+  public readonly confirmQueue: sqs.Queue;
 
   constructor(scope: Construct, id: string, props?: LambdaStackProps) {
     super(scope, id, props);
 
+    // Modules shared by the action handlers (and the voice processor, which
+    // deploys the same directory as its own layer in VoiceStack). The
+    // runtime's boto3 may predate S3 conditional writes (slot holds), so the
+    // layer carries the pinned versions from requirements.txt
+    const sharedLayer = new lambda.LayerVersion(this, 'SharedLayer', {
+      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambda/shared'), {
+        exclude: ['**/__pycache__'],
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_11.bundlingImage,
+          command: [
+            'bash', '-c',
+            'pip install --no-cache-dir -r requirements.txt -t /asset-output/python && cp -au python /asset-output',
+          ],
+        },
+      }),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_11],
+      description: 'Action events, appointment client, slot holds and hedging',
+    });
+
+    // Every action handler lives in lambda/actions; each function below runs one of them
+    const actionsCode = lambda.Code.fromAsset(path.join(__dirname, '../../lambda/actions'), {
+      exclude: ['**/__pycache__'],
+    });
+
+    // Slot holds (slot_holds.py): searches and confirmations run in many
+    // execution environments, so the hold table lives in S3 where all of
+    // them see it. Holds expire by themselves; the table is never deleted
+    const holdsBucket = new s3.Bucket(this, 'SlotHoldsBucket', {
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: s3.BucketEncryption.S3_MANAGED,
+      enforceSSL: true,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      autoDeleteObjects: true,
+    });
+
     // Common Lambda configuration
     const commonProps = {
       runtime: lambda.Runtime.PYTHON_3_11,
       timeout: cdk.Duration.seconds(30),
       memorySize: 256,
+      code: actionsCode,
+      layers: [sharedLayer],
       environment: {
         APPOINTMENT_SERVICE_URL: props?.appointmentServiceUrl || 'http://localhost:7002',
+        TENANT_CONFIG_URL: props?.tenantConfigUrl || '',
+        HOLD_STORE: `s3://${holdsBucket.bucketName}/slot-holds`,
       },
     };
 
@@ -30,8 +75,7 @@ export class LambdaStack extends cdk.Stack {
     this.searchSlotsFunction = new lambda.Function(this, 'SearchSlotsFunction', {
       ...commonProps,
       functionName: 'ivr-search-slots',
-      handler: 'index.handler',
-      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambda/search-slots')),
+      handler: 'search_slots.handler',
       description: 'Search for available appointment slots',
     });
 
@@ -39,8 +83,7 @@ export class LambdaStack extends cdk.Stack {
     this.confirmAppointmentFunction = new lambda.Function(this, 'ConfirmAppointmentFunction', {
       ...commonProps,
       functionName: 'ivr-confirm-appointment',
-      handler: 'index.handler',
-      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambda/confirm-appointment')),
+      handler: 'confirm_appointment.handler',
       description: 'Confirm and book an appointment',
     });
 
@@ -48,11 +91,51 @@ export class LambdaStack extends cdk.Stack {
     this.handoffHumanFunction = new lambda.Function(this, 'HandoffHumanFunction', {
       ...commonProps,
       functionName: 'ivr-handoff-human',
-      handler: 'index.handler',
-      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambda/handoff-human')),
+      handler: 'handoff_human.handler',
       description: 'Initiate handoff to human receptionist',
     });
 
+    // Action dispatcher: the three handlers above in one function, routed on apiPath,
+    // so a conversation warms one container instead of three
+    this.actionDispatcherFunction = new lambda.Function(this, 'ActionDispatcherFunction', {
+      ...commonProps,
+      functionName: 'ivr-action-dispatcher',
+      handler: 'action_dispatcher.handler',
+      description: 'Route every agent action to its handler in one warm container',
+    });
+
+    for (const fn of [this.searchSlotsFunction, this.confirmAppointmentFunction, this.actionDispatcherFunction]) {
+      holdsBucket.grantReadWrite(fn, 'slot-holds/*');
+    }
+
+    // Bookings made while the appointment service is down wait here
+    // (deferred_confirmations.py). confirm-appointment consumes the queue in
+    // either action layout; both functions that serve confirmAppointment can
+    // queue. Requests still failing after a day of redeliveries land in the
+    // DLQ for front-desk follow-up.
+    const confirmDeadLetterQueue = new sqs.Queue(this, 'ConfirmDeadLetterQueue', {
+      queueName: 'ivr-deferred-confirmations-dlq',
+      encryption: sqs.QueueEncryption.SQS_MANAGED,
+      retentionPeriod: cdk.Duration.days(14),
+    });
+    this.confirmQueue = new sqs.Queue(this, 'ConfirmQueue', {
+      queueName: 'ivr-deferred-confirmations',
+      encryption: sqs.QueueEncryption.SQS_MANAGED,
+      // Lambda's guidance for SQS event sources: six times the function timeout
+      visibilityTimeout: cdk.Duration.seconds(180),
+      retentionPeriod: cdk.Duration.days(4),
+      deadLetterQueue: { queue: confirmDeadLetterQueue, maxReceiveCount: 480 },
+    });
+    for (const fn of [this.confirmAppointmentFunction, this.actionDispatcherFunction]) {
+      fn.addEnvironment('CONFIRM_QUEUE', `sqs:${this.confirmQueue.queueUrl}`);
+      this.confirmQueue.grantSendMessages(fn);
+    }
+    this.confirmAppointmentFunction.addEventSource(new SqsEventSource(this.confirmQueue, {
+      batchSize: 10,
+      // Requests the service still refuses are retried alone, not with the whole batch
+      reportBatchItemFailures: true,
+    }));
+
     // Output Lambda ARNs
     new cdk.CfnOutput(this, 'SearchSlotsFunctionArn', {
       value: this.searchSlotsFunction.functionArn,
@@ -68,5 +151,20 @@ export class LambdaStack extends cdk.Stack {
       value: this.handoffHumanFunction.functionArn,
       exportName: 'HandoffHumanFunctionArn',
     });
+
+    new cdk.CfnOutput(this, 'ActionDispatcherFunctionArn', {
+      value: this.actionDispatcherFunction.functionArn,
+      exportName: 'ActionDispatcherFunctionArn',
+    });
+
+    new cdk.CfnOutput(this, 'ConfirmQueueUrl', {
+      value: this.confirmQueue.queueUrl,
+      exportName: 'ConfirmQueueUrl',
+    });
+
+    new cdk.CfnOutput(this, 'ConfirmDeadLetterQueueUrl', {
+      value: confirmDeadLetterQueue.queueUrl,
+      exportName: 'ConfirmDeadLetterQueueUrl',
+    });
   }
-}
\ No newline at end of file
+}
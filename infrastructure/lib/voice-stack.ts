@@ -2,24 +2,82 @@ import * as cdk from 'aws-cdk-lib';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as logs from 'aws-cdk-lib/aws-logs';
+import * as s3 from 'aws-cdk-lib/aws-s3';
 import { Construct } from 'constructs';
 
 export class VoiceStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props?: cdk.StackProps) {
     super(scope, id, props);
 
-    // Lambda function for voice processing
+    // Modules shared with the action functions (hedging.py); the same
+    // directory LambdaStack deploys as the action functions' layer
+    const sharedLayer = new lambda.LayerVersion(this, 'SharedLayer', {
+      code: lambda.Code.fromAsset('../lambda/shared', { exclude: ['**/__pycache__'] }),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+      description: 'Action events, appointment client, slot holds and hedging',
+    });
+
+    // Speech audio, call artifacts and the small per-call state shared
+    // between Lambda containers: caller profiles, call-setup prefetches,
+    // turn dedupe markers and async Twilio turn results. Each store's
+    // short-lived state expires under its own lifecycle rule
+    const voiceBucket = new s3.Bucket(this, 'VoiceProcessingBucket', {
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: s3.BucketEncryption.S3_MANAGED,
+      enforceSSL: true,
+      removalPolicy: cdk.RemovalPolicy.RETAIN,
+      lifecycleRules: [
+        // Async Twilio turn results a hung-up call never collected
+        { id: 'TwilioTurnResults', prefix: 'twilio-turns/', expiration: cdk.Duration.days(1) },
+        // Caller profiles after CALLER_PROFILE_TTL_SECONDS (every update
+        // rewrites the object). Only objects tagged as profiles: opt-out
+        // tombstones under the same keys must never expire
+        {
+          id: 'CallerProfiles',
+          prefix: 'profiles/',
+          tagFilters: { kind: 'profile' },
+          expiration: cdk.Duration.days(90),
+        },
+        // Call artifacts: stalled multipart uploads, fragments of calls whose
+        // end never arrived, and Transcribe inputs a failed turn left behind
+        { id: 'CallArtifactUploads', prefix: 'calls/', abortIncompleteMultipartUploadAfter: cdk.Duration.days(1) },
+        { id: 'CallArtifactFragments', prefix: 'calls/fragments/', expiration: cdk.Duration.days(7) },
+        { id: 'TranscribeInputs', prefix: 'audio/', expiration: cdk.Duration.days(1) },
+        // Turn dedupe claims and cached responses (live TURN_DEDUPE_TTL_SECONDS)
+        { id: 'TurnDedupe', prefix: 'dedupe/', expiration: cdk.Duration.days(1) },
+        // Call-setup prefetches of calls whose end never arrived
+        { id: 'CallSetup', prefix: 'call-setup/', expiration: cdk.Duration.days(1) },
+      ],
+    });
+
+    // Lambda function for voice processing. audio_codec needs numpy for
+    // telephony audio (mu-law, resampling), which the runtime lacks, and the
+    // runtime's boto3 may predate S3 conditional writes (caller profiles,
+    // turn dedupe); bundle the pinned versions from requirements.txt with
+    // the code (built in the Lambda image so the wheels match the runtime)
     const voiceProcessorFunction = new lambda.Function(this, 'VoiceProcessorFunction', {
       runtime: lambda.Runtime.PYTHON_3_9,
       handler: 'index.lambda_handler',
-      code: lambda.Code.fromAsset('../lambda/voice-processor'),
+      code: lambda.Code.fromAsset('../lambda/voice-processor', {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_9.bundlingImage,
+          command: [
+            'bash', '-c',
+            'pip install --no-cache-dir $(grep -E \'^(numpy|boto3|botocore)\' requirements.txt) -t /asset-output && cp -au . /asset-output',
+          ],
+        },
+      }),
+      layers: [sharedLayer],
       timeout: cdk.Duration.seconds(30),
       memorySize: 512,
       environment: {
         BEDROCK_AGENT_ID: 'S2MOVY5G8J',
         BEDROCK_AGENT_ALIAS_ID: 'XOOC4XVDXZ',
         TENANT_CONFIG_URL: 'https://3ecpj0ss4j.execute-api.us-east-1.amazonaws.com/prod',
-        APPOINTMENT_SERVICE_URL: 'https://zkbwkpdpx9.execute-api.us-east-1.amazonaws.com/prod'
+        APPOINTMENT_SERVICE_URL: 'https://zkbwkpdpx9.execute-api.us-east-1.amazonaws.com/prod',
+        S3_BUCKET: voiceBucket.bucketName,
+        // Duplicate turns can land on different containers
+        TURN_DEDUPE_SHARED: 's3'
       },
       logRetention: logs.RetentionDays.ONE_WEEK,
     });
@@ -31,12 +89,26 @@ export class VoiceStack extends cdk.Stack {
         'bedrock:InvokeAgent',
         'bedrock:InvokeModel',
         'polly:SynthesizeSpeech',
+        'polly:DescribeVoices',
         'transcribe:StartTranscriptionJob',
         'transcribe:GetTranscriptionJob',
         'connect:*'
       ],
       resources: ['*']
     }));
+    voiceBucket.grantReadWrite(voiceProcessorFunction);
+
+    // Call setup returns the greeting and runs its prefetches in an
+    // asynchronous invocation of the same function (standalone policy: one
+    // on the function's own role would depend on its own ARN)
+    new iam.Policy(this, 'VoiceProcessorSelfInvokePolicy', {
+      roles: [voiceProcessorFunction.role!],
+      statements: [new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: ['lambda:InvokeFunction'],
+        resources: [voiceProcessorFunction.functionArn]
+      })]
+    });
 
     // Output the function ARN for Connect integration
     new cdk.CfnOutput(this, 'VoiceProcessorFunctionArn', {
@@ -57,7 +129,12 @@ export class VoiceStack extends cdk.Stack {
       timeout: cdk.Duration.seconds(30),
       memorySize: 256,
       environment: {
-        VOICE_FUNCTION_NAME: voiceProcessorFunction.functionName
+        VOICE_FUNCTION_NAME: voiceProcessorFunction.functionName,
+        // Hold-and-poll turns: the webhook invokes itself to run each turn
+        // and serves the reply from the turn store
+        TURN_MODE: 'async',
+        TURN_QUEUE: 'lambda',
+        TURN_STORE: `s3://${voiceBucket.bucketName}/twilio-turns`
       },
       logRetention: logs.RetentionDays.ONE_WEEK,
     });
@@ -65,6 +142,23 @@ export class VoiceStack extends cdk.Stack {
     // Grant permission to invoke voice processor
     voiceProcessorFunction.grantInvoke(twilioWebhookFunction);
 
+    // Async turns: self-invoke and the turn store. A standalone policy, as
+    // one on the function's own role would make it depend on its own ARN
+    new iam.Policy(this, 'TwilioWebhookSelfInvokePolicy', {
+      roles: [twilioWebhookFunction.role!],
+      statements: [new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: ['lambda:InvokeFunction'],
+        resources: [twilioWebhookFunction.functionArn]
+      })]
+    });
+    voiceBucket.grantReadWrite(twilioWebhookFunction, 'twilio-turns/*');
+
+    new cdk.CfnOutput(this, 'VoiceProcessingBucketName', {
+      value: voiceBucket.bucketName,
+      description: 'S3 bucket for voice audio, call artifacts and per-call state'
+    });
+
     // Output the Twilio webhook function details
     new cdk.CfnOutput(this, 'TwilioWebhookFunctionArn', {
       value: twilioWebhookFunction.functionArn,
@@ -0,0 +1,70 @@
+"""
+Lambda function serving every Bedrock Agent action from one container.
+Called by Bedrock Agent as the action group's single executor.
+
+search_slots, confirm_appointment and handoff_human each scale and
+cold-start on their own when deployed as separate functions, so one
+booking conversation could wait on three cold starts. This function
+imports all three handlers at init and routes each event on its apiPath,
+so a conversation warms one container. The handlers share that
+container's appointment-service client (one keep-alive pool, one circuit
+breaker), slot-hold table and parameter parsing, since the shared-layer
+modules (lambda/shared) are loaded once per process.
+
+Every action function is deployed from this directory with the shared
+layer; deploying them as separate functions keeps working (see
+infrastructure, actionLayout).
+"""
+
+import json
+import time
+from typing import Any, Callable
+
+_started = time.time()
+
+import confirm_appointment  # noqa: E402
+import handoff_human  # noqa: E402
+import search_slots  # noqa: E402
+from action_events import create_response  # noqa: E402
+
+# apiPath -> handler module
+ACTION_FUNCTIONS = {
+    '/searchSlots': search_slots,
+    '/confirmAppointment': confirm_appointment,
+    '/handoffToHuman': handoff_human,
+}
+# SQS records are deferred confirmations (CONFIRM_QUEUE), handled by confirmAppointment
+RECORDS_PATH = '/confirmAppointment'
+
+_routes = {}
+
+
+def register(api_path: str, action_handler: Callable[[dict, Any], dict]) -> None:
+    """Route events for an apiPath to an action handler."""
+    _routes[api_path] = action_handler
+
+
+for _api_path, _module in ACTION_FUNCTIONS.items():
+    register(_api_path, _module.handler)
+
+print(f"Action dispatcher initialized in {(time.time() - _started) * 1000:.0f}ms "
+      f"with routes {', '.join(sorted(_routes))}")
+
+
+def handler(event: dict, context: Any) -> dict:
+    """
+    Bedrock Agent action group handler for every action. The response is
+    whatever the routed handler returns.
+    """
+    if 'Records' in event:
+        return _routes[RECORDS_PATH](event, context)
+
+    api_path = event.get('apiPath', '')
+    action_handler = _routes.get(api_path)
+    if action_handler is None:
+        print(f"No action registered for {api_path}: {json.dumps(event)}")
+        return create_response(event, 404, {
+            "error": f"Unknown action: {api_path}",
+            "message": "Sorry, I can't do that right now."
+        })
+    return action_handler(event, context)
@@ -0,0 +1,258 @@
+"""
+Lambda function for confirming/booking appointments.
+Called by Bedrock Agent as an action group.
+"""
+
+import json
+import os
+import re
+import urllib.error
+from datetime import datetime
+from typing import Any
+import random
+import string
+
+from action_events import create_response, extract_parameters
+from appointment_client import AppointmentServiceUnavailable, default_client
+from deferred_confirmations import build_confirmation_queue, pending_ref
+from slot_holds import default_holds
+
+# Where confirmations wait while the appointment service is down (see deferred_confirmations.py);
+# unset means bookings during an outage fail instead of being promised
+CONFIRM_QUEUE = os.environ.get('CONFIRM_QUEUE', '')
+# Local testing without an appointment service: answer BOOKED with a made-up reference
+MOCK_APPOINTMENTS = os.environ.get('MOCK_APPOINTMENTS', 'false').lower() == 'true'
+
+# Short slot handles ("S1", "S2", ...) issued by searchSlots in compact mode
+SLOT_HANDLE_PATTERN = re.compile(r'^S\d{1,2}$', re.IGNORECASE)
+
+# Holds placed by search-slots on the slots it offered
+holds = default_holds()
+
+# Circuit-broken appointment-service client, and the queue for bookings it cannot take right now
+appointments = default_client()
+deferred = build_confirmation_queue(CONFIRM_QUEUE)
+
+
+def handler(event: dict, context: Any) -> dict:
+    """
+    Bedrock Agent action group handler for confirmAppointment. SQS
+    records are deferred confirmations from CONFIRM_QUEUE.
+    """
+    print(f"Received event: {json.dumps(event)}")
+    
+    if 'Records' in event:
+        return process_deferred(event)
+    
+    try:
+        params = extract_parameters(event)
+        tenant_id = params.get('tenant_id', 'default')
+        slot_id = params.get('slot_id', '')
+        patient_name = params.get('patient_name', '')
+        patient_email = params.get('patient_email', '')
+        
+        if SLOT_HANDLE_PATTERN.match(slot_id):
+            handle = slot_id
+            slot_id = resolve_slot_handle(event, handle)
+            if not slot_id:
+                return create_response(event, 400, {
+                    "status": "FAILED",
+                    "error": f"Unknown slot handle: {handle}",
+                    "message": "I lost track of that time slot. Let me search the available times again."
+                })
+        
+        print(f"Confirming appointment: tenant={tenant_id}, slot={slot_id}, name={patient_name}, email={patient_email}")
+        
+        # Validate required fields
+        missing_fields = []
+        if not slot_id:
+            missing_fields.append("slot_id")
+        if not patient_name:
+            missing_fields.append("patient_name")
+        if not patient_email:
+            missing_fields.append("patient_email")
+        
+        if missing_fields:
+            return create_response(event, 400, {
+                "status": "FAILED",
+                "error": f"Missing required fields: {', '.join(missing_fields)}",
+                "message": f"I still need the following information: {', '.join(missing_fields).replace('_', ' ')}"
+            })
+        
+        # Fail fast if another conversation is holding this slot
+        session_id = event.get('sessionId', '')
+        hold_owner = holds.owner(slot_id)
+        if hold_owner and hold_owner != session_id:
+            holds.reject()
+            return create_response(event, 200, {
+                "status": "FAILED",
+                "error": "Slot is held by another caller",
+                "message": "That time was just reserved by another caller. Would you like one of the other times I mentioned?"
+            })
+        
+        # Call appointment service; queue the booking instead if it is unavailable
+        try:
+            result = confirm_appointment(tenant_id, slot_id, patient_name, patient_email)
+        except AppointmentServiceUnavailable as e:
+            return defer_confirmation(event, {
+                "tenant_id": tenant_id,
+                "slot_id": slot_id,
+                "patient_name": patient_name,
+                "patient_email": patient_email,
+                "session_id": session_id
+            }, str(e))
+        
+        if result.get('status') == 'BOOKED':
+            if session_id:
+                # Turn the hold into the booking and free the other offered slots
+                converted = holds.convert(session_id, slot_id)
+                holds.release(session_id)
+                print(f"Booked slot {slot_id} (held: {converted}); hold stats: {json.dumps(holds.stats())}")
+            conf_ref = result.get('confirmation_ref', '')
+            return create_response(event, 200, {
+                "status": "BOOKED",
+                "confirmation_ref": conf_ref,
+                "message": f"Appointment confirmed! Confirmation number is {conf_ref}. A confirmation email will be sent to {patient_email}."
+            })
+        else:
+            return create_response(event, 200, {
+                "status": "FAILED",
+                "error": result.get('error', 'Booking failed'),
+                "message": "I'm sorry, I couldn't book that slot. It may have been taken. Would you like to search for other available times?"
+            })
+        
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return create_response(event, 500, {
+            "status": "FAILED",
+            "error": str(e),
+            "message": "Sorry, I couldn't complete the booking right now. Please try again."
+        })
+
+
+def resolve_slot_handle(event: dict, handle: str) -> str:
+    """Map a compact searchSlots handle back to the full slot id via session attributes."""
+    try:
+        handles = json.loads(event.get('sessionAttributes', {}).get('slot_handles', '{}'))
+    except ValueError:
+        return ''
+    return handles.get(handle.upper(), '')
+
+
+def confirm_appointment(tenant_id: str, slot_id: str, patient_name: str, patient_email: str) -> dict:
+    """
+    Call appointment service to confirm booking. Raises
+    AppointmentServiceUnavailable when the service is down or the circuit
+    breaker is open.
+    """
+    payload = {
+        "tenantId": tenant_id,
+        "slotId": slot_id,
+        "patientName": patient_name,
+        "patientEmail": patient_email
+    }
+    
+    try:
+        return appointments.post('/v1/appointments/confirm', payload)
+    except urllib.error.HTTPError as e:
+        # The service refused the booking (slot taken, bad request)
+        try:
+            return json.loads(e.read().decode('utf-8'))
+        except ValueError:
+            return {"status": "FAILED", "error": f"Appointment service returned {e.code}"}
+    except AppointmentServiceUnavailable as e:
+        if not MOCK_APPOINTMENTS:
+            raise
+        print(f"Failed to call appointment service: {e}")
+        # Mock success for local testing
+        return {
+            "status": "BOOKED",
+            "confirmation_ref": generate_confirmation_ref(tenant_id)
+        }
+
+
+def defer_confirmation(event: dict, request: dict, reason: str) -> dict:
+    """
+    Queue a booking the appointment service cannot take now and tell the
+    caller it is pending. Without a durable queue nothing is promised.
+    """
+    if deferred is None:
+        print(f"No CONFIRM_QUEUE configured; not queueing slot {request['slot_id']} ({reason})")
+        return create_response(event, 200, {
+            "status": "FAILED",
+            "error": "Appointment service unavailable",
+            "message": "The booking system isn't answering right now, so I couldn't book that time. "
+                       "Would you like me to connect you with the front desk, or try again in a few minutes?"
+        })
+    request = dict(request, pending_ref=pending_ref(request["tenant_id"]), queued_at=datetime.now().isoformat())
+    deferred.enqueue(request)
+    print(f"Queued confirmation {request['pending_ref']} for slot {request['slot_id']} ({reason}); "
+          f"breaker: {json.dumps(appointments.breaker.stats())}")
+    return create_response(event, 200, {
+        "status": "PENDING",
+        "pending_ref": request["pending_ref"],
+        "message": f"The booking system isn't answering right now, so I've saved your request. "
+                   f"Your reference is {request['pending_ref']}, and a confirmation email will go to "
+                   f"{request['patient_email']} as soon as the appointment is booked."
+    })
+
+
+def run_deferred(request: dict) -> None:
+    """Book one queued confirmation; raises AppointmentServiceUnavailable to leave it queued."""
+    result = confirm_appointment(request["tenant_id"], request["slot_id"],
+                                 request["patient_name"], request["patient_email"])
+    if result.get('status') == 'BOOKED':
+        session_id = request.get("session_id")
+        if session_id:
+            holds.convert(session_id, request["slot_id"])
+            holds.release(session_id)
+        print(f"Deferred confirmation {request['pending_ref']} booked as {result.get('confirmation_ref', '')}")
+    else:
+        print(f"Deferred confirmation {request['pending_ref']} failed ({result.get('error', 'Booking failed')}); "
+              f"needs front-desk follow-up with {request['patient_email']}")
+
+
+def drain_deferred() -> None:
+    """
+    Book confirmations queued in a CONFIRM_QUEUE directory during an outage.
+    Run from a background job, never inside a caller's turn; SQS queues are
+    delivered to process_deferred instead.
+    """
+    if deferred is None:
+        return
+    try:
+        ran = deferred.drain(run_deferred)
+    except AppointmentServiceUnavailable as e:
+        print(f"Deferred confirmations still waiting: {e}")
+        return
+    if ran:
+        print(f"Processed {ran} deferred confirmations")
+
+
+def process_deferred(event: dict) -> dict:
+    """
+    SQS batch of deferred confirmations. Requests the service still cannot
+    take are reported as batch item failures (ReportBatchItemFailures) so
+    SQS redelivers them after the visibility timeout. Any other error is
+    reported for that record alone, so confirmations already booked in the
+    batch are not redelivered; a record that keeps failing goes to the DLQ.
+    """
+    failures = []
+    for record in event['Records']:
+        try:
+            run_deferred(json.loads(record['body']))
+        except AppointmentServiceUnavailable as e:
+            print(f"Deferred confirmation still waiting: {e}")
+            failures.append({"itemIdentifier": record['messageId']})
+        except Exception as e:
+            print(f"Deferred confirmation {record.get('messageId')} failed: {type(e).__name__}: {e}")
+            failures.append({"itemIdentifier": record['messageId']})
+    return {"batchItemFailures": failures}
+
+
+def generate_confirmation_ref(tenant_id: str) -> str:
+    """Generate a mock confirmation reference."""
+    prefix = tenant_id[:4].upper() if tenant_id else "APPT"
+    date_part = datetime.now().strftime("%m%d")
+    random_part = ''.join(random.choices(string.digits, k=3))
+    return f"{prefix}-{date_part}-{random_part}"
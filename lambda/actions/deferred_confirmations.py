@@ -0,0 +1,142 @@
+"""
+Confirmations deferred while the appointment service is unavailable.
+
+When the circuit breaker is open (or the confirm call fails), the booking
+request is queued instead of being answered with a made-up BOOKED status.
+The caller is told the request is saved under a pending reference and
+that the confirmation email follows once it is booked.
+
+    CONFIRM_QUEUE  sqs:<queue-url>  SQS queue; this function consumes it
+                                    through an event source mapping
+                   <dir>            job files in a directory, run by a
+                                    background drain_deferred() (local
+                                    testing)
+                   (unset)          no queue: outage bookings are answered
+                                    FAILED, never promised as PENDING
+
+Only a queue that outlives the container may back a PENDING answer; a
+request held in process memory is lost with the container, and the caller
+would wait for an email that never comes.
+
+Queued requests are never replayed inside a caller's confirm turn: SQS
+delivers them to process_deferred, and the directory backend is drained
+by a background job that claims each file (an atomic rename) before
+running it, so two drainers never book the same request.
+
+A confirm that timed out may have been booked after all; its replay then
+comes back FAILED (slot taken) and is logged for front-desk follow-up
+rather than booked twice.
+"""
+
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Callable
+
+# A claimed job file older than this belongs to a drainer that died; requeue it
+CLAIM_SECONDS = int(os.environ.get('CONFIRM_CLAIM_SECONDS', '300'))
+
+
+def pending_ref(tenant_id: str) -> str:
+    """Reference read to the caller for a queued confirmation."""
+    prefix = tenant_id[:4].upper() if tenant_id else "APPT"
+    return f"{prefix}-P{datetime.now().strftime('%m%d')}-{uuid.uuid4().hex[:4].upper()}"
+
+
+class SqsConfirmationQueue:
+    """Deferred confirmations as SQS messages."""
+
+    def __init__(self, queue_url: str, sqs=None):
+        self.queue_url = queue_url
+        self._sqs = sqs
+
+    def enqueue(self, request: dict) -> None:
+        if self._sqs is None:
+            import boto3
+            self._sqs = boto3.client('sqs')
+        self._sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(request))
+
+    def drain(self, worker: Callable[[dict], None]) -> int:
+        # Delivered to the handler as SQS records instead
+        return 0
+
+
+class FileConfirmationQueue:
+    """Deferred confirmations as JSON files in a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def __len__(self) -> int:
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def enqueue(self, request: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{request['pending_ref']}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(request, f)
+        os.replace(path + '.tmp', path)
+
+    def drain(self, worker: Callable[[dict], None]) -> int:
+        """
+        Claim, run and remove queued requests oldest first. A request whose
+        worker raises goes back in the queue; one claimed by another drainer
+        is skipped.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        self._requeue_stale_claims()
+        queued = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    path = os.path.join(self.directory, name)
+                    queued.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    pass  # claimed since the listing
+        ran = 0
+        for _, path in sorted(queued):
+            # The claim time is in the name: a rename keeps the enqueue mtime
+            claimed = f"{path}.{int(time.time())}-{uuid.uuid4().hex[:8]}.claimed"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # another drainer claimed it
+            try:
+                with open(claimed) as f:
+                    worker(json.load(f))
+            except Exception:
+                os.rename(claimed, path)
+                raise
+            os.remove(claimed)
+            ran += 1
+        return ran
+
+    def _requeue_stale_claims(self) -> None:
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.claimed'):
+                continue
+            job, _, claim = name[:-len('.claimed')].rpartition('.')
+            if now - int(claim.split('-')[0]) <= CLAIM_SECONDS:
+                continue
+            try:
+                os.rename(os.path.join(self.directory, name), os.path.join(self.directory, job))
+            except FileNotFoundError:
+                pass  # finished or requeued by another drainer
+
+
+def build_confirmation_queue(spec: str):
+    """Confirmation queue from CONFIRM_QUEUE: 'sqs:<queue-url>' or a directory; None if unset."""
+    if not spec:
+        return None
+    if spec.startswith('sqs:'):
+        return SqsConfirmationQueue(spec[len('sqs:'):])
+    if spec == 'memory':
+        print("CONFIRM_QUEUE=memory is no longer supported (not durable); outage bookings will fail")
+        return None
+    return FileConfirmationQueue(spec)
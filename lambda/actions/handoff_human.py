@@ -6,6 +6,8 @@ Called by Bedrock Agent as an action group.
 import json
 from typing import Any
 
+from action_events import create_response, extract_parameters
+
 
 def handler(event: dict, context: Any) -> dict:
     """
@@ -46,43 +48,3 @@ def handler(event: dict, context: Any) -> dict:
             "error": str(e),
             "message": "I'm having trouble connecting you. Please hold while I try again."
         })
-
-
-def extract_parameters(event: dict) -> dict:
-    """Extract parameters from Bedrock Agent event structure."""
-    params = {}
-    
-    try:
-        request_body = event.get('requestBody', {})
-        content = request_body.get('content', {})
-        json_content = content.get('application/json', {})
-        properties = json_content.get('properties', [])
-        
-        for prop in properties:
-            name = prop.get('name')
-            value = prop.get('value')
-            if name and value:
-                params[name] = value
-                
-    except Exception as e:
-        print(f"Error extracting parameters: {e}")
-    
-    return params
-
-
-def create_response(event: dict, status_code: int, body: dict) -> dict:
-    """Create response in Bedrock Agent expected format."""
-    return {
-        "messageVersion": "1.0",
-        "response": {
-            "actionGroup": event.get("actionGroup", ""),
-            "apiPath": event.get("apiPath", ""),
-            "httpMethod": event.get("httpMethod", "POST"),
-            "httpStatusCode": status_code,
-            "responseBody": {
-                "application/json": {
-                    "body": json.dumps(body)
-                }
-            }
-        }
-    }
\ No newline at end of file
@@ -0,0 +1,520 @@
+"""
+Lambda function for searching available appointment slots.
+Called by Bedrock Agent as an action group.
+"""
+
+import json
+import os
+import re
+import urllib.parse
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as date_type, datetime, timedelta
+from typing import Any, Optional
+
+from action_events import create_response, extract_parameters
+from appointment_client import AppointmentServiceUnavailable, LastKnownGood, default_client
+from hedging import hedger
+from slot_holds import default_holds
+
+TENANT_CONFIG_URL = os.environ.get('TENANT_CONFIG_URL', '')
+# Local testing without an appointment service: offer made-up slots
+MOCK_APPOINTMENTS = os.environ.get('MOCK_APPOINTMENTS', 'false').lower() == 'true'
+
+# Widening defaults: how many candidates to aim for and how far ahead to look
+DEFAULT_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '3'))
+DEFAULT_WIDEN_DAYS = int(os.environ.get('SEARCH_WIDEN_DAYS', '5'))
+MAX_DATES_PER_REQUEST = 14
+
+# 'full' keeps the original verbose body; 'compact' sends a handle table instead
+RESPONSE_FORMAT = os.environ.get('RESPONSE_FORMAT', 'full')
+COMPACT_TOP_K = int(os.environ.get('COMPACT_TOP_K', '3'))
+
+TIME_PREFERENCES = ('morning', 'afternoon', 'evening')
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# Relaxation labels, in the order the search widens
+RELAX_EXACT = 'exact'
+RELAX_OTHER_TIME = 'other_time'
+RELAX_NEXT_DAYS = 'next_days'
+RELAX_OTHER_DOCTOR = 'other_doctor'
+
+# Hedged operations (opt-in via HEDGE_OPERATIONS); both are idempotent reads
+SLOTS_SEARCH = 'slots.search'
+TENANT_DOCTORS = 'tenant.doctors'
+
+_executor = ThreadPoolExecutor(max_workers=6)
+
+# Holds on offered slots, shared with confirm-appointment
+holds = default_holds()
+
+# Circuit-broken appointment-service client; last good search results are served stale while it is down
+appointments = default_client()
+last_known_slots = LastKnownGood()
+
+
+def handler(event: dict, context: Any) -> dict:
+    """
+    Bedrock Agent action group handler for searchSlots.
+    
+    Event structure from Bedrock:
+    {
+        "actionGroup": "AppointmentActions",
+        "apiPath": "/searchSlots",
+        "httpMethod": "POST",
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "properties": [
+                        {"name": "tenant_id", "value": "clinic_a"},
+                        {"name": "date", "value": "tomorrow"},
+                        {"name": "time_preference", "value": "morning"}
+                    ]
+                }
+            }
+        },
+        "sessionAttributes": {...},
+        "promptSessionAttributes": {...}
+    }
+    """
+    print(f"Received event: {json.dumps(event)}")
+    
+    try:
+        # Extract parameters from Bedrock Agent event
+        params = extract_parameters(event)
+        tenant_id = params.get('tenant_id', 'default')
+        dates = parse_dates(params)
+        time_preferences = parse_list(params.get('time_preference', 'any')) or ['any']
+        doctor = params.get('doctor', '')
+        specialty = params.get('specialty', '')
+        max_results = parse_int(params.get('max_results'), DEFAULT_MAX_RESULTS)
+        widen_days = parse_int(params.get('widen_days'), DEFAULT_WIDEN_DAYS)
+        response_format = params.get('response_format', RESPONSE_FORMAT)
+        session_id = event.get('sessionId', '')
+        
+        print(f"Searching slots: tenant={tenant_id}, dates={dates}, time_prefs={time_preferences}, "
+              f"doctor={doctor}, specialty={specialty}, k={max_results}")
+        
+        # Call appointment service, widening the window until we have k candidates
+        # Never offer slots another conversation is holding
+        held_elsewhere = holds.held_by_others(session_id) if session_id else set()
+        try:
+            slots = search_slots_widening(
+                tenant_id, dates, time_preferences,
+                doctor=doctor, specialty=specialty,
+                max_results=max_results, widen_days=widen_days,
+                exclude=held_elsewhere
+            )
+        except AppointmentServiceUnavailable as e:
+            print(f"Appointment service unavailable ({e}); breaker: {json.dumps(appointments.breaker.stats())}")
+            return create_response(event, 200, {
+                "slots": [],
+                "unavailable": True,
+                "message": "The scheduling system isn't answering right now. Apologize, and offer to connect "
+                           "the caller with the front desk or have the clinic call them back."
+            }, compact=response_format == 'compact')
+        if hedger.names:
+            print(f"Hedge stats: {json.dumps(hedger.stats())}")
+        
+        # Served from the last good copy while the appointment service is down
+        stale = any(slot.get('stale') for slot in slots)
+        stale_note = ("The booking system isn't answering, so these times come from a recent copy of the "
+                      "schedule; tell the caller the booking will be confirmed by email. ") if stale else ""
+        
+        # Hold what we offer so the caller's pick is still there at confirm time
+        offered = slots[:COMPACT_TOP_K] if response_format == 'compact' else slots
+        if session_id and offered:
+            held = holds.place(session_id, [slot['slot_id'] for slot in offered])
+            print(f"Holding {len(held)} slots for session {session_id}; hold stats: {json.dumps(holds.stats())}")
+        
+        if response_format == 'compact':
+            # Short handles go to the agent; the full slot ids ride along in session attributes
+            body, handles = compact_slots_body(slots, COMPACT_TOP_K)
+            if stale:
+                body["stale"] = True
+            return create_response(event, 200, body, session_attributes={
+                'slot_handles': json.dumps(handles, separators=(',', ':'))
+            }, compact=True)
+        
+        # Format response for Bedrock Agent
+        if slots:
+            slots_text = format_slots_for_agent(slots)
+            if all(slot['relaxation'] == RELAX_EXACT for slot in slots):
+                message = f"Found {len(slots)} available slots: {slots_text}"
+            else:
+                message = (f"Nothing matched every preference exactly, so I widened the search. "
+                           f"Closest options: {slots_text}")
+            response_body = {
+                "slots": slots,
+                "message": stale_note + message
+            }
+            if stale:
+                response_body["stale"] = True
+        else:
+            response_body = {
+                "slots": [],
+                "message": f"No available slots found in the next {widen_days} business days. "
+                           f"Ask whether a later date would work, or offer to connect the caller with the front desk."
+            }
+        
+        return create_response(event, 200, response_body)
+        
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return create_response(event, 500, {
+            "error": str(e),
+            "message": "Sorry, I couldn't search for appointments right now. Please try again."
+        })
+
+
+def parse_list(value: Any) -> list:
+    """Accept a list, a JSON array string or a comma-separated string."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(v).strip().lower() for v in value if str(v).strip()]
+    text = str(value).strip()
+    if text.startswith('['):
+        try:
+            return [str(v).strip().lower() for v in json.loads(text) if str(v).strip()]
+        except ValueError:
+            pass
+    return [part.strip().lower() for part in text.split(',') if part.strip()]
+
+
+def parse_int(value: Any, default: int) -> int:
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def resolve_date(text: str, today: Optional[date_type] = None) -> Optional[date_type]:
+    """Resolve 'today', 'tomorrow', weekday names and ISO/US dates to a date."""
+    today = today or datetime.now().date()
+    text = text.strip().lower()
+    
+    if text == 'today':
+        return today
+    if text == 'tomorrow':
+        return today + timedelta(days=1)
+    
+    weekday = re.sub(r'^(next|this|on)\s+', '', text)
+    if weekday in WEEKDAYS:
+        days_ahead = (WEEKDAYS.index(weekday) - today.weekday()) % 7 or 7
+        return today + timedelta(days=days_ahead)
+    
+    for fmt in ('%Y-%m-%d', '%m/%d/%Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_dates(params: dict) -> list:
+    """
+    Collect the requested dates from `date`, `dates` (list) or a
+    `date_from`/`date_to` range. Unresolvable phrases are passed through
+    so the appointment service can still try them.
+    """
+    requested = parse_list(params.get('dates')) or parse_list(params.get('date'))
+    
+    start = resolve_date(params['date_from']) if params.get('date_from') else None
+    end = resolve_date(params['date_to']) if params.get('date_to') else None
+    if start and end and end >= start:
+        day = start
+        while day <= end and len(requested) < MAX_DATES_PER_REQUEST:
+            requested.append(day.isoformat())
+            day += timedelta(days=1)
+    
+    if not requested:
+        requested = ['tomorrow']
+    
+    dates = []
+    for text in requested[:MAX_DATES_PER_REQUEST]:
+        resolved = resolve_date(text)
+        value = resolved.isoformat() if resolved else text
+        if value not in dates:
+            dates.append(value)
+    return dates
+
+
+def next_business_days(after: list, count: int) -> list:
+    """`count` weekdays following the latest resolvable requested date."""
+    resolved = [resolve_date(d) for d in after]
+    resolved = [d for d in resolved if d]
+    day = max(resolved) if resolved else datetime.now().date()
+    
+    days = []
+    while len(days) < count:
+        day += timedelta(days=1)
+        if day.weekday() < 5:
+            days.append(day.isoformat())
+    return days
+
+
+def fetch_doctors(tenant_id: str) -> list:
+    """Doctors (with specialties) from the tenant-config service, if configured."""
+    if not TENANT_CONFIG_URL:
+        return []
+    
+    url = f"{TENANT_CONFIG_URL}/v1/tenants/{urllib.parse.quote(tenant_id)}"
+    
+    def fetch():
+        with urllib.request.urlopen(url, timeout=3) as response:
+            return json.loads(response.read().decode('utf-8')).get('doctors', [])
+    
+    try:
+        return hedger.call(TENANT_DOCTORS, fetch)
+    except (urllib.error.URLError, ValueError) as e:
+        print(f"Failed to load doctors for {tenant_id}: {e}")
+        return []
+
+
+def matches_doctor(slot: dict, doctor: str) -> bool:
+    doctor = doctor.lower().replace('dr.', '').strip()
+    return (doctor == str(slot.get('doctor_id', '')).lower()
+            or doctor in str(slot.get('doctor_name', '')).lower())
+
+
+def search_slots_widening(tenant_id: str, dates: list, time_preferences: list,
+                          doctor: str = '', specialty: str = '',
+                          max_results: int = DEFAULT_MAX_RESULTS,
+                          widen_days: int = DEFAULT_WIDEN_DAYS,
+                          exclude: Optional[set] = None) -> list:
+    """
+    Search the requested dates and preferences, then widen the window
+    server-side until `max_results` candidates are found:
+    
+      exact        - requested dates and time preferences (and doctor)
+      other_time   - requested dates at any time of day
+      next_days    - the next `widen_days` business days, preferred times first
+      other_doctor - other doctors of the same specialty (or any doctor)
+    
+    Each returned slot carries a `relaxation` field naming the step that
+    produced it, so the agent can explain the offer. Slot ids in `exclude`
+    (held by other conversations) are skipped. Raises
+    AppointmentServiceUnavailable only when the service is down and no
+    query had a last-known-good result.
+    """
+    preferences = [p for p in time_preferences if p in TIME_PREFERENCES] or ['any']
+    later_days = next_business_days(dates, widen_days)
+    
+    steps = [
+        (RELAX_EXACT, [(d, p) for d in dates for p in preferences], True),
+        (RELAX_OTHER_TIME, [(d, 'any') for d in dates], True),
+        (RELAX_NEXT_DAYS, [(d, p) for d in later_days for p in preferences]
+                          + [(d, 'any') for d in later_days], True),
+    ]
+    if doctor:
+        steps.append((RELAX_OTHER_DOCTOR, [(d, 'any') for d in dates + later_days], False))
+    
+    # Other doctors are restricted to the requested doctor's specialty when we know it
+    allowed_doctors = None
+    if doctor:
+        doctors = fetch_doctors(tenant_id)
+        if not specialty:
+            specialty = next((d.get('specialty', '') for d in doctors
+                              if matches_doctor({'doctor_id': d.get('id'), 'doctor_name': d.get('name')}, doctor)), '')
+        if specialty:
+            allowed_doctors = {d.get('id') for d in doctors
+                               if str(d.get('specialty', '')).lower() == specialty.lower()} or None
+    
+    def search(query):
+        try:
+            return search_slots(tenant_id, *query)
+        except AppointmentServiceUnavailable as e:
+            return e
+    
+    results = {}
+    found = []
+    seen = set(exclude or ())
+    unavailable = None
+    
+    for relaxation, queries, doctor_filter in steps:
+        pending = [q for q in dict.fromkeys(queries) if q not in results]
+        for query, slots in zip(pending, _executor.map(search, pending)):
+            if isinstance(slots, AppointmentServiceUnavailable):
+                # Queries with a last-known-good copy still contribute (marked stale)
+                unavailable, slots = slots, []
+            results[query] = slots
+        
+        for query in dict.fromkeys(queries):
+            for slot in sorted(results[query], key=lambda s: s.get('start_time', '')):
+                if slot.get('slot_id') in seen:
+                    continue
+                if doctor and doctor_filter and not matches_doctor(slot, doctor):
+                    continue
+                if doctor and not doctor_filter and allowed_doctors and slot.get('doctor_id') not in allowed_doctors:
+                    continue
+                seen.add(slot.get('slot_id'))
+                found.append(dict(slot, relaxation=relaxation))
+                if len(found) >= max_results:
+                    return found
+    
+    if unavailable and not found:
+        raise unavailable
+    return found
+
+
+def search_slots(tenant_id: str, date: str, time_preference: str) -> list:
+    """
+    Call appointment service to search for slots. While the service is
+    unavailable, the last good result for the same query is returned with
+    every slot marked stale; with none, AppointmentServiceUnavailable is
+    raised.
+    """
+    key = (tenant_id, date, time_preference)
+    payload = {
+        "tenantId": tenant_id,
+        "date": date,
+        "timePreference": time_preference
+    }
+    
+    try:
+        result = hedger.call(SLOTS_SEARCH, lambda: appointments.post('/v1/slots/search', payload, idempotent=True))
+    except urllib.error.HTTPError as e:
+        print(f"Appointment service rejected the search for {date} {time_preference}: {e}")
+        return []
+    except AppointmentServiceUnavailable as e:
+        cached = last_known_slots.get(key)
+        if cached is not None:
+            age, slots = cached
+            print(f"Failed to call appointment service ({e}); serving {len(slots)} slots from {age:.0f}s ago")
+            return [dict(slot, stale=True) for slot in slots]
+        if MOCK_APPOINTMENTS:
+            print(f"Failed to call appointment service: {e}")
+            # Mock data for local testing
+            return generate_mock_slots(tenant_id, date, time_preference)
+        raise
+    
+    slots = result.get('slots') or []
+    last_known_slots.put(key, slots)
+    return slots
+
+
+def generate_mock_slots(tenant_id: str, date: str, time_preference: str) -> list:
+    """Generate mock slots for testing when service is unavailable."""
+    base_time = datetime.now() + timedelta(days=1)
+    
+    if time_preference == 'morning':
+        hours = [9, 9, 10]
+        minutes = [0, 30, 0]
+    elif time_preference == 'afternoon':
+        hours = [14, 14, 15]
+        minutes = [0, 30, 0]
+    else:
+        hours = [9, 14, 16]
+        minutes = [30, 0, 30]
+    
+    slots = []
+    for i, (h, m) in enumerate(zip(hours, minutes)):
+        slot_time = base_time.replace(hour=h, minute=m, second=0, microsecond=0)
+        slots.append({
+            "slot_id": f"{tenant_id}-{slot_time.strftime('%Y%m%d')}-{h:02d}{m:02d}",
+            "start_time": slot_time.isoformat(),
+            "end_time": (slot_time + timedelta(minutes=30)).isoformat(),
+            "doctor_name": f"Dr. {'Sharma' if i == 0 else 'Patel' if i == 1 else 'Kumar'}"
+        })
+    
+    return slots
+
+
+def format_slots_for_agent(slots: list) -> str:
+    """Format slots as natural language for agent response."""
+    days = {str(slot.get('start_time', ''))[:10] for slot in slots[:3]}
+    formatted = []
+    for i, slot in enumerate(slots[:3], 1):
+        try:
+            dt = datetime.fromisoformat(slot['start_time'].replace('Z', '+00:00'))
+            time_str = dt.strftime('%I:%M %p').lstrip('0')
+            if len(days) > 1:
+                # Spoken day only matters once the search spans several dates
+                time_str = f"{time_str} on {dt.strftime('%A')}"
+            formatted.append(f"{time_str}")
+        except:
+            formatted.append(slot.get('start_time', 'Unknown'))
+    
+    return ", ".join(formatted)
+
+
+def compact_slots_body(slots: list, top_k: int = COMPACT_TOP_K) -> tuple:
+    """
+    Token-efficient search result for the agent.
+    
+    Returns (body, handles). The body lists the top-k slots as short handles
+    ("S1", "S2", ...) with a local start time and an index into a
+    deduplicated doctor list, plus a speech-ready summary. `handles` maps
+    each handle back to its full slot id for confirmAppointment.
+    """
+    shown = slots[:top_k]
+    doctors = []
+    rows = []
+    handles = {}
+    
+    for i, slot in enumerate(shown, 1):
+        handle = f"S{i}"
+        handles[handle] = slot.get('slot_id', '')
+        
+        doctor = slot.get('doctor_name', '')
+        if doctor and doctor not in doctors:
+            doctors.append(doctor)
+        
+        row = {"h": handle, "t": compact_time(slot.get('start_time', ''))}
+        if doctor:
+            row["d"] = doctors.index(doctor)
+        if slot.get('relaxation', RELAX_EXACT) != RELAX_EXACT:
+            row["r"] = slot['relaxation']
+        rows.append(row)
+    
+    body = {"say": speech_summary(shown, doctors)}
+    if rows:
+        body["slots"] = rows
+        body["doctors"] = doctors
+    if len(slots) > len(shown):
+        body["more"] = len(slots) - len(shown)
+    return body, handles
+
+
+def compact_time(start_time: str) -> str:
+    """'2024-12-25T09:30:00Z' -> 'Wed 12-25 09:30'"""
+    try:
+        dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        return dt.strftime('%a %m-%d %H:%M')
+    except ValueError:
+        return start_time
+
+
+def speech_summary(slots: list, doctors: list) -> str:
+    """One sentence the agent can read out as-is."""
+    if not slots:
+        return "No openings in the next few business days."
+    
+    times = []
+    for slot in slots:
+        try:
+            times.append(datetime.fromisoformat(slot['start_time'].replace('Z', '+00:00')))
+        except (KeyError, ValueError):
+            times.append(None)
+    same_day = len({dt.date() for dt in times if dt}) == 1
+    
+    parts = []
+    for slot, dt in zip(slots, times):
+        if dt is None:
+            part = str(slot.get('start_time', ''))
+        elif same_day:
+            part = dt.strftime('%I:%M %p').lstrip('0')
+        else:
+            part = f"{dt.strftime('%A')} at {dt.strftime('%I:%M %p').lstrip('0')}"
+        if len(doctors) > 1 and slot.get('doctor_name'):
+            part = f"{part} with {slot['doctor_name']}"
+        parts.append(part)
+    
+    options = parts[0] if len(parts) == 1 else ", ".join(parts[:-1]) + f" or {parts[-1]}"
+    if same_day and times[0]:
+        options = f"{options} on {times[0].strftime('%A')}"
+    if len(doctors) == 1:
+        options = f"{options} with {doctors[0]}"
+    return f"I have {options}."
@@ -0,0 +1,53 @@
+"""
+Bedrock Agent action-group events: request parameters in, responses out.
+
+Part of the shared layer (lambda/shared): used by every action handler
+in lambda/actions.
+"""
+
+import json
+from typing import Optional
+
+
+def extract_parameters(event: dict) -> dict:
+    """Extract parameters from Bedrock Agent event structure."""
+    params = {}
+
+    try:
+        request_body = event.get('requestBody', {})
+        content = request_body.get('content', {})
+        json_content = content.get('application/json', {})
+        properties = json_content.get('properties', [])
+
+        for prop in properties:
+            name = prop.get('name')
+            value = prop.get('value')
+            if name and value:
+                params[name] = value
+
+    except Exception as e:
+        print(f"Error extracting parameters: {e}")
+
+    return params
+
+
+def create_response(event: dict, status_code: int, body: dict,
+                    session_attributes: Optional[dict] = None, compact: bool = False) -> dict:
+    """Create response in Bedrock Agent expected format."""
+    response = {
+        "messageVersion": "1.0",
+        "response": {
+            "actionGroup": event.get("actionGroup", ""),
+            "apiPath": event.get("apiPath", ""),
+            "httpMethod": event.get("httpMethod", "POST"),
+            "httpStatusCode": status_code,
+            "responseBody": {
+                "application/json": {
+                    "body": json.dumps(body, separators=(',', ':')) if compact else json.dumps(body)
+                }
+            }
+        }
+    }
+    if session_attributes:
+        response["sessionAttributes"] = {**event.get("sessionAttributes", {}), **session_attributes}
+    return response
@@ -0,0 +1,297 @@
+"""
+Appointment-service client with a circuit breaker.
+
+Every call to the appointment service goes through one CircuitBreaker per
+process:
+
+  closed     calls go out; BREAKER_FAILURE_THRESHOLD failures in a row
+             (connection errors, timeouts, 5xx) open the breaker
+  open       calls fail at once with AppointmentServiceUnavailable instead
+             of waiting out the request timeout, for BREAKER_OPEN_SECONDS
+  half_open  one probe call (with the shorter BREAKER_PROBE_TIMEOUT) goes
+             out; success closes the breaker, failure opens it again
+
+Transitions are printed with how long the breaker was open, and stats()
+counts them along with calls rejected while open.
+
+Connections are kept alive and reused (up to APPOINTMENT_POOL_SIZE idle
+per host), so a warm function skips the TCP (and TLS) handshake on every
+search and confirm. default_client() is the one client per process: the
+action dispatcher's handlers share its pool and its breaker.
+
+A reused connection the server has already closed fails the request. Only
+idempotent calls (post(..., idempotent=True), e.g. slot search) are sent
+again on a fresh connection: a confirm the server dropped may still have
+been booked, so it is never resent, and it only reuses connections idle
+for less than APPOINTMENT_REUSE_SECONDS, well inside server keep-alive
+timeouts.
+
+LastKnownGood keeps recent successful responses so a caller can serve
+them, marked stale, while the service is down.
+
+Part of the shared layer (lambda/shared): used by the search and confirm
+actions.
+"""
+
+import http.client
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+from collections import OrderedDict
+from typing import Any, Optional
+
+APPOINTMENT_SERVICE_URL = os.environ.get('APPOINTMENT_SERVICE_URL', 'http://localhost:7002')
+APPOINTMENT_TIMEOUT = float(os.environ.get('APPOINTMENT_TIMEOUT', '10'))
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '3'))
+BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', '30'))
+BREAKER_PROBE_TIMEOUT = float(os.environ.get('BREAKER_PROBE_TIMEOUT', '3'))
+# Idle keep-alive connections kept per host
+APPOINTMENT_POOL_SIZE = int(os.environ.get('APPOINTMENT_POOL_SIZE', '8'))
+# Non-idempotent calls only reuse connections idle for less than this
+APPOINTMENT_REUSE_SECONDS = float(os.environ.get('APPOINTMENT_REUSE_SECONDS', '2'))
+
+# Last-known-good responses older than this are not served
+STALE_MAX_AGE_SECONDS = float(os.environ.get('STALE_MAX_AGE_SECONDS', '900'))
+STALE_MAX_ENTRIES = 512
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class AppointmentServiceUnavailable(Exception):
+    """The appointment service failed, or the breaker is open and the call was not sent."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.outage_started = 0.0
+        self.probing = False
+        self._stats = {"rejected": 0, "opened": 0, "closed": 0, "open_seconds_total": 0.0,
+                       "last_open_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """Raise if the call must not go out; True if it is the half-open probe."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            self._stats["rejected"] += 1
+        raise AppointmentServiceUnavailable(f"{self.name} circuit is {self.state}")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._transition(OPEN)
+
+    def stats(self) -> dict:
+        """State, consecutive failures, transitions and open time (seconds)."""
+        with self._lock:
+            stats = dict(self._stats, state=self.state, failures=self.failures)
+            if self.state != CLOSED:
+                stats["open_for_seconds"] = round(time.monotonic() - self.outage_started, 1)
+        stats["open_seconds_total"] = round(stats["open_seconds_total"], 1)
+        stats["last_open_seconds"] = round(stats["last_open_seconds"], 1)
+        return stats
+
+    def _transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        now = time.monotonic()
+        if state == OPEN:
+            if previous == CLOSED:
+                self.outage_started = now
+                self._stats["opened"] += 1
+            # A failed probe restarts the open period; the outage clock keeps running
+            self.opened_at = now
+            print(f"Circuit {self.name}: {previous} -> {OPEN} after {self.failures} failures")
+        elif state == CLOSED:
+            outage = now - self.outage_started
+            self._stats["closed"] += 1
+            self._stats["open_seconds_total"] += outage
+            self._stats["last_open_seconds"] = outage
+            print(f"Circuit {self.name}: {previous} -> {CLOSED} after {outage:.1f}s open")
+        else:
+            print(f"Circuit {self.name}: {previous} -> {state}")
+
+
+class ConnectionPool:
+    """Idle keep-alive HTTP connections per scheme and host."""
+
+    def __init__(self, max_idle: int = APPOINTMENT_POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._stats = {"opened": 0, "reused": 0}
+        self._lock = threading.Lock()
+
+    def get(self, scheme: str, netloc: str, timeout: float, max_idle_seconds: Optional[float] = None) -> tuple:
+        """
+        (connection, reused) for a host, with the request timeout applied.
+        With max_idle_seconds, connections idle longer are closed, not reused.
+        """
+        stale = []
+        try:
+            with self._lock:
+                idle = self._idle.get((scheme, netloc))
+                while idle:
+                    conn, idle_since = idle.pop()
+                    if max_idle_seconds is not None and time.monotonic() - idle_since > max_idle_seconds:
+                        stale.append(conn)
+                        continue
+                    self._stats["reused"] += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                self._stats["opened"] += 1
+        finally:
+            for conn in stale:
+                conn.close()
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(netloc, timeout=timeout), False
+
+    def put(self, scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, idle=sum(len(idle) for idle in self._idle.values()))
+
+
+class AppointmentClient:
+    """JSON POSTs to the appointment service behind a circuit breaker."""
+
+    def __init__(self, base_url: str = APPOINTMENT_SERVICE_URL, breaker: Optional[CircuitBreaker] = None,
+                 timeout: float = APPOINTMENT_TIMEOUT, probe_timeout: float = BREAKER_PROBE_TIMEOUT,
+                 pool: Optional[ConnectionPool] = None):
+        self.base_url = base_url
+        self.breaker = breaker or CircuitBreaker('appointment-service')
+        self.timeout = timeout
+        self.probe_timeout = probe_timeout
+        self.pool = pool or ConnectionPool()
+
+    def post(self, path: str, payload: dict, idempotent: bool = False) -> dict:
+        """
+        POST payload as JSON and return the decoded response. Raises
+        AppointmentServiceUnavailable on connection errors, timeouts and 5xx
+        (or at once while the breaker is open); a 4xx HTTPError is the
+        caller's problem and is re-raised as is. Only an idempotent call is
+        resent when a reused connection turns out to be closed.
+        """
+        probe = self.breaker.before_call()
+        try:
+            status, reason, headers, data = self._send(path, json.dumps(payload).encode('utf-8'),
+                                                       self.probe_timeout if probe else self.timeout, idempotent)
+            if status >= 400:
+                raise urllib.error.HTTPError(f"{self.base_url}{path}", status, reason, headers, io.BytesIO(data))
+            result = json.loads(data.decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            if e.code < 500:
+                self.breaker.record_success()
+                raise
+            self.breaker.record_failure()
+            raise AppointmentServiceUnavailable(f"appointment service returned {e.code}") from e
+        except (http.client.HTTPException, OSError, ValueError) as e:
+            self.breaker.record_failure()
+            raise AppointmentServiceUnavailable(f"appointment service unreachable: {e}") from e
+        self.breaker.record_success()
+        return result
+
+    def _send(self, path: str, body: bytes, timeout: float, idempotent: bool) -> tuple:
+        """(status, reason, headers, body) over a pooled connection."""
+        url = urllib.parse.urlsplit(self.base_url)
+        base_path = url.path.rstrip('/')
+        max_idle_seconds = None if idempotent else APPOINTMENT_REUSE_SECONDS
+        while True:
+            conn, reused = self.pool.get(url.scheme, url.netloc, timeout, max_idle_seconds)
+            try:
+                conn.request('POST', base_path + path, body=body, headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and idempotent:
+                    # The server dropped the idle connection; sending a read again is harmless
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self.pool.put(url.scheme, url.netloc, conn)
+            return response.status, response.reason, response.headers, data
+
+
+class LastKnownGood:
+    """Recent successful responses by key, for serving stale while the service is down."""
+
+    def __init__(self, max_age_seconds: float = STALE_MAX_AGE_SECONDS, max_entries: int = STALE_MAX_ENTRIES):
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: Any) -> Optional[tuple]:
+        """(age_seconds, value), or None if missing or too old to serve."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry[0]
+        if age > self.max_age_seconds:
+            return None
+        return age, entry[1]
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> AppointmentClient:
+    """The process's appointment-service client (one pool, one breaker)."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = AppointmentClient()
+        return _default_client
@@ -0,0 +1,206 @@
+"""
+Hedged requests for idempotent calls with a long latency tail.
+
+Hedger.call(operation, fn) runs fn() and, if it has not returned after the
+operation's hedge delay (the HEDGE_PERCENTILE of its recent latencies, at
+least HEDGE_MIN_DELAY_MS), sends a second identical attempt. Whichever
+attempt succeeds first wins; the other is cancelled: dropped if it has not
+started, otherwise told through cancelled() so it can stop early (skip
+reading a response body, say), and its late result is handed to
+`discard`. If one attempt fails the other can still win; if both fail the
+primary's error is raised.
+
+Hedges cost extra load, so one budget per process caps them: every call
+deposits HEDGE_BUDGET_RATIO of a token, every hedge takes one. At the p95
+about 5% of calls hedge; a slow dependency cannot push the extra load
+past the ratio.
+
+Hedging is opt-in per operation through HEDGE_OPERATIONS (comma-separated
+names, or 'all'); other operations run fn() inline with no overhead. Only
+wrap calls that are safe to send twice.
+
+Part of the shared layer (lambda/shared): used by the voice processor and
+the slot search action.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+HEDGE_OPERATIONS = os.environ.get('HEDGE_OPERATIONS', '')
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_DELAY_MS = float(os.environ.get('HEDGE_MIN_DELAY_MS', '20'))
+# Below this many samples an operation is not hedged (the delay is not known yet)
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_BUDGET_RATIO = float(os.environ.get('HEDGE_BUDGET_RATIO', '0.1'))
+HEDGE_BUDGET_MAX = float(os.environ.get('HEDGE_BUDGET_MAX', '10'))
+HEDGE_WORKERS = int(os.environ.get('HEDGE_WORKERS', '32'))
+HEDGE_WINDOW = 512
+
+_cancel = contextvars.ContextVar('hedge_cancel', default=None)
+
+
+def cancelled() -> bool:
+    """True inside an attempt that has lost to the other one."""
+    event = _cancel.get()
+    return event is not None and event.is_set()
+
+
+class _Operation:
+    """Recent latencies and counters for one operation."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=HEDGE_WINDOW)
+        self.delay = None
+        self.fresh = 0
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_skipped": 0, "errors": 0}
+        self.latencies = deque(maxlen=HEDGE_WINDOW)
+
+
+class Hedger:
+    """Second attempts for slow calls, under a shared hedge budget."""
+
+    def __init__(self, operations: str = HEDGE_OPERATIONS, percentile: float = HEDGE_PERCENTILE,
+                 min_delay_ms: float = HEDGE_MIN_DELAY_MS, min_samples: int = HEDGE_MIN_SAMPLES,
+                 budget_ratio: float = HEDGE_BUDGET_RATIO, budget_max: float = HEDGE_BUDGET_MAX,
+                 workers: int = HEDGE_WORKERS):
+        names = {name.strip() for name in operations.split(',') if name.strip()}
+        self.all = 'all' in names
+        self.names = names
+        self.percentile = percentile
+        self.min_delay = min_delay_ms / 1000
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.budget_max = budget_max
+        self.balance = budget_max
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def enabled(self, operation: str) -> bool:
+        return self.all or operation in self.names
+
+    def call(self, operation: str, fn: Callable[[], Any], discard: Optional[Callable[[Any], None]] = None) -> Any:
+        """fn(), hedged with a second attempt once it is slower than the operation's hedge delay."""
+        if not self.enabled(operation):
+            return fn()
+        op = self._operation(operation)
+        with self._lock:
+            op.stats["calls"] += 1
+            self.balance = min(self.budget_max, self.balance + self.budget_ratio)
+            delay = op.delay
+        started = time.monotonic()
+        attempts = [self._submit(op, fn)]
+        if delay is not None:
+            done, _ = wait([attempts[0][0]], timeout=delay)
+            if not done:
+                if self._withdraw(op):
+                    attempts.append(self._submit(op, fn))
+                else:
+                    with self._lock:
+                        op.stats["budget_skipped"] += 1
+        winner = None
+        try:
+            winner = self._first_success(attempts)
+        except Exception:
+            with self._lock:
+                op.stats["errors"] += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            for future, event in attempts:
+                if future is not winner:
+                    self._cancel(op, future, event, elapsed, discard)
+        with self._lock:
+            op.latencies.append(elapsed)
+            if winner is not attempts[0][0]:
+                op.stats["hedge_wins"] += 1
+        return winner.result()
+
+    def stats(self) -> dict:
+        """Per operation: calls, hedges, hedge rate and call latency percentiles (ms)."""
+        with self._lock:
+            operations = {name: (dict(op.stats), sorted(op.latencies), op.delay)
+                          for name, op in self._operations.items()}
+        result = {}
+        for name, (stats, latencies, delay) in operations.items():
+            stats["hedge_rate"] = round(stats["hedged"] / stats["calls"], 4) if stats["calls"] else 0.0
+            stats["delay_ms"] = round(delay * 1000, 1) if delay is not None else None
+            for pct in (50, 95, 99):
+                stats[f"p{pct}_ms"] = round(_percentile(latencies, pct) * 1000, 1) if latencies else None
+            result[name] = stats
+        return result
+
+    def _operation(self, operation: str) -> _Operation:
+        with self._lock:
+            op = self._operations.get(operation)
+            if op is None:
+                op = self._operations[operation] = _Operation()
+            return op
+
+    def _withdraw(self, op: _Operation) -> bool:
+        with self._lock:
+            if self.balance < 1.0:
+                return False
+            self.balance -= 1.0
+            op.stats["hedged"] += 1
+            return True
+
+    def _submit(self, op: _Operation, fn: Callable[[], Any]) -> tuple:
+        # Each attempt runs in a copy of the caller's context (turn deadline, tenant scope)
+        context = contextvars.copy_context()
+        event = threading.Event()
+
+        def attempt():
+            _cancel.set(event)
+            started = time.monotonic()
+            result = fn()
+            if not event.is_set():
+                self._record(op, time.monotonic() - started)
+            return result
+
+        return self.executor.submit(context.run, attempt), event
+
+    def _first_success(self, attempts: list):
+        """The first attempt's future to succeed; the primary's error if all fail."""
+        pending = {future for future, _ in attempts}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future
+        raise attempts[0][0].exception()
+
+    def _cancel(self, op: _Operation, future, event: threading.Event, elapsed: float,
+                discard: Optional[Callable[[Any], None]]) -> None:
+        event.set()
+        if future.cancel():
+            return
+        if not future.done():
+            # Still running: its latency is at least as long as the call took
+            self._record(op, elapsed)
+        if discard:
+            future.add_done_callback(lambda f: f.exception() is None and f.result() is not None
+                                     and discard(f.result()))
+
+    def _record(self, op: _Operation, seconds: float) -> None:
+        with self._lock:
+            op.samples.append(seconds)
+            op.fresh += 1
+            if len(op.samples) < self.min_samples or (op.delay is not None and op.fresh < 16):
+                return
+            op.fresh = 0
+            op.delay = max(self.min_delay, _percentile(sorted(op.samples), self.percentile))
+
+
+def _percentile(samples: list, pct: float) -> float:
+    index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+# One hedge budget per process, shared by every hedged operation
+hedger = Hedger()
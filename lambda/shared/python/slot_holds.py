@@ -0,0 +1,262 @@
+"""
+Short-lived holds on slots offered to a conversation.
+
+searchSlots places a hold on every slot it offers, keyed by the Bedrock
+session ID, so a parallel caller cannot be offered (or book) the same
+time while this caller is still deciding. confirmAppointment converts the
+hold into a booking. Holds release themselves when they expire.
+
+The hold table is a compact dict of slot_id -> [session_id, expires_at].
+Where it lives decides who can see a hold:
+
+  HOLD_STORE=s3://bucket/prefix  one JSON object shared by every function
+                                 and execution environment (deployed)
+  HOLD_STORE_PATH=<file>         a locked JSON file, shared by processes on
+                                 one host (local runs, container mode)
+  neither                        process memory: one container only
+
+Lambda runs each function in many execution environments, so only the S3
+store gives callers on different containers each other's holds; without
+it a Lambda logs a warning at start. S3 writes are conditional on the
+ETag read (If-Match, or If-None-Match for the first write), and a write
+that loses the race is re-run against the fresh table. A transaction that
+changes nothing writes nothing.
+
+Part of the shared layer (lambda/shared): used by the search and confirm
+actions.
+"""
+
+import fcntl
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+HOLD_SECONDS = int(os.environ.get('SLOT_HOLD_SECONDS', '180'))
+HOLD_STORE = os.environ.get('HOLD_STORE', '')
+HOLD_STORE_PATH = os.environ.get('HOLD_STORE_PATH', '')
+# Conditional-write races a hold operation re-runs before giving up
+HOLD_WRITE_ATTEMPTS = int(os.environ.get('HOLD_WRITE_ATTEMPTS', '8'))
+
+COUNTERS = ('placed', 'converted', 'expired', 'released', 'rejected')
+
+
+def _empty_state() -> dict:
+    return {"holds": {}, "stats": {name: 0 for name in COUNTERS}}
+
+
+class MemoryHoldBackend:
+    """Process-local hold table."""
+
+    def __init__(self):
+        self._state = _empty_state()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self) -> Iterator[dict]:
+        with self._lock:
+            yield self._state
+
+
+class FileHoldBackend:
+    """Hold table in a JSON file guarded by an exclusive flock."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextmanager
+    def transaction(self) -> Iterator[dict]:
+        with open(self.path, 'a+') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                raw = handle.read()
+                try:
+                    state = json.loads(raw) if raw else _empty_state()
+                except ValueError:
+                    state = _empty_state()
+                yield state
+                handle.seek(0)
+                handle.truncate()
+                json.dump(state, handle, separators=(',', ':'))
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class HoldWriteConflict(Exception):
+    """Another writer changed the shared hold table since it was read."""
+
+
+class S3HoldBackend:
+    """Hold table in one S3 object, written only if unchanged since it was read."""
+
+    def __init__(self, bucket: str, prefix: str = 'slot-holds', s3=None):
+        self.bucket = bucket
+        self.key = f"{prefix.strip('/')}/holds.json"
+        self._s3 = s3
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client('s3')
+        return self._s3
+
+    @contextmanager
+    def transaction(self) -> Iterator[dict]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self.key)
+            raw, etag = response['Body'].read().decode('utf-8'), response.get('ETag')
+        except self.s3.exceptions.NoSuchKey:
+            raw, etag = '', None
+        try:
+            state = json.loads(raw) if raw else _empty_state()
+        except ValueError:
+            state = _empty_state()
+        yield state
+        body = json.dumps(state, separators=(',', ':'))
+        if body == raw:
+            return
+        from botocore.exceptions import ClientError
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body.encode('utf-8'),
+                               ContentType='application/json', **condition)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise HoldWriteConflict(self.key) from e
+            raise
+
+
+def _retry_on_conflict(method):
+    """Re-run a hold operation against the fresh table when its write lost a race."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(1, HOLD_WRITE_ATTEMPTS + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except HoldWriteConflict:
+                if attempt == HOLD_WRITE_ATTEMPTS:
+                    raise
+    return wrapper
+
+
+class SlotHolds:
+    """Place, check, convert and expire slot holds."""
+
+    def __init__(self, backend=None, hold_seconds: int = HOLD_SECONDS):
+        self.backend = backend or MemoryHoldBackend()
+        self.hold_seconds = hold_seconds
+
+    @_retry_on_conflict
+    def place(self, session_id: str, slot_ids: list) -> list:
+        """
+        Hold slots for a session, replacing its earlier holds. Returns the
+        slot ids now held; slots held by another session are skipped.
+        """
+        now = time.time()
+        held = []
+        with self.backend.transaction() as state:
+            self._expire(state, now)
+            holds = state["holds"]
+            for slot_id, (owner, _) in list(holds.items()):
+                if owner == session_id and slot_id not in slot_ids:
+                    del holds[slot_id]
+                    state["stats"]["released"] += 1
+            for slot_id in slot_ids:
+                owner = holds.get(slot_id, [None])[0]
+                if owner not in (None, session_id):
+                    continue
+                if owner is None:
+                    state["stats"]["placed"] += 1
+                holds[slot_id] = [session_id, now + self.hold_seconds]
+                held.append(slot_id)
+        return held
+
+    @_retry_on_conflict
+    def held_by_others(self, session_id: str) -> set:
+        """Slot ids currently held by a different session."""
+        with self.backend.transaction() as state:
+            self._expire(state, time.time())
+            return {s for s, (owner, _) in state["holds"].items() if owner != session_id}
+
+    @_retry_on_conflict
+    def owner(self, slot_id: str) -> Optional[str]:
+        with self.backend.transaction() as state:
+            self._expire(state, time.time())
+            return state["holds"].get(slot_id, [None])[0]
+
+    @_retry_on_conflict
+    def convert(self, session_id: str, slot_id: str) -> bool:
+        """Turn this session's hold into a booking; False if it no longer holds the slot."""
+        with self.backend.transaction() as state:
+            self._expire(state, time.time())
+            hold = state["holds"].get(slot_id)
+            if not hold or hold[0] != session_id:
+                return False
+            del state["holds"][slot_id]
+            state["stats"]["converted"] += 1
+            return True
+
+    @_retry_on_conflict
+    def reject(self) -> None:
+        """Count a confirm attempt refused because another session holds the slot."""
+        with self.backend.transaction() as state:
+            state["stats"]["rejected"] += 1
+
+    @_retry_on_conflict
+    def release(self, session_id: str) -> int:
+        """Drop every hold a session has (e.g. after booking or handoff)."""
+        with self.backend.transaction() as state:
+            mine = [s for s, (owner, _) in state["holds"].items() if owner == session_id]
+            for slot_id in mine:
+                del state["holds"][slot_id]
+            state["stats"]["released"] += len(mine)
+            return len(mine)
+
+    @_retry_on_conflict
+    def stats(self) -> dict:
+        """Counters plus the hold conversion rate."""
+        with self.backend.transaction() as state:
+            self._expire(state, time.time())
+            stats = dict(state["stats"])
+            stats["active"] = len(state["holds"])
+        stats["conversion_rate"] = round(stats["converted"] / stats["placed"], 4) if stats["placed"] else 0.0
+        return stats
+
+    @staticmethod
+    def _expire(state: dict, now: float) -> None:
+        expired = [s for s, (_, expires_at) in state["holds"].items() if expires_at <= now]
+        for slot_id in expired:
+            del state["holds"][slot_id]
+        state["stats"]["expired"] += len(expired)
+
+
+def build_hold_backend(store: str = '', path: str = ''):
+    """Backend from HOLD_STORE ('s3://bucket/prefix') or HOLD_STORE_PATH, else process memory."""
+    if store.startswith('s3://'):
+        bucket, _, prefix = store[len('s3://'):].partition('/')
+        return S3HoldBackend(bucket, prefix or 'slot-holds')
+    if store:
+        raise ValueError(f"HOLD_STORE must be s3://bucket/prefix, got {store!r}")
+    if path:
+        return FileHoldBackend(path)
+    if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+        print("WARNING: no HOLD_STORE configured; slot holds are visible to this execution environment only")
+    return MemoryHoldBackend()
+
+
+_default_holds = None
+_default_holds_lock = threading.Lock()
+
+
+def default_holds() -> SlotHolds:
+    """Hold table configured from the environment, one per process."""
+    global _default_holds
+    with _default_holds_lock:
+        if _default_holds is None:
+            _default_holds = SlotHolds(build_hold_backend(HOLD_STORE, HOLD_STORE_PATH))
+        return _default_holds
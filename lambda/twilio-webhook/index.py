@@ -1,12 +1,64 @@
 import json
+import os
 import boto3
 import base64
+import time
 import urllib.parse
-from xml.sax.saxutils import escape
+import uuid
+from xml.sax.saxutils import escape, quoteattr
+
+from turn_queue import build_result_store, build_turn_queue
+
+VOICE_FUNCTION_NAME = os.environ.get('VOICE_FUNCTION_NAME', 'IvrVoiceStack-VoiceProcessorFunction11F26011-trz1dxgnXLEW')
+
+# When set (wss://host/twilio), calls are bridged to the real-time media server
+# instead of the turn-based <Gather> loop
+MEDIA_STREAM_URL = os.environ.get('MEDIA_STREAM_URL', '')
+
+# Used when the voice processor does not send per-turn endpointing
+DEFAULT_GATHER = {'speechTimeout': '5'}
+
+# 'async': answer each turn at once with a hold and <Redirect> to the result
+# endpoint while a worker runs the voice-processor turn, so slow agent turns
+# never hit Twilio's webhook timeout. 'sync' blocks on the turn as before.
+TURN_MODE = os.environ.get('TURN_MODE', 'sync')
+TURN_QUEUE = os.environ.get('TURN_QUEUE', 'lambda')
+TURN_STORE = os.environ.get('TURN_STORE', 's3://clinic-voice-processing/twilio-turns')
+RESULT_PATH = '/voice/result'
+# Each hold is a <Pause> of this length before the next poll; give up after TURN_MAX_POLLS
+TURN_HOLD_SECONDS = int(os.environ.get('TURN_HOLD_SECONDS', '1'))
+TURN_MAX_POLLS = int(os.environ.get('TURN_MAX_POLLS', '20'))
+# Spoken once when the caller is first put on hold; empty for silence
+TURN_FILLER = os.environ.get('TURN_FILLER', 'One moment.')
+
+# Async turn plumbing; built only when TURN_MODE is 'async'
+turn_store = build_result_store(TURN_STORE) if TURN_MODE == 'async' else None
+turn_queue = (build_turn_queue(TURN_QUEUE, lambda job: run_queued_turn(job),
+                               os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+              if TURN_MODE == 'async' else None)
+
+# Sent by Twilio's call status callback (pointed at this webhook) once the call is over
+CALL_ENDED_STATUSES = ('completed', 'busy', 'failed', 'no-answer', 'canceled')
+EMPTY_TWIML = """<?xml version="1.0" encoding="UTF-8"?>
+<Response/>"""
+
+# Only when the clinic's synthesized greeting is unavailable
+WELCOME_TWIML = """<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say voice="alice">Hello! Welcome to our AI voice appointment bot. Please tell me how I can help you.</Say>
+    <Gather input="speech" action="/voice" method="POST" speechTimeout="auto">
+        <Say voice="alice">Please speak after the beep.</Say>
+    </Gather>
+    <Say voice="alice">I didn't hear anything. Please try calling again.</Say>
+</Response>"""
 
 def lambda_handler(event, context):
     """Handle Twilio webhook and bridge to voice processor"""
     
+    if event.get('action') == 'run_turn':
+        # Async turn queued by an earlier webhook invocation
+        return run_queued_turn(event)
+    
     # Parse Twilio webhook data
     if event.get('body'):
         # Parse form data from Twilio
@@ -14,6 +66,12 @@ def lambda_handler(event, context):
         
         # Extract call information
         call_sid = body.get('CallSid', [''])[0]
+        
+        if request_path(event).endswith(RESULT_PATH):
+            # Redirected back while an async turn runs
+            query = event.get('queryStringParameters') or {}
+            return xml_response(poll_turn_result(call_sid, query.get('turn', ''), int(query.get('attempt', '1'))))
+        
         from_number = body.get('From', [''])[0]
         to_number = body.get('To', [''])[0]
         speech_result = body.get('SpeechResult', ['Hello'])[0]
@@ -25,67 +83,239 @@ def lambda_handler(event, context):
         elif '1003' in to_number:
             did = '1003'
         
+        if body.get('CallStatus', [''])[0] in CALL_ENDED_STATUSES:
+            # Status callback: the voice processor writes the call's artifact
+            end_call(voice_client(), call_sid, did)
+            return xml_response(EMPTY_TWIML)
+        
         print(f"Twilio call: {call_sid}, DID: {did}, Speech: {speech_result}")
         
         # Call voice processor Lambda
-        lambda_client = boto3.client('lambda')
+        lambda_client = voice_client()
+        
+        if MEDIA_STREAM_URL and 'SpeechResult' not in body:
+            # Streaming mode: the media server handles the whole call
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Content-Type': 'text/xml'
+                },
+                'body': media_stream_twiml(did, from_number)
+            }
+        
+        if 'SpeechResult' not in body and body.get('CallStatus', [''])[0] in ('ringing', 'in-progress'):
+            # Call just connected: the voice processor synthesizes the clinic's greeting
+            # and starts prefetching the first turn's data while it plays
+            greeting_url = start_call_setup(lambda_client, call_sid, did, from_number)
+            return xml_response(welcome_twiml(greeting_url))
         
         voice_payload = {
             'text': speech_result,
             'did': did,
-            'session_id': f'twilio-{call_sid}'
+            'session_id': f'twilio-{call_sid}',
+            'caller_number': from_number,
+            'channel': 'twilio'
         }
         
-        try:
-            response = lambda_client.invoke(
-                FunctionName='IvrVoiceStack-VoiceProcessorFunction11F26011-trz1dxgnXLEW',
-                Payload=json.dumps(voice_payload)
-            )
-            
-            result = json.loads(response['Payload'].read())
-            
-            if result['statusCode'] == 200:
-                body_data = json.loads(result['body'])
-                agent_response = body_data['agent_response']
-            else:
-                agent_response = "I'm sorry, I'm having technical difficulties."
-                
-        except Exception as e:
-            print(f"Error calling voice processor: {e}")
-            agent_response = "I'm sorry, there was an error processing your request."
-        
-        # Create TwiML response
-        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
+        # Same on Twilio's retries of this request: the voice processor replays the first turn
+        idempotency_token = request_header(event, 'I-Twilio-Idempotency-Token')
+        if idempotency_token:
+            voice_payload['turn_id'] = idempotency_token
+        
+        if TURN_MODE == 'async':
+            # Answer Twilio now; the turn runs on the queue and is picked up by redirect
+            return xml_response(start_async_turn(call_sid, voice_payload))
+        
+        agent_response, audio_url, gather = run_voice_turn(lambda_client, voice_payload)
+        return xml_response(reply_twiml(agent_response, audio_url, gather))
+    
+    # Initial call - just start the conversation
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'text/xml'
+        },
+        'body': WELCOME_TWIML
+    }
+
+def voice_client():
+    """Lambda client for the voice processor; container mode swaps in an in-process invoker"""
+    return boto3.client('lambda')
+
+def run_voice_turn(lambda_client, voice_payload):
+    """Invoke the voice processor for one turn; returns (agent_response, audio_url, gather)"""
+    try:
+        response = lambda_client.invoke(
+            FunctionName=VOICE_FUNCTION_NAME,
+            Payload=json.dumps(voice_payload)
+        )
+        
+        result = json.loads(response['Payload'].read())
+        
+        if result['statusCode'] == 200:
+            body_data = json.loads(result['body'])
+            # 8 kHz mu-law WAV in the clinic's Polly voice
+            return (body_data['agent_response'], body_data.get('audio_url'),
+                    body_data.get('gather') or DEFAULT_GATHER)
+        return "I'm sorry, I'm having technical difficulties.", None, DEFAULT_GATHER
+        
+    except Exception as e:
+        print(f"Error calling voice processor: {e}")
+        return "I'm sorry, there was an error processing your request.", None, DEFAULT_GATHER
+
+def reply_twiml(agent_response, audio_url, gather):
+    """Speak the agent's reply and gather the caller's next turn"""
+    print(f"Gather for next turn: {gather}")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
-    <Say voice="alice">{escape(agent_response)}</Say>
-    <Gather input="speech" action="/voice" method="POST" speechTimeout="5">
+    {agent_speech(agent_response, audio_url)}
+    <Gather input="speech" action="/voice" method="POST"{gather_attributes(gather)}>
         <Say voice="alice">Please continue speaking, or hang up when finished.</Say>
     </Gather>
     <Say voice="alice">Thank you for calling. Goodbye!</Say>
 </Response>"""
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'text/xml'
-            },
-            'body': twiml
-        }
-    
-    # Initial call - just start the conversation
-    twiml = """<?xml version="1.0" encoding="UTF-8"?>
+
+def hold_twiml(turn_id, attempt, filler=''):
+    """Hold the caller briefly, then redirect back to collect the turn's result"""
+    say = f'<Say voice="alice">{escape(filler)}</Say>' if filler else ''
+    url = f"{RESULT_PATH}?{urllib.parse.urlencode({'turn': turn_id, 'attempt': attempt})}"
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
-    <Say voice="alice">Hello! Welcome to our AI voice appointment bot. Please tell me how I can help you.</Say>
-    <Gather input="speech" action="/voice" method="POST" speechTimeout="5">
-        <Say voice="alice">Please speak after the beep.</Say>
-    </Gather>
-    <Say voice="alice">I didn't hear anything. Please try calling again.</Say>
+    {say}<Pause length="{TURN_HOLD_SECONDS}"/>
+    <Redirect method="POST">{escape(url)}</Redirect>
 </Response>"""
-    
+
+def start_async_turn(call_sid, voice_payload):
+    """Queue the turn and put the caller on hold at once; the result endpoint serves the reply"""
+    turn_id = uuid.uuid4().hex[:16]
+    turn_queue.enqueue({'call_sid': call_sid, 'turn_id': turn_id, 'voice_payload': voice_payload})
+    print(f"Turn {turn_id} queued for {call_sid}: holding")
+    return hold_twiml(turn_id, 1, TURN_FILLER)
+
+def take_result(call_sid, turn_id):
+    """The finished turn from the result store, removed so it is served once; None while running"""
+    result = turn_store.get(call_sid, turn_id)
+    if result is not None:
+        turn_store.delete(call_sid, turn_id)
+    return result
+
+def poll_turn_result(call_sid, turn_id, attempt):
+    """Result endpoint: the finished reply, another hold, or an apology once polling gives up"""
+    result = take_result(call_sid, turn_id)
+    if result is not None:
+        return reply_twiml(result['agent_response'], result['audio_url'], result['gather'])
+    if attempt >= TURN_MAX_POLLS:
+        print(f"Turn {turn_id} for {call_sid} not ready after {attempt} polls")
+        return reply_twiml("I'm sorry, that's taking longer than expected. Could you say that again?",
+                           None, DEFAULT_GATHER)
+    return hold_twiml(turn_id, attempt + 1)
+
+def run_queued_turn(job):
+    """Worker: run a queued turn through the voice processor and store the reply"""
+    started = time.time()
+    agent_response, audio_url, gather = run_voice_turn(voice_client(), job['voice_payload'])
+    turn_store.put(job['call_sid'], job['turn_id'], {
+        'agent_response': agent_response,
+        'audio_url': audio_url,
+        'gather': gather
+    })
+    print(f"Turn {job['turn_id']} for {job['call_sid']} finished in {time.time() - started:.1f}s")
+    return {'statusCode': 200, 'turnId': job['turn_id']}
+
+def request_header(event, name):
+    """Case-insensitive request header lookup (API Gateway keeps the caller's casing)"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def request_path(event):
+    """Request path for API Gateway (REST and HTTP) and function URL events"""
+    return event.get('rawPath') or event.get('path') or ''
+
+def xml_response(twiml):
     return {
         'statusCode': 200,
         'headers': {
             'Content-Type': 'text/xml'
         },
         'body': twiml
-    }
\ No newline at end of file
+    }
+
+def agent_speech(agent_response, audio_url):
+    """<Play> the clinic voice when audio was rendered, else fall back to <Say>"""
+    if audio_url:
+        return f"<Play>{escape(audio_url)}</Play>"
+    return f'<Say voice="alice">{escape(agent_response)}</Say>'
+
+def gather_attributes(params):
+    """Render per-turn <Gather> settings as XML attributes"""
+    return ''.join(f' {name}={quoteattr(str(value))}' for name, value in params.items())
+
+def media_stream_twiml(did, from_number):
+    """TwiML that connects the call to the bidirectional media-stream server"""
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Connect>
+        <Stream url="{escape(MEDIA_STREAM_URL)}">
+            <Parameter name="did" value="{escape(did)}"/>
+            <Parameter name="caller_number" value="{escape(from_number)}"/>
+        </Stream>
+    </Connect>
+</Response>"""
+
+def welcome_twiml(greeting_url):
+    """<Play> the clinic's greeting inside the first <Gather> (callers can talk over it)"""
+    if not greeting_url:
+        return WELCOME_TWIML
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Gather input="speech" action="/voice" method="POST" speechTimeout="auto">
+        <Play>{escape(greeting_url)}</Play>
+    </Gather>
+    <Say voice="alice">I didn't hear anything. Please try calling again.</Say>
+</Response>"""
+
+def end_call(lambda_client, call_sid, did):
+    """Tell the voice processor the call is over (asynchronously: Twilio only needs a 200)"""
+    try:
+        lambda_client.invoke(
+            FunctionName=VOICE_FUNCTION_NAME,
+            InvocationType='Event',
+            Payload=json.dumps({
+                'action': 'end_call',
+                'did': did,
+                'session_id': f'twilio-{call_sid}',
+                'channel': 'twilio'
+            })
+        )
+        print(f"Call {call_sid} ended")
+    except Exception as e:
+        print(f"Error ending call {call_sid}: {e}")
+
+def start_call_setup(lambda_client, call_sid, did, from_number):
+    """
+    Run the voice processor's call setup: it returns once the greeting is
+    synthesized and saves its prefetches for the call's turns (which may run
+    in any container) while the greeting plays. Returns the greeting's audio
+    URL, or None.
+    """
+    try:
+        response = lambda_client.invoke(
+            FunctionName=VOICE_FUNCTION_NAME,
+            Payload=json.dumps({
+                'action': 'start_call',
+                'did': did,
+                'session_id': f'twilio-{call_sid}',
+                'caller_number': from_number,
+                'channel': 'twilio'
+            })
+        )
+        result = json.loads(response['Payload'].read())
+        if result.get('statusCode') == 200:
+            return result.get('audioUrl')
+        print(f"Call setup failed for {call_sid}: {result.get('error')}")
+    except Exception as e:
+        print(f"Error starting call setup: {e}")
+    return None
+
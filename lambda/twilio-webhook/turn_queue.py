@@ -0,0 +1,189 @@
+"""
+Turn queue and per-call result store for asynchronous Twilio turns.
+
+In async mode the webhook enqueues a caller turn, answers Twilio at once
+with a hold (<Pause> + <Redirect>), and a worker runs the voice-processor
+turn and writes the finished reply to the result store, where the
+redirect target picks it up.
+
+    queue    lambda   async self-invoke of this function (production)
+             memory   thread pool in this process
+             <dir>    job files in a directory, run by drain()
+    store    s3://bucket/prefix   one small JSON object per turn (production)
+             memory               dict in this process
+             <dir>                JSON files under a directory
+"""
+
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Result stores ------------------------------------------------------------
+
+
+class MemoryResultStore:
+    """Finished turns keyed by (call, turn) in this process"""
+
+    def __init__(self):
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def put(self, call_sid, turn_id, result):
+        with self._lock:
+            self._results[(call_sid, turn_id)] = result
+
+    def get(self, call_sid, turn_id):
+        with self._lock:
+            return self._results.get((call_sid, turn_id))
+
+    def delete(self, call_sid, turn_id):
+        with self._lock:
+            self._results.pop((call_sid, turn_id), None)
+
+
+class FileResultStore:
+    """Finished turns as <dir>/<call>/<turn>.json, written atomically"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, call_sid, turn_id):
+        return os.path.join(self.directory, call_sid, f"{turn_id}.json")
+
+    def put(self, call_sid, turn_id, result):
+        path = self._path(call_sid, turn_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(result, f)
+        os.replace(path + '.tmp', path)
+
+    def get(self, call_sid, turn_id):
+        try:
+            with open(self._path(call_sid, turn_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, call_sid, turn_id):
+        try:
+            os.remove(self._path(call_sid, turn_id))
+        except FileNotFoundError:
+            pass
+
+
+class S3ResultStore:
+    """Finished turns as s3://bucket/<prefix>/<call>/<turn>.json"""
+
+    def __init__(self, bucket, prefix, s3=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self._s3 = s3
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client('s3')
+        return self._s3
+
+    def _key(self, call_sid, turn_id):
+        return f"{self.prefix}/{call_sid}/{turn_id}.json"
+
+    def put(self, call_sid, turn_id, result):
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(call_sid, turn_id),
+                           Body=json.dumps(result), ContentType='application/json')
+
+    def get(self, call_sid, turn_id):
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(call_sid, turn_id))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def delete(self, call_sid, turn_id):
+        self.s3.delete_object(Bucket=self.bucket, Key=self._key(call_sid, turn_id))
+
+
+def build_result_store(spec):
+    """Result store from TURN_STORE: 's3://bucket/prefix', 'memory' or a directory"""
+    if spec.startswith('s3://'):
+        bucket, _, prefix = spec[len('s3://'):].partition('/')
+        return S3ResultStore(bucket, prefix or 'twilio-turns')
+    if spec == 'memory':
+        return MemoryResultStore()
+    return FileResultStore(spec)
+
+
+# --- Turn queues --------------------------------------------------------------
+
+
+class LambdaTurnQueue:
+    """Jobs run by an asynchronous (Event) invocation of this same function"""
+
+    def __init__(self, function_name, lambda_client=None):
+        self.function_name = function_name
+        self._client = lambda_client
+
+    def enqueue(self, job):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('lambda')
+        self._client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='Event',
+            Payload=json.dumps(dict(job, action='run_turn'))
+        )
+
+
+class MemoryTurnQueue:
+    """Jobs run on a thread pool in this process"""
+
+    def __init__(self, worker, workers=4):
+        self.worker = worker
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='turn')
+
+    def enqueue(self, job):
+        self.executor.submit(self.worker, job)
+
+
+class FileTurnQueue:
+    """Jobs as JSON files in a directory; a separate process runs them with drain()"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def enqueue(self, job):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    def drain(self, worker):
+        """Run and remove every queued job, oldest first; returns how many ran"""
+        if not os.path.isdir(self.directory):
+            return 0
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith('.json')]
+        ran = 0
+        for path in sorted(paths, key=os.path.getmtime):
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+                os.remove(path)
+            except FileNotFoundError:
+                continue  # another drainer took it
+            worker(job)
+            ran += 1
+        return ran
+
+
+def build_turn_queue(spec, worker, function_name=None):
+    """Turn queue from TURN_QUEUE: 'lambda', 'memory' or a directory"""
+    if spec == 'lambda':
+        return LambdaTurnQueue(function_name)
+    if spec == 'memory':
+        return MemoryTurnQueue(worker)
+    return FileTurnQueue(spec)
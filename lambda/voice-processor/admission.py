@@ -0,0 +1,358 @@
+"""
+Per-tenant admission control and fair scheduling for Bedrock and Polly.
+
+Every clinic shares one Bedrock agent and one Polly account quota, so a
+burst on one DID used to throttle every other clinic. Each service call
+now passes through a FairScheduler first:
+
+  - a fixed number of concurrency slots per service, shared by all tenants
+    (the slice of the account quota this process may use)
+  - a token bucket per tenant (rate, burst), so one tenant's burst waits
+    on its own bucket instead of taking every slot
+  - weighted fair queueing among tenants that are waiting: each tenant's
+    requests carry virtual finish tags advanced by 1/weight, and a free
+    slot goes to the lowest tag whose tenant has a token
+  - strict priority classes ahead of that: urgent turns (emergency
+    language), then handoffs (the caller asking for a person), then normal
+    turns, then background work (predictive and fragment pre-synthesis).
+    Urgent and handoff turns skip the tenant bucket; background work only
+    uses idle slots and never waits
+  - a maximum queue wait per class. A turn that can't be admitted in time
+    is shed with AdmissionRejected rather than left to hit the throttle
+
+Tenant and priority come from the turn: the handler opens turn_scope(did)
+and escalate() raises the priority once the caller's words are known, so
+the reply's synthesis inherits the turn's priority. Work on other threads
+(predictor, fragment warmers) has no scope and runs as background.
+
+Limits are per process. In container mode that is the whole fleet's share
+of the quota on that host; on Lambda each environment carries one turn,
+so there the per-tenant buckets only cap one environment's retries.
+
+    ADMISSION_TENANTS='{"1002": {"weight": 2, "bedrock_rate": 4, "polly_rate": 20}}'
+"""
+
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BEDROCK = 'bedrock'
+POLLY = 'polly'
+
+# Lower runs first
+URGENT = 0
+HANDOFF = 1
+NORMAL = 2
+BACKGROUND = 3
+PRIORITY_NAMES = {URGENT: 'urgent', HANDOFF: 'handoff', NORMAL: 'normal', BACKGROUND: 'background'}
+
+SHARED_TENANT = 'shared'
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true') == 'true'
+ADMISSION_TENANTS = json.loads(os.environ.get('ADMISSION_TENANTS', '{}'))
+# Defaults per service: process-wide concurrency, then per-tenant rate/burst
+ADMISSION_LIMITS = {
+    BEDROCK: {
+        'concurrency': int(os.environ.get('ADMISSION_BEDROCK_CONCURRENCY', '16')),
+        'rate': float(os.environ.get('ADMISSION_BEDROCK_RATE', '4')),
+        'burst': float(os.environ.get('ADMISSION_BEDROCK_BURST', '8')),
+        # A shed agent turn still has to answer well inside the webhook timeout
+        'max_wait': float(os.environ.get('ADMISSION_BEDROCK_MAX_WAIT_SECONDS', '3')),
+    },
+    POLLY: {
+        'concurrency': int(os.environ.get('ADMISSION_POLLY_CONCURRENCY', '32')),
+        'rate': float(os.environ.get('ADMISSION_POLLY_RATE', '16')),
+        'burst': float(os.environ.get('ADMISSION_POLLY_BURST', '32')),
+        'max_wait': float(os.environ.get('ADMISSION_POLLY_MAX_WAIT_SECONDS', '1.5')),
+    },
+}
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '500'))
+# Background work may hold at most this share of a service's slots
+BACKGROUND_SHARE = float(os.environ.get('ADMISSION_BACKGROUND_SHARE', '0.5'))
+# Urgent and handoff turns wait this much longer than the class default before shedding
+PRIORITY_WAIT_FACTOR = 2.0
+
+URGENT_PATTERN = re.compile(
+    r"\b(emergency|urgent|chest pains?|can'?t breathe|trouble breathing|bleeding|overdose|"
+    r"unconscious|suicid\w*|seizure|stroke|911)\b", re.IGNORECASE)
+HANDOFF_PATTERN = re.compile(
+    r"\b(representative|operator|receptionist|real person|human|front desk|"
+    r"(?:talk|speak) (?:to|with) (?:someone|somebody|a person|the office))\b", re.IGNORECASE)
+
+
+class AdmissionRejected(Exception):
+    """A call was shed: its tenant or the service had no capacity within the wait limit"""
+
+    def __init__(self, service, tenant, reason):
+        super().__init__(f"{service} admission shed for tenant {tenant} ({reason})")
+        self.service = service
+        self.tenant = tenant
+        self.reason = reason
+
+
+def turn_priority(text):
+    """Priority class for a caller utterance"""
+    if not text:
+        return NORMAL
+    if URGENT_PATTERN.search(text):
+        return URGENT
+    if HANDOFF_PATTERN.search(text):
+        return HANDOFF
+    return NORMAL
+
+
+# --- Turn scope ---------------------------------------------------------------
+
+_scope = contextvars.ContextVar('admission_scope', default=None)
+
+
+class _Scope:
+    __slots__ = ('tenant', 'priority', 'shed')
+
+    def __init__(self, tenant, priority):
+        self.tenant = tenant
+        self.priority = priority
+        self.shed = False
+
+
+@contextmanager
+def turn_scope(tenant, priority=NORMAL):
+    """Attribute the service calls made on this thread to a tenant's turn"""
+    token = _scope.set(_Scope(tenant or SHARED_TENANT, priority))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def escalate(priority):
+    """Raise the current turn's priority (never lowers it)"""
+    scope = _scope.get()
+    if scope is not None and priority < scope.priority:
+        scope.priority = priority
+
+
+def current():
+    """(tenant, priority) of the current turn; background outside a turn"""
+    scope = _scope.get()
+    if scope is None:
+        return SHARED_TENANT, BACKGROUND
+    return scope.tenant, scope.priority
+
+
+def turn_shed():
+    """True if a call in the current turn was shed"""
+    scope = _scope.get()
+    return scope is not None and scope.shed
+
+
+# --- Scheduling ---------------------------------------------------------------
+
+class TokenBucket:
+    """rate tokens per second up to burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_seconds(self, now):
+        """Until the next token, or None if it never refills"""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else None
+
+
+class _Waiter:
+    __slots__ = ('priority', 'finish', 'seq', 'tenant', 'start', 'granted')
+
+    def __init__(self, priority, finish, seq, tenant, start):
+        self.priority = priority
+        self.finish = finish
+        self.seq = seq
+        self.tenant = tenant
+        self.start = start
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.finish, self.seq) < (other.priority, other.finish, other.seq)
+
+
+class FairScheduler:
+    """Concurrency slots for one service, handed out by priority, tenant token bucket and WFQ tag"""
+
+    def __init__(self, service, concurrency, rate, burst, max_wait, tenants=None, max_queue=ADMISSION_MAX_QUEUE):
+        self.service = service
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.tenants = tenants or {}
+        self.max_queue = max_queue
+        self.inflight = 0
+        self._queue = []
+        self._buckets = {}
+        self._last_finish = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def resize(self, concurrency):
+        """Follow a service's adaptive concurrency limit"""
+        with self._cond:
+            self.concurrency = max(1, concurrency)
+            self._dispatch(time.monotonic())
+
+    def _tenant(self, tenant, key, default):
+        return self.tenants.get(tenant, {}).get(f"{self.service}_{key}", default)
+
+    def _bucket(self, tenant):
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            bucket = self._buckets[tenant] = TokenBucket(self._tenant(tenant, 'rate', self.rate),
+                                                         self._tenant(tenant, 'burst', self.burst))
+        return bucket
+
+    def _max_wait(self, priority):
+        if priority == BACKGROUND:
+            return 0.0
+        if priority < NORMAL:
+            return self.max_wait * PRIORITY_WAIT_FACTOR
+        return self.max_wait
+
+    @contextmanager
+    def admit(self, tenant, priority=NORMAL):
+        """Hold one slot for the duration of the block; raises AdmissionRejected if shed"""
+        self.acquire(tenant, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, tenant, priority=NORMAL):
+        started = time.monotonic()
+        deadline = started + self._max_wait(priority)
+        label = PRIORITY_NAMES[priority]
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._shed(tenant, label, 'queue_full')
+            weight = float(self.tenants.get(tenant, {}).get('weight', 1.0))
+            start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+            waiter = _Waiter(priority, start + 1.0 / weight, next(self._seq), tenant, start)
+            self._last_finish[tenant] = waiter.finish
+            heapq.heappush(self._queue, waiter)
+            while True:
+                now = time.monotonic()
+                self._dispatch(now)
+                if waiter.granted:
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._queue.remove(waiter)
+                    heapq.heapify(self._queue)
+                    reason = 'capacity' if self.inflight >= self.concurrency else 'tenant_rate'
+                    self._shed(tenant, label, reason)
+                # Tokens refill with time, not on release: wake for the next one
+                token_wait = self._bucket(tenant).wait_seconds(now)
+                self._cond.wait(min(remaining, token_wait) if token_wait else remaining)
+        metrics.incr('admission.admitted', service=self.service, priority=label)
+        metrics.observe('admission.queue_ms', (time.monotonic() - started) * 1000, service=self.service,
+                        priority=label)
+
+    def release(self):
+        with self._cond:
+            self.inflight -= 1
+            self._dispatch(time.monotonic())
+
+    def _dispatch(self, now):
+        """Grant free slots to eligible waiters in (priority, finish tag) order"""
+        if self.inflight >= self.concurrency or not self._queue:
+            return
+        granted = False
+        foreground_waiting = False
+        background_limit = max(1, int(self.concurrency * BACKGROUND_SHARE))
+        for waiter in sorted(self._queue):
+            if self.inflight >= self.concurrency:
+                break
+            if waiter.priority == BACKGROUND:
+                if foreground_waiting or self.inflight >= background_limit:
+                    continue
+            bucket = self._bucket(waiter.tenant)
+            if not bucket.take(now) and waiter.priority >= NORMAL:
+                foreground_waiting = foreground_waiting or waiter.priority < BACKGROUND
+                continue
+            waiter.granted = True
+            self.inflight += 1
+            self._virtual_time = max(self._virtual_time, waiter.start)
+            granted = True
+        if granted:
+            self._queue = [waiter for waiter in self._queue if not waiter.granted]
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def _shed(self, tenant, label, reason):
+        metrics.incr('admission.shed', service=self.service, priority=label, reason=reason)
+        metrics.incr('admission.shed_by_tenant', service=self.service, tenant=tenant)
+        scope = _scope.get()
+        if scope is not None:
+            scope.shed = True
+        raise AdmissionRejected(self.service, tenant, reason)
+
+
+class Admission:
+    """One FairScheduler per service; calls are attributed to the current turn scope"""
+
+    def __init__(self, limits=None, tenants=None, enabled=ADMISSION_ENABLED):
+        limits = limits or ADMISSION_LIMITS
+        tenants = ADMISSION_TENANTS if tenants is None else tenants
+        self.enabled = enabled
+        self.schedulers = {service: FairScheduler(service, tenants=tenants, **settings)
+                           for service, settings in limits.items()}
+
+    @contextmanager
+    def admit(self, service, tenant=None, priority=None):
+        """Slot for one call to service; raises AdmissionRejected when shed"""
+        if not self.enabled:
+            yield
+            return
+        scope_tenant, scope_priority = current()
+        with self.schedulers[service].admit(tenant or scope_tenant,
+                                            scope_priority if priority is None else priority):
+            yield
+
+
+def admission_stats():
+    """Admitted, shed and queue time per service and priority class"""
+    stats = {}
+    for name in ('admission.admitted', 'admission.shed'):
+        for dims, count in metrics.counters_by(name).items():
+            labels = dict(dims)
+            entry = stats.setdefault((labels['service'], labels['priority']), {'admitted': 0, 'shed': 0})
+            entry[name.split('.')[1]] += count
+    for (service, priority), entry in stats.items():
+        entry['shed_rate'] = metrics.ratio(entry['shed'], entry['admitted'] + entry['shed'])
+    return stats
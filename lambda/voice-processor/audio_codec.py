@@ -0,0 +1,363 @@
+"""
+Vectorized telephony audio conversion.
+
+Everything numeric here works on numpy int16 arrays; bytes, bytearrays and
+memoryviews are wrapped with np.frombuffer, so decoding an inbound frame or
+framing a WAV never copies the input. Covers what the call paths need:
+
+  - G.711 mu-law / A-law <-> PCM16 (256-entry decode and 64K-entry encode
+    lookup tables, built once)
+  - polyphase resampling between any two integer rates (8 kHz telephony,
+    16 kHz client and Transcribe, 22.05/24 kHz Polly), one-shot or
+    streaming via Resampler
+  - stereo downmix, loudness normalization, RMS energy
+  - WAV parse and framing (PCM16, mu-law and A-law WAV)
+"""
+
+import struct
+from math import gcd
+
+# Imported on first use (_numpy), so WAV framing, the format constants and
+# the Polly/Transcribe paths that never touch raw samples load without it
+np = None
+
+PCM16 = 'pcm16'
+ULAW = 'ulaw'
+ALAW = 'alaw'
+
+_WAV_FORMATS = {1: PCM16, 6: ALAW, 7: ULAW}
+
+# Filter length in taps per output-rate period (per polyphase branch when
+# upsampling, scaled by the decimation factor when downsampling): with the
+# Kaiser window below, ~70 dB stopband from just above the lower Nyquist,
+# so 16 kHz -> 8 kHz keeps 4-8 kHz energy out of the telephony band
+RESAMPLE_TAPS = 48
+KAISER_BETA = 7.0
+# Cutoff as a fraction of the lower Nyquist: the transition band ends at
+# Nyquist instead of straddling it, still passing the 300-3400 Hz voice band
+RESAMPLE_CUTOFF = 0.9
+
+# Up to this many polyphase branches, resample with one strided
+# matrix-vector product per branch instead of gathering every window
+STRIDED_MAX_UP = 8
+
+NORMALIZE_TARGET_DBFS = -20.0
+NORMALIZE_MAX_GAIN_DB = 20.0
+PEAK_LIMIT = 0.97 * 32767
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def as_pcm16(data):
+    """int16 view of PCM16 bytes/bytearray/memoryview (no copy); arrays pass through"""
+    _numpy()
+    if isinstance(data, np.ndarray):
+        return data if data.dtype == np.int16 else data.astype(np.int16)
+    view = memoryview(data)
+    usable = view.nbytes - view.nbytes % 2
+    return np.frombuffer(view[:usable] if usable != view.nbytes else view, dtype='<i2')
+
+
+def _as_uint8(data):
+    _numpy()
+    if isinstance(data, np.ndarray):
+        return data.astype(np.uint8, copy=False)
+    return np.frombuffer(memoryview(data), dtype=np.uint8)
+
+
+# --- G.711 ------------------------------------------------------------------
+
+def _ulaw_decode_table():
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _alaw_decode_table():
+    codes = np.arange(256, dtype=np.int32) ^ 0x55
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = np.where(exponent == 0, (mantissa << 4) + 8, ((mantissa << 4) + 0x108) << np.maximum(exponent - 1, 0))
+    return np.where(codes & 0x80, magnitude, -magnitude).astype(np.int16)
+
+
+# Segment end points of the 14-bit (mu-law) and 13-bit (A-law) G.711 curves
+_ULAW_SEGMENT_END = (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF)
+_ALAW_SEGMENT_END = (0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF)
+
+
+def _ulaw_encode_vector(samples):
+    value = samples.astype(np.int32) >> 2
+    mask = np.where(value < 0, 0x7F, 0xFF)
+    value = np.minimum(np.abs(value), 8159) + 0x21
+    segment = np.searchsorted(_ULAW_SEGMENT_END, value)
+    code = (segment << 4) | ((value >> (segment + 1)) & 0x0F)
+    return (np.where(segment >= 8, 0x7F, code) ^ mask).astype(np.uint8)
+
+
+def _alaw_encode_vector(samples):
+    value = samples.astype(np.int32) >> 3
+    mask = np.where(value >= 0, 0xD5, 0x55)
+    value = np.where(value >= 0, value, -value - 1)
+    segment = np.searchsorted(_ALAW_SEGMENT_END, value)
+    shift = np.where(segment < 2, 1, segment)
+    code = (segment << 4) | ((value >> shift) & 0x0F)
+    return (np.where(segment >= 8, 0x7F, code) ^ mask).astype(np.uint8)
+
+
+_TABLES = {}
+
+
+def _table(name):
+    """G.711 lookup table, built on first use"""
+    if not _TABLES:
+        _numpy()
+        all_pcm16 = np.arange(-32768, 32768, dtype=np.int32)
+        _TABLES.update({
+            'ulaw_decode': _ulaw_decode_table(),
+            'alaw_decode': _alaw_decode_table(),
+            'ulaw_encode': _ulaw_encode_vector(all_pcm16),
+            'alaw_encode': _alaw_encode_vector(all_pcm16),
+        })
+    return _TABLES[name]
+
+
+def ulaw_decode(data):
+    """mu-law bytes -> int16 array"""
+    return _table('ulaw_decode')[_as_uint8(data)]
+
+
+def alaw_decode(data):
+    """A-law bytes -> int16 array"""
+    return _table('alaw_decode')[_as_uint8(data)]
+
+
+def ulaw_encode(pcm):
+    """PCM16 (bytes or int16 array) -> mu-law bytes"""
+    return _table('ulaw_encode')[as_pcm16(pcm).astype(np.int32) + 32768].tobytes()
+
+
+def alaw_encode(pcm):
+    """PCM16 (bytes or int16 array) -> A-law bytes"""
+    return _table('alaw_encode')[as_pcm16(pcm).astype(np.int32) + 32768].tobytes()
+
+
+# --- Level ------------------------------------------------------------------
+
+def rms(pcm):
+    """Root-mean-square energy of PCM16 audio"""
+    samples = as_pcm16(pcm)
+    if not samples.size:
+        return 0.0
+    floats = samples.astype(np.float32)
+    return float(np.sqrt(np.dot(floats, floats) / samples.size))
+
+
+def downmix(pcm, channels):
+    """Interleaved multi-channel PCM16 -> mono int16"""
+    samples = as_pcm16(pcm)
+    if channels == 1:
+        return samples
+    frames = samples[:samples.size - samples.size % channels].reshape(-1, channels)
+    return (frames.astype(np.int32).sum(axis=1) // channels).astype(np.int16)
+
+
+def normalize(pcm, target_dbfs=NORMALIZE_TARGET_DBFS, max_gain_db=NORMALIZE_MAX_GAIN_DB):
+    """Scale to a target RMS level without clipping peaks or boosting line noise unboundedly"""
+    samples = as_pcm16(pcm)
+    level = rms(samples)
+    if level == 0.0:
+        return samples
+    gain = (10 ** (target_dbfs / 20.0) * 32767) / level
+    gain = min(gain, 10 ** (max_gain_db / 20.0))
+    peak = int(np.abs(samples.astype(np.int32)).max())
+    if peak:
+        gain = min(gain, PEAK_LIMIT / peak)
+    return np.clip(np.rint(samples.astype(np.float32) * gain), -32768, 32767).astype(np.int16)
+
+
+# --- Resampling ---------------------------------------------------------------
+
+_FILTERS = {}
+
+
+def branch_taps(up, down, taps=RESAMPLE_TAPS):
+    """Coefficients per polyphase branch: `taps` scaled by the decimation factor"""
+    return taps * -(-down // up)
+
+
+def _polyphase_filter(up, down, taps):
+    """Kaiser-windowed sinc low-pass split into `up` branches of `taps` coefficients"""
+    key = (up, down, taps)
+    if key not in _FILTERS:
+        _numpy()
+        length = up * taps
+        cutoff = RESAMPLE_CUTOFF * 0.5 / max(up, down)
+        n = np.arange(length) - (length - 1) / 2.0
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, KAISER_BETA)
+        h *= up / h.sum()
+        # Branch p holds h[p], h[p + up], h[p + 2 up], ...
+        _FILTERS[key] = h.reshape(taps, up).T.astype(np.float32).copy()
+    return _FILTERS[key]
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler. Keeps filter history and output phase
+    between process() calls, so 20 ms frames resample with no seams. Output
+    lags input by (up * taps - 1) / 2 filter samples at the upsampled rate
+    (3 ms at the default length).
+    """
+
+    def __init__(self, from_rate, to_rate, taps=RESAMPLE_TAPS):
+        _numpy()
+        divisor = gcd(int(from_rate), int(to_rate))
+        self.up = int(to_rate) // divisor
+        self.down = int(from_rate) // divisor
+        taps = branch_taps(self.up, self.down, taps)
+        self.taps = taps
+        # Branches reversed so they line up with oldest-first input windows
+        self.kernels = _polyphase_filter(self.up, self.down, taps)[:, ::-1].copy()
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+        # Next output position in 1/up input-sample units, relative to the buffer start
+        self._position = (taps - 1) * self.up
+
+    def process(self, pcm):
+        """Resample the next chunk; returns int16"""
+        samples = as_pcm16(pcm)
+        if self.up == self.down:
+            return samples
+        buffer = np.concatenate((self._history, samples.astype(np.float32)))
+        # Every phase of the newest sample can be computed from what we have
+        last = buffer.size * self.up - 1
+        count = max(0, (last - self._position) // self.down + 1)
+        positions = self._position + self.down * np.arange(count, dtype=np.int64)
+        base = positions // self.up
+        phase = positions % self.up
+
+        # windows[j] = buffer[j .. j + taps - 1]; output i ends at base_i
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)
+        start = base - self.taps + 1
+        if self.up <= STRIDED_MAX_UP:
+            # Outputs r, r + up, r + 2 up ... share a branch and sit `down`
+            # inputs apart: one matrix-vector product per branch on a strided view
+            output = np.empty(count, dtype=np.float32)
+            for r in range(min(self.up, count)):
+                rows = len(range(r, count, self.up))
+                output[r::self.up] = windows[start[r]::self.down][:rows] @ self.kernels[phase[r]]
+        else:
+            output = np.einsum('ij,ij->i', windows[start], self.kernels[phase])
+
+        keep = self.taps - 1
+        self._position += self.down * count - (buffer.size - keep) * self.up
+        self._history = buffer[buffer.size - keep:].copy()
+        return np.clip(np.rint(output), -32768, 32767).astype(np.int16)
+
+
+def resample(pcm, from_rate, to_rate, taps=RESAMPLE_TAPS):
+    """One-shot resample of PCM16 audio between integer sample rates"""
+    if int(from_rate) == int(to_rate):
+        return as_pcm16(pcm)
+    return Resampler(from_rate, to_rate, taps).process(pcm)
+
+
+# --- WAV ----------------------------------------------------------------------
+
+def wav_header(data_bytes, sample_rate, channels=1, encoding=PCM16):
+    """44-byte RIFF header (58 for G.711, which carries a fact chunk)"""
+    if encoding == PCM16:
+        fmt = struct.pack('<HHIIHH', 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16)
+        return struct.pack('<4sI4s4sI', b'RIFF', 36 + data_bytes, b'WAVE', b'fmt ', 16) + fmt + \
+            struct.pack('<4sI', b'data', data_bytes)
+    tag = 7 if encoding == ULAW else 6
+    fmt = struct.pack('<HHIIHHH', tag, channels, sample_rate, sample_rate * channels, channels, 8, 0)
+    fact = struct.pack('<4sII', b'fact', 4, data_bytes // channels)
+    return struct.pack('<4sI4s4sI', b'RIFF', 50 + data_bytes, b'WAVE', b'fmt ', 18) + fmt + fact + \
+        struct.pack('<4sI', b'data', data_bytes)
+
+
+def wav_bytes(audio, sample_rate, channels=1, encoding=PCM16):
+    """Frame PCM16 samples (or already-encoded G.711 bytes) as a WAV file"""
+    payload = as_pcm16(audio).tobytes() if encoding == PCM16 else bytes(audio)
+    return wav_header(len(payload), sample_rate, channels, encoding) + payload
+
+
+def read_wav(data):
+    """
+    Parse a WAV file. Returns (payload, sample_rate, channels, encoding) where
+    payload is a zero-copy memoryview of the data chunk.
+    """
+    view = memoryview(data)
+    if view.nbytes < 12 or bytes(view[0:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        raise ValueError('not a RIFF/WAVE file')
+    offset = 12
+    fmt = None
+    while offset + 8 <= view.nbytes:
+        chunk_id = bytes(view[offset:offset + 4])
+        size = struct.unpack_from('<I', view, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            tag, channels, sample_rate = struct.unpack_from('<HHI', view, body)
+            bits = struct.unpack_from('<H', view, body + 14)[0]
+            if tag == 0xFFFE and size >= 40:
+                tag = struct.unpack_from('<H', view, body + 24)[0]  # WAVE_FORMAT_EXTENSIBLE sub-format
+            if tag not in _WAV_FORMATS or (tag == 1 and bits != 16):
+                raise ValueError(f'unsupported WAV encoding (format {tag}, {bits} bits)')
+            fmt = (sample_rate, channels, _WAV_FORMATS[tag])
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError('WAV data chunk before fmt chunk')
+            end = min(body + size, view.nbytes)
+            return (view[body:end],) + fmt
+        offset = body + size + (size & 1)
+    raise ValueError('WAV file has no data chunk')
+
+
+# --- One-call conversion ------------------------------------------------------
+
+def decode(data, encoding):
+    """Raw PCM16 / mu-law / A-law bytes -> int16 array"""
+    if encoding == ULAW:
+        return ulaw_decode(data)
+    if encoding == ALAW:
+        return alaw_decode(data)
+    return as_pcm16(data)
+
+
+def encode(pcm, encoding):
+    """int16 array -> raw PCM16 / mu-law / A-law bytes"""
+    if encoding == ULAW:
+        return ulaw_encode(pcm)
+    if encoding == ALAW:
+        return alaw_encode(pcm)
+    return as_pcm16(pcm).tobytes()
+
+
+def convert(data, src_encoding, src_rate, dst_encoding, dst_rate, channels=1, loudness=False):
+    """
+    Convert raw audio between encodings and rates in one pass: decode,
+    downmix, resample, optionally normalize, encode.
+    """
+    pcm = downmix(decode(data, src_encoding), channels)
+    pcm = resample(pcm, src_rate, dst_rate)
+    if loudness:
+        pcm = normalize(pcm)
+    return encode(pcm, dst_encoding)
+
+
+def to_wav(data, encoding, sample_rate, channels=1, target_rate=None):
+    """Raw or WAV audio -> mono PCM16 WAV bytes at target_rate (default: unchanged)"""
+    if encoding == 'wav':
+        payload, sample_rate, channels, encoding = read_wav(data)
+        data = payload
+    pcm = downmix(decode(data, encoding), channels)
+    rate = target_rate or sample_rate
+    return wav_bytes(resample(pcm, sample_rate, rate), rate)
@@ -0,0 +1,132 @@
+"""
+Audio delivery: hand synthesized speech to each channel the way it needs it.
+
+Every turn used to put the reply in S3 under a random key and presign a
+URL, even on the direct and text paths that also return the audio inline.
+Only URL consumers (Amazon Connect prompts, Twilio <Play>) need a URL:
+
+  inline   web and desktop clients get base64 bytes in the response; no S3
+  stream   the media server sends PCM frames itself; no S3
+  url      Connect and Twilio get a URL, created only when asked for
+
+URLs are content-addressed (speech/<sha256>.<ext>), so a prompt already
+uploaded by this container is never written again and its presigned URL
+is reused until close to expiry. With AUDIO_PROXY_BASE_URL set (container
+mode), URLs point at this process's /audio/<id> route instead: the bytes
+stay in memory and S3 is not touched at all.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from tts_profiles import get_profile
+
+logger = logging.getLogger(__name__)
+
+INLINE = 'inline'
+STREAM = 'stream'
+URL = 'url'
+
+# How each output profile's consumer takes its audio
+PROFILE_DELIVERY = {
+    'connect': URL,
+    'twilio': URL,
+    'stream': STREAM,
+    'web': INLINE,
+    'desktop': INLINE,
+}
+
+AUDIO_URL_TTL_SECONDS = int(os.environ.get('AUDIO_URL_TTL_SECONDS', '3600'))
+# Presigned URLs are reused until they have less than this left
+AUDIO_URL_MIN_REMAINING_SECONDS = int(os.environ.get('AUDIO_URL_MIN_REMAINING_SECONDS', '600'))
+AUDIO_PROXY_BASE_URL = os.environ.get('AUDIO_PROXY_BASE_URL', '')
+AUDIO_PROXY_MAX_BYTES = int(os.environ.get('AUDIO_PROXY_MAX_BYTES', str(64 * 1024 * 1024)))
+AUDIO_URL_CACHE_SIZE = int(os.environ.get('AUDIO_URL_CACHE_SIZE', '2048'))
+
+
+def delivery_for(profile):
+    return PROFILE_DELIVERY.get(profile, INLINE)
+
+
+def audio_id(audio, profile):
+    """Content address of finished audio; the profile picks the extension"""
+    return f"{hashlib.sha256(audio).hexdigest()[:32]}.{get_profile(profile)['extension']}"
+
+
+class AudioDelivery:
+    """Lazily uploaded, cached audio URLs plus the in-memory store behind the proxy route"""
+
+    def __init__(self, s3, bucket, proxy_base_url=AUDIO_PROXY_BASE_URL, ttl_seconds=AUDIO_URL_TTL_SECONDS):
+        self.s3 = s3
+        self.bucket = bucket
+        self.proxy_base_url = proxy_base_url.rstrip('/')
+        self.ttl_seconds = ttl_seconds
+        self._urls = OrderedDict()  # audio id -> (url, expires_at)
+        self._proxied = OrderedDict()  # audio id -> (bytes, content type)
+        self._proxied_bytes = 0
+        self._lock = threading.Lock()
+
+    def url(self, audio, profile):
+        """A URL for the audio, uploading it only if this container has not already"""
+        if not audio:
+            return None
+        key = audio_id(audio, profile)
+        if self.proxy_base_url:
+            self._keep(key, audio, get_profile(profile)['content_type'])
+            metrics.incr('delivery.proxy', profile=profile)
+            return f"{self.proxy_base_url}/audio/{key}"
+
+        now = time.time()
+        with self._lock:
+            cached = self._urls.get(key)
+            if cached and cached[1] - now > AUDIO_URL_MIN_REMAINING_SECONDS:
+                self._urls.move_to_end(key)
+                metrics.incr('delivery.url_cached', profile=profile)
+                return cached[0]
+
+        object_key = f"speech/{key}"
+        if cached is None:
+            # Content-addressed, so an expiring URL can be re-signed without a second write
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=object_key,
+                Body=audio,
+                ContentType=get_profile(profile)['content_type']
+            )
+            metrics.incr('delivery.s3_put', profile=profile)
+            metrics.incr('delivery.s3_bytes', len(audio), profile=profile)
+        url = self.s3.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': object_key},
+            ExpiresIn=self.ttl_seconds
+        )
+        with self._lock:
+            self._urls[key] = (url, now + self.ttl_seconds)
+            while len(self._urls) > AUDIO_URL_CACHE_SIZE:
+                self._urls.popitem(last=False)
+        return url
+
+    def fetch(self, key):
+        """(bytes, content type) for the proxy route, or None once evicted"""
+        with self._lock:
+            item = self._proxied.get(key)
+            if item is not None:
+                self._proxied.move_to_end(key)
+        metrics.incr('delivery.proxy_fetch' if item else 'delivery.proxy_miss')
+        return item
+
+    def _keep(self, key, audio, content_type):
+        with self._lock:
+            if key in self._proxied:
+                self._proxied.move_to_end(key)
+                return
+            self._proxied[key] = (audio, content_type)
+            self._proxied_bytes += len(audio)
+            while self._proxied_bytes > AUDIO_PROXY_MAX_BYTES and len(self._proxied) > 1:
+                _, (evicted, _) = self._proxied.popitem(last=False)
+                self._proxied_bytes -= len(evicted)
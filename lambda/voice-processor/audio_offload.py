@@ -0,0 +1,236 @@
+"""
+Process-pool offload for CPU-bound audio stages.
+
+Base64 decode/encode of whole utterances, WAV framing with resampling for
+Transcribe, and PCM -> mu-law/WAV finishing of Polly output all hold the
+GIL. In a process that carries many calls (server.py) they stall the
+event loop and every other call's turn. With AUDIO_OFFLOAD=process these
+stages run on a pool of worker processes:
+
+  - the pool is started (and every worker has imported numpy and the
+    codec tables) before the first turn, not on it
+  - payloads travel through shared-memory segments, not pickled through
+    the pool's pipe; the caller writes the input into a segment, the
+    worker writes the result into a second one, and only the stage name,
+    segment names and sizes cross the pipe. Segments are reused from a
+    small free list, and workers keep them attached
+  - payloads under AUDIO_OFFLOAD_MIN_BYTES run inline: for a short prompt
+    the hop costs more than the work
+
+A Lambda execution environment has no /dev/shm and runs one turn at a
+time, so the default there stays inline (AUDIO_OFFLOAD=off).
+"""
+
+import base64
+import binascii
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import audio_codec
+import metrics
+from tts_profiles import finish_audio
+
+logger = logging.getLogger(__name__)
+
+AUDIO_OFFLOAD = os.environ.get('AUDIO_OFFLOAD', 'off')
+AUDIO_OFFLOAD_WORKERS = int(os.environ.get('AUDIO_OFFLOAD_WORKERS', str(os.cpu_count() or 1)))
+# ~2 s of 16 kHz PCM16: below this the process hop costs more than the stage
+AUDIO_OFFLOAD_MIN_BYTES = int(os.environ.get('AUDIO_OFFLOAD_MIN_BYTES', str(64 * 1024)))
+# Free segments kept for reuse, per process
+AUDIO_OFFLOAD_SEGMENTS = int(os.environ.get('AUDIO_OFFLOAD_SEGMENTS', '32'))
+SEGMENT_MIN_BYTES = 64 * 1024
+WAV_HEADER_SLACK = 64
+
+
+# --- Stages -------------------------------------------------------------------
+# Each stage takes the payload as a memoryview plus plain arguments, returns
+# a bytes-like result, and has an upper bound on its output size so the
+# caller can size the output segment up front.
+
+def _b64decode(view):
+    return binascii.a2b_base64(view)
+
+
+def _b64encode(view):
+    return base64.b64encode(view)
+
+
+def _transcribe_wav(view, encoding, sample_rate, target_rate):
+    return audio_codec.to_wav(view, encoding, sample_rate, target_rate=target_rate)
+
+
+def _finish_audio(view, profile):
+    return finish_audio(view, profile)
+
+
+STAGES = {
+    'b64decode': (_b64decode, lambda size, *args: size * 3 // 4 + 3),
+    'b64encode': (_b64encode, lambda size, *args: (size + 2) // 3 * 4),
+    # Output is never above the source rate, and a sample is at least one input byte
+    'transcribe_wav': (_transcribe_wav, lambda size, *args: 2 * size + WAV_HEADER_SLACK),
+    'finish_audio': (_finish_audio, lambda size, *args: size + WAV_HEADER_SLACK),
+}
+
+
+# --- Worker side ----------------------------------------------------------------
+
+_attached = OrderedDict()  # segment name -> SharedMemory, in each worker
+
+
+def _attach(name):
+    segment = _attached.get(name)
+    if segment is None:
+        # Workers share the parent's resource tracker, so attaching doesn't take ownership
+        segment = shared_memory.SharedMemory(name=name)
+        _attached[name] = segment
+        while len(_attached) > 2 * AUDIO_OFFLOAD_SEGMENTS:
+            _attached.popitem(last=False)[1].close()
+    else:
+        _attached.move_to_end(name)
+    return segment
+
+
+def _warm(_):
+    return os.getpid()
+
+
+def _run_stage(stage, in_name, in_size, out_name, out_capacity, args):
+    """Worker: stage over one segment into another; returns the output size, or the bytes if they don't fit"""
+    view = _attach(in_name).buf[:in_size]
+    result = None
+    try:
+        # Compressed audio passes through finish_audio as the input view itself
+        result = STAGES[stage][0](view, *args)
+        size = len(result)
+        if size > out_capacity:
+            return bytes(result)
+        _attach(out_name).buf[:size] = result
+        return size
+    finally:
+        del result
+        view.release()
+
+
+# --- Caller side ----------------------------------------------------------------
+
+class _Segments:
+    """Free list of shared-memory segments, sized in powers of two"""
+
+    def __init__(self, max_free=AUDIO_OFFLOAD_SEGMENTS):
+        self.max_free = max_free
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        with self._lock:
+            for i, segment in enumerate(self._free):
+                if segment.size >= size:
+                    return self._free.pop(i)
+        capacity = SEGMENT_MIN_BYTES
+        while capacity < size:
+            capacity *= 2
+        return shared_memory.SharedMemory(create=True, size=capacity)
+
+    def release(self, segment):
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(segment)
+                self._free.sort(key=lambda s: s.size)
+                return
+        segment.close()
+        segment.unlink()
+
+    def close(self):
+        with self._lock:
+            free, self._free = self._free, []
+        for segment in free:
+            segment.close()
+            segment.unlink()
+
+
+class AudioOffload:
+    """Runs audio stages inline or on a pre-started process pool, by payload size"""
+
+    def __init__(self, mode=AUDIO_OFFLOAD, workers=AUDIO_OFFLOAD_WORKERS, min_bytes=AUDIO_OFFLOAD_MIN_BYTES):
+        self.mode = mode
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._pool = None
+        self._segments = _Segments()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode == 'process'
+
+    def start(self):
+        """Start every worker now so no turn pays for a process start or numpy import"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(
+                    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+                if context.get_start_method() == 'forkserver':
+                    # Workers fork from a server that already imported the stages
+                    context.set_forkserver_preload(['audio_offload'])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            pool = self._pool
+        started = time.time()
+        try:
+            pids = set(pool.map(_warm, range(self.workers * 2)))
+        except Exception as e:
+            logger.error(f"Audio offload pool failed to start, running inline: {str(e)}")
+            self.mode = 'off'
+            return None
+        logger.info(f"Audio offload pool started: {len(pids)} workers in {(time.time() - started) * 1000:.0f} ms")
+        return pids
+
+    def run(self, stage, data, *args):
+        """Result of STAGES[stage] over data (bytes-like, or an ASCII str)"""
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        size = len(data)
+        started = time.time()
+        if not self.enabled or size < self.min_bytes:
+            result = STAGES[stage][0](data, *args)
+            where = 'inline'
+        else:
+            result, where = self._offload(stage, data, size, args)
+        metrics.incr('offload.stage', stage=stage, where=where)
+        metrics.observe('offload.stage_ms', (time.time() - started) * 1000, stage=stage, where=where)
+        return bytes(result) if not isinstance(result, bytes) else result
+
+    def _offload(self, stage, data, size, args):
+        if self._pool is None:
+            self.start()
+        source = self._segments.acquire(size)
+        target = self._segments.acquire(STAGES[stage][1](size, *args))
+        try:
+            source.buf[:size] = data
+            out = self._pool.submit(_run_stage, stage, source.name, size, target.name, target.size, args).result()
+            if isinstance(out, bytes):
+                return out, 'process'
+            return bytes(target.buf[:out]), 'process'
+        except BrokenProcessPool as e:
+            # A worker died (OOM kill): keep serving turns inline
+            logger.error(f"Audio offload pool broken, running inline: {str(e)}")
+            self.mode = 'off'
+            return STAGES[stage][0](data, *args), 'inline'
+        finally:
+            self._segments.release(source)
+            self._segments.release(target)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+        self._segments.close()
@@ -0,0 +1,93 @@
+"""
+Barge-in: let the caller interrupt the agent mid-reply.
+
+While a reply is playing, a BargeInDetector watches the inbound audio for
+sustained caller speech. When it fires, the reply's PlaybackTurn is
+cancelled: sentences not yet sent to Polly are never synthesized, pending
+work registered on the turn (synthesis or upload futures) is cancelled, and
+frames already queued for playout are dropped. The interruption itself is
+already flowing into transcription, so it becomes the next turn.
+"""
+
+import re
+import threading
+
+from endpointing import MIN_SPEECH_ENERGY, NOISE_MULTIPLIER
+
+# Caller speech needed during playback before it counts as an interruption;
+# shorter bursts are backchannel ("mm-hm") or line noise
+BARGE_IN_MS = 240
+
+# Inbound energy must also clear this multiple of the noise floor measured
+# while the agent was speaking, which absorbs handset echo of our own audio
+ECHO_MARGIN = 2.0
+
+# Titles like "Dr. Smith" do not end a sentence
+_SENTENCE_END = re.compile(r'(?<!\bDr\.)(?<!\bMr\.)(?<!\bMs\.)(?<!\bMrs\.)(?<!\bSt\.)(?<=[.!?])\s+')
+
+
+def split_sentences(text):
+    """Split a reply into sentences so synthesis can stop between them"""
+    return [s for s in _SENTENCE_END.split(text.strip()) if s]
+
+
+class PlaybackTurn:
+    """Cancellation scope for one agent reply"""
+
+    def __init__(self, text):
+        self.text = text
+        self.cancelled = False
+        self.synthesized_chars = 0
+        self.saved_chars = 0
+        self.dropped_frames = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def track(self, future):
+        """Register pending work (synthesis, upload) to cancel on barge-in"""
+        with self._lock:
+            if self.cancelled:
+                future.cancel()
+            else:
+                self._pending.append(future)
+        return future
+
+    def synthesized(self, sentence):
+        self.synthesized_chars += len(sentence)
+
+    def cancel(self):
+        """Stop the reply; returns the Polly characters that were never synthesized"""
+        with self._lock:
+            if self.cancelled:
+                return 0
+            self.cancelled = True
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.cancel()
+        self.saved_chars = max(0, len(self.text) - self.synthesized_chars)
+        return self.saved_chars
+
+
+class BargeInDetector:
+    """Sustained caller speech during playback, robust to echo and short noises"""
+
+    def __init__(self, barge_in_ms=BARGE_IN_MS):
+        self.barge_in_ms = barge_in_ms
+        self.noise_floor = MIN_SPEECH_ENERGY / NOISE_MULTIPLIER
+        self.speech_ms = 0.0
+
+    def reset(self):
+        self.speech_ms = 0.0
+
+    def feed(self, energy, frame_ms):
+        """True once the caller has spoken over the agent for barge_in_ms"""
+        threshold = max(MIN_SPEECH_ENERGY, self.noise_floor * NOISE_MULTIPLIER * ECHO_MARGIN)
+        if energy >= threshold:
+            self.speech_ms += frame_ms
+            if self.speech_ms >= self.barge_in_ms:
+                self.speech_ms = 0.0
+                return True
+            return False
+        self.noise_floor += 0.05 * (energy - self.noise_floor)
+        self.speech_ms = 0.0
+        return False
@@ -0,0 +1,484 @@
+"""
+Per-call recording and transcript artifacts.
+
+Turn audio used to land in S3 as independent objects under random keys
+(audio/<uuid>.wav, speech/<uuid>.mp3) with nothing tying a call together.
+The artifact writer buffers a call's turns in memory and writes one
+indexed object per call:
+
+  calls/<yyyy>/<mm>/<dd>/<session_id>/<started_ms>.ivrcall
+
+    b'IVRCALL1'                 8-byte magic
+    audio                       8 kHz G.711 mu-law, turn segments back to back
+    transcript                  JSONL, one line per turn
+    index                       JSON: per-turn audio offsets and the transcript span
+    <uint32 index length>IVRI   8-byte footer
+
+Offsets are absolute, so ops can fetch the whole call in one read or range
+read the footer, the index and then any single turn. Short calls are one
+PUT; once the buffered audio reaches CALL_ARTIFACT_PART_BYTES the writer
+switches to a multipart upload and ships parts as the call goes, so memory
+stays bounded on long calls.
+
+Audio is stored as mu-law rather than FLAC or Opus: neither Polly nor the
+Lambda runtime has an encoder without native dependencies, and mu-law at
+8 kHz is exactly what the phone leg carried, at half the size of PCM16.
+Turns without decodable audio (mp3/ogg speech, Connect recordings) are
+kept as transcript lines only.
+
+A Lambda container only sees the turns routed to it and may be recycled
+at any time, so the Lambda handler runs the writer in fragments mode: the
+turns of each invocation are written at once as a small fragment in the
+same format,
+
+  calls/fragments/<session_id>/<started_ms>-<id>.ivrcall
+
+and the end of the call (end_call, or the idle sweep of a container that
+wrote fragments) merges every fragment of the call, whichever container
+wrote it, into the one artifact and deletes them. A call handled by a
+single container with nothing stored yet is written directly.
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import audio_codec
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 's3' (default), 'off', or a directory for the local-filesystem backend
+CALL_ARTIFACTS = os.environ.get('CALL_ARTIFACTS', 's3')
+CALL_ARTIFACT_PREFIX = os.environ.get('CALL_ARTIFACT_PREFIX', 'calls')
+# S3's minimum multipart part size; about 11 minutes of mu-law audio
+CALL_ARTIFACT_PART_BYTES = int(os.environ.get('CALL_ARTIFACT_PART_BYTES', str(5 * 1024 * 1024)))
+CALL_ARTIFACT_IDLE_SECONDS = int(os.environ.get('CALL_ARTIFACT_IDLE_SECONDS', '900'))
+CALL_ARTIFACT_MAX_CALLS = int(os.environ.get('CALL_ARTIFACT_MAX_CALLS', '2000'))
+
+MAGIC = b'IVRCALL1'
+FOOTER = struct.Struct('<I4s')
+FOOTER_MAGIC = b'IVRI'
+SAMPLE_RATE = 8000
+CONTENT_TYPE = 'application/octet-stream'
+
+
+def artifact_key(session_id, started_at, prefix=CALL_ARTIFACT_PREFIX):
+    day = datetime.fromtimestamp(started_at, tz=timezone.utc).strftime('%Y/%m/%d')
+    return f"{prefix}/{day}/{session_id}/{int(started_at * 1000)}.ivrcall"
+
+
+def fragment_prefix(session_id, prefix=CALL_ARTIFACT_PREFIX):
+    return f"{prefix}/fragments/{session_id}/"
+
+
+def fragment_key(session_id, started_at):
+    return f"{fragment_prefix(session_id)}{int(started_at * 1000):013d}-{uuid.uuid4().hex[:8]}.ivrcall"
+
+
+def to_ulaw(audio, encoding, sample_rate=SAMPLE_RATE):
+    """8 kHz mu-law from PCM16/G.711 bytes or a WAV file; None for compressed formats"""
+    if not audio:
+        return None
+    channels = 1
+    if encoding == 'wav':
+        try:
+            audio, sample_rate, channels, encoding = audio_codec.read_wav(audio)
+        except ValueError:
+            return None
+    if encoding == 'pcm':
+        encoding = audio_codec.PCM16
+    if encoding not in (audio_codec.PCM16, audio_codec.ULAW, audio_codec.ALAW):
+        return None
+    if encoding == audio_codec.ULAW and sample_rate == SAMPLE_RATE and channels == 1:
+        return bytes(audio)
+    return audio_codec.convert(audio, encoding, sample_rate, audio_codec.ULAW, SAMPLE_RATE, channels)
+
+
+# --- Backends -----------------------------------------------------------------
+
+class S3ArtifactBackend:
+    """Single PUT for short calls, multipart upload for long ones"""
+
+    def __init__(self, s3, bucket):
+        self.s3 = s3
+        self.bucket = bucket
+
+    def put(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=CONTENT_TYPE)
+
+    def start(self, key):
+        response = self.s3.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=CONTENT_TYPE)
+        return response['UploadId']
+
+    def upload_part(self, key, upload_id, number, data):
+        response = self.s3.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                       PartNumber=number, Body=data)
+        return response['ETag']
+
+    def complete(self, key, upload_id, etags):
+        parts = [{'PartNumber': n, 'ETag': etag} for n, etag in enumerate(etags, 1)]
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                          MultipartUpload={'Parts': parts})
+
+    def abort(self, key, upload_id):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+    def get(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def list(self, prefix):
+        keys = []
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(item['Key'] for item in page.get('Contents', []))
+        return keys
+
+    def delete(self, keys):
+        for start in range(0, len(keys), 1000):
+            self.s3.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True})
+
+
+class LocalArtifactBackend:
+    """Artifacts as files under a directory; parts append to a .partial file"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def start(self, key):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path + '.partial', 'wb').close()
+        return path + '.partial'
+
+    def upload_part(self, key, upload_id, number, data):
+        with open(upload_id, 'ab') as f:
+            f.write(data)
+        return str(number)
+
+    def complete(self, key, upload_id, etags):
+        os.replace(upload_id, self._path(key))
+
+    def abort(self, key, upload_id):
+        if os.path.exists(upload_id):
+            os.remove(upload_id)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def list(self, prefix):
+        directory = self._path(prefix.rstrip('/'))
+        if not os.path.isdir(directory):
+            return []
+        return [f"{prefix.rstrip('/')}/{name}" for name in os.listdir(directory) if not name.endswith('.partial')]
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+def artifact_backend(s3, bucket, spec=CALL_ARTIFACTS):
+    """Backend from CALL_ARTIFACTS: 's3', 'off' or a local directory"""
+    if not spec or spec == 'off':
+        return None
+    if spec == 's3':
+        return S3ArtifactBackend(s3, bucket)
+    return LocalArtifactBackend(spec)
+
+
+# --- Writer -------------------------------------------------------------------
+
+class CallArtifact:
+    """One call's buffered audio and transcript, plus its multipart state"""
+
+    def __init__(self, session_id, did, started_at, key=None):
+        self.session_id = session_id
+        self.did = did
+        self.started_at = started_at
+        self.touched_at = started_at
+        self.key = key or artifact_key(session_id, started_at)
+        self.turns = []
+        self.pending = bytearray(MAGIC)
+        self.written = 0  # bytes already shipped as parts
+        self.upload_id = None
+        self.etags = []
+        self.failed = False  # an upload failed; the rest of the call is dropped
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.written + len(self.pending)
+
+    def add(self, role, text, audio, at):
+        turn = {'turn': len(self.turns), 'role': role, 'text': text,
+                't_ms': int((at - self.started_at) * 1000)}
+        if audio and not self.failed:
+            turn.update(audio_offset=self.size, audio_bytes=len(audio),
+                        audio_ms=len(audio) * 1000 // SAMPLE_RATE)
+            self.pending.extend(audio)
+        self.turns.append(turn)
+        self.touched_at = at
+
+    def take_part(self, part_bytes):
+        """Pending bytes to ship as the next part, once there are enough"""
+        if self.failed or len(self.pending) < part_bytes:
+            return None
+        part = bytes(self.pending)
+        self.written += len(part)
+        self.pending = bytearray()
+        return part
+
+    def tail(self):
+        """Transcript, index and footer closing the artifact"""
+        transcript = ''.join(json.dumps(turn) + '\n' for turn in self.turns).encode('utf-8')
+        transcript_offset = self.size
+        index = json.dumps({
+            'version': 1,
+            'session_id': self.session_id,
+            'did': self.did,
+            'started_at': self.started_at,
+            'encoding': audio_codec.ULAW,
+            'sample_rate': SAMPLE_RATE,
+            'transcript': {'offset': transcript_offset, 'length': len(transcript)},
+            'turns': self.turns,
+        }).encode('utf-8')
+        return transcript + index + FOOTER.pack(len(index), FOOTER_MAGIC)
+
+
+class CallArtifactWriter:
+    """
+    Buffers turns per call and writes one artifact when the call ends or goes
+    idle. With fragments=True (Lambda) flush() writes each invocation's turns
+    as a durable fragment and finish() merges the call's fragments.
+    """
+
+    def __init__(self, backend, part_bytes=CALL_ARTIFACT_PART_BYTES, idle_seconds=CALL_ARTIFACT_IDLE_SECONDS,
+                 max_calls=CALL_ARTIFACT_MAX_CALLS, fragments=False):
+        self.backend = backend
+        self.part_bytes = part_bytes
+        self.idle_seconds = idle_seconds
+        self.max_calls = max_calls
+        self.fragments = fragments
+        self._calls = {}
+        self._fragmented = {}  # session_id -> last fragment time, for calls this process wrote fragments of
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def record(self, session_id, did, role, text, audio=None, encoding=audio_codec.ULAW,
+               sample_rate=SAMPLE_RATE, at=None):
+        """Add a caller or agent turn; audio is any PCM16/G.711/WAV the codec can read"""
+        if not self.enabled:
+            return
+        at = at or time.time()
+        ulaw = to_ulaw(audio, encoding, sample_rate)
+        with self._lock:
+            call = self._calls.get(session_id)
+            if call is None:
+                if len(self._calls) >= self.max_calls:
+                    oldest = min(self._calls, key=lambda sid: self._calls[sid].touched_at)
+                    evicted = self._calls.pop(oldest)
+                else:
+                    evicted = None
+                key = fragment_key(session_id, at) if self.fragments else None
+                call = self._calls[session_id] = CallArtifact(session_id, did, at, key)
+            else:
+                evicted = None
+        if evicted is not None:
+            self._close(evicted)
+        with call.lock:
+            call.add(role, text or '', ulaw, at)
+            part = call.take_part(self.part_bytes)
+            if part is not None:
+                self._ship_part(call, part)
+        metrics.incr('artifact.turns', role=role)
+
+    def flush(self, session_id):
+        """Write a call's buffered turns as a fragment (fragments mode); returns its key"""
+        if not self.enabled or not self.fragments:
+            return None
+        with self._lock:
+            call = self._calls.pop(session_id, None)
+        return self._close(call) if call else None
+
+    def finish(self, session_id):
+        """Write a call's artifact; returns its key, or None if nothing was recorded"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            call = self._calls.pop(session_id, None)
+            self._fragmented.pop(session_id, None)
+        if not self.fragments:
+            return self._write(call) if call else None
+        try:
+            stored = self.backend.list(fragment_prefix(session_id))
+        except Exception as e:
+            logger.error(f"Artifact fragment listing failed for {session_id}: {str(e)}")
+            return None
+        if call is not None and not stored and call.upload_id is None:
+            # Every turn of the call is right here: write the artifact directly
+            call.key = artifact_key(session_id, call.started_at)
+            return self._write(call)
+        if call is not None:
+            written = self._write(call, fragment=True)
+            stored += [written] if written else []
+        return self._merge(session_id, stored) if stored else None
+
+    def sweep(self):
+        """Write artifacts for calls idle past the timeout"""
+        now = time.time()
+        with self._lock:
+            idle = [sid for sid, call in self._calls.items() if now - call.touched_at > self.idle_seconds]
+            expired = [self._calls.pop(sid) for sid in idle]
+            ended = [sid for sid, at in self._fragmented.items() if now - at > self.idle_seconds]
+        for call in expired:
+            self._close(call)
+        for session_id in ended:
+            self.finish(session_id)
+        return len(expired) + len(ended)
+
+    def finish_all(self):
+        """On shutdown: artifacts for every buffered call, or fragments while calls may go on elsewhere"""
+        with self._lock:
+            calls = list(self._calls.values())
+            self._calls.clear()
+        return [self._close(call) for call in calls]
+
+    def _close(self, call):
+        """Write a call that leaves the buffer: as a fragment in fragments mode, else as its artifact"""
+        if not self.fragments:
+            return self._write(call)
+        key = self._write(call, fragment=True)
+        if key:
+            with self._lock:
+                self._fragmented[call.session_id] = call.touched_at
+        return key
+
+    def _merge(self, session_id, keys):
+        """One artifact from a call's fragments, turns in time order; the fragments are then deleted"""
+        turns = []
+        for n, key in enumerate(sorted(keys)):
+            try:
+                data = self.backend.get(key)
+                meta, transcript = read_artifact(data)
+            except Exception as e:
+                logger.error(f"Artifact fragment {key} unreadable: {str(e)}")
+                continue
+            for turn in transcript:
+                at = meta['started_at'] + turn['t_ms'] / 1000
+                turns.append(((at, n, turn['turn']), meta['did'], turn['role'], turn['text'], turn_ulaw(data, turn)))
+        if not turns:
+            return None
+        turns.sort(key=lambda turn: turn[0])
+        call = CallArtifact(session_id, turns[0][1], turns[0][0][0])
+        for (at, _, _), _, role, text, audio in turns:
+            call.add(role, text, audio, at)
+            part = call.take_part(self.part_bytes)
+            if part is not None:
+                self._ship_part(call, part)
+        key = self._write(call)
+        if key:
+            try:
+                self.backend.delete(list(keys))
+            except Exception as e:
+                logger.warning(f"Artifact fragments of {session_id} not deleted: {str(e)}")
+        return key
+
+    def _ship_part(self, call, part):
+        try:
+            if call.upload_id is None:
+                call.upload_id = self.backend.start(call.key)
+            call.etags.append(self.backend.upload_part(call.key, call.upload_id, len(call.etags) + 1, part))
+            metrics.incr('artifact.put', kind='part')
+            metrics.incr('artifact.bytes', len(part))
+        except Exception as e:
+            logger.error(f"Artifact part upload failed for {call.session_id}: {str(e)}")
+            self._abort(call)
+
+    def _write(self, call, fragment=False):
+        with call.lock:
+            if call.failed:
+                return None
+            try:
+                data = bytes(call.pending) + call.tail()
+                if call.upload_id is None:
+                    self.backend.put(call.key, data)
+                    metrics.incr('artifact.put', kind='put')
+                else:
+                    call.etags.append(self.backend.upload_part(call.key, call.upload_id,
+                                                               len(call.etags) + 1, data))
+                    self.backend.complete(call.key, call.upload_id, call.etags)
+                    metrics.incr('artifact.put', kind='part')
+                metrics.incr('artifact.bytes', len(data))
+                metrics.incr('artifact.fragments' if fragment else 'artifact.calls')
+                return call.key
+            except Exception as e:
+                logger.error(f"Artifact write failed for {call.session_id}: {str(e)}")
+                self._abort(call)
+                return None
+
+    def _abort(self, call):
+        if call.upload_id is not None:
+            try:
+                self.backend.abort(call.key, call.upload_id)
+            except Exception as e:
+                logger.warning(f"Artifact abort failed for {call.session_id}: {str(e)}")
+        call.upload_id = None
+        call.failed = True
+        call.pending = bytearray()
+        metrics.incr('artifact.failed')
+
+
+# --- Reader -------------------------------------------------------------------
+
+def read_index(data):
+    """The index of a whole artifact (or of any suffix holding its tail)"""
+    length, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+    if magic != FOOTER_MAGIC:
+        raise ValueError('not a call artifact')
+    start = len(data) - FOOTER.size - length
+    return json.loads(bytes(data[start:start + length]))
+
+
+def read_artifact(data):
+    """(index, transcript turns) from a whole artifact"""
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError('not a call artifact')
+    index = read_index(data)
+    span = index['transcript']
+    lines = bytes(data[span['offset']:span['offset'] + span['length']]).decode('utf-8').splitlines()
+    return index, [json.loads(line) for line in lines]
+
+
+def turn_ulaw(data, turn):
+    """A turn's raw mu-law audio, or None for text-only turns"""
+    if 'audio_offset' not in turn:
+        return None
+    start = turn['audio_offset']
+    return bytes(data[start:start + turn['audio_bytes']])
+
+
+def turn_audio(data, turn):
+    """A turn's mu-law audio as a playable WAV, or None for text-only turns"""
+    audio = turn_ulaw(data, turn)
+    return audio_codec.wav_bytes(audio, SAMPLE_RATE, encoding=audio_codec.ULAW) if audio is not None else None
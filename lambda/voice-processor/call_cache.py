@@ -0,0 +1,104 @@
+"""
+Per-call cache shared by the stages of a single phone call.
+
+Entries are grouped by session ID and expire together when the call has
+been idle for CALL_CACHE_TTL_SECONDS. Values written by the call-setup
+prefetcher are flagged so we can measure which prefetches were actually
+used (hits) and which were thrown away unread (waste).
+"""
+
+import os
+import threading
+import time
+
+import metrics
+
+CALL_CACHE_TTL_SECONDS = int(os.environ.get('CALL_CACHE_TTL_SECONDS', '900'))
+CALL_CACHE_MAX_CALLS = int(os.environ.get('CALL_CACHE_MAX_CALLS', '5000'))
+
+_MISSING = object()
+
+
+class _CallEntry:
+    __slots__ = ('values', 'prefetched', 'consumed', 'touched_at')
+
+    def __init__(self):
+        self.values = {}
+        self.prefetched = set()
+        self.consumed = set()
+        self.touched_at = time.time()
+
+
+class CallCache:
+    """Session-scoped key/value cache with prefetch hit and waste accounting"""
+
+    def __init__(self, ttl_seconds=CALL_CACHE_TTL_SECONDS, max_calls=CALL_CACHE_MAX_CALLS):
+        self.ttl_seconds = ttl_seconds
+        self.max_calls = max_calls
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def put(self, session_id, key, value, prefetched=False):
+        """Store a value for a call"""
+        with self._lock:
+            entry = self._entry(session_id, create=True)
+            entry.values[key] = value
+            if prefetched:
+                entry.prefetched.add(key)
+
+    def get(self, session_id, key, default=None):
+        """Read a value for a call, recording prefetch hits and misses"""
+        with self._lock:
+            entry = self._entry(session_id)
+            value = entry.values.get(key, _MISSING) if entry else _MISSING
+            if value is _MISSING:
+                metrics.incr('call_cache.miss', key=key)
+                return default
+            if key in entry.prefetched and key not in entry.consumed:
+                entry.consumed.add(key)
+                metrics.incr('prefetch.hit', kind=key)
+            return value
+
+    def has(self, session_id, key):
+        with self._lock:
+            entry = self._entry(session_id)
+            return bool(entry) and key in entry.values
+
+    def end_call(self, session_id):
+        """Drop a call's entries and account for prefetches never read"""
+        with self._lock:
+            entry = self._calls.pop(session_id, None)
+        if entry:
+            self._record_waste(entry)
+
+    def sweep(self):
+        """Expire idle calls; cheap enough to run on every invocation"""
+        now = time.time()
+        expired = []
+        with self._lock:
+            for session_id, entry in list(self._calls.items()):
+                if now - entry.touched_at > self.ttl_seconds:
+                    expired.append(self._calls.pop(session_id))
+        for entry in expired:
+            self._record_waste(entry)
+        return len(expired)
+
+    def _entry(self, session_id, create=False):
+        entry = self._calls.get(session_id)
+        if entry is None and create:
+            if len(self._calls) >= self.max_calls:
+                oldest = min(self._calls, key=lambda s: self._calls[s].touched_at)
+                self._record_waste(self._calls.pop(oldest))
+            entry = self._calls[session_id] = _CallEntry()
+        if entry is not None:
+            entry.touched_at = time.time()
+        return entry
+
+    @staticmethod
+    def _record_waste(entry):
+        for key in entry.prefetched - entry.consumed:
+            metrics.incr('prefetch.wasted', kind=key)
+
+
+# Process-wide cache shared by all handlers in this container
+call_cache = CallCache()
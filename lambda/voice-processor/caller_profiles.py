@@ -0,0 +1,339 @@
+"""
+Returning-caller profile cache.
+
+Profiles are keyed by tenant DID and normalized caller number and hold the
+last known patient name and email plus a preferred doctor or time window.
+The voice processor consults the cache at the start of every agent turn so
+the Bedrock Agent can skip re-asking a repeat patient for details it
+already has.
+
+S3 is the source of truth. A container keeps a record for at most
+CALLER_PROFILE_LOCAL_TTL_SECONDS before reading it again, so an opt-out
+recorded by another container is seen within minutes. remember() always
+re-reads the record and writes it conditionally on its ETag, so it never
+overwrites an opt-out (or another container's update) it has not seen.
+
+Caller ID alone does not prove who is calling (shared and spoofed numbers),
+so the stored name and email only reach the agent once the caller has said
+the stored name on this call (confirms_identity); until then the agent is
+told a returning caller is unconfirmed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TTL_SECONDS = int(os.environ.get('CALLER_PROFILE_TTL_SECONDS', str(90 * 24 * 3600)))
+# How long a container trusts its copy of a record before reading S3 again
+PROFILE_LOCAL_TTL_SECONDS = int(os.environ.get('CALLER_PROFILE_LOCAL_TTL_SECONDS', '300'))
+PROFILE_CACHE_SIZE = int(os.environ.get('CALLER_PROFILE_CACHE_SIZE', '1024'))
+# Conditional writes that lose to another container are retried on a fresh read
+PROFILE_WRITE_ATTEMPTS = 3
+# S3 object tag on profiles (never on opt-out tombstones); the bucket's
+# lifecycle rule expires only objects carrying it
+PROFILE_OBJECT_TAG = 'kind=profile'
+
+# Fields we are willing to remember about a caller
+PROFILE_FIELDS = ('patient_name', 'patient_email', 'preferred_doctor', 'preferred_time')
+# Withheld from the agent until the caller confirms who they are
+IDENTITY_FIELDS = ('patient_name', 'patient_email')
+
+# Caller ID values carriers use when the number is withheld
+WITHHELD_NUMBERS = {'anonymous', 'restricted', 'unknown', 'private', 'unavailable'}
+
+
+def normalize_caller_number(raw_number):
+    """Normalize a caller ID (E.164, national or SIP URI) to +<digits>, or None"""
+    if not raw_number:
+        return None
+
+    number = str(raw_number).strip()
+    if number.lower() in WITHHELD_NUMBERS:
+        return None
+
+    # sip:+15551234567@host;user=phone -> +15551234567
+    if number.lower().startswith(('sip:', 'sips:', 'tel:')):
+        number = number.split(':', 1)[1]
+    number = number.split('@', 1)[0].split(';', 1)[0]
+
+    digits = re.sub(r'\D', '', number)
+    if not digits:
+        return None
+
+    if number.startswith('+'):
+        return f"+{digits}"
+    if len(digits) == 10:
+        # North American national format
+        return f"+1{digits}"
+    if len(digits) == 11 and digits.startswith('1'):
+        return f"+{digits}"
+    if digits.startswith('00'):
+        return f"+{digits[2:]}"
+    # Short extensions (e.g. FreeSWITCH 1000) are kept as-is
+    return digits
+
+
+def caller_digest(number):
+    """Hash a normalized number so raw caller IDs never appear in storage keys"""
+    return hashlib.sha256(number.encode('utf-8')).hexdigest()[:32]
+
+
+class S3ProfileBackend:
+    """Shared profile storage in S3, one small JSON object per caller"""
+
+    def __init__(self, s3_client, bucket, prefix='profiles'):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, tenant, digest):
+        return f"{self.prefix}/{tenant}/{digest}.json"
+
+    def get(self, tenant, digest):
+        """(record, etag), or (None, None) when the caller has no object"""
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(tenant, digest))
+            return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+        except self.s3.exceptions.NoSuchKey:
+            return None, None
+
+    def put(self, tenant, digest, record, etag=None, conditional=False):
+        """
+        Write a record. conditional=True only writes if the object is still
+        the one read (etag), or still absent when etag is None; returns
+        False when another writer got there first.
+        """
+        args = {}
+        if conditional:
+            args = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        if not record.get('opted_out'):
+            args['Tagging'] = PROFILE_OBJECT_TAG
+        try:
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self._key(tenant, digest),
+                Body=json.dumps(record).encode('utf-8'),
+                ContentType='application/json',
+                **args
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+        return True
+
+    def delete(self, tenant, digest):
+        self.s3.delete_object(Bucket=self.bucket, Key=self._key(tenant, digest))
+
+
+class CallerProfileCache:
+    """
+    TTL cache of caller profiles with an optional shared backend.
+
+    Records are stored as {'updated_at': epoch, 'profile': {...}}. An opted-out
+    caller is stored as a tombstone ({'opted_out': True}) that carries no
+    personal data and stops the profile from being re-learned; tombstones
+    never expire, only profiles do. Local copies expire after
+    local_ttl_seconds; the backend's copy wins after that.
+    """
+
+    def __init__(self, backend=None, ttl_seconds=PROFILE_TTL_SECONDS, local_ttl_seconds=PROFILE_LOCAL_TTL_SECONDS,
+                 max_entries=PROFILE_CACHE_SIZE):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.local_ttl_seconds = local_ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (tenant, digest) -> (record, loaded_at)
+        self._lock = threading.Lock()
+
+    def get(self, tenant, raw_number):
+        """Return the caller's profile dict, or None if unknown, expired or opted out"""
+        number = normalize_caller_number(raw_number)
+        if not number:
+            return None
+
+        record = self._load(tenant, caller_digest(number))
+        if not record or record.get('opted_out'):
+            return None
+        return dict(record.get('profile', {}))
+
+    def remember(self, tenant, raw_number, **fields):
+        """Merge known fields into the caller's profile and refresh its TTL"""
+        number = normalize_caller_number(raw_number)
+        if not number:
+            return None
+
+        updates = {k: v for k, v in fields.items() if k in PROFILE_FIELDS and v}
+        if not updates:
+            return None
+
+        digest = caller_digest(number)
+        for _ in range(PROFILE_WRITE_ATTEMPTS):
+            # Always from the backend: a local copy may predate another container's opt-out
+            record, etag = self._fetch(tenant, digest)
+            if record is not None and record.get('opted_out'):
+                logger.info(f"Caller opted out of profile storage, not remembering (tenant {tenant})")
+                return None
+            if record is not None and self._expired(record):
+                record = None
+
+            profile = dict((record or {}).get('profile', {}))
+            profile.update(updates)
+            new_record = {'updated_at': time.time(), 'profile': profile}
+            written = self._store(tenant, digest, new_record, etag=etag, conditional=True)
+            if written is None:
+                return None
+            if written:
+                return profile
+        logger.warning(f"Caller profile not updated: concurrent writes kept winning (tenant {tenant})")
+        return None
+
+    def forget(self, tenant, raw_number):
+        """Evict a caller's profile on explicit opt-out"""
+        number = normalize_caller_number(raw_number)
+        if not number:
+            return False
+
+        digest = caller_digest(number)
+        record = {'updated_at': time.time(), 'opted_out': True}
+        # Unconditional: an opt-out replaces whatever is stored
+        self._store(tenant, digest, record)
+        logger.info(f"Caller profile evicted on opt-out (tenant {tenant})")
+        return True
+
+    def _load(self, tenant, digest):
+        key = (tenant, digest)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.backend and time.time() - entry[1] > self.local_ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record = entry[0] if entry is not None else None
+
+        if entry is None and self.backend:
+            record, _ = self._fetch(tenant, digest)
+
+        if record is None or record.get('opted_out'):
+            return record
+
+        if self._expired(record):
+            self._evict(tenant, digest)
+            return None
+        return record
+
+    def _fetch(self, tenant, digest):
+        """(record, etag) from the backend, cached locally; (None, None) without a backend or on error"""
+        if not self.backend:
+            with self._lock:
+                entry = self._entries.get((tenant, digest))
+            return (entry[0] if entry else None), None
+        try:
+            record, etag = self.backend.get(tenant, digest)
+        except Exception as e:
+            logger.error(f"Caller profile lookup failed: {str(e)}")
+            return None, None
+        if record is not None:
+            self._remember_locally((tenant, digest), record)
+        return record, etag
+
+    def _expired(self, record):
+        return time.time() - record.get('updated_at', 0) > self.ttl_seconds
+
+    def _store(self, tenant, digest, record, etag=None, conditional=False):
+        """True once written; False when a conditional write lost to another writer; None if it failed"""
+        if self.backend:
+            try:
+                written = self.backend.put(tenant, digest, record, etag=etag, conditional=conditional)
+            except Exception as e:
+                logger.error(f"Caller profile write failed: {str(e)}")
+                if conditional:
+                    return None
+                written = True  # an opt-out is still honoured by this container
+            if not written:
+                with self._lock:
+                    self._entries.pop((tenant, digest), None)
+                return False
+        self._remember_locally((tenant, digest), record)
+        return True
+
+    def _evict(self, tenant, digest):
+        """
+        Drop an expired profile from this container. The S3 object is left to
+        the bucket's lifecycle rule: a delete here could remove an opt-out
+        tombstone written since the read.
+        """
+        with self._lock:
+            self._entries.pop((tenant, digest), None)
+
+    def _remember_locally(self, key, record):
+        with self._lock:
+            self._entries[key] = (record, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", (text or '').lower())
+
+
+def confirms_identity(profile, text):
+    """True when the caller's words contain every part of the stored patient name"""
+    name = set(_words((profile or {}).get('patient_name')))
+    return bool(name) and name <= set(_words(text))
+
+
+def profile_prompt_attributes(profile, identity_confirmed=False):
+    """
+    Render a profile as Bedrock promptSessionAttributes (string values only).
+    Name and email are left out until the caller has confirmed who they are.
+    """
+    if not profile:
+        return {}
+
+    attributes = {'returning_caller': 'true',
+                  'caller_identity': 'confirmed' if identity_confirmed else 'unconfirmed'}
+    for field in PROFILE_FIELDS:
+        if field in IDENTITY_FIELDS and not identity_confirmed:
+            continue
+        if profile.get(field):
+            attributes[field] = str(profile[field])
+    return attributes
+
+
+def booking_details_from_trace(trace_event):
+    """
+    Pull confirmAppointment / searchSlots parameters out of an agent trace event.
+
+    Returns (api_path, params) for action group invocations, else (None, {}).
+    """
+    orchestration = trace_event.get('trace', {}).get('orchestrationTrace', {})
+    invocation = orchestration.get('invocationInput', {}).get('actionGroupInvocationInput')
+    if not invocation:
+        return None, {}
+
+    params = {}
+    for prop in invocation.get('parameters', []) or []:
+        if prop.get('name') and prop.get('value'):
+            params[prop['name']] = prop['value']
+
+    content = invocation.get('requestBody', {}).get('content', {})
+    properties = content.get('application/json', [])
+    if isinstance(properties, dict):
+        properties = properties.get('properties', [])
+    for prop in properties or []:
+        if prop.get('name') and prop.get('value'):
+            params[prop['name']] = prop['value']
+
+    return invocation.get('apiPath'), params
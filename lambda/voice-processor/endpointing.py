@@ -0,0 +1,204 @@
+"""
+Adaptive end-of-utterance detection.
+
+Instead of waiting a fixed five seconds of silence after every caller turn,
+the endpoint is chosen from what the agent just asked for: a yes/no answer
+can end after a short pause, while an email address spelled out with
+"at" and "dot" needs room for thinking pauses between parts.
+
+Consumers:
+  - the Twilio webhook, which gets per-turn <Gather> attributes from
+    gather_params(expected_answer_type(agent_response))
+  - Connect flows, which get the next turn's end timeout
+  - streaming paths (media server, voice client), which feed frame energy
+    and partial transcripts into an Endpointer and act as soon as it
+    reports end of turn
+"""
+
+import re
+
+import audio_codec
+
+# Answer types and their silence budgets (milliseconds of trailing silence).
+# silence_ms applies while the transcript is unknown or inconclusive,
+# complete_ms once a stable partial already looks like a full answer, and
+# extend_ms when the caller stopped mid-phrase ("my email is john at ...").
+ANSWER_PROFILES = {
+    'yes_no': {'silence_ms': 600, 'complete_ms': 300, 'extend_ms': 1200, 'speech_timeout': '1',
+               'hints': 'yes, no, correct, that is right'},
+    'date_time': {'silence_ms': 1200, 'complete_ms': 500, 'extend_ms': 2200, 'speech_timeout': '2',
+                  'hints': 'morning, afternoon, today, tomorrow, next week'},
+    'name': {'silence_ms': 900, 'complete_ms': 500, 'extend_ms': 1800, 'speech_timeout': '2',
+             'hints': ''},
+    'digits': {'silence_ms': 1200, 'complete_ms': 600, 'extend_ms': 2500, 'speech_timeout': '3',
+               'hints': ''},
+    'email': {'silence_ms': 1500, 'complete_ms': 700, 'extend_ms': 3000, 'speech_timeout': '3',
+              'hints': 'at, dot com, dot org, dot net, gmail, yahoo, outlook, hotmail'},
+    'open': {'silence_ms': 900, 'complete_ms': 500, 'extend_ms': 1800, 'speech_timeout': 'auto',
+             'hints': 'appointment, book, reschedule, cancel'},
+}
+
+DEFAULT_ANSWER_TYPE = 'open'
+
+# Seconds Twilio waits for the caller to start speaking at all
+GATHER_START_TIMEOUT = '5'
+
+# Agent prompt -> expected answer type, checked in order
+_PROMPT_PATTERNS = [
+    ('email', re.compile(r'\be-?mail\b', re.I)),
+    ('digits', re.compile(r'\b(phone|number|date of birth|zip|digits)\b', re.I)),
+    ('name', re.compile(r'\b(your|the patient\'?s?) (full |first |last )?name\b', re.I)),
+    ('date_time', re.compile(r'\b(what|which) (day|date|time)\b|\bwhen would\b|\bpreferred (date|time|day)\b', re.I)),
+    ('yes_no', re.compile(r'\b(would you like|shall i|should i|is that (correct|right|ok)|do you want|'
+                          r'can i|did you|are you|is there anything)\b[^?]*\?\s*$', re.I)),
+]
+
+# Partial transcript already looks like a whole answer of that type
+_COMPLETE_PATTERNS = {
+    'yes_no': re.compile(r'\b(yes|yeah|yep|no|nope|correct|sure|ok|okay|right|please)\b', re.I),
+    # A day alone ("tomorrow", "next tuesday") is usually followed by a time,
+    # so only a time of day makes a date/time answer look complete
+    'date_time': re.compile(r'\b(\d{1,2}(:\d{2})?\s*(a\.?m\.?|p\.?m\.?)|noon|morning|afternoon|evening|'
+                            r'any ?time)\b', re.I),
+    'name': re.compile(r'^\s*(my name is\s+|it\'?s\s+|this is\s+)?[a-z\'-]+\s+[a-z\'-]+', re.I),
+    'digits': re.compile(r'(\d[\s-]*){10,}'),
+    'email': re.compile(r'(@|\bat\b).+(\.|\bdot\b)\s*(com|org|net|edu|gov|io|co|us)\b', re.I),
+    'open': re.compile(r'[.?!]\s*$'),
+}
+
+# Trailing words that mean the caller is not finished
+_CONTINUATION = re.compile(r'\b(at|dot|and|um+|uh+|er+|the|a|my|is|it\'?s|so|like|to|at the)\s*$', re.I)
+
+# VAD: energy threshold tracks the line's noise floor
+MIN_SPEECH_ENERGY = 300.0
+NOISE_MULTIPLIER = 3.0
+NOISE_ALPHA = 0.05
+MIN_SPEECH_MS = 100
+STABILITY_MS = 300
+
+
+def expected_answer_type(prompt):
+    """Guess what kind of answer the agent's reply is asking for"""
+    if not prompt:
+        return DEFAULT_ANSWER_TYPE
+    # Only the last sentence carries the question
+    sentences = re.split(r'(?<=[.!?])\s+', prompt.strip())
+    question = sentences[-1] if sentences else prompt
+    for answer_type, pattern in _PROMPT_PATTERNS:
+        if pattern.search(question):
+            return answer_type
+    return DEFAULT_ANSWER_TYPE
+
+
+def gather_params(answer_type):
+    """Twilio <Gather> attributes for the next caller turn"""
+    profile = ANSWER_PROFILES.get(answer_type, ANSWER_PROFILES[DEFAULT_ANSWER_TYPE])
+    params = {
+        'speechTimeout': profile['speech_timeout'],
+        'timeout': GATHER_START_TIMEOUT,
+    }
+    if profile['hints']:
+        params['hints'] = profile['hints']
+    return params
+
+
+def end_timeout_ms(answer_type):
+    """
+    Trailing-silence budget for the next turn, for Connect flows that pass it
+    to Lex as the x-amz-lex:audio:end-timeout-ms session attribute
+    """
+    profile = ANSWER_PROFILES.get(answer_type, ANSWER_PROFILES[DEFAULT_ANSWER_TYPE])
+    return profile['silence_ms']
+
+
+def looks_complete(answer_type, transcript):
+    """True when a transcript already reads like a full answer of this type"""
+    text = (transcript or '').strip()
+    if not text or _CONTINUATION.search(text):
+        return False
+    pattern = _COMPLETE_PATTERNS.get(answer_type)
+    return bool(pattern and pattern.search(text))
+
+
+def frame_energy(pcm16):
+    """RMS energy of a little-endian PCM16 frame"""
+    return audio_codec.rms(pcm16)
+
+
+class Endpointer:
+    """
+    Decides end of turn for a stream of audio frames.
+
+    feed() takes each frame's energy and duration and returns True exactly
+    once per utterance, when the trailing silence exceeds the budget for
+    the expected answer type. partial() supplies interim ASR text; a stable
+    transcript that already looks complete shortens the budget, one ending
+    in a connective ("at", "dot", "and") lengthens it.
+    """
+
+    def __init__(self, answer_type=DEFAULT_ANSWER_TYPE):
+        self.noise_floor = MIN_SPEECH_ENERGY / NOISE_MULTIPLIER
+        self.utterance = 0
+        self.last_transcript = ''
+        self.expect(answer_type)
+        self.reset()
+
+    def expect(self, answer_type):
+        """Set the answer type for the caller's next utterance"""
+        self.answer_type = answer_type if answer_type in ANSWER_PROFILES else DEFAULT_ANSWER_TYPE
+        self.profile = ANSWER_PROFILES[self.answer_type]
+
+    def reset(self):
+        self.in_speech = False
+        self.speech_ms = 0.0
+        self.silence_ms = 0.0
+        self.transcript = ''
+        self.stable_ms = 0.0
+
+    @property
+    def threshold(self):
+        return max(MIN_SPEECH_ENERGY, self.noise_floor * NOISE_MULTIPLIER)
+
+    def partial(self, text):
+        """Record interim transcript text for the current utterance"""
+        if text != self.transcript:
+            self.transcript = text
+            self.stable_ms = 0.0
+
+    def required_silence_ms(self):
+        """Trailing silence needed before the current utterance counts as finished"""
+        text = self.transcript.strip()
+        if text and _CONTINUATION.search(text):
+            return self.profile['extend_ms']
+        if self.stable_ms >= STABILITY_MS and looks_complete(self.answer_type, text):
+            return self.profile['complete_ms']
+        return self.profile['silence_ms']
+
+    def feed(self, energy, frame_ms):
+        """Process one frame; True when this frame ends the caller's turn"""
+        self.stable_ms += frame_ms
+        if energy >= self.threshold:
+            self.speech_ms += frame_ms
+            self.silence_ms = 0.0
+            if not self.in_speech and self.speech_ms >= MIN_SPEECH_MS:
+                self.in_speech = True
+                self.utterance += 1
+            return False
+
+        if not self.in_speech:
+            # Background only: follow the noise floor, forget short clicks
+            self.noise_floor += NOISE_ALPHA * (energy - self.noise_floor)
+            self.speech_ms = 0.0
+            return False
+
+        self.silence_ms += frame_ms
+        if self.silence_ms >= self.required_silence_ms():
+            self.last_transcript = self.transcript
+            self.reset()
+            return True
+        return False
+
+    def consume(self):
+        """An ASR final answered the current utterance: forget it so feed() does not end it again"""
+        self.reset()
+        self.last_transcript = ''
@@ -0,0 +1,303 @@
+"""
+Concatenative rendering of slot offers from pre-synthesized fragments.
+
+Slot offers ("I have 9:30 AM, 2:00 PM or 4:30 PM on Tuesday with
+Dr. Smith.") and confirmation numbers are the most common agent utterances
+and are built from a small closed vocabulary. Each tenant voice gets a
+fragment library: times of day, weekdays, months and ordinals, doctor
+names, spelled characters and connective phrases, synthesized once as PCM
+under the same SSML wrapper, trimmed of edge silence and level-normalized
+so joins do not jump in loudness or pace.
+
+An utterance is rendered from fragments only when every token is covered;
+fragments are joined with short crossfades and punctuation becomes fixed
+pauses. Anything else returns None and the caller falls back to a full
+Polly synthesis. Only PCM output profiles (telephony and media streams)
+can use this; compressed profiles always go to Polly.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+import audio_codec
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_CROSSFADE_MS = int(os.environ.get('FRAGMENT_CROSSFADE_MS', '12'))
+FRAGMENT_GAP_MS = int(os.environ.get('FRAGMENT_GAP_MS', '30'))
+FRAGMENT_PROSODY_RATE = os.environ.get('FRAGMENT_PROSODY_RATE', '100%')
+FRAGMENT_WORKERS = int(os.environ.get('FRAGMENT_WORKERS', '4'))
+
+# Clinic hours covered by time-of-day fragments, on the half hour
+FIRST_SLOT_HOUR = 7
+LAST_SLOT_HOUR = 19
+
+# Samples below this level at the fragment edges are Polly's lead-in/out silence
+TRIM_THRESHOLD = 300
+TRIM_PAD_MS = 8
+
+PAUSE_MS = {',': 160, ';': 220, ':': 220, '-': 120, '.': 350, '?': 350, '!': 350}
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MONTHS = ('January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December')
+
+CONNECTIVES = (
+    'I have', 'I also have', 'a', 'we have', 'there is', "there's", 'or', 'and', 'on', 'at', 'with', 'the',
+    'today', 'tomorrow', 'next', 'this',
+    'Which works best for you?', 'Which works best?', 'Which would you prefer?', 'Does that work for you?',
+    'Would any of those work?', "You're all set for", 'You are all set for', 'Your appointment is',
+    'Your confirmation number is', 'A confirmation email will be sent to you',
+)
+
+_TOKEN = re.compile(
+    r"(?P<time>\b\d{1,2}(?::\d{2})?\s*[AaPp]\.?\s?[Mm]\b)"
+    r"|(?P<ref>\b(?=[A-Z0-9-]*\d)[A-Z0-9]+(?:-[A-Z0-9]+)+\b)"
+    r"|(?P<title>\bDr\.)"
+    r"|(?P<word>[A-Za-z0-9']+)"
+    r"|(?P<pause>[,;:.?!])"
+    r"|(?P<space>\s+)"
+    r"|(?P<other>.)"
+)
+_TIME = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*([AaPp])")
+
+
+def _ordinal(n):
+    suffix = 'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    return f"{n}{suffix}"
+
+
+def time_key(hour, minute, meridiem):
+    return f"{hour}:{minute:02d} {meridiem.upper()}M".lower()
+
+
+def char_key(char):
+    return f"char {char.lower()}"
+
+
+def vocabulary(doctors=()):
+    """Fragment key -> SSML body for the shared vocabulary plus a tenant's doctors"""
+    phrases = {}
+    for text in CONNECTIVES + WEEKDAYS + MONTHS:
+        phrases[' '.join(_words(text))] = escape(text)
+    for day in range(1, 32):
+        phrases[_ordinal(day)] = _ordinal(day)
+    for hour in range(FIRST_SLOT_HOUR, LAST_SLOT_HOUR):
+        for minute in (0, 30):
+            display = f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+            phrases[display.lower()] = display
+    for char in '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+        phrases[char_key(char)] = f'<say-as interpret-as="characters">{char}</say-as>'
+    for doctor in doctors:
+        name = doctor.split('.', 1)[-1].split() if doctor.lower().startswith('dr') else doctor.split()
+        # Agents say both "Dr. Sarah Smith" and "Dr. Smith"
+        for spoken in {' '.join(name), name[-1]} if name else ():
+            phrases[' '.join(['dr'] + _words(spoken))] = escape(f"Dr. {spoken}")
+    return phrases
+
+
+def fragment_ssml(body):
+    """Every fragment is synthesized under the same wrapper for consistent prosody"""
+    return f'<speak><prosody rate="{FRAGMENT_PROSODY_RATE}">{body}</prosody></speak>'
+
+
+def _words(text):
+    return [w.lower() for w in re.findall(r"[A-Za-z0-9']+", text.replace('’', "'"))]
+
+
+def plan(text, phrases=None):
+    """
+    Split an utterance into fragment keys and pause lengths (ms), matching
+    the longest known multi-word phrases first. Returns None when something
+    cannot be expressed with fragment keys at all.
+    """
+    known = _KNOWN_PHRASES if phrases is None else phrases
+    max_words = max((len(k.split()) for k in known), default=1)
+    items = []
+    words = []
+
+    def flush_words():
+        i = 0
+        while i < len(words):
+            # Longest phrase first; unknown words stay single and fail at lookup
+            if words[i].isdigit():
+                items.extend(char_key(c) for c in words[i])
+                i += 1
+                continue
+            for n in range(min(max_words, len(words) - i), 0, -1):
+                key = ' '.join(words[i:i + n])
+                if n == 1 or key in known:
+                    items.append(key)
+                    i += n
+                    break
+        words.clear()
+
+    for match in _TOKEN.finditer(text.replace('’', "'")):
+        kind = match.lastgroup
+        value = match.group()
+        if kind in ('word', 'title'):
+            words.append(value.lower().rstrip('.'))
+            continue
+        if kind == 'space':
+            continue
+        flush_words()
+        if kind == 'other':
+            return None
+        if kind == 'pause':
+            items.append(PAUSE_MS[value])
+        elif kind == 'time':
+            hour, minute, meridiem = _TIME.match(value).groups()
+            items.append(time_key(int(hour), int(minute or 0), meridiem))
+        elif kind == 'ref':
+            for group_index, group in enumerate(value.split('-')):
+                if group_index:
+                    items.append(PAUSE_MS['-'])
+                items.extend(char_key(c) for c in group)
+    flush_words()
+
+    # A trailing pause is just dead air
+    while items and isinstance(items[-1], int):
+        items.pop()
+    return items or None
+
+
+def _trim(samples, sample_rate):
+    import numpy as np
+    loud = np.flatnonzero(np.abs(samples.astype(np.int32)) > TRIM_THRESHOLD)
+    if loud.size == 0:
+        return samples[:0]
+    pad = sample_rate * TRIM_PAD_MS // 1000
+    return samples[max(0, loud[0] - pad):loud[-1] + pad + 1]
+
+
+def crossfade_join(pieces, sample_rate, crossfade_ms=FRAGMENT_CROSSFADE_MS):
+    """Concatenate int16 arrays, overlapping neighbours with a linear crossfade"""
+    import numpy as np
+    pieces = [p for p in pieces if p.size]
+    if not pieces:
+        return np.zeros(0, dtype=np.int16)
+    fade = sample_rate * crossfade_ms // 1000
+    overlaps = [min(fade, a.size, b.size) for a, b in zip(pieces, pieces[1:])]
+    out = np.zeros(sum(p.size for p in pieces) - sum(overlaps), dtype=np.float32)
+
+    pos = 0
+    for i, piece in enumerate(pieces):
+        piece = piece.astype(np.float32)
+        k = overlaps[i - 1] if i else 0
+        if k:
+            ramp = np.linspace(0.0, 1.0, k, endpoint=False, dtype=np.float32)
+            out[pos - k:pos] = out[pos - k:pos] * (1.0 - ramp) + piece[:k] * ramp
+        out[pos:pos + piece.size - k] = piece[k:]
+        pos += piece.size - k
+    return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+
+class FragmentLibrary:
+    """Pre-synthesized PCM fragments for one voice, engine and sample rate"""
+
+    def __init__(self, synthesize, sample_rate=8000, executor=None):
+        # synthesize(ssml) -> PCM16 bytes at sample_rate
+        self.synthesize = synthesize
+        self.sample_rate = sample_rate
+        self.executor = executor or _executor
+        self._fragments = {}
+        self._phrases = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._fragments
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def add(self, key, pcm):
+        samples = audio_codec.normalize(_trim(audio_codec.as_pcm16(pcm), self.sample_rate))
+        with self._lock:
+            self._fragments[key] = samples
+            if ' ' in key:
+                self._phrases = self._phrases | {key}
+
+    def missing(self, phrases):
+        return {key: body for key, body in phrases.items() if key not in self._fragments}
+
+    def warm(self, phrases):
+        """Synthesize every fragment not yet in the library; returns how many were added"""
+        todo = self.missing(phrases)
+        if not todo:
+            return 0
+        started = time.time()
+
+        def build(item):
+            key, body = item
+            try:
+                self.add(key, self.synthesize(fragment_ssml(body)))
+                metrics.incr('fragments.synthesized_chars', len(body))
+                return True
+            except Exception as e:
+                logger.warning(f"Fragment synthesis failed for {key!r}: {e}")
+                return False
+
+        added = sum(1 for ok in self.executor.map(build, todo.items()) if ok)
+        logger.info(f"Fragment library warmed: {added} fragments in {time.time() - started:.1f}s")
+        return added
+
+    def warm_async(self, phrases):
+        """Warm in the background; the first calls on a cold container fall back to Polly"""
+        return _warm_executor.submit(self.warm, phrases)
+
+    def render(self, text):
+        """PCM16 bytes for text built entirely from fragments, or None if not covered"""
+        started = time.time()
+        items = plan(text, self._phrases)
+        if items is None:
+            metrics.incr('fragments.fallback', reason='unsupported')
+            return None
+
+        import numpy as np
+        gap = np.zeros(self.sample_rate * FRAGMENT_GAP_MS // 1000, dtype=np.int16)
+        pieces = []
+        after_fragment = False
+        for item in items:
+            if isinstance(item, int):
+                pieces.append(np.zeros(self.sample_rate * item // 1000, dtype=np.int16))
+                after_fragment = False
+                continue
+            fragment = self._fragments.get(item)
+            if fragment is None:
+                metrics.incr('fragments.fallback', reason='uncovered')
+                return None
+            if after_fragment:
+                pieces.append(gap)
+            pieces.append(fragment)
+            after_fragment = True
+
+        audio = crossfade_join(pieces, self.sample_rate).tobytes()
+        metrics.incr('fragments.rendered')
+        metrics.incr('fragments.saved_chars', len(text))
+        metrics.observe('fragments.render_ms', (time.time() - started) * 1000)
+        return audio
+
+
+_KNOWN_PHRASES = frozenset(k for k in vocabulary() if ' ' in k)
+
+_executor = ThreadPoolExecutor(max_workers=FRAGMENT_WORKERS, thread_name_prefix='fragments')
+_warm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fragments-warm')
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def fragment_library(voice_id, engine, sample_rate, synthesize):
+    """The process-wide library for a tenant voice, created on first use"""
+    key = (voice_id, engine, sample_rate)
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None:
+            library = _libraries[key] = FragmentLibrary(synthesize, sample_rate)
+        return library
@@ -1,27 +1,62 @@
 import json
+import os
 import boto3
-import base64
 import uuid
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from botocore.config import Config
+
+from caller_profiles import (
+    CallerProfileCache,
+    S3ProfileBackend,
+    booking_details_from_trace,
+    confirms_identity,
+    profile_prompt_attributes,
+)
+from admission import BEDROCK, POLLY, Admission, AdmissionRejected, escalate, turn_priority, turn_scope, turn_shed
+import audio_codec
+from audio_delivery import URL, AudioDelivery, delivery_for
+from audio_offload import AudioOffload
+from call_artifacts import CallArtifactWriter, artifact_backend
+from call_cache import call_cache
+from endpointing import end_timeout_ms, expected_answer_type, gather_params
+from fragments import fragment_library, vocabulary
+from hedging import cancelled as hedge_cancelled, hedger
+from prefetch import CALLER_PROFILE, TENANT_CONFIG, UPCOMING_SLOTS, CallPrefetcher, CallSetupStore
+from prompt_predictor import LAST_ACTION, PromptPredictor
+from resilience import Resilience, deadline_scope
+from speech_renderer import record as record_speech, render_reply
+from tts_cache import tts_cache
+from tts_profiles import DEFAULT_PROFILE, get_profile, profile_for_event
+from tts_selector import TTSSelector
+from turn_dedupe import TURN_DEDUPE_SHARED, DuplicateTurnInProgress, S3DedupeBackend, TurnDedupe
+import metrics
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-bedrock_agent = boto3.client('bedrock-agent-runtime', region_name='us-east-1')
-polly = boto3.client('polly', region_name='us-east-1')
-transcribe = boto3.client('transcribe', region_name='us-east-1')
-s3 = boto3.client('s3', region_name='us-east-1')
+# Initialize AWS clients. One Lambda invocation needs few connections; the
+# container-mode server (server.py) shares these pools across every call in flight
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '10'))
+aws_config = Config(max_pool_connections=AWS_MAX_POOL_CONNECTIONS)
+# Retried by the resilience layer instead, inside the turn's deadline and retry budget
+service_config = aws_config.merge(Config(retries={'total_max_attempts': 1}))
+bedrock_agent = boto3.client('bedrock-agent-runtime', region_name='us-east-1', config=service_config)
+polly = boto3.client('polly', region_name='us-east-1', config=service_config)
+transcribe = boto3.client('transcribe', region_name='us-east-1', config=service_config)
+s3 = boto3.client('s3', region_name='us-east-1', config=aws_config)
+lambda_client = boto3.client('lambda', region_name='us-east-1', config=aws_config)
 
 # Configuration
 BEDROCK_AGENT_ID = 'S2MOVY5G8J'
 BEDROCK_AGENT_ALIAS_ID = 'XOOC4XVDXZ'
-S3_BUCKET = 'clinic-voice-processing'  # You'll need to create this
+S3_BUCKET = os.environ.get('S3_BUCKET', 'clinic-voice-processing')
 
-# Clinic configurations with voice settings
+# Clinic configurations with voice settings. Optional speech settings
+# (max_speech_seconds, max_list_items, speaking_rate) are read by speech_renderer.
 CLINIC_VOICES = {
     '1001': {
         'name': 'Downtown Medical Center',
@@ -39,10 +74,85 @@ CLINIC_VOICES = {
         'name': 'Pediatric Care Clinic',
         'voice_id': 'Salli',
         'engine': 'neural',
-        'greeting': 'Welcome to Pediatric Care Clinic! We\'re here to help with your child\'s health needs.'
+        'greeting': 'Welcome to Pediatric Care Clinic! We\'re here to help with your child\'s health needs.',
+        # Parents are often juggling kids on the call: slower and shorter
+        'speaking_rate': '95%',
+        'max_speech_seconds': 15
     }
 }
 
+# Returning-caller profiles, shared across containers through S3
+caller_profiles = CallerProfileCache(backend=S3ProfileBackend(s3, S3_BUCKET))
+
+# Inline audio where the channel accepts it; S3 only when a URL is consumed
+audio_delivery = AudioDelivery(s3, S3_BUCKET)
+
+# One recording + transcript object per call instead of per-turn objects. A
+# call's turns can land in any container, so each turn is saved as a fragment
+# and the call's fragments are merged when it ends
+call_artifacts = CallArtifactWriter(artifact_backend(s3, S3_BUCKET), fragments=True)
+
+# Large audio payloads are decoded, framed and encoded off the request thread
+# in container mode (AUDIO_OFFLOAD=process); inline in Lambda
+audio_offload = AudioOffload()
+
+# Per-tenant token buckets and fair queueing in front of the shared Bedrock and Polly quotas
+admission = Admission()
+# What a shed agent turn says instead; pre-synthesized at call setup
+HOLD_RESPONSE = "We're helping a lot of callers right now. Please hold on a moment, then tell me again how I can help."
+_hold_warmed = set()
+
+# Throttle-aware retries and AIMD concurrency limits; admission slots follow the limits
+resilience = Resilience()
+for _service in (BEDROCK, POLLY):
+    resilience.limit(_service).listeners.append(admission.schedulers[_service].resize)
+
+# Slow Polly requests get a hedged twin when HEDGE_OPERATIONS opts in (see hedging.py)
+POLLY_SYNTHESIZE = 'polly.synthesize'
+
+# Neural voices fall back to the standard engine while they break the tenant's TTS SLO;
+# a short synthesis probes the neural engine until it recovers
+TTS_PROBE_TEXT = 'One moment, please.'
+tts_selector = TTSSelector(
+    probe=lambda engine, voice_id: synthesize_audio(TTS_PROBE_TEXT, voice_id, engine, 'pcm', '8000')
+)
+
+# Webhook retries replay the original turn's response instead of re-running the agent
+turn_dedupe = TurnDedupe(shared=S3DedupeBackend(s3, S3_BUCKET) if TURN_DEDUPE_SHARED == 's3' else None)
+
+# Call-setup prefetcher; warmers open the boto3 connection pools ahead of the first turn.
+# Results are saved to S3 for the containers that serve the call's later turns
+prefetcher = CallPrefetcher(call_cache, caller_profiles, warmers={
+    'polly': lambda: polly.describe_voices(LanguageCode='en-US'),
+    's3': lambda: s3.head_bucket(Bucket=S3_BUCKET)
+}, store=CallSetupStore(s3, S3_BUCKET))
+# Call setup returns the greeting at once and the prefetches finish afterwards:
+# in a Lambda as an asynchronous invocation of this function (the environment
+# freezes once setup returns), elsewhere on this pool
+SETUP_FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+setup_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='call-setup')
+
+# Pre-synthesizes the agent's likely next prompts into the TTS cache
+predictor = PromptPredictor(
+    lambda text, clinic_config, profile: render_speech(text, clinic_config['voice_id'], clinic_config['engine'],
+                                                       profile, clinic_config)
+)
+
+# Batch Transcribe gains nothing above 16 kHz for telephone speech; larger
+# uploads just cost time
+TRANSCRIBE_MAX_SAMPLE_RATE = 16000
+RAW_AUDIO_FORMATS = (audio_codec.PCM16, 'pcm', audio_codec.ULAW, audio_codec.ALAW)
+
+# Number of upcoming slots handed to the agent as warm context
+PREFETCHED_SLOTS_FOR_AGENT = 6
+
+# Per-call flag: the caller said the name stored in their profile
+IDENTITY_CONFIRMED = 'identity_confirmed'
+
+# Idle-call sweeps scan every call in the process; in container mode that is thousands
+SWEEP_INTERVAL_SECONDS = float(os.environ.get('SWEEP_INTERVAL_SECONDS', '1'))
+_last_sweep = 0.0
+
 def lambda_handler(event, context):
     """
     Main Lambda handler for voice processing
@@ -51,17 +161,41 @@ def lambda_handler(event, context):
     try:
         logger.info(f"Received event: {json.dumps(event)}")
         
-        # Determine the source of the call
-        if 'Details' in event and 'ContactData' in event['Details']:
-            # Amazon Connect call
-            return handle_connect_call(event, context)
-        elif 'audio_data' in event:
-            # Direct API call with audio
-            return handle_direct_voice_call(event, context)
-        else:
-            # Text-based call (for testing)
-            return handle_text_call(event, context)
+        # Expire per-call state for calls that have gone quiet
+        sweep_idle_calls()
+        
+        # Bedrock and Polly calls below are admitted against this tenant's share
+        with turn_scope(session_for_event(event)[1]), deadline_scope(context):
+            # Determine the source of the call
+            if is_call_setup(event):
+                # Call just connected - prefetch while the greeting plays
+                return handle_call_setup(event, context)
+            elif event.get('action') == 'prefetch_call':
+                # Deferred by call setup
+                return handle_call_prefetch(event, context)
+            elif is_call_end(event):
+                # Caller hung up - write the call's artifact and drop its state
+                return handle_call_end(event, context)
+            elif 'Details' in event and 'ContactData' in event['Details']:
+                # Amazon Connect call
+                return turn_dedupe.run(event, lambda: handle_connect_call(event, context), turn_completed)
+            elif 'audio_data' in event:
+                # Direct API call with audio
+                return turn_dedupe.run(event, lambda: handle_direct_voice_call(event, context), turn_completed)
+            else:
+                # Text-based call (for testing)
+                return turn_dedupe.run(event, lambda: handle_text_call(event, context), turn_completed)
             
+    except DuplicateTurnInProgress as e:
+        # A retry of a turn that is still running: never run the agent twice
+        logger.warning(f"Duplicate turn still in progress: {str(e)}")
+        return {
+            'statusCode': 409,
+            'body': json.dumps({
+                'error': 'Duplicate turn in progress',
+                'message': str(e)
+            })
+        }
     except Exception as e:
         logger.error(f"Error in lambda_handler: {str(e)}")
         return {
@@ -71,6 +205,147 @@ def lambda_handler(event, context):
                 'message': str(e)
             })
         }
+    finally:
+        metrics.flush()
+
+def turn_completed(response):
+    """Only real agent turns are replayed to retries, not errors or shed "please hold" replies"""
+    return response.get('statusCode') == 200 and not turn_shed()
+
+def sweep_idle_calls():
+    """Expire idle calls; at most once per SWEEP_INTERVAL_SECONDS when many calls share a process"""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = now
+    call_cache.sweep()
+    call_artifacts.sweep()
+
+def is_call_setup(event):
+    """True for the call-start event sent before the first caller utterance"""
+    if event.get('action') == 'start_call':
+        return True
+    parameters = event.get('Details', {}).get('Parameters', {})
+    return parameters.get('action') == 'start_call'
+
+def is_call_end(event):
+    """True for the disconnect event sent when the caller hangs up"""
+    if event.get('action') == 'end_call':
+        return True
+    parameters = event.get('Details', {}).get('Parameters', {})
+    return parameters.get('action') == 'end_call'
+
+def session_for_event(event):
+    """(session_id, did, caller_number) for a setup or disconnect event"""
+    if 'Details' in event:
+        contact_data = event['Details'].get('ContactData', {})
+        did = extract_did_from_number(contact_data.get('SystemEndpoint', {}).get('Address', ''))
+        caller_number = contact_data.get('CustomerEndpoint', {}).get('Address', '')
+        return f"connect-{did}-{contact_data.get('ContactId', '')}", did, caller_number
+    did = event.get('did', '1001')
+    session_id = event.get('session_id', f"direct-{did}-{int(time.time())}")
+    return session_id, did, event.get('caller_number', '')
+
+def handle_call_setup(event, context):
+    """Return the tenant greeting as soon as it is synthesized; the first turn's data is prefetched meanwhile"""
+    try:
+        session_id, did, caller_number = session_for_event(event)
+        
+        logger.info(f"Call setup - DID: {did}, Session: {session_id}")
+        
+        clinic_config = CLINIC_VOICES.get(did, CLINIC_VOICES['1001'])
+        
+        profile = profile_for_event(event)
+        
+        # Prefetches run while the greeting plays, not before it
+        defer_call_prefetch(session_id, did, caller_number, profile)
+        audio_url, audio_base64 = deliver_speech(clinic_config['greeting'], clinic_config, profile,
+                                                 event.get('delivery'))
+        warm_hold_response(clinic_config, profile)
+        record_turn(session_id, did, None, clinic_config['greeting'], clinic_config, profile)
+        
+        return {
+            'statusCode': 200,
+            'agentResponse': clinic_config['greeting'],
+            'audioUrl': audio_url,
+            'audioBase64': audio_base64,
+            'sessionId': session_id,
+            'did': did,
+            'clinicName': clinic_config['name']
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in handle_call_setup: {str(e)}")
+        return {
+            'statusCode': 500,
+            'error': str(e)
+        }
+
+def defer_call_prefetch(session_id, did, caller_number, profile):
+    """Run the call's prefetches without holding up the greeting"""
+    event = {'action': 'prefetch_call', 'session_id': session_id, 'did': did, 'caller_number': caller_number,
+             'output_profile': profile}
+    if not SETUP_FUNCTION_NAME:
+        return setup_executor.submit(handle_call_prefetch, event, None)
+    try:
+        lambda_client.invoke(FunctionName=SETUP_FUNCTION_NAME, InvocationType='Event', Payload=json.dumps(event))
+    except Exception as e:
+        # The first turn fetches what it needs itself
+        logger.warning(f"Call prefetch not started for {session_id}: {str(e)}")
+    return None
+
+def handle_call_prefetch(event, context):
+    """Prefetch a call's first-turn data and save it for the containers that serve its turns"""
+    try:
+        session_id, did, caller_number = session_for_event(event)
+        clinic_config = CLINIC_VOICES.get(did, CLINIC_VOICES['1001'])
+        profile = profile_for_event(event)
+        
+        futures = prefetcher.start(session_id, did, caller_number)
+        prefetched = prefetcher.wait(futures)
+        prefetcher.save(session_id)
+        warm_fragments(session_id, clinic_config, profile)
+        
+        logger.info(f"Call setup prefetched {prefetched} for session {session_id}")
+        
+        return {
+            'statusCode': 200,
+            'sessionId': session_id,
+            'prefetched': prefetched
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in handle_call_prefetch: {str(e)}")
+        return {
+            'statusCode': 500,
+            'error': str(e)
+        }
+
+def handle_call_end(event, context):
+    """Write the call's recording/transcript artifact and release its per-call state"""
+    try:
+        session_id, did, _ = session_for_event(event)
+        artifact_key = call_artifacts.finish(session_id)
+        predictor.end_call(session_id)
+        prefetcher.forget(session_id)
+        call_cache.end_call(session_id)
+        
+        logger.info(f"Call ended - Session: {session_id}, artifact: {artifact_key}")
+        
+        return {
+            'statusCode': 200,
+            'sessionId': session_id,
+            'did': did,
+            'artifactKey': artifact_key
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in handle_call_end: {str(e)}")
+        return {
+            'statusCode': 500,
+            'error': str(e)
+        }
 
 def handle_connect_call(event, context):
     """Handle Amazon Connect voice calls"""
@@ -84,11 +359,17 @@ def handle_connect_call(event, context):
         dialed_number = system_endpoint.get('Address', '')
         did = extract_did_from_number(dialed_number)
         
+        # Caller ID for returning-caller profiles
+        caller_number = contact_data.get('CustomerEndpoint', {}).get('Address', '')
+        
         # Get parameters from Connect
         parameters = event.get('Details', {}).get('Parameters', {})
         user_input = parameters.get('userInput', '')
         audio_url = parameters.get('audioUrl', '')
         
+        if parameters.get('callerOptOut') == 'true':
+            forget_caller(f"connect-{did}-{contact_id}", did, caller_number)
+        
         logger.info(f"Connect call - DID: {did}, Contact: {contact_id}")
         
         # Process the voice input
@@ -99,17 +380,26 @@ def handle_connect_call(event, context):
             # Use text input (for DTMF or text-based testing)
             transcribed_text = user_input or "Hello"
         
-        # Get clinic configuration
+        # Get clinic configuration and the channel's audio format
         clinic_config = CLINIC_VOICES.get(did, CLINIC_VOICES['1001'])
+        profile = profile_for_event(event)
         
         # Generate session ID
         session_id = f"connect-{did}-{contact_id}"
         
         # Call Bedrock Agent
-        agent_response = call_bedrock_agent(session_id, transcribed_text, did)
+        agent_response = call_bedrock_agent(session_id, transcribed_text, did, caller_number)
+        
+        predict_next_prompts(session_id, did, agent_response, clinic_config, profile)
         
         # Generate speech audio
-        audio_url = generate_speech(agent_response, clinic_config['voice_id'], clinic_config['engine'])
+        audio_url = generate_speech(agent_response, clinic_config['voice_id'], clinic_config['engine'],
+                                    profile, clinic_config)
+        
+        # Connect keeps its own recording; the artifact holds the transcript and our speech
+        record_turn(session_id, did, (transcribed_text, None), agent_response, clinic_config, profile)
+        
+        answer_type = expected_answer_type(agent_response)
         
         return {
             'statusCode': 200,
@@ -117,7 +407,10 @@ def handle_connect_call(event, context):
             'audioUrl': audio_url,
             'sessionId': session_id,
             'did': did,
-            'clinicName': clinic_config['name']
+            'clinicName': clinic_config['name'],
+            'audioFormat': get_profile(profile)['extension'],
+            'expectedAnswer': answer_type,
+            'endTimeoutMs': str(end_timeout_ms(answer_type))
         }
         
     except Exception as e:
@@ -136,26 +429,37 @@ def handle_direct_voice_call(event, context):
         did = event.get('did', '1001')
         session_id = event.get('session_id', f"direct-{did}-{int(time.time())}")
         audio_format = event.get('audio_format', 'wav')
+        sample_rate = int(event.get('sample_rate', 8000))
+        caller_number = event.get('caller_number', '')
         
         logger.info(f"Direct voice call - DID: {did}, Session: {session_id}")
         
+        if event.get('caller_opt_out'):
+            forget_caller(session_id, did, caller_number)
+        
         # Decode base64 audio data
-        audio_bytes = base64.b64decode(audio_data)
+        audio_bytes = audio_offload.run('b64decode', audio_data)
         
         # Transcribe the audio
-        transcribed_text = transcribe_audio_bytes(audio_bytes, audio_format)
+        transcribed_text = transcribe_audio_bytes(audio_bytes, audio_format, sample_rate)
         
-        # Get clinic configuration
+        # Get clinic configuration and the channel's audio format
         clinic_config = CLINIC_VOICES.get(did, CLINIC_VOICES['1001'])
+        profile = profile_for_event(event)
         
         # Call Bedrock Agent
-        agent_response = call_bedrock_agent(session_id, transcribed_text, did)
+        agent_response = call_bedrock_agent(session_id, transcribed_text, did, caller_number)
         
-        # Generate speech audio
-        audio_url = generate_speech(agent_response, clinic_config['voice_id'], clinic_config['engine'])
+        predict_next_prompts(session_id, did, agent_response, clinic_config, profile)
+        
+        # Inline audio unless the channel plays from a URL (or the client asked for one)
+        audio_url, audio_base64 = deliver_speech(agent_response, clinic_config, profile, event.get('delivery'))
+        
+        record_turn(session_id, did, (transcribed_text, (audio_bytes, audio_format, sample_rate)), agent_response,
+                    clinic_config, profile)
         
-        # Also return base64 encoded audio for direct use
-        audio_base64 = generate_speech_base64(agent_response, clinic_config['voice_id'], clinic_config['engine'])
+        # Endpointing for the caller's next turn depends on what was just asked
+        answer_type = expected_answer_type(agent_response)
         
         return {
             'statusCode': 200,
@@ -167,7 +471,10 @@ def handle_direct_voice_call(event, context):
                 'session_id': session_id,
                 'did': did,
                 'clinic_name': clinic_config['name'],
-                'voice_id': clinic_config['voice_id']
+                'voice_id': clinic_config['voice_id'],
+                'audio_format': get_profile(profile)['extension'],
+                'expected_answer': answer_type,
+                'gather': gather_params(answer_type)
             })
         }
         
@@ -188,18 +495,29 @@ def handle_text_call(event, context):
         user_input = event.get('text', event.get('inputText', 'Hello'))
         did = event.get('did', '1001')
         session_id = event.get('session_id', f"text-{did}-{int(time.time())}")
+        caller_number = event.get('caller_number', '')
         
         logger.info(f"Text call - DID: {did}, Input: {user_input}")
         
-        # Get clinic configuration
+        if event.get('caller_opt_out'):
+            forget_caller(session_id, did, caller_number)
+        
+        # Get clinic configuration and the channel's audio format
         clinic_config = CLINIC_VOICES.get(did, CLINIC_VOICES['1001'])
+        profile = profile_for_event(event)
         
         # Call Bedrock Agent
-        agent_response = call_bedrock_agent(session_id, user_input, did)
+        agent_response = call_bedrock_agent(session_id, user_input, did, caller_number)
         
-        # Generate speech audio
-        audio_url = generate_speech(agent_response, clinic_config['voice_id'], clinic_config['engine'])
-        audio_base64 = generate_speech_base64(agent_response, clinic_config['voice_id'], clinic_config['engine'])
+        predict_next_prompts(session_id, did, agent_response, clinic_config, profile)
+        
+        # Inline audio unless the channel plays from a URL (Twilio <Play>) or the client asked for one
+        audio_url, audio_base64 = deliver_speech(agent_response, clinic_config, profile, event.get('delivery'))
+        
+        record_turn(session_id, did, (user_input, None), agent_response, clinic_config, profile)
+        
+        # Endpointing for the caller's next turn depends on what was just asked
+        answer_type = expected_answer_type(agent_response)
         
         return {
             'statusCode': 200,
@@ -211,7 +529,10 @@ def handle_text_call(event, context):
                 'session_id': session_id,
                 'did': did,
                 'clinic_name': clinic_config['name'],
-                'voice_id': clinic_config['voice_id']
+                'voice_id': clinic_config['voice_id'],
+                'audio_format': get_profile(profile)['extension'],
+                'expected_answer': answer_type,
+                'gather': gather_params(answer_type)
             })
         }
         
@@ -241,29 +562,30 @@ def extract_did_from_number(phone_number):
         # Default to Downtown Medical
         return '1001'
 
-def transcribe_audio_from_url(audio_url):
+def transcribe_audio_from_url(audio_url, media_format='wav'):
     """Transcribe audio from a URL using Amazon Transcribe"""
     try:
         job_name = f"transcribe-{uuid.uuid4().hex[:8]}-{int(time.time())}"
         
         # Start transcription job
-        response = transcribe.start_transcription_job(
+        response = resilience.call('transcribe', lambda: transcribe.start_transcription_job(
             TranscriptionJobName=job_name,
             Media={'MediaFileUri': audio_url},
-            MediaFormat='wav',  # Adjust based on your audio format
+            MediaFormat=media_format,
             LanguageCode='en-US',
             Settings={
                 'ShowSpeakerLabels': False,
                 'MaxSpeakerLabels': 1
             }
-        )
+        ))
         
         # Wait for completion (with timeout)
         max_wait_time = 30  # seconds
         wait_time = 0
         
         while wait_time < max_wait_time:
-            job_status = transcribe.get_transcription_job(TranscriptionJobName=job_name)
+            job_status = resilience.call('transcribe',
+                                         lambda: transcribe.get_transcription_job(TranscriptionJobName=job_name))
             status = job_status['TranscriptionJob']['TranscriptionJobStatus']
             
             if status == 'COMPLETED':
@@ -285,105 +607,353 @@ def transcribe_audio_from_url(audio_url):
         logger.error(f"Transcription error: {str(e)}")
         return "Hello"
 
-def transcribe_audio_bytes(audio_bytes, audio_format):
+def prepare_transcribe_audio(audio_bytes, audio_format, sample_rate=8000):
+    """Frame raw telephony audio (or re-frame a WAV) as mono PCM16 WAV Transcribe accepts"""
+    if audio_format not in RAW_AUDIO_FORMATS and audio_format != 'wav':
+        return audio_bytes, audio_format
+    try:
+        encoding = audio_codec.PCM16 if audio_format == 'pcm' else audio_format
+        if encoding == 'wav':
+            sample_rate = audio_codec.read_wav(audio_bytes)[1]
+        target_rate = min(sample_rate, TRANSCRIBE_MAX_SAMPLE_RATE)
+        return audio_offload.run('transcribe_wav', audio_bytes, encoding, sample_rate, target_rate), 'wav'
+    except ValueError as e:
+        # Unusual WAV variants go to Transcribe as they are
+        logger.warning(f"Audio not re-framed for Transcribe: {str(e)}")
+        return audio_bytes, audio_format
+
+def transcribe_audio_bytes(audio_bytes, audio_format, sample_rate=8000):
     """Transcribe audio from bytes using Amazon Transcribe"""
     try:
         # For real-time transcription, you might want to use Amazon Transcribe Streaming
         # For now, we'll upload to S3 and use regular Transcribe
+        audio_bytes, audio_format = prepare_transcribe_audio(audio_bytes, audio_format, sample_rate)
         
-        # Upload audio to S3
+        # Batch Transcribe only reads media from S3: the upload lives for the
+        # job alone, the call's audio is kept in its artifact
         audio_key = f"audio/{uuid.uuid4().hex}.{audio_format}"
         s3.put_object(Bucket=S3_BUCKET, Key=audio_key, Body=audio_bytes)
-        
-        # Transcribe from S3
-        audio_url = f"s3://{S3_BUCKET}/{audio_key}"
-        return transcribe_audio_from_url(audio_url)
+        try:
+            return transcribe_audio_from_url(f"s3://{S3_BUCKET}/{audio_key}", audio_format)
+        finally:
+            s3.delete_object(Bucket=S3_BUCKET, Key=audio_key)
         
     except Exception as e:
         logger.error(f"Audio transcription error: {str(e)}")
         return "Hello"
 
-def call_bedrock_agent(session_id, input_text, did):
+def call_bedrock_agent(session_id, input_text, did, caller_number=None):
     """Call AWS Bedrock Agent"""
     try:
         logger.info(f"Calling Bedrock Agent - Session: {session_id}, DID: {did}, Input: {input_text}")
         
-        response = bedrock_agent.invoke_agent(
-            agentId=BEDROCK_AGENT_ID,
-            agentAliasId=BEDROCK_AGENT_ALIAS_ID,
-            sessionId=session_id,
-            inputText=f"[DID: {did}] {input_text}"
-        )
+        # Pre-fill context for returning callers so the agent can skip slot-filling turns
+        prompt_attributes = build_prompt_attributes(session_id, did, caller_number, input_text)
+        session_state = {}
+        if prompt_attributes:
+            session_state['promptSessionAttributes'] = prompt_attributes
         
-        # Parse streaming response
-        agent_response = ""
-        for event in response['completion']:
-            if 'chunk' in event:
-                chunk = event['chunk']
-                if 'bytes' in chunk:
-                    agent_response += chunk['bytes'].decode('utf-8')
+        invoke_args = {
+            'agentId': BEDROCK_AGENT_ID,
+            'agentAliasId': BEDROCK_AGENT_ALIAS_ID,
+            'sessionId': session_id,
+            'inputText': f"[DID: {did}] {input_text}",
+            # Traces show which action group ran (next-prompt prediction) and
+            # let us learn the caller's details from the booking action
+            'enableTrace': True
+        }
+        if session_state:
+            invoke_args['sessionState'] = session_state
+        
+        # Emergencies and requests for a person jump the tenant's queue, for the reply's speech too
+        priority = turn_priority(input_text)
+        escalate(priority)
+        
+        # The slot is held while the completion streams: that is the agent's work
+        with admission.admit(BEDROCK, did, priority):
+            # Retried only if the agent produced nothing yet: a half-streamed
+            # turn may already have run an action group (a booking)
+            progress = {'events': 0}
+            agent_response, last_action = resilience.call(
+                BEDROCK, lambda: stream_agent_turn(invoke_args, did, caller_number, progress),
+                retryable=lambda: progress['events'] == 0
+            )
+        call_cache.put(session_id, LAST_ACTION, last_action)
         
         logger.info(f"Bedrock Agent response: {agent_response}")
         return agent_response.strip() or "I'm here to help you with your appointment needs."
         
+    except AdmissionRejected as e:
+        # Shed rather than throttled: the caller hears a (cached) hold prompt and tries again
+        logger.warning(f"Agent turn shed for session {session_id}: {str(e)}")
+        return HOLD_RESPONSE
     except Exception as e:
         logger.error(f"Bedrock Agent error: {str(e)}")
         return "I'm sorry, I'm having trouble processing your request right now. Let me transfer you to a human representative."
 
-def generate_speech(text, voice_id, engine='neural'):
-    """Generate speech using Amazon Polly and return S3 URL"""
+def stream_agent_turn(invoke_args, did, caller_number, progress):
+    """One invoke_agent attempt: (reply text, last action group path); counts events in progress"""
+    response = bedrock_agent.invoke_agent(**invoke_args)
+    
+    # Parse streaming response
+    agent_response = ""
+    pending_booking = None
+    last_action = None
+    for event in response['completion']:
+        progress['events'] += 1
+        if 'chunk' in event:
+            chunk = event['chunk']
+            if 'bytes' in chunk:
+                agent_response += chunk['bytes'].decode('utf-8')
+        elif 'trace' in event:
+            api_path, _ = booking_details_from_trace(event['trace'])
+            last_action = api_path or last_action
+            if caller_number:
+                pending_booking = learn_from_trace(event['trace'], did, caller_number, pending_booking)
+    return agent_response, last_action
+
+def build_prompt_attributes(session_id, did, caller_number, input_text=''):
+    """Turn-level agent context from the caller profile and call-setup prefetches"""
+    attributes = {}
+    # Setup usually ran in another container: load what it prefetched for this call
+    prefetcher.restore(session_id)
+    
+    if call_cache.has(session_id, CALLER_PROFILE):
+        profile = call_cache.get(session_id, CALLER_PROFILE)
+    else:
+        profile = caller_profiles.get(did, caller_number) if caller_number else None
+    if profile:
+        logger.info(f"Returning caller profile found for session {session_id}")
+        # Caller ID alone is not identity: name and email wait until the caller says the stored name
+        confirmed = call_cache.get(session_id, IDENTITY_CONFIRMED) or confirms_identity(profile, input_text)
+        if confirmed:
+            call_cache.put(session_id, IDENTITY_CONFIRMED, True)
+        attributes.update(profile_prompt_attributes(profile, identity_confirmed=confirmed))
+    
+    tenant_config = call_cache.get(session_id, TENANT_CONFIG)
+    if tenant_config and tenant_config.get('tenant_name'):
+        attributes['tenant_id'] = tenant_config['tenant_name']
+    
+    upcoming_slots = call_cache.get(session_id, UPCOMING_SLOTS)
+    if upcoming_slots:
+        attributes['upcoming_slots'] = json.dumps([
+            {
+                'slot_id': slot.get('slot_id'),
+                'start_time': slot.get('start_time'),
+                'doctor_name': slot.get('doctor_name')
+            }
+            for slot in upcoming_slots[:PREFETCHED_SLOTS_FOR_AGENT]
+        ])
+    
+    return attributes
+
+def forget_caller(session_id, did, caller_number):
+    """Opt-out: tombstone the stored profile and drop the copy this call is using"""
+    caller_profiles.forget(did, caller_number)
+    call_cache.put(session_id, CALLER_PROFILE, None)
+    call_cache.put(session_id, IDENTITY_CONFIRMED, False)
+
+def learn_from_trace(trace_event, did, caller_number, pending_booking):
+    """Update the caller profile from action group invocations seen in the agent trace"""
+    api_path, params = booking_details_from_trace(trace_event)
+    
+    if api_path == '/searchSlots':
+        preferred_time = params.get('time_preference')
+        caller_profiles.remember(
+            did, caller_number,
+            preferred_time=preferred_time if preferred_time != 'any' else None,
+            preferred_doctor=params.get('doctor')
+        )
+    elif api_path == '/confirmAppointment':
+        # Only remember details once the booking observation reports success
+        return params
+    
+    observation = trace_event.get('trace', {}).get('orchestrationTrace', {}).get('observation', {})
+    output = observation.get('actionGroupInvocationOutput', {}).get('text', '')
+    if pending_booking and ('BOOKED' in output or 'PENDING' in output):
+        caller_profiles.remember(
+            did, caller_number,
+            patient_name=pending_booking.get('patient_name'),
+            patient_email=pending_booking.get('patient_email')
+        )
+        return None
+    
+    return pending_booking
+
+def predict_next_prompts(session_id, did, agent_response, clinic_config, profile):
+    """Score last turn's predictions and pre-synthesize the likely next prompts"""
+    if agent_response == HOLD_RESPONSE:
+        return []
     try:
-        logger.info(f"Generating speech with voice {voice_id}: {text[:50]}...")
-        
-        # Generate speech with Polly
+        # State: the action group that ran this turn, else what the agent just asked for
+        state = call_cache.get(session_id, LAST_ACTION) or expected_answer_type(agent_response)
+        return predictor.observe(session_id, did, state, agent_response, clinic_config, profile)
+    except Exception as e:
+        logger.warning(f"Next-prompt prediction failed for {session_id}: {str(e)}")
+        return []
+
+def record_turn(session_id, did, caller, agent_response, clinic_config, profile):
+    """
+    Save a turn to the call's artifact. caller is (text, audio) where audio
+    is (bytes, format, sample_rate) or None; agent speech is recorded from
+    the TTS cache when the profile is PCM-based.
+    """
+    if not call_artifacts.enabled:
+        return
+    try:
+        if caller is not None:
+            text, audio = caller
+            audio_bytes, audio_format, sample_rate = audio or (None, None, None)
+            call_artifacts.record(session_id, did, 'caller', text, audio_bytes, audio_format, sample_rate)
+        settings = get_profile(profile)
+        speech = None
+        if settings['polly_format'] == 'pcm':
+            speech = render_speech(agent_response, clinic_config['voice_id'], clinic_config['engine'],
+                                   profile, clinic_config)
+        encoding = 'wav' if settings['container'] == 'wav' else settings['encoding']
+        call_artifacts.record(session_id, did, 'agent', agent_response, speech, encoding, settings['sample_rate'])
+        # Durable before the invocation returns: this container may never see the call again
+        call_artifacts.flush(session_id)
+    except Exception as e:
+        logger.warning(f"Call artifact record failed for {session_id}: {str(e)}")
+
+def synthesize_audio(text, voice_id, engine='neural', output_format='mp3', sample_rate='22050', text_type='text'):
+    """Synthesize speech with Amazon Polly and return the raw audio bytes"""
+    def synthesize():
         response = polly.synthesize_speech(
             Text=text,
-            OutputFormat='mp3',
+            TextType=text_type,
+            OutputFormat=output_format,
             VoiceId=voice_id,
             Engine=engine,
-            SampleRate='22050'
-        )
-        
-        # Upload to S3
-        audio_key = f"speech/{uuid.uuid4().hex}.mp3"
-        s3.put_object(
-            Bucket=S3_BUCKET,
-            Key=audio_key,
-            Body=response['AudioStream'].read(),
-            ContentType='audio/mpeg'
+            SampleRate=sample_rate
         )
+        if hedge_cancelled():
+            # The hedged twin already won: don't download a second copy
+            response['AudioStream'].close()
+            return None
+        return response['AudioStream'].read()
+    
+    with admission.admit(POLLY):
+        # Timed inside admission: a shed request says nothing about the engine's health
+        started = time.time()
+        try:
+            audio = hedger.call(POLLY_SYNTHESIZE, lambda: resilience.call(POLLY, synthesize))
+        except Exception:
+            tts_selector.record(engine, voice_id, time.time() - started, ok=False)
+            raise
+        tts_selector.record(engine, voice_id, time.time() - started, ok=True)
+        return audio
+
+def fragments_for(voice_id, engine, sample_rate):
+    """The slot-offer fragment library for a clinic voice at a PCM sample rate"""
+    def synthesize(ssml):
+        return synthesize_audio(ssml, voice_id, engine, 'pcm', str(sample_rate), text_type='ssml')
+    return fragment_library(voice_id, engine, sample_rate, synthesize)
+
+def warm_fragments(session_id, clinic_config, profile):
+    """Pre-synthesize the clinic voice's fragments (plus prefetched doctor names) in the background"""
+    settings = get_profile(profile)
+    if settings['polly_format'] != 'pcm':
+        return None
+    slots = call_cache.get(session_id, UPCOMING_SLOTS) or []
+    doctors = sorted({slot['doctor_name'] for slot in slots if slot.get('doctor_name')})
+    library = fragments_for(clinic_config['voice_id'], clinic_config['engine'], settings['sample_rate'])
+    return library.warm_async(vocabulary(doctors))
+
+def warm_hold_response(clinic_config, profile):
+    """Pre-synthesize the shed-turn hold prompt into the TTS cache, once per voice and profile"""
+    key = (clinic_config['voice_id'], clinic_config['engine'], profile)
+    if key in _hold_warmed:
+        return None
+    _hold_warmed.add(key)
+    future = predictor.executor.submit(render_speech, HOLD_RESPONSE, clinic_config['voice_id'],
+                                       clinic_config['engine'], profile, clinic_config)
+    # Shed or failed as background work: try again at the next call setup
+    future.add_done_callback(lambda f: f.exception() and _hold_warmed.discard(key))
+    return future
+
+def render_speech(text, voice_id, engine='neural', profile=DEFAULT_PROFILE, clinic_config=None):
+    """Synthesized audio in the profile's delivery format, from the TTS cache when possible"""
+    # Markup stripped, held to the clinic's speech budget and rendered as SSML
+    speech = render_reply(text, clinic_config)
+    audio = tts_cache.get(speech.ssml, voice_id, engine, profile)
+    if audio is not None:
+        return audio
+    # The engine is degraded for this tenant: a copy in the fallback voice is just as good
+    tenant = (clinic_config or {}).get('name', 'default')
+    choice = tts_selector.choose(tenant, voice_id, engine, clinic_config)
+    if choice.engine != engine:
+        audio = tts_cache.get(speech.ssml, choice.voice_id, choice.engine, profile)
+        if audio is not None:
+            return audio
+    record_speech(speech)
+    
+    settings = get_profile(profile)
+    started = time.time()
+    polly_bytes = None
+    used_voice, used_engine = voice_id, engine
+    if settings['polly_format'] == 'pcm':
+        # Slot offers and confirmation numbers are stitched from pre-synthesized fragments
+        polly_bytes = fragments_for(voice_id, engine, settings['sample_rate']).render(speech.text)
+    if polly_bytes is None:
+        used_voice, used_engine = choice.voice_id, choice.engine
+        if used_engine != engine:
+            logger.info(f"TTS fallback for {tenant}: {engine} {voice_id} -> {used_engine} {used_voice} "
+                        f"({choice.reason})")
+        try:
+            polly_bytes = synthesize_audio(speech.ssml, used_voice, used_engine, settings['polly_format'],
+                                           str(settings['sample_rate']), text_type='ssml')
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            # The primary engine failed this turn: the fallback engine still gives the caller an answer
+            fallback = tts_selector.fallback_for(voice_id, engine, clinic_config)
+            if used_engine != engine or fallback is None:
+                raise
+            used_engine, used_voice = fallback
+            logger.warning(f"TTS failover for {tenant}: {engine} {voice_id} failed ({str(e)}), "
+                           f"retrying with {used_engine} {used_voice}")
+            metrics.incr('tts.failover', engine=engine)
+            polly_bytes = synthesize_audio(speech.ssml, used_voice, used_engine, settings['polly_format'],
+                                           str(settings['sample_rate']), text_type='ssml')
+        metrics.incr('tts.engine', engine=used_engine, reason=choice.reason)
+    synthesized = time.time()
+    audio = audio_offload.run('finish_audio', polly_bytes, profile)
+    
+    metrics.observe('tts.synthesis_ms', (synthesized - started) * 1000, profile=profile)
+    metrics.observe('tts.transcode_ms', (time.time() - synthesized) * 1000, profile=profile)
+    metrics.observe('tts.bytes', len(audio), profile=profile)
+    
+    tts_cache.put(speech.ssml, used_voice, used_engine, profile, audio)
+    return audio
+
+def generate_speech(text, voice_id, engine='neural', profile=DEFAULT_PROFILE, clinic_config=None):
+    """Generate speech using Amazon Polly and return a URL for it"""
+    try:
+        logger.info(f"Generating {profile} speech with voice {voice_id}: {text[:50]}...")
         
-        # Generate presigned URL
-        audio_url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET, 'Key': audio_key},
-            ExpiresIn=3600  # 1 hour
-        )
+        audio_bytes = render_speech(text, voice_id, engine, profile, clinic_config)
         
-        return audio_url
+        # Uploaded (or proxied) only now that a URL is actually needed
+        return audio_delivery.url(audio_bytes, profile)
         
     except Exception as e:
         logger.error(f"Speech generation error: {str(e)}")
         return None
 
-def generate_speech_base64(text, voice_id, engine='neural'):
-    """Generate speech using Amazon Polly and return base64 encoded audio"""
+def deliver_speech(text, clinic_config, profile=DEFAULT_PROFILE, delivery=None):
+    """
+    Synthesize a reply and hand it over the way the channel consumes audio.
+    Returns (audio_url, audio_base64); only one of them is set.
+    """
+    delivery = delivery or delivery_for(profile)
+    if delivery == URL:
+        return generate_speech(text, clinic_config['voice_id'], clinic_config['engine'], profile, clinic_config), None
     try:
-        # Generate speech with Polly
-        response = polly.synthesize_speech(
-            Text=text,
-            OutputFormat='mp3',
-            VoiceId=voice_id,
-            Engine=engine,
-            SampleRate='22050'
-        )
-        
-        # Read audio stream and encode as base64
-        audio_bytes = response['AudioStream'].read()
-        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-        
-        return audio_base64
-        
+        audio_bytes = render_speech(text, clinic_config['voice_id'], clinic_config['engine'], profile, clinic_config)
+        metrics.incr('delivery.inline', profile=profile)
+        return None, audio_offload.run('b64encode', audio_bytes).decode('utf-8')
     except Exception as e:
         logger.error(f"Speech generation error: {str(e)}")
-        return None
\ No newline at end of file
+        return None, None
@@ -0,0 +1,630 @@
+"""
+Real-time bidirectional media-stream server.
+
+An asyncio WebSocket server that accepts Twilio Media Streams (/twilio) and
+FreeSWITCH mod_audio_fork (/freeswitch) connections, streams caller audio
+into streaming transcription, runs each final utterance through the same
+Bedrock Agent and Polly logic as the voice-processor Lambda, and streams the
+reply back with real-time frame pacing.
+
+Everything per call is a handful of coroutines; only the blocking Bedrock
+and Polly calls run on a bounded thread pool, so one process can carry
+thousands of concurrent calls.
+
+    PYTHONPATH=../shared/python python media_server.py --port 8080  # AWS-backed
+    python media_server.py --port 8080 --offline  # fake ASR/agent/TTS for load tests
+
+(AWS-backed mode imports index.py, which needs the shared layer's modules.)
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from aiohttp import WSMsgType, web
+
+import audio_codec
+from barge_in import BargeInDetector, PlaybackTurn, split_sentences
+from endpointing import Endpointer, expected_answer_type
+
+logger = logging.getLogger(__name__)
+
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', '64'))
+TRANSCRIBE_REGION = os.environ.get('TRANSCRIBE_REGION', 'us-east-1')
+
+# Outbound pacing: Twilio expects 20 ms mu-law frames; mod_audio_fork plays
+# each playAudio message as a file, so it gets larger chunks
+TWILIO_FRAME_MS = 20
+FREESWITCH_CHUNK_MS = int(os.environ.get('FREESWITCH_CHUNK_MS', '500'))
+
+# Synthesize the next sentence only when less than this much audio is queued,
+# so a barge-in leaves the rest of the reply unsynthesized
+SYNTH_LOOKAHEAD_SECONDS = float(os.environ.get('SYNTH_LOOKAHEAD_SECONDS', '1.5'))
+
+# Caller audio kept for the call artifact: at most this much before each utterance
+ARTIFACT_CALLER_SECONDS = float(os.environ.get('ARTIFACT_CALLER_SECONDS', '30'))
+
+
+# --- Streaming transcription ------------------------------------------------
+
+class _QueueTranscriber:
+    """Base class: results are (text, is_final) tuples on an asyncio queue"""
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self._results = asyncio.Queue()
+
+    async def start(self):
+        pass
+
+    async def feed(self, pcm16):
+        raise NotImplementedError
+
+    async def close(self):
+        await self._results.put(None)
+
+    async def results(self):
+        while True:
+            item = await self._results.get()
+            if item is None:
+                return
+            yield item
+
+
+class AmazonStreamingTranscriber(_QueueTranscriber):
+    """Amazon Transcribe streaming (requires the amazon-transcribe package)"""
+
+    def __init__(self, sample_rate, language_code='en-US', region=TRANSCRIBE_REGION):
+        super().__init__(sample_rate)
+        self.language_code = language_code
+        self.region = region
+        self._stream = None
+        self._reader = None
+
+    async def start(self):
+        from amazon_transcribe.client import TranscribeStreamingClient
+
+        client = TranscribeStreamingClient(region=self.region)
+        self._stream = await client.start_stream_transcription(
+            language_code=self.language_code,
+            media_sample_rate_hz=self.sample_rate,
+            media_encoding='pcm'
+        )
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def feed(self, pcm16):
+        await self._stream.input_stream.send_audio_event(audio_chunk=pcm16)
+
+    async def _read(self):
+        try:
+            async for event in self._stream.output_stream:
+                for result in event.transcript.results:
+                    if result.alternatives:
+                        await self._results.put((result.alternatives[0].transcript, not result.is_partial))
+        except Exception as e:
+            logger.error(f"Transcribe stream error: {str(e)}")
+        finally:
+            await self._results.put(None)
+
+    async def close(self):
+        if self._stream:
+            await self._stream.input_stream.end_stream()
+        if self._reader:
+            await self._reader
+
+
+class OfflineTranscriber(_QueueTranscriber):
+    """
+    Energy-based stand-in for streaming ASR used by offline load tests:
+    emits the phrase as a partial when speech starts and as a final once
+    speech is followed by silence_ms (a typical streaming-ASR finalization
+    delay, which the session's endpointer is expected to beat).
+    """
+
+    def __init__(self, sample_rate, phrase="I'd like to book an appointment.", threshold=500.0, silence_ms=1000):
+        super().__init__(sample_rate)
+        self.phrase = phrase
+        self.threshold = threshold
+        self.silence_ms = silence_ms
+        self._in_speech = False
+        self._silent_ms = 0.0
+
+    async def feed(self, pcm16):
+        frame_ms = 1000.0 * len(pcm16) / 2 / self.sample_rate
+        if audio_codec.rms(pcm16) >= self.threshold:
+            if not self._in_speech:
+                await self._results.put((self.phrase, False))
+            self._in_speech = True
+            self._silent_ms = 0.0
+        elif self._in_speech:
+            self._silent_ms += frame_ms
+            if self._silent_ms >= self.silence_ms:
+                self._in_speech = False
+                await self._results.put((self.phrase, True))
+
+
+# --- Agent / TTS backends ---------------------------------------------------
+
+class VoiceProcessorBackend:
+    """Bedrock Agent and Polly through the voice-processor Lambda's own functions"""
+
+    def __init__(self):
+        import index  # boto3 clients are created on import
+        self.index = index
+
+    def clinic(self, did):
+        return self.index.CLINIC_VOICES.get(did, self.index.CLINIC_VOICES['1001'])
+
+    def start_call(self, session_id, did, caller_number):
+        futures = self.index.prefetcher.start(session_id, did, caller_number)
+        clinic = self.clinic(did)
+        # Fragment vocabulary includes the doctors from the prefetched slots
+        futures[self.index.UPCOMING_SLOTS].add_done_callback(
+            lambda _: self.index.warm_fragments(session_id, clinic, 'stream')
+        )
+
+    def reply(self, session_id, text, did, caller_number):
+        with self.index.turn_scope(did):
+            reply = self.index.call_bedrock_agent(session_id, text, did, caller_number)
+        # Budget and clean the whole reply before it is split into sentences
+        return self.index.render_reply(reply, self.clinic(did)).text
+
+    def predict(self, session_id, did, reply, clinic, sample_rate):
+        if sample_rate == 8000:
+            # Only the cached 'stream' path can be served from predictions
+            self.index.predict_next_prompts(session_id, did, reply, clinic, 'stream')
+
+    def record(self, session_id, did, role, text, pcm, sample_rate, at):
+        self.index.call_artifacts.record(session_id, did, role, text, pcm, audio_codec.PCM16, sample_rate, at)
+
+    def end_call(self, session_id):
+        self.index.predictor.end_call(session_id)
+        self.index.call_artifacts.finish(session_id)
+
+    def audio(self, audio_id):
+        # Proxied speech (AUDIO_PROXY_BASE_URL pointing at this server)
+        return self.index.audio_delivery.fetch(audio_id)
+
+    def synthesize(self, text, clinic, sample_rate, did=None):
+        with self.index.turn_scope(did):
+            if sample_rate == 8000:
+                # Cached, channel-native 8 kHz PCM
+                return self.index.render_speech(text, clinic['voice_id'], clinic['engine'], 'stream', clinic)
+            return self.index.synthesize_audio(
+                self.index.render_reply(text, clinic).ssml, clinic['voice_id'], clinic['engine'],
+                output_format='pcm', sample_rate=str(sample_rate), text_type='ssml'
+            )
+
+    def transcriber(self, sample_rate):
+        return AmazonStreamingTranscriber(sample_rate)
+
+
+class OfflineBackend:
+    """No-AWS backend: echo agent and a tone whose length tracks the reply text"""
+
+    CHARS_PER_SECOND = 15.0
+    MAX_SECONDS = 10.0
+
+    def __init__(self):
+        self._tones = {}
+
+    def clinic(self, did):
+        return {'name': 'Offline Clinic', 'voice_id': 'offline', 'engine': 'standard',
+                'greeting': 'Hello, thanks for calling. How can I help you today?'}
+
+    def start_call(self, session_id, did, caller_number):
+        pass
+
+    def reply(self, session_id, text, did, caller_number):
+        return f"You said {text}. What else can I do for you?"
+
+    def predict(self, session_id, did, reply, clinic, sample_rate):
+        pass
+
+    def record(self, session_id, did, role, text, pcm, sample_rate, at):
+        pass
+
+    def end_call(self, session_id):
+        pass
+
+    def audio(self, audio_id):
+        return None
+
+    def synthesize(self, text, clinic, sample_rate, did=None):
+        if sample_rate not in self._tones:
+            t = np.arange(int(self.MAX_SECONDS * sample_rate)) / sample_rate
+            self._tones[sample_rate] = (3000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16).tobytes()
+        seconds = min(len(text) / self.CHARS_PER_SECOND, self.MAX_SECONDS)
+        return self._tones[sample_rate][:int(seconds * sample_rate) * 2]
+
+    def transcriber(self, sample_rate):
+        return OfflineTranscriber(sample_rate)
+
+
+# --- Channel adapters -------------------------------------------------------
+
+class TwilioAdapter:
+    """Twilio Media Streams: JSON text frames with base64 8 kHz mu-law payloads"""
+
+    channel = 'twilio'
+    sample_rate = 8000
+    frame_ms = TWILIO_FRAME_MS
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.stream_sid = None
+        self._marks = 0
+
+    def parse(self, msg):
+        """Returns ('start', info) | ('audio', pcm16) | ('stop', None) | (None, None)"""
+        if msg.type != WSMsgType.TEXT:
+            return None, None
+        data = json.loads(msg.data)
+        event = data.get('event')
+        if event == 'start':
+            start = data.get('start', {})
+            self.stream_sid = start.get('streamSid') or data.get('streamSid')
+            params = start.get('customParameters', {})
+            return 'start', {
+                'session_id': f"twilio-{start.get('callSid', self.stream_sid)}",
+                'did': params.get('did', '1001'),
+                'caller_number': params.get('caller_number', params.get('From', ''))
+            }
+        if event == 'media' and data.get('media', {}).get('track', 'inbound') == 'inbound':
+            return 'audio', audio_codec.ulaw_decode(base64.b64decode(data['media']['payload'])).tobytes()
+        if event == 'stop':
+            return 'stop', None
+        return None, None
+
+    async def send_audio(self, pcm16):
+        await self.ws.send_str(json.dumps({
+            'event': 'media',
+            'streamSid': self.stream_sid,
+            'media': {'payload': base64.b64encode(audio_codec.ulaw_encode(pcm16)).decode('ascii')}
+        }))
+
+    async def end_of_reply(self):
+        self._marks += 1
+        await self.ws.send_str(json.dumps({
+            'event': 'mark',
+            'streamSid': self.stream_sid,
+            'mark': {'name': f"reply-{self._marks}"}
+        }))
+
+    async def clear(self):
+        await self.ws.send_str(json.dumps({'event': 'clear', 'streamSid': self.stream_sid}))
+
+
+class FreeSwitchAdapter:
+    """mod_audio_fork: JSON metadata text frame, then binary L16 frames"""
+
+    channel = 'freeswitch'
+    frame_ms = FREESWITCH_CHUNK_MS
+
+    def __init__(self, ws, sample_rate=8000):
+        self.ws = ws
+        self.sample_rate = sample_rate
+
+    def parse(self, msg):
+        if msg.type == WSMsgType.BINARY:
+            return 'audio', msg.data
+        if msg.type != WSMsgType.TEXT:
+            return None, None
+        data = json.loads(msg.data)
+        if 'uuid' in data or 'did' in data:
+            self.sample_rate = int(data.get('sample_rate', self.sample_rate))
+            return 'start', {
+                'session_id': f"freeswitch-{data.get('uuid', int(time.time()))}",
+                'did': str(data.get('did', '1001')),
+                'caller_number': data.get('caller_id_number', '')
+            }
+        return None, None
+
+    async def send_audio(self, pcm16):
+        await self.ws.send_str(json.dumps({
+            'type': 'playAudio',
+            'data': {
+                'audioContentType': 'raw',
+                'sampleRate': self.sample_rate,
+                'audioContent': base64.b64encode(pcm16).decode('ascii')
+            }
+        }))
+
+    async def end_of_reply(self):
+        pass
+
+    async def clear(self):
+        await self.ws.send_str(json.dumps({'type': 'killAudio'}))
+
+
+# --- Per-call session -------------------------------------------------------
+
+class CallSession:
+    """One caller: inbound audio -> ASR -> agent -> TTS -> paced outbound audio"""
+
+    def __init__(self, server, adapter, info):
+        self.server = server
+        self.backend = server.backend
+        self.adapter = adapter
+        self.session_id = info['session_id']
+        self.did = info['did']
+        self.caller_number = info['caller_number']
+        self.clinic = self.backend.clinic(self.did)
+        self.transcriber = self.backend.transcriber(adapter.sample_rate)
+        self.outbound = asyncio.Queue()
+        self.turns = asyncio.Queue()
+        self.endpointer = Endpointer()
+        self.barge_in = BargeInDetector()
+        self.playing = None  # PlaybackTurn of the reply being spoken
+        self._answered = 0  # highest Endpointer.utterance already handed to the agent
+        self._segment = None  # utterance the ASR segment in progress belongs to
+        self._heard = bytearray()  # caller audio since the last utterance, for the artifact
+        self._heard_max = int(ARTIFACT_CALLER_SECONDS * adapter.sample_rate) * 2
+        self._records = []
+        self._tasks = []
+
+    async def start(self):
+        await self.transcriber.start()
+        self.backend.start_call(self.session_id, self.did, self.caller_number)
+        self._tasks = [
+            asyncio.ensure_future(self._transcripts()),
+            asyncio.ensure_future(self._turns()),
+            asyncio.ensure_future(self._playout()),
+            asyncio.ensure_future(self.speak(self.clinic['greeting'])),
+        ]
+
+    async def feed(self, pcm16):
+        await self.transcriber.feed(pcm16)
+        self._heard.extend(pcm16)
+        if len(self._heard) > 2 * self._heard_max:
+            del self._heard[:-self._heard_max]
+        frame_ms = 1000.0 * len(pcm16) / 2 / self.adapter.sample_rate
+        energy = audio_codec.rms(pcm16)
+        if self.playing is not None and self.barge_in.feed(energy, frame_ms):
+            await self.interrupt()
+        if self.endpointer.feed(energy, frame_ms):
+            utterance, text = self.endpointer.utterance, self.endpointer.last_transcript
+            if utterance > self._answered and text.strip():
+                # End of turn decided before the ASR final: answer the stable partial now
+                self._answered = utterance
+                self.server.stats['early_endpoints'] += 1
+                self.turns.put_nowait(text)
+
+    async def interrupt(self):
+        """Caller spoke over the reply: stop synthesis, drop queued audio, flush the far end"""
+        turn, self.playing = self.playing, None
+        saved = turn.cancel()
+        self.server.stats['barge_ins'] += 1
+        self.server.stats['saved_chars'] += saved
+        await self.adapter.clear()
+        logger.info(f"Barge-in on {self.session_id}: {saved} of {len(turn.text)} characters not synthesized")
+
+    async def speak(self, text):
+        """Synthesize a reply sentence by sentence off-loop and queue it as paced frames"""
+        loop = asyncio.get_running_loop()
+        turn = PlaybackTurn(text)
+        self.playing = turn
+        self.barge_in.reset()
+        frame_seconds = self.adapter.frame_ms / 1000.0
+        frame_bytes = int(self.adapter.sample_rate * frame_seconds) * 2
+        spoken = bytearray()
+        started = time.time()
+
+        try:
+            for sentence in split_sentences(text):
+                while not turn.cancelled and self.outbound.qsize() * frame_seconds > SYNTH_LOOKAHEAD_SECONDS:
+                    await asyncio.sleep(frame_seconds)
+                if turn.cancelled:
+                    return
+                turn.synthesized(sentence)
+                future = turn.track(loop.run_in_executor(
+                    self.server.executor, self.backend.synthesize, sentence, self.clinic, self.adapter.sample_rate,
+                    self.did
+                ))
+                try:
+                    pcm = await future
+                except asyncio.CancelledError:
+                    if not turn.cancelled:
+                        raise
+                    return
+                except Exception as e:
+                    logger.error(f"Synthesis failed for {self.session_id}: {str(e)}")
+                    continue
+                if turn.cancelled:
+                    return
+                spoken.extend(pcm)
+                for offset in range(0, len(pcm), frame_bytes):
+                    self.outbound.put_nowait((turn, pcm[offset:offset + frame_bytes]))
+            self.outbound.put_nowait((turn, b''))  # end-of-reply marker
+        finally:
+            # What was actually synthesized, even when a barge-in cut the reply short
+            self._record('agent', text, spoken, started)
+
+    def _record(self, role, text, pcm, at):
+        """Hand a turn to the call artifact off-loop"""
+        self._records = [f for f in self._records if not f.done()]
+        self._records.append(asyncio.get_running_loop().run_in_executor(
+            self.server.executor, self.backend.record, self.session_id, self.did, role, text,
+            bytes(pcm), self.adapter.sample_rate, at
+        ))
+
+    async def _transcripts(self):
+        """
+        ASR results -> turns. Each ASR segment is tied to the endpointer's
+        utterance it started in, so whichever of the endpointer and the ASR
+        final ends an utterance first answers it and the other is ignored
+        """
+        endpointer = self.endpointer
+        async for text, is_final in self.transcriber.results():
+            if self._segment is None:
+                # ASR can report speech a frame or two before the VAD counts it
+                started = endpointer.in_speech or is_final
+                self._segment = endpointer.utterance if started else endpointer.utterance + 1
+            if not is_final:
+                if self._segment > self._answered:
+                    endpointer.partial(text)
+                continue
+            utterance, self._segment = self._segment, None
+            if utterance <= self._answered:
+                # The endpointer already answered this utterance
+                continue
+            self._answered = utterance
+            if endpointer.utterance == utterance:
+                endpointer.consume()
+            if text.strip():
+                self.turns.put_nowait(text)
+
+    async def _turns(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            text = await self.turns.get()
+            self.server.stats['utterances'] += 1
+            started = time.time()
+            heard, self._heard = self._heard[-self._heard_max:], bytearray()
+            self._record('caller', text, heard, started)
+            try:
+                reply = await loop.run_in_executor(
+                    self.server.executor, self.backend.reply, self.session_id, text, self.did, self.caller_number
+                )
+            except Exception as e:
+                logger.error(f"Agent turn failed for {self.session_id}: {str(e)}")
+                reply = "I'm sorry, I'm having trouble right now. Could you say that again?"
+            self.server.stats['turn_ms_total'] += (time.time() - started) * 1000
+            self.endpointer.expect(expected_answer_type(reply))
+            # Likely next prompts synthesize while this reply plays and the caller answers
+            self.backend.predict(self.session_id, self.did, reply, self.clinic, self.adapter.sample_rate)
+            await self.speak(reply)
+
+    async def _playout(self):
+        """Send frames at real-time pace against an absolute clock (no drift)"""
+        loop = asyncio.get_running_loop()
+        frame_seconds = self.adapter.frame_ms / 1000.0
+        next_at = None
+        while True:
+            item = await self.outbound.get()
+            if item is None:
+                return
+            turn, frame = item
+            if turn.cancelled:
+                # Queued before a barge-in: never sent
+                turn.dropped_frames += 1
+                self.server.stats['dropped_frames'] += 1
+                continue
+            if frame == b'':
+                if self.playing is turn:
+                    self.playing = None
+                await self.adapter.end_of_reply()
+                continue
+            now = loop.time()
+            if next_at is None or next_at < now:
+                next_at = now
+            await self.adapter.send_audio(frame)
+            self.server.stats['frames_out'] += 1
+            next_at += frame_seconds
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        self.outbound.put_nowait(None)
+        try:
+            await self.transcriber.close()
+        except Exception as e:
+            logger.warning(f"Transcriber close failed for {self.session_id}: {e}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # After the tasks so the artifact gets the last (possibly cut-off) reply
+        await asyncio.gather(*self._records, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(self.server.executor, self.backend.end_call,
+                                                         self.session_id)
+
+
+# --- Server -----------------------------------------------------------------
+
+class MediaServer:
+    """aiohttp application hosting the media-stream endpoints"""
+
+    def __init__(self, backend=None, workers=MEDIA_WORKERS):
+        self.backend = backend or VoiceProcessorBackend()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media')
+        self.sessions = {}
+        self.stats = {'calls': 0, 'utterances': 0, 'frames_in': 0, 'frames_out': 0, 'turn_ms_total': 0.0,
+                      'early_endpoints': 0, 'barge_ins': 0, 'saved_chars': 0, 'dropped_frames': 0}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/twilio', self.handle_twilio)
+        app.router.add_get('/freeswitch', self.handle_freeswitch)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/audio/{audio_id}', self.handle_audio)
+        return app
+
+    async def handle_twilio(self, request):
+        return await self._serve(request, TwilioAdapter)
+
+    async def handle_freeswitch(self, request):
+        rate = int(request.query.get('sample_rate', '8000'))
+        return await self._serve(request, lambda ws: FreeSwitchAdapter(ws, rate))
+
+    async def handle_health(self, request):
+        return web.json_response(dict(self.stats, active_calls=len(self.sessions)))
+
+    async def handle_audio(self, request):
+        item = self.backend.audio(request.match_info['audio_id'])
+        if item is None:
+            raise web.HTTPNotFound()
+        body, content_type = item
+        return web.Response(body=body, content_type=content_type,
+                            headers={'Cache-Control': 'private, max-age=3600'})
+
+    async def _serve(self, request, make_adapter):
+        ws = web.WebSocketResponse(max_msg_size=1 << 20, heartbeat=30)
+        await ws.prepare(request)
+        adapter = make_adapter(ws)
+        session = None
+
+        try:
+            async for msg in ws:
+                kind, payload = adapter.parse(msg)
+                if kind == 'start' and session is None:
+                    session = CallSession(self, adapter, payload)
+                    self.sessions[session.session_id] = session
+                    self.stats['calls'] += 1
+                    logger.info(f"{adapter.channel} stream started: {session.session_id}")
+                    await session.start()
+                elif kind == 'audio' and session is not None:
+                    self.stats['frames_in'] += 1
+                    await session.feed(payload)
+                elif kind == 'stop':
+                    break
+        except Exception as e:
+            logger.error(f"{adapter.channel} stream error: {str(e)}")
+        finally:
+            if session is not None:
+                self.sessions.pop(session.session_id, None)
+                await session.close()
+                logger.info(f"{adapter.channel} stream ended: {session.session_id}")
+        return ws
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Real-time media-stream server for Twilio and FreeSWITCH')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8080')))
+    parser.add_argument('--offline', action='store_true', help='Fake ASR, agent and TTS (no AWS calls)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    server = MediaServer(OfflineBackend() if args.offline else None)
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Lightweight in-process metrics for the voice processor.
+
+Counters and timings are kept in memory so ratios can be inspected from a
+warm container (or the container-mode /metrics route), and flush() writes
+them to the log in CloudWatch Embedded Metric Format so no extra client or
+dependency is needed to get them onto dashboards.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+
+NAMESPACE = 'IvrVoiceProcessor'
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_timings = defaultdict(list)
+_flushed = {}
+
+# Keep timing samples bounded in long-lived processes
+MAX_SAMPLES = 2048
+
+
+def _key(name, dimensions):
+    if not dimensions:
+        return (name, ())
+    return (name, tuple(sorted((k, str(v)) for k, v in dimensions.items())))
+
+
+def incr(name, value=1, **dimensions):
+    """Increment a counter"""
+    with _lock:
+        _counters[_key(name, dimensions)] += value
+
+
+def observe(name, value, **dimensions):
+    """Record a timing or size sample"""
+    with _lock:
+        samples = _timings[_key(name, dimensions)]
+        samples.append(value)
+        if len(samples) > MAX_SAMPLES:
+            del samples[:len(samples) - MAX_SAMPLES]
+
+
+def counter(name, **dimensions):
+    """Current value of a counter"""
+    with _lock:
+        return _counters.get(_key(name, dimensions), 0)
+
+
+def counters_by(name):
+    """All dimension combinations recorded for a counter, as {dims: value}"""
+    with _lock:
+        return {dims: value for (n, dims), value in _counters.items() if n == name}
+
+
+def percentile(name, pct, **dimensions):
+    """Percentile of recorded samples, or None if there are none"""
+    with _lock:
+        samples = sorted(_timings.get(_key(name, dimensions), []))
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+def ratio(numerator, denominator):
+    """Safe ratio helper for reporting"""
+    return numerator / denominator if denominator else 0.0
+
+
+def snapshot():
+    """Plain dict view of all metrics, for logging or a /metrics route"""
+    with _lock:
+        counters = {_format(k): v for k, v in _counters.items()}
+        timings = {}
+        for k, samples in _timings.items():
+            if samples:
+                ordered = sorted(samples)
+                timings[_format(k)] = {
+                    'count': len(ordered),
+                    'p50': ordered[len(ordered) // 2],
+                    'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    'max': ordered[-1]
+                }
+    return {'counters': counters, 'timings': timings}
+
+
+def flush():
+    """Write counter deltas since the last flush to the log in CloudWatch Embedded Metric Format"""
+    with _lock:
+        deltas = []
+        for key, value in _counters.items():
+            delta = value - _flushed.get(key, 0)
+            if delta:
+                deltas.append((key, delta))
+                _flushed[key] = value
+
+    for (name, dims), value in deltas:
+        dimensions = dict(dims)
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [list(dimensions.keys())],
+                    'Metrics': [{'Name': name}]
+                }]
+            },
+            name: value
+        }
+        record.update(dimensions)
+        print(json.dumps(record))
+
+
+def reset():
+    """Clear all metrics (used by benchmarks)"""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _flushed.clear()
+
+
+def _format(key):
+    name, dims = key
+    if not dims:
+        return name
+    return name + '{' + ','.join(f"{k}={v}" for k, v in dims) + '}'
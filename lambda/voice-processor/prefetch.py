@@ -0,0 +1,284 @@
+"""
+Speculative prefetch at call start.
+
+While the tenant greeting is played, background fetches run in parallel:
+tenant config, the next few business days of slots (one request per day,
+concurrently), the caller profile, and cheap calls that warm the boto3
+connection pools. Results land in the per-call cache so the first real
+agent turn mostly sees warm data. Call setup returns the greeting without
+waiting for them.
+
+A Lambda call's turns rarely run in the container that ran its setup, so
+the tenant config and slots are also saved to S3 under the call's session
+ID (CallSetupStore); the first turn a container serves for that call loads
+them into its own call cache, trying again on its next turns while the
+prefetches are still running. The caller profile is not copied there: it
+already lives in S3 through the profile cache.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import metrics
+from hedging import hedger
+
+logger = logging.getLogger(__name__)
+
+TENANT_CONFIG_URL = os.environ.get('TENANT_CONFIG_URL', 'http://localhost:7001')
+APPOINTMENT_SERVICE_URL = os.environ.get('APPOINTMENT_SERVICE_URL', 'http://localhost:7002')
+
+PREFETCH_SLOT_DAYS = int(os.environ.get('PREFETCH_SLOT_DAYS', '3'))
+PREFETCH_BUDGET_SECONDS = float(os.environ.get('PREFETCH_BUDGET_SECONDS', '2.5'))
+PREFETCH_HTTP_TIMEOUT = float(os.environ.get('PREFETCH_HTTP_TIMEOUT', '3'))
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', '8'))
+# Tenant config is shared by every call to the same DID in this process
+TENANT_SNAPSHOT_TTL_SECONDS = float(os.environ.get('TENANT_SNAPSHOT_TTL_SECONDS', '60'))
+
+# Hedged operations (opt-in via HEDGE_OPERATIONS); both lookups are idempotent reads
+TENANT_RESOLVE = 'tenant.resolve'
+SLOTS_SEARCH = 'slots.search'
+
+# Cache keys written by the prefetcher
+TENANT_CONFIG = 'tenant_config'
+UPCOMING_SLOTS = 'upcoming_slots'
+CALLER_PROFILE = 'caller_profile'
+# Kinds saved for the call's other containers; marker set once a container has loaded them
+SHARED_KINDS = (TENANT_CONFIG, UPCOMING_SLOTS)
+SETUP_RESTORED = 'setup_restored'
+# A turn that finds nothing saved yet tries again on the next, up to this many turns
+RESTORE_ATTEMPTS = 3
+RESTORE_MISSES = 'setup_restore_misses'
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch')
+# Per-day slot searches; separate from _executor, whose workers wait on them
+_slot_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch-slots')
+
+_tenant_snapshots = {}  # did -> (fetched_at, config)
+_tenant_lock = threading.Lock()
+
+
+def fetch_json(url, payload=None, timeout=PREFETCH_HTTP_TIMEOUT):
+    """GET (or POST when payload is given) a JSON endpoint"""
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(
+        url,
+        data=data,
+        headers={'Content-Type': 'application/json'},
+        method='POST' if data is not None else 'GET'
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def fetch_tenant_config(did):
+    """Resolve the tenant config for a DID from the tenant-config service"""
+    query = urllib.parse.urlencode({'did': did})
+    return hedger.call(TENANT_RESOLVE, lambda: fetch_json(f"{TENANT_CONFIG_URL}/v1/tenants/resolve?{query}"))
+
+
+def tenant_snapshot(did):
+    """Tenant config for a DID, fetched at most once per TTL per process"""
+    now = time.time()
+    with _tenant_lock:
+        cached = _tenant_snapshots.get(did)
+    if cached and now - cached[0] < TENANT_SNAPSHOT_TTL_SECONDS:
+        metrics.incr('tenant_snapshot.hit')
+        return cached[1]
+    config = fetch_tenant_config(did)
+    with _tenant_lock:
+        _tenant_snapshots[did] = (now, config)
+    metrics.incr('tenant_snapshot.miss')
+    return config
+
+
+def next_business_days(count, start=None):
+    """The next `count` weekdays starting tomorrow, as YYYY-MM-DD strings"""
+    day = (start or datetime.now()) + timedelta(days=1)
+    days = []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    return days
+
+
+def fetch_slots_for_day(tenant_id, date):
+    payload = {'tenantId': tenant_id, 'date': date, 'timePreference': 'any'}
+    result = hedger.call(SLOTS_SEARCH, lambda: fetch_json(f"{APPOINTMENT_SERVICE_URL}/v1/slots/search", payload))
+    return result.get('slots') or []
+
+
+def fetch_upcoming_slots(tenant_id, days=PREFETCH_SLOT_DAYS):
+    """Fetch open slots for the next few business days, one concurrent search per day"""
+    futures = [_slot_executor.submit(fetch_slots_for_day, tenant_id, date) for date in next_business_days(days)]
+    slots = [slot for future in futures for slot in future.result()]
+    slots.sort(key=lambda slot: slot.get('start_time', ''))
+    return slots
+
+
+class CallSetupStore:
+    """Call-setup prefetch results in S3, one small JSON object per call"""
+
+    def __init__(self, s3_client, bucket, prefix='call-setup'):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, session_id):
+        return f"{self.prefix}/{session_id}.json"
+
+    def put(self, session_id, values):
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(session_id), Body=json.dumps(values).encode('utf-8'),
+                           ContentType='application/json')
+
+    def get(self, session_id):
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(session_id))
+            return json.loads(response['Body'].read().decode('utf-8'))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def delete(self, session_id):
+        self.s3.delete_object(Bucket=self.bucket, Key=self._key(session_id))
+
+
+class CallPrefetcher:
+    """Fires the call-setup prefetches and stores their results in the call cache (and the setup store)"""
+
+    def __init__(self, cache, caller_profiles=None, warmers=None, executor=None, store=None):
+        self.cache = cache
+        self.caller_profiles = caller_profiles
+        self.warmers = warmers or {}
+        self.executor = executor or _executor
+        self.store = store
+
+    def start(self, session_id, did, caller_number=None):
+        """Submit all prefetches for a call; returns {kind: future}"""
+        futures = {}
+
+        tenant_future = self._submit(session_id, TENANT_CONFIG, tenant_snapshot, did)
+        futures[TENANT_CONFIG] = tenant_future
+
+        def slots_for_tenant():
+            # Needs the tenant ID, so chain off the tenant config fetch
+            tenant = tenant_future.result(timeout=PREFETCH_BUDGET_SECONDS) or {}
+            return fetch_upcoming_slots(tenant.get('tenant_name', did))
+
+        futures[UPCOMING_SLOTS] = self._submit(session_id, UPCOMING_SLOTS, slots_for_tenant)
+
+        if caller_number and self.caller_profiles:
+            futures[CALLER_PROFILE] = self._submit(
+                session_id, CALLER_PROFILE, self.caller_profiles.get, did, caller_number
+            )
+
+        for name, warmer in self.warmers.items():
+            futures[f"warm_{name}"] = self.executor.submit(self._warm, name, warmer)
+
+        return futures
+
+    def wait(self, futures, budget=PREFETCH_BUDGET_SECONDS):
+        """Block until prefetches finish or the budget runs out; returns finished kinds"""
+        done, not_done = wait(list(futures.values()), timeout=budget)
+        for kind, future in futures.items():
+            if future in not_done:
+                metrics.incr('prefetch.late', kind=kind)
+        return sorted(kind for kind, future in futures.items() if future in done)
+
+    def save(self, session_id):
+        """Save the call's finished shared prefetches for containers that serve its later turns"""
+        if self.store is None:
+            return
+        values = {kind: self.cache.get(session_id, kind) for kind in SHARED_KINDS if self.cache.has(session_id, kind)}
+        if not values:
+            return
+        try:
+            self.store.put(session_id, values)
+        except Exception as e:
+            logger.warning(f"Call setup save failed for {session_id}: {e}")
+
+    def restore(self, session_id):
+        """
+        Load the call's saved prefetches into this container's call cache:
+        once per container when found, else again on the next few turns
+        (the prefetches run while the greeting plays and may not be saved yet)
+        """
+        if self.store is None or self.cache.has(session_id, SETUP_RESTORED):
+            return
+        if all(self.cache.has(session_id, kind) for kind in SHARED_KINDS):
+            self.cache.put(session_id, SETUP_RESTORED, True)
+            return  # prefetched here
+        try:
+            values = self.store.get(session_id) or {}
+        except Exception as e:
+            logger.warning(f"Call setup load failed for {session_id}: {e}")
+            metrics.incr('prefetch.restore', result='error')
+            values = {}
+        else:
+            metrics.incr('prefetch.restore', result='hit' if values else 'miss')
+        misses = 0 if values else (self.cache.get(session_id, RESTORE_MISSES) or 0) + 1
+        if values or misses >= RESTORE_ATTEMPTS:
+            self.cache.put(session_id, SETUP_RESTORED, True)
+        else:
+            self.cache.put(session_id, RESTORE_MISSES, misses)
+        for kind, value in values.items():
+            if kind in SHARED_KINDS and not self.cache.has(session_id, kind):
+                self.cache.put(session_id, kind, value, prefetched=True)
+
+    def forget(self, session_id):
+        """Call ended: drop its saved prefetches"""
+        if self.store is None:
+            return
+        try:
+            self.store.delete(session_id)
+        except Exception as e:
+            logger.warning(f"Call setup delete failed for {session_id}: {e}")
+
+    def _submit(self, session_id, kind, fn, *args):
+        metrics.incr('prefetch.issued', kind=kind)
+
+        def run():
+            started = time.time()
+            try:
+                value = fn(*args)
+            except Exception as e:
+                logger.warning(f"Prefetch {kind} failed for {session_id}: {e}")
+                metrics.incr('prefetch.failed', kind=kind)
+                return None
+            metrics.observe('prefetch.latency_ms', (time.time() - started) * 1000, kind=kind)
+            if value is not None:
+                self.cache.put(session_id, kind, value, prefetched=True)
+            return value
+
+        return self.executor.submit(run)
+
+    @staticmethod
+    def _warm(name, warmer):
+        try:
+            warmer()
+            metrics.incr('prefetch.warmed', kind=name)
+        except Exception as e:
+            logger.warning(f"Connection warm-up {name} failed: {e}")
+
+
+def prefetch_stats():
+    """Hit and waste ratios per prefetch kind, for tuning what is worth fetching"""
+    stats = {}
+    for dims, issued in metrics.counters_by('prefetch.issued').items():
+        kind = dict(dims).get('kind')
+        hits = metrics.counter('prefetch.hit', kind=kind)
+        wasted = metrics.counter('prefetch.wasted', kind=kind)
+        stats[kind] = {
+            'issued': issued,
+            'hits': hits,
+            'wasted': wasted,
+            'hit_ratio': metrics.ratio(hits, issued),
+            'waste_ratio': metrics.ratio(wasted, issued)
+        }
+    return stats
@@ -0,0 +1,216 @@
+"""
+Predictive pre-synthesis of the agent's likely next prompts.
+
+Once slots have been offered the next agent utterances are predictable:
+"May I have your full name?", then the email question, then the booking
+confirmation. After each agent turn the predictor works out the call's
+state (the action group invoked this turn, else the kind of answer the
+agent just asked for), picks the top-N likely next prompts for that state
+and synthesizes them into the TTS cache in the background while the caller
+is answering. When the agent's next reply matches a prediction, its audio
+is already cached.
+
+Candidates come from a seed table plus what each tenant's agent was
+actually observed to say next from the same state, so the lists converge
+on the tenant's own phrasing. Predictions are made per synthesis unit:
+whole replies for the Lambda channels, sentences for the media server,
+which synthesizes sentence by sentence.
+
+Hit rate and wasted synthesis characters are recorded per tenant (see
+predictor_stats) so top-N and the minimum share can be tuned per tenant
+through PREDICTION_POLICIES, e.g. '{"1002": {"top_n": 1}}'.
+
+On Lambda the background synthesis runs while the container is live and
+otherwise resumes on the next invocation, overlapping that turn's
+transcription and agent call; the media server keeps synthesizing while
+the caller talks.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from barge_in import split_sentences
+
+logger = logging.getLogger(__name__)
+
+PREDICT_TOP_N = int(os.environ.get('PREDICT_TOP_N', '3'))
+# Learned candidates must account for at least this share of what followed the state
+PREDICT_MIN_SHARE = float(os.environ.get('PREDICT_MIN_SHARE', '0.1'))
+PREDICTION_POLICIES = json.loads(os.environ.get('PREDICTION_POLICIES', '{}'))
+PREDICT_MAX_SESSIONS = int(os.environ.get('PREDICT_MAX_SESSIONS', '5000'))
+# Distinct next utterances remembered per tenant and state
+PREDICT_MAX_LEARNED = 50
+
+# Call-cache key for the action group API path invoked on the latest agent turn
+LAST_ACTION = 'last_action'
+
+# Seed prompts per state until a tenant's own transitions have been observed.
+# States are action group API paths or the answer type just asked for.
+SEED_PREDICTIONS = {
+    '/searchSlots': [
+        "May I have your full name, please?",
+        "Great. May I have your full name, please?",
+        "And what's the best email address for your confirmation?",
+    ],
+    'name': [
+        "Thank you. And what's the best email address for your confirmation?",
+        "And your email address?",
+    ],
+    'email': [
+        "Let me book that for you.",
+        "Is there anything else I can help you with today?",
+    ],
+    '/confirmAppointment': [
+        "Is there anything else I can help you with today?",
+        "Thank you for calling. Goodbye!",
+    ],
+    'date_time': [
+        "Let me check what's available.",
+    ],
+}
+
+
+def normalize(text):
+    return ' '.join(text.split()).lower()
+
+
+def synthesis_units(text, profile):
+    """What one synthesis call covers on this channel"""
+    return split_sentences(text) if profile == 'stream' else [text.strip()]
+
+
+def policy_for(did):
+    policy = PREDICTION_POLICIES.get(str(did), {})
+    return (int(policy.get('top_n', PREDICT_TOP_N)),
+            float(policy.get('min_share', PREDICT_MIN_SHARE)))
+
+
+class _Pending:
+    __slots__ = ('text', 'future')
+
+    def __init__(self, text, future):
+        self.text = text
+        self.future = future
+
+
+class PromptPredictor:
+    """Per-session next-prompt prediction with per-tenant learned transitions"""
+
+    def __init__(self, synthesize, max_sessions=PREDICT_MAX_SESSIONS, workers=2):
+        # synthesize(text, clinic_config, profile) -> audio; fills the TTS cache
+        self.synthesize = synthesize
+        self.max_sessions = max_sessions
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='predict')
+        self._sessions = OrderedDict()  # session_id -> (did, state, {normalized unit: _Pending})
+        # (did, state) -> Counter of next units, kept verbatim because cache keys are exact text
+        self._learned = {}
+        self._lock = threading.Lock()
+
+    def observe(self, session_id, did, state, reply, clinic_config, profile):
+        """
+        Account for the reply against the last predictions, learn the
+        transition, then pre-synthesize the predictions for the new state.
+        Returns the list of units submitted for synthesis.
+        """
+        units = synthesis_units(reply, profile)
+        with self._lock:
+            _, previous_state, pending = self._sessions.pop(session_id, (did, None, {}))
+            if previous_state is not None:
+                learned = self._learned.setdefault((did, previous_state), Counter())
+                learned.update(units)
+                if len(learned) > PREDICT_MAX_LEARNED:
+                    for unit, _ in learned.most_common()[PREDICT_MAX_LEARNED:]:
+                        del learned[unit]
+        self._settle(did, units, pending)
+
+        predictions = self.predict(did, state, units)
+        futures = {}
+        for text in predictions:
+            metrics.incr('predict.issued', did=did)
+            future = self.executor.submit(self._synthesize, did, text, clinic_config, profile)
+            futures[normalize(text)] = _Pending(text, future)
+        with self._lock:
+            self._sessions[session_id] = (did, state, futures)
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1])
+        for evicted_did, _, evicted_pending in evicted:
+            self._settle(evicted_did, [], evicted_pending)
+        return predictions
+
+    def predict(self, did, state, just_said=()):
+        """Top-N likely next units for a state, learned phrasing first"""
+        if state is None:
+            return []
+        top_n, min_share = policy_for(did)
+        said = {normalize(u) for u in just_said}
+        with self._lock:
+            learned = self._learned.get((did, state), Counter())
+            total = sum(learned.values())
+            ranked = [u for u, count in learned.most_common() if total and count / total >= min_share]
+        by_norm = {}
+        for text in ranked + SEED_PREDICTIONS.get(state, []):
+            key = normalize(text)
+            if key not in said and key not in by_norm:
+                by_norm[key] = text
+        return list(by_norm.values())[:top_n]
+
+    def end_call(self, session_id):
+        """Settle a finished call's outstanding predictions as waste"""
+        with self._lock:
+            did, _, pending = self._sessions.pop(session_id, (None, None, {}))
+        self._settle(did, [], pending)
+
+    def _settle(self, did, units, pending):
+        said = {normalize(u) for u in units}
+        for key, prediction in pending.items():
+            future = prediction.future
+            if key in said:
+                if future.done() and not future.cancelled() and future.result():
+                    metrics.incr('predict.hit', did=did)
+                    metrics.incr('predict.saved_chars', len(prediction.text), did=did)
+                else:
+                    metrics.incr('predict.late', did=did)
+            elif future.cancel():
+                # Never reached Polly, so nothing was wasted
+                metrics.incr('predict.cancelled', did=did)
+            else:
+                metrics.incr('predict.wasted_chars', len(prediction.text), did=did)
+
+    def _synthesize(self, did, text, clinic_config, profile):
+        started = time.time()
+        try:
+            audio = self.synthesize(text, clinic_config, profile)
+        except Exception as e:
+            logger.warning(f"Predictive synthesis failed for {text[:40]!r}: {e}")
+            return False
+        metrics.incr('predict.synthesized_chars', len(text), did=did)
+        metrics.observe('predict.synthesis_ms', (time.time() - started) * 1000, did=did)
+        return bool(audio)
+
+
+def predictor_stats():
+    """Hit rate and wasted synthesis characters per tenant, for tuning PREDICTION_POLICIES"""
+    stats = {}
+    for dims, issued in metrics.counters_by('predict.issued').items():
+        did = dict(dims).get('did')
+        hits = metrics.counter('predict.hit', did=did)
+        synthesized = metrics.counter('predict.synthesized_chars', did=did)
+        wasted = metrics.counter('predict.wasted_chars', did=did)
+        stats[did] = {
+            'issued': issued,
+            'hits': hits,
+            'late': metrics.counter('predict.late', did=did),
+            'hit_rate': metrics.ratio(hits, issued),
+            'saved_chars': metrics.counter('predict.saved_chars', did=did),
+            'synthesized_chars': synthesized,
+            'wasted_chars': wasted,
+            'waste_ratio': metrics.ratio(wasted, synthesized)
+        }
+    return stats
@@ -0,0 +1,297 @@
+"""
+Throttling-aware retries and adaptive concurrency for AWS service calls.
+
+Bedrock, Polly and Transcribe errors used to end the turn with a canned
+apology on the first failure, while botocore's own hidden retries hammered
+a throttled service with more requests. Calls now go through
+Resilience.call(service, fn):
+
+  classify   throttle   the service is shedding load (ThrottlingException,
+                        TooManyRequests, LimitExceeded, SlowDown, 429)
+             transient  worth another try (5xx, connection resets, timeouts)
+             fatal      retrying cannot help (validation, access, not found)
+  retry      throttles and transient errors are retried with decorrelated
+             jitter (sleep = uniform(base, 3 x previous sleep), capped), but
+             only while the turn's deadline leaves room for the sleep plus
+             one more attempt, and only while the service's retry budget
+             (RETRY_BUDGET_RATIO of recent calls plus a small floor per
+             second) has a token. A service in trouble gets a few percent of
+             extra load, never a retry storm
+  limit      each service has an AIMD concurrency limit: +1/limit per
+             success, x AIMD_DECREASE on a throttle. Only calls sent after
+             the last decrease can cut it again, so one burst of throttles
+             halves it once, while a limit still above the service's
+             capacity keeps halving every round trip. Callers wait for a
+             slot until the turn's deadline. Listeners
+             (the admission schedulers) follow the limit, so shedding stays
+             per-tenant fair while the service recovers
+
+The turn deadline comes from the Lambda context (remaining time minus
+DEADLINE_MARGIN_SECONDS) or TURN_BUDGET_SECONDS, opened by deadline_scope()
+in the handler. Calls outside a turn get the default budget.
+
+The Bedrock, Polly and Transcribe clients are created with botocore
+retries off (see index.py), so this layer is the only one retrying them.
+"""
+
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+THROTTLE = 'throttle'
+TRANSIENT = 'transient'
+FATAL = 'fatal'
+
+TURN_BUDGET_SECONDS = float(os.environ.get('TURN_BUDGET_SECONDS', '10'))
+# Left for the rest of the turn (speech, response) after the last service call
+DEADLINE_MARGIN_SECONDS = float(os.environ.get('DEADLINE_MARGIN_SECONDS', '1.5'))
+
+RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', '4'))
+RETRY_BASE_SECONDS = float(os.environ.get('RETRY_BASE_SECONDS', '0.05'))
+RETRY_CAP_SECONDS = float(os.environ.get('RETRY_CAP_SECONDS', '2'))
+# Retries may add this share of the service's calls, plus RETRY_BUDGET_MIN_PER_SECOND
+RETRY_BUDGET_RATIO = float(os.environ.get('RETRY_BUDGET_RATIO', '0.1'))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.environ.get('RETRY_BUDGET_MIN_PER_SECOND', '1'))
+# Unused retry tokens saved up for a burst
+RETRY_BUDGET_MAX = float(os.environ.get('RETRY_BUDGET_MAX', '10'))
+
+AIMD_DECREASE = float(os.environ.get('AIMD_DECREASE', '0.5'))
+
+# Initial (and maximum) concurrency per service; the limit never drops below min
+SERVICE_LIMITS = {
+    'bedrock': {'initial': int(os.environ.get('ADMISSION_BEDROCK_CONCURRENCY', '16')), 'min': 1},
+    'polly': {'initial': int(os.environ.get('ADMISSION_POLLY_CONCURRENCY', '32')), 'min': 2},
+    'transcribe': {'initial': int(os.environ.get('TRANSCRIBE_CONCURRENCY', '16')), 'min': 1},
+}
+
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'TooManyRequestsException',
+    'RequestLimitExceeded', 'LimitExceededException', 'ProvisionedThroughputExceededException',
+    'SlowDown', 'RequestThrottled', 'RequestThrottledException', 'ServiceQuotaExceededException',
+    'throttlingException',
+}
+TRANSIENT_CODES = {
+    'InternalServerException', 'InternalServerError', 'InternalFailure', 'InternalError',
+    'ServiceUnavailable', 'ServiceUnavailableException', 'ServiceFailureException',
+    'DependencyFailedException', 'BadGatewayException', 'ModelNotReadyException',
+    'RequestTimeout', 'RequestTimeoutException', 'internalServerException',
+}
+TRANSIENT_ERRORS = (ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError,
+                    ConnectionError, TimeoutError)
+
+
+class DeadlineExceeded(Exception):
+    """No time left in the turn for another attempt (or for a concurrency slot)"""
+
+
+def classify(error):
+    """THROTTLE, TRANSIENT or FATAL for an exception from a service call"""
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code', '')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        if code in THROTTLE_CODES or status == 429:
+            return THROTTLE
+        if code in TRANSIENT_CODES or status >= 500:
+            return TRANSIENT
+        return FATAL
+    if isinstance(error, TRANSIENT_ERRORS):
+        return TRANSIENT
+    return FATAL
+
+
+# --- Turn deadline --------------------------------------------------------------
+
+_deadline = contextvars.ContextVar('turn_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(context=None, budget_seconds=TURN_BUDGET_SECONDS):
+    """Service calls on this thread must finish by the turn's deadline"""
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        budget_seconds = context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS
+    token = _deadline.set(time.monotonic() + max(budget_seconds, 0.0))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current turn"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return TURN_BUDGET_SECONDS
+    return deadline - time.monotonic()
+
+
+# --- Budget and limit -------------------------------------------------------------
+
+class RetryBudget:
+    """Retry tokens: each call deposits `ratio` of one, time adds `min_per_second`, a retry takes one"""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, min_per_second=RETRY_BUDGET_MIN_PER_SECOND,
+                 max_balance=RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.balance = min(self.max_balance, self.balance + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def withdraw(self):
+        """True if a retry may go out now"""
+        with self._lock:
+            self._refill()
+            if self.balance >= 1.0:
+                self.balance -= 1.0
+                return True
+            return False
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit with a blocking slot gate"""
+
+    def __init__(self, service, initial, minimum=1, maximum=None, decrease=AIMD_DECREASE):
+        self.service = service
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.decrease = decrease
+        self.inflight = 0
+        self.listeners = []
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        """Wait for a slot; returns the send time to pass back to release()"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    metrics.incr('resilience.limit_wait_timeout', service=self.service)
+                    raise DeadlineExceeded(f"no {self.service} slot (limit {int(self.limit)})")
+                self._cond.wait(left)
+            self.inflight += 1
+            return time.monotonic()
+
+    def release(self, sent, outcome):
+        with self._cond:
+            self.inflight -= 1
+            before = int(self.limit)
+            if outcome == THROTTLE:
+                # Calls sent before the last decrease were already counted in it
+                if sent >= self._last_decrease:
+                    self._last_decrease = time.monotonic()
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+            elif outcome is None:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+            after = int(self.limit)
+            self._cond.notify_all()
+        if after != before:
+            metrics.observe('resilience.limit', after, service=self.service)
+            logger.info(f"{self.service} concurrency limit {before} -> {after}")
+            for listener in self.listeners:
+                listener(after)
+
+
+class Resilience:
+    """Per-service retry budget and AIMD limit around service calls"""
+
+    def __init__(self, limits=None, max_attempts=RETRY_MAX_ATTEMPTS, base_seconds=RETRY_BASE_SECONDS,
+                 cap_seconds=RETRY_CAP_SECONDS, sleep=time.sleep):
+        limits = limits or SERVICE_LIMITS
+        self.limits = {service: AdaptiveLimit(service, settings['initial'], settings.get('min', 1))
+                       for service, settings in limits.items()}
+        self.budgets = {service: RetryBudget() for service in limits}
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.cap_seconds = cap_seconds
+        self.sleep = sleep
+
+    def limit(self, service):
+        return self.limits[service]
+
+    def call(self, service, fn, retryable=lambda: True):
+        """
+        fn() with retries on throttles and transient errors. retryable() is
+        asked before each retry, for calls that stop being idempotent once
+        they have produced output. The last error is re-raised when retries
+        run out; DeadlineExceeded when the turn has no time left.
+        """
+        limit = self.limits[service]
+        budget = self.budgets[service]
+        budget.deposit()
+        delay = self.base_seconds
+        attempt = 1
+        while True:
+            sent = limit.acquire(max(remaining(), 0.0))
+            outcome = None
+            try:
+                result = fn()
+            except Exception as e:
+                outcome = classify(e)
+                error = e
+            finally:
+                limit.release(sent, outcome)
+            metrics.incr('resilience.attempt', service=service, outcome=outcome or 'ok')
+            if outcome is None:
+                return result
+            if outcome == FATAL or not retryable():
+                raise error
+            if attempt >= self.max_attempts:
+                metrics.incr('resilience.exhausted', service=service, reason='attempts')
+                raise error
+            # Decorrelated jitter: spread retries from many callers instead of syncing them
+            delay = min(self.cap_seconds, random.uniform(self.base_seconds, delay * 3))
+            if remaining() < delay + self.base_seconds:
+                metrics.incr('resilience.exhausted', service=service, reason='deadline')
+                raise error
+            if not budget.withdraw():
+                metrics.incr('resilience.exhausted', service=service, reason='budget')
+                raise error
+            metrics.incr('resilience.retry', service=service, outcome=outcome)
+            logger.warning(f"{service} {outcome} error, retry {attempt} in {delay * 1000:.0f} ms: {str(error)}")
+            self.sleep(delay)
+            attempt += 1
+
+
+def resilience_stats(resilience):
+    """Current limit and in-flight calls per service, with attempt outcomes and retries"""
+    stats = {}
+    for service, limit in resilience.limits.items():
+        stats[service] = {'limit': int(limit.limit), 'inflight': limit.inflight,
+                          'retry_budget': round(resilience.budgets[service].balance, 2),
+                          'ok': 0, THROTTLE: 0, TRANSIENT: 0, FATAL: 0, 'retries': 0}
+    for dims, count in metrics.counters_by('resilience.attempt').items():
+        labels = dict(dims)
+        stats[labels['service']][labels['outcome']] += count
+    for dims, count in metrics.counters_by('resilience.retry').items():
+        stats[dict(dims)['service']]['retries'] += count
+    return stats
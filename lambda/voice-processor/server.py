@@ -0,0 +1,243 @@
+"""
+Container mode: the voice-processor handlers as a long-running HTTP service.
+
+As a Lambda, each execution environment carries one invocation at a time,
+so every burst of calls is a burst of cold starts, and every environment
+keeps its own TTS cache, boto3 pools and tenant config. This entry point
+runs the same handlers behind an aiohttp server. Requests are parsed on
+the event loop, and the blocking Bedrock/Polly/Transcribe work runs on a
+bounded thread pool. One process then serves thousands of concurrent
+calls that share the process-wide state in index.py: the call cache,
+TTS and fragment caches, caller profiles, tenant snapshots, turn dedupe
+and one set of boto3 connection pools.
+
+    POST /connect          Amazon Connect Lambda event     -> handler JSON
+    POST /direct           direct voice API event          -> handler JSON
+    POST /text             text event                      -> handler JSON
+    POST /invoke           any event, dispatched like lambda_handler
+    POST /voice            Twilio <Gather> webhook (form)  -> TwiML
+    POST /voice/result     Twilio async-turn result polls  -> TwiML
+    GET  /audio/{audio_id} proxied speech (AUDIO_PROXY_BASE_URL)
+    GET  /health           liveness and counters
+    GET  /ready            200 once warmed, 503 before that and while draining
+    GET  /metrics          metrics snapshot
+
+On SIGTERM the server stops accepting connections and reports not ready.
+It lets in-flight turns finish for up to SHUTDOWN_GRACE_SECONDS, then
+writes open call artifacts and flushes metrics.
+
+    python server.py --port 8000
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import io
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SERVICE_WORKERS = int(os.environ.get('SERVICE_WORKERS', '256'))
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get('SHUTDOWN_GRACE_SECONDS', '25'))
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get('WARMUP_TIMEOUT_SECONDS', '10'))
+
+# Sized before index.py creates its clients: every worker may hold a connection
+os.environ.setdefault('AWS_MAX_POOL_CONNECTIONS', str(SERVICE_WORKERS))
+# Large audio payloads go to worker processes instead of holding the GIL
+os.environ.setdefault('AUDIO_OFFLOAD', 'process')
+# Async Twilio turns run on this process's own queue and store
+os.environ.setdefault('TURN_QUEUE', 'memory')
+os.environ.setdefault('TURN_STORE', 'memory')
+
+TWILIO_WEBHOOK_DIR = os.environ.get(
+    'TWILIO_WEBHOOK_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'twilio-webhook')
+)
+# Modules a Lambda gets from the shared layer (hedging.py)
+SHARED_MODULES_DIR = os.environ.get(
+    'SHARED_MODULES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared', 'python')
+)
+if os.path.isdir(SHARED_MODULES_DIR) and SHARED_MODULES_DIR not in sys.path:
+    sys.path.append(SHARED_MODULES_DIR)
+
+
+class LocalInvoker:
+    """Stands in for the Lambda client: invokes the voice processor in this process"""
+
+    def __init__(self, handler, executor):
+        self.handler = handler
+        self.executor = executor
+
+    def invoke(self, FunctionName=None, Payload='{}', InvocationType='RequestResponse'):
+        event = json.loads(Payload)
+        if InvocationType == 'Event':
+            self.executor.submit(self.handler, event, None)
+            return {'StatusCode': 202, 'Payload': io.BytesIO(b'')}
+        result = self.handler(event, None)
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(result).encode('utf-8'))}
+
+
+def load_twilio_webhook(invoker):
+    """The Twilio webhook Lambda's module, wired to invoke this process"""
+    path = os.path.join(TWILIO_WEBHOOK_DIR, 'index.py')
+    if not os.path.exists(path):
+        return None
+    if TWILIO_WEBHOOK_DIR not in sys.path:
+        sys.path.insert(0, TWILIO_WEBHOOK_DIR)
+    spec = importlib.util.spec_from_file_location('twilio_webhook', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.voice_client = lambda: invoker
+    return module
+
+
+class VoiceService:
+    """aiohttp application serving the voice-processor handlers from one process"""
+
+    def __init__(self, workers=SERVICE_WORKERS):
+        import index  # boto3 clients and process-wide caches are created on import
+        self.index = index
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='voice')
+        self.twilio = load_twilio_webhook(LocalInvoker(index.lambda_handler, self.executor))
+        self.ready = False
+        self.draining = False
+        self.inflight = 0
+        self.stats = {'requests': 0, 'errors': 0, 'rejected': 0, 'latency_ms_total': 0.0}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/connect', self.handle_event)
+        app.router.add_post('/direct', self.handle_event)
+        app.router.add_post('/text', self.handle_event)
+        app.router.add_post('/invoke', self.handle_event)
+        app.router.add_post('/voice', self.handle_twilio)
+        app.router.add_post('/voice/result', self.handle_twilio)
+        app.router.add_get('/audio/{audio_id}', self.handle_audio)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/ready', self.handle_ready)
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.on_startup.append(self._startup)
+        app.on_shutdown.append(self._shutdown)
+        return app
+
+    # --- Routes -----------------------------------------------------------------
+
+    async def handle_event(self, request):
+        try:
+            event = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text='expected a JSON event')
+        route = request.path.strip('/')
+        if route == 'connect' and 'Details' not in event:
+            raise web.HTTPBadRequest(text='expected an Amazon Connect event')
+        if route == 'direct' and 'audio_data' not in event:
+            raise web.HTTPBadRequest(text='expected audio_data')
+        result = await self._run(self.index.lambda_handler, event)
+        if 'body' in result:
+            # Direct and text handlers return an API Gateway-style response
+            return web.Response(status=result.get('statusCode', 200), body=result['body'],
+                                content_type='application/json')
+        return web.json_response(result)
+
+    async def handle_twilio(self, request):
+        if self.twilio is None:
+            raise web.HTTPNotFound()
+        event = {
+            'body': await request.text(),
+            'headers': dict(request.headers),
+            'rawPath': request.path,
+            'queryStringParameters': dict(request.query) or None,
+        }
+        result = await self._run(self.twilio.lambda_handler, event)
+        return web.Response(status=result['statusCode'], text=result['body'], content_type='text/xml')
+
+    async def handle_audio(self, request):
+        item = self.index.audio_delivery.fetch(request.match_info['audio_id'])
+        if item is None:
+            raise web.HTTPNotFound()
+        body, content_type = item
+        return web.Response(body=body, content_type=content_type,
+                            headers={'Cache-Control': 'private, max-age=3600'})
+
+    async def handle_health(self, request):
+        return web.json_response(dict(self.stats, inflight=self.inflight, ready=self.ready,
+                                      draining=self.draining))
+
+    async def handle_ready(self, request):
+        if self.ready and not self.draining:
+            return web.json_response({'ready': True})
+        return web.json_response({'ready': False, 'draining': self.draining}, status=503)
+
+    async def handle_metrics(self, request):
+        return web.json_response(self.index.metrics.snapshot())
+
+    async def _run(self, handler, event):
+        if self.draining:
+            self.stats['rejected'] += 1
+            raise web.HTTPServiceUnavailable(text='draining')
+        self.inflight += 1
+        self.stats['requests'] += 1
+        started = time.time()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, handler, event, None)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Handler failed: {str(e)}")
+            raise web.HTTPInternalServerError(text='handler failed')
+        finally:
+            self.inflight -= 1
+            self.stats['latency_ms_total'] += (time.time() - started) * 1000
+
+    # --- Lifecycle ----------------------------------------------------------------
+
+    async def _startup(self, app):
+        """Open the boto3 pools and start audio workers in the background; ready once done (or timed out)"""
+        loop = asyncio.get_running_loop()
+        warmers = [loop.run_in_executor(self.executor, warmer) for warmer in self.index.prefetcher.warmers.values()]
+
+        warmers.append(loop.run_in_executor(self.executor, self.index.audio_offload.start))
+
+        async def warm():
+            if warmers:
+                await asyncio.wait(warmers, timeout=WARMUP_TIMEOUT_SECONDS)
+            self.ready = True
+            logger.info('Voice service ready')
+
+        asyncio.ensure_future(warm())
+
+    async def _shutdown(self, app):
+        """Stop taking turns, let in-flight ones finish, then persist per-call state"""
+        self.draining = True
+        deadline = time.time() + SHUTDOWN_GRACE_SECONDS
+        while self.inflight and time.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.inflight:
+            logger.warning(f"Shutting down with {self.inflight} turns still in flight")
+        loop = asyncio.get_running_loop()
+        written = await loop.run_in_executor(self.executor, self.index.call_artifacts.finish_all)
+        logger.info(f"Wrote {len([key for key in written if key])} call artifacts on shutdown")
+        self.index.metrics.flush()
+        await loop.run_in_executor(self.executor, self.index.audio_offload.shutdown)
+        self.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Voice-processor handlers as a long-running HTTP service')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=SERVICE_WORKERS, help='Threads for blocking AWS calls')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    service = VoiceService(workers=args.workers)
+    web.run_app(service.app(), host=args.host, port=args.port, shutdown_timeout=SHUTDOWN_GRACE_SECONDS)
+
+
+if __name__ == '__main__':
+    main()
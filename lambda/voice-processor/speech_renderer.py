@@ -0,0 +1,223 @@
+"""
+Speech rendering for agent replies.
+
+The agent writes for a screen: markdown, bullet lists, links, the clinic's
+full name in every sentence and the occasional paragraph-long answer. All
+of that used to go straight to Polly and the caller sat through it. This
+stage turns a reply into what should actually be spoken:
+
+  1. strip non-speakable markup (markdown emphasis, headings, code, links,
+     URLs, emoji) and expand bullet/numbered lists into one spoken list,
+     capped at the tenant's max_list_items ("..., and 4 more")
+  2. say the clinic's name once; later mentions become "our office"
+  3. enforce the tenant's max_speech_seconds, first by cutting lists
+     shorter, then by dropping sentences from the end, always keeping the
+     closing question so the caller knows what to answer
+  4. emit SSML with the tenant's speaking rate and short breaks between
+     sentences
+
+Durations are estimates from word counts and pauses (neural voices speak
+about 2.7 words a second at 100%), reported before and after rendering.
+This is the Python counterpart of the media gateway's optimizeForSpeech.
+"""
+
+import logging
+import os
+import re
+from xml.sax.saxutils import escape
+
+import metrics
+from barge_in import split_sentences
+
+logger = logging.getLogger(__name__)
+
+SPEECH_MAX_SECONDS = float(os.environ.get('SPEECH_MAX_SECONDS', '20'))
+SPEECH_MAX_LIST_ITEMS = int(os.environ.get('SPEECH_MAX_LIST_ITEMS', '3'))
+SPEECH_RATE = os.environ.get('SPEECH_RATE', '100%')
+
+WORDS_PER_SECOND = 2.7
+PAUSE_SECONDS = {',': 0.15, ';': 0.2, ':': 0.2, '.': 0.35, '?': 0.35, '!': 0.35}
+SENTENCE_BREAK_MS = 250
+
+CLINIC_REPEAT = 'our office'
+
+_LINK = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+_URL = re.compile(r'(?:https?://|www\.)\S+?(?=[.,;:!?)]?(?:\s|$))')
+_CODE = re.compile(r'`+([^`]*)`+')
+_EMPHASIS = re.compile(r'(\*\*|__|\*|~~)(?=\S)(.+?)(?<=\S)\1')
+_HEADING = re.compile(r'^\s{0,3}#{1,6}\s*')
+_LIST_ITEM = re.compile(r'^\s*(?:[-*+•]|\d{1,2}[.)])\s+')
+_TABLE_RULE = re.compile(r'^\s*\|?[\s:-]*\|[\s|:-]*$')
+_SYMBOLS = re.compile(r'[*#`|<>{}\[\]~^\\]')
+_EMOJI = re.compile('[\U0001F000-\U0001FAFF☀-➿️]')
+_WORD = re.compile(r"[A-Za-z0-9']+")
+_SPACES = re.compile(r'\s+')
+_DASH = re.compile(r'\s+[-–—]+\s+')
+_SPACE_BEFORE_PUNCT = re.compile(r'\s+([.,;:!?])')
+
+# Lists are never cut below this many items to meet the budget
+MIN_LIST_ITEMS = 2
+
+
+class SpokenReply:
+    """A reply ready for synthesis: plain text, SSML and estimated durations"""
+
+    __slots__ = ('text', 'ssml', 'seconds_before', 'seconds_after', 'dropped')
+
+    def __init__(self, text, ssml, seconds_before, seconds_after, dropped):
+        self.text = text
+        self.ssml = ssml
+        self.seconds_before = seconds_before
+        self.seconds_after = seconds_after
+        self.dropped = dropped
+
+
+def _rate_factor(rate):
+    try:
+        return max(0.2, float(str(rate).rstrip('%')) / 100.0)
+    except ValueError:
+        return 1.0
+
+
+def estimate_seconds(text, rate=SPEECH_RATE):
+    """Rough spoken duration of plain text"""
+    words = len(_WORD.findall(text))
+    pauses = sum(PAUSE_SECONDS.get(ch, 0.0) for ch in text)
+    return (words / WORDS_PER_SECOND + pauses) / _rate_factor(rate)
+
+
+def _clean_line(line):
+    line = _LINK.sub(r'\1', line)
+    line = _URL.sub('our website', line)
+    line = _CODE.sub(r'\1', line)
+    line = _EMPHASIS.sub(r'\2', line)
+    line = _HEADING.sub('', line)
+    line = _EMOJI.sub('', line)
+    line = _SYMBOLS.sub(' ', line)
+    line = _DASH.sub(', ', line)
+    line = _SPACE_BEFORE_PUNCT.sub(r'\1', _SPACES.sub(' ', line))
+    return line.strip()
+
+
+def _spoken_list(items, max_items):
+    items = [item.rstrip('.;,') for item in items if item]
+    shown = items[:max_items]
+    more = len(items) - len(shown)
+    # Items that contain commas themselves need a longer pause between them
+    sep = '; ' if any(',' in item for item in shown) else ', '
+    if more:
+        return f"{sep.join(shown)}{sep}and {more} more."
+    if len(shown) == 1:
+        return f"{shown[0]}."
+    return f"{sep.join(shown[:-1])}{sep}and {shown[-1]}."
+
+
+def strip_markup(text, max_list_items=SPEECH_MAX_LIST_ITEMS):
+    """Speakable sentences from agent text, with lists collapsed to one sentence"""
+    sentences = []
+    items = []
+    for raw in text.splitlines():
+        if _TABLE_RULE.match(raw):
+            continue
+        is_item = bool(_LIST_ITEM.match(raw))
+        line = _clean_line(_LIST_ITEM.sub('', raw))
+        if is_item:
+            if line:
+                items.append(line)
+            continue
+        if items:
+            sentences.append(_spoken_list(items, max_list_items))
+            items = []
+        if line:
+            if line[-1] not in '.?!:':
+                line += '.'
+            sentences.extend(split_sentences(line))
+    if items:
+        sentences.append(_spoken_list(items, max_list_items))
+    # A list intro like "Here are the options:" reads fine as a sentence
+    return [s[:-1] + '.' if s.endswith(':') else s for s in sentences]
+
+
+def _mention_clinic_once(sentences, clinic_name):
+    if not clinic_name:
+        return sentences
+    pattern = re.compile(re.escape(clinic_name), re.IGNORECASE)
+    seen = False
+    result = []
+    for sentence in sentences:
+        def replace(match):
+            nonlocal seen
+            if not seen:
+                seen = True
+                return match.group()
+            return CLINIC_REPEAT.capitalize() if match.start() == 0 else CLINIC_REPEAT
+        result.append(pattern.sub(replace, sentence))
+    return result
+
+
+def _fit_budget(sentences, max_seconds, rate):
+    """Keep sentences in order within the budget, always ending on the closing question"""
+    total = sum(estimate_seconds(s, rate) for s in sentences)
+    if total <= max_seconds or len(sentences) <= 1:
+        return sentences, 0
+    closing = sentences[-1] if sentences[-1].endswith('?') else None
+    body = sentences[:-1] if closing else sentences
+    budget = max_seconds - (estimate_seconds(closing, rate) if closing else 0.0)
+
+    kept = []
+    used = 0.0
+    for sentence in body:
+        seconds = estimate_seconds(sentence, rate)
+        if kept and used + seconds > budget:
+            break
+        kept.append(sentence)
+        used += seconds
+    if closing:
+        kept.append(closing)
+    return kept, len(sentences) - len(kept)
+
+
+def to_ssml(sentences, rate=SPEECH_RATE):
+    body = f'<break time="{SENTENCE_BREAK_MS}ms"/>'.join(escape(s) for s in sentences)
+    return f'<speak><prosody rate="{rate}">{body}</prosody></speak>'
+
+
+def render_reply(text, clinic=None):
+    """
+    Render agent text for speech under the clinic's settings
+    (name, max_speech_seconds, max_list_items, speaking_rate).
+    """
+    clinic = clinic or {}
+    rate = clinic.get('speaking_rate', SPEECH_RATE)
+    max_seconds = float(clinic.get('max_speech_seconds', SPEECH_MAX_SECONDS))
+
+    def prepare(max_list_items):
+        sentences = strip_markup(text, max_list_items) or [_clean_line(text) or text.strip()]
+        return _mention_clinic_once(sentences, clinic.get('name'))
+
+    # Over budget: summarize lists harder before dropping whole sentences
+    max_list_items = int(clinic.get('max_list_items', SPEECH_MAX_LIST_ITEMS))
+    sentences = prepare(max_list_items)
+    while max_list_items > MIN_LIST_ITEMS and sum(estimate_seconds(s, rate) for s in sentences) > max_seconds:
+        max_list_items -= 1
+        shorter = prepare(max_list_items)
+        if shorter == sentences:
+            break
+        sentences = shorter
+    sentences, dropped = _fit_budget(sentences, max_seconds, rate)
+
+    spoken = ' '.join(sentences)
+    reply = SpokenReply(spoken, to_ssml(sentences, rate), estimate_seconds(text, rate),
+                        estimate_seconds(spoken, rate), dropped)
+    if dropped:
+        logger.info(f"Speech budget: dropped {dropped} sentences "
+                    f"({reply.seconds_before:.1f}s -> {reply.seconds_after:.1f}s)")
+    return reply
+
+
+def record(reply):
+    """Report estimated spoken seconds before and after rendering"""
+    metrics.observe('speech.seconds', reply.seconds_before, stage='before')
+    metrics.observe('speech.seconds', reply.seconds_after, stage='after')
+    if reply.dropped:
+        metrics.incr('speech.truncated')
@@ -0,0 +1,66 @@
+"""
+Process-wide cache of synthesized speech.
+
+Greetings, confirmations and re-prompts repeat constantly across calls, so
+finished audio is kept in a byte-bounded LRU. The key covers everything
+that changes the bytes: text, voice, engine and output profile, so a
+telephony mu-law WAV and a web mp3 of the same sentence never collide.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+def cache_key(text, voice_id, engine, profile):
+    digest = hashlib.sha256(text.strip().encode('utf-8')).hexdigest()[:32]
+    return f"{voice_id}:{engine}:{profile}:{digest}"
+
+
+class TTSCache:
+    """Byte-bounded LRU of finished audio"""
+
+    def __init__(self, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text, voice_id, engine, profile):
+        key = cache_key(text, voice_id, engine, profile)
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+        metrics.incr('tts_cache.hit' if audio is not None else 'tts_cache.miss', profile=profile)
+        return audio
+
+    def put(self, text, voice_id, engine, profile, audio):
+        if not audio or len(audio) > self.max_bytes:
+            return
+        key = cache_key(text, voice_id, engine, profile)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = audio
+            self.size += len(audio)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared by every handler in this container
+tts_cache = TTSCache()
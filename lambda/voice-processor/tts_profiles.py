@@ -0,0 +1,65 @@
+"""
+Channel-native speech output profiles.
+
+Each channel gets audio in the form it actually plays, straight from the
+Polly request, instead of 22.05 kHz mp3 everywhere:
+
+  connect, twilio   8 kHz mu-law WAV (what Connect prompts and <Play> want)
+  stream            8 kHz raw PCM16 for the media server's Twilio Media
+                    Streams and FreeSWITCH legs (framed per channel there)
+  web               mp3, decoded by every browser
+  desktop           Ogg Vorbis for the pygame voice client
+
+Telephony profiles ask Polly for 8 kHz PCM, so the only downstream work
+is a table-lookup mu-law encode. Polly has no Opus output; the desktop
+profile uses Ogg Vorbis, its closest compressed format.
+"""
+
+import audio_codec
+
+TTS_PROFILES = {
+    'connect': {'polly_format': 'pcm', 'sample_rate': 8000, 'encoding': audio_codec.ULAW,
+                'container': 'wav', 'content_type': 'audio/wav', 'extension': 'wav'},
+    'twilio': {'polly_format': 'pcm', 'sample_rate': 8000, 'encoding': audio_codec.ULAW,
+               'container': 'wav', 'content_type': 'audio/wav', 'extension': 'wav'},
+    'stream': {'polly_format': 'pcm', 'sample_rate': 8000, 'encoding': audio_codec.PCM16,
+               'container': 'raw', 'content_type': 'audio/L16', 'extension': 'raw'},
+    'web': {'polly_format': 'mp3', 'sample_rate': 22050, 'encoding': 'mp3',
+            'container': 'mp3', 'content_type': 'audio/mpeg', 'extension': 'mp3'},
+    'desktop': {'polly_format': 'ogg_vorbis', 'sample_rate': 22050, 'encoding': 'ogg_vorbis',
+                'container': 'ogg', 'content_type': 'audio/ogg', 'extension': 'ogg'},
+}
+
+DEFAULT_PROFILE = 'web'
+
+
+def get_profile(name):
+    """Profile settings by name, falling back to the default"""
+    return TTS_PROFILES.get(name, TTS_PROFILES[DEFAULT_PROFILE])
+
+
+def profile_for_event(event):
+    """Pick the output profile from the request source"""
+    requested = event.get('output_profile') or event.get('channel')
+    if requested in TTS_PROFILES:
+        return requested
+    if 'Details' in event and 'ContactData' in event['Details']:
+        return 'connect'
+    session_id = str(event.get('session_id', ''))
+    if session_id.startswith('twilio-'):
+        return 'twilio'
+    return DEFAULT_PROFILE
+
+
+def finish_audio(polly_bytes, profile):
+    """
+    Turn Polly output into the profile's delivery format. Compressed
+    formats pass through; PCM is encoded and framed locally.
+    """
+    settings = get_profile(profile)
+    if settings['polly_format'] != 'pcm':
+        return polly_bytes
+    encoded = audio_codec.encode(audio_codec.as_pcm16(polly_bytes), settings['encoding'])
+    if settings['container'] == 'wav':
+        return audio_codec.wav_bytes(encoded, settings['sample_rate'], encoding=settings['encoding'])
+    return encoded
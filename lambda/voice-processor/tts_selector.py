@@ -0,0 +1,198 @@
+"""
+Latency-aware Polly engine choice per tenant voice.
+
+The neural engine sounds better but is the first to slow down or throttle
+when Polly is under load, and a reply that takes two seconds to synthesize
+is dead air on the phone. Every synthesis reports its latency and outcome
+for its (engine, voice); for each tenant voice the selector compares the
+primary engine's p95 and error rate over the last TTS_WINDOW_SECONDS with
+the tenant's TTS SLO (clinic 'tts_slo_ms', default TTS_SLO_MS):
+
+  degrade   p95 above the SLO, or error rate above TTS_MAX_ERROR_RATE, over
+            at least TTS_MIN_SAMPLES syntheses: new replies use the
+            standard engine (clinic 'fallback_voice_id', default the same
+            voice)
+  recover   at least TTS_HOLD_SECONDS on the fallback, and the primary's
+            syntheses since the switch have a p95 under TTS_RECOVER_RATIO of
+            the SLO and half the error limit
+
+Both decisions only count syntheses since the voice's last switch.
+The gap between the thresholds plus the hold time is the hysteresis that
+keeps a voice from flapping on every slow request. While a voice is on the
+fallback, a short background synthesis probes the primary engine every
+TTS_PROBE_SECONDS, so recovery is measured rather than guessed.
+
+TTS-cache hits and slot offers stitched from cached fragments never reach
+Polly; render_speech serves those first whichever engine is chosen.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TTS_SLO_MS = float(os.environ.get('TTS_SLO_MS', '800'))
+TTS_WINDOW_SECONDS = float(os.environ.get('TTS_WINDOW_SECONDS', '60'))
+TTS_MIN_SAMPLES = int(os.environ.get('TTS_MIN_SAMPLES', '20'))
+TTS_MAX_ERROR_RATE = float(os.environ.get('TTS_MAX_ERROR_RATE', '0.2'))
+TTS_RECOVER_RATIO = float(os.environ.get('TTS_RECOVER_RATIO', '0.7'))
+TTS_RECOVER_SAMPLES = int(os.environ.get('TTS_RECOVER_SAMPLES', '3'))
+TTS_HOLD_SECONDS = float(os.environ.get('TTS_HOLD_SECONDS', '30'))
+TTS_PROBE_SECONDS = float(os.environ.get('TTS_PROBE_SECONDS', '5'))
+TTS_WINDOW_MAX = 512
+
+STANDARD = 'standard'
+# Engines with a cheaper, faster engine to fall back to
+FALLBACK_ENGINES = {'neural': STANDARD, 'long-form': STANDARD, 'generative': STANDARD}
+
+# Why a choice was made
+PRIMARY = 'primary'
+LATENCY = 'latency'
+ERRORS = 'errors'
+
+Choice = namedtuple('Choice', ['engine', 'voice_id', 'reason'])
+
+
+class _VoiceState:
+    """Fallback state of one tenant voice"""
+
+    def __init__(self):
+        self.fallback = False
+        self.reason = PRIMARY
+        self.changed = 0.0
+        self.last_probe = 0.0
+
+
+class TTSSelector:
+    """Rolling per-engine health and per-tenant fallback with hysteresis"""
+
+    def __init__(self, probe=None, slo_ms=TTS_SLO_MS, window_seconds=TTS_WINDOW_SECONDS,
+                 min_samples=TTS_MIN_SAMPLES, max_error_rate=TTS_MAX_ERROR_RATE,
+                 recover_ratio=TTS_RECOVER_RATIO, recover_samples=TTS_RECOVER_SAMPLES,
+                 hold_seconds=TTS_HOLD_SECONDS, probe_seconds=TTS_PROBE_SECONDS, executor=None):
+        # probe(engine, voice_id) synthesizes a short phrase; its latency is recorded like any other
+        self.probe = probe
+        self.slo_ms = slo_ms
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.recover_ratio = recover_ratio
+        self.recover_samples = recover_samples
+        self.hold_seconds = hold_seconds
+        self.probe_seconds = probe_seconds
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix='tts-probe')
+        self._samples = {}
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def record(self, engine, voice_id, seconds, ok):
+        """One synthesis by an engine and voice: its latency and whether it succeeded"""
+        now = time.monotonic()
+        with self._lock:
+            samples = self._samples.get((engine, voice_id))
+            if samples is None:
+                samples = self._samples[(engine, voice_id)] = deque(maxlen=TTS_WINDOW_MAX)
+            samples.append((now, seconds, ok))
+
+    def health(self, engine, voice_id, since=None):
+        """(samples, p95 ms, error rate) of an engine and voice over the window, or since a time"""
+        cutoff = time.monotonic() - self.window_seconds
+        if since is not None:
+            cutoff = max(cutoff, since)
+        with self._lock:
+            samples = [s for s in self._samples.get((engine, voice_id), ()) if s[0] >= cutoff]
+        if not samples:
+            return 0, None, 0.0
+        latencies = sorted(seconds for _, seconds, _ in samples)
+        p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return len(samples), p95 * 1000, errors / len(samples)
+
+    def choose(self, tenant, voice_id, engine, clinic_config=None):
+        """The engine and voice a tenant's next synthesis should use, and why"""
+        fallback_engine = FALLBACK_ENGINES.get(engine)
+        if fallback_engine is None:
+            return Choice(engine, voice_id, PRIMARY)
+        clinic_config = clinic_config or {}
+        slo_ms = float(clinic_config.get('tts_slo_ms', self.slo_ms))
+        now = time.monotonic()
+        probe_due = False
+        with self._lock:
+            state = self._states.get((tenant, voice_id, engine))
+            if state is None:
+                state = self._states[(tenant, voice_id, engine)] = _VoiceState()
+            # Only syntheses since the last switch count, so old samples can't undo it
+            since = state.changed
+        count, p95_ms, error_rate = self.health(engine, voice_id, since=since)
+        with self._lock:
+            if not state.fallback:
+                reason = None
+                if count >= self.min_samples:
+                    if error_rate > self.max_error_rate:
+                        reason = ERRORS
+                    elif p95_ms > slo_ms:
+                        reason = LATENCY
+                if reason:
+                    state.fallback, state.reason, state.changed = True, reason, now
+                    state.last_probe = now
+                    self._transition(tenant, voice_id, engine, fallback_engine, reason, p95_ms, error_rate, slo_ms)
+            elif (now - state.changed >= self.hold_seconds and count >= self.recover_samples
+                  and p95_ms < slo_ms * self.recover_ratio and error_rate <= self.max_error_rate / 2):
+                state.fallback, state.reason, state.changed = False, PRIMARY, now
+                self._transition(tenant, voice_id, fallback_engine, engine, PRIMARY, p95_ms, error_rate, slo_ms)
+            if state.fallback and self.probe and now - state.last_probe >= self.probe_seconds:
+                state.last_probe = now
+                probe_due = True
+            fallback, reason = state.fallback, state.reason
+        if probe_due:
+            self.executor.submit(self._probe, engine, voice_id)
+        if not fallback:
+            return Choice(engine, voice_id, PRIMARY)
+        return Choice(fallback_engine, clinic_config.get('fallback_voice_id', voice_id), reason)
+
+    def fallback_for(self, voice_id, engine, clinic_config=None):
+        """The fallback engine and voice for a primary engine, or None if it has none"""
+        fallback_engine = FALLBACK_ENGINES.get(engine)
+        if fallback_engine is None:
+            return None
+        return fallback_engine, (clinic_config or {}).get('fallback_voice_id', voice_id)
+
+    def snapshot(self):
+        """Fallback state per tenant voice and health per engine and voice"""
+        with self._lock:
+            states = {f"{tenant}/{voice_id}/{engine}": {'fallback': s.fallback, 'reason': s.reason}
+                      for (tenant, voice_id, engine), s in self._states.items()}
+            keys = list(self._samples)
+        engines = {}
+        for engine, voice_id in keys:
+            count, p95_ms, error_rate = self.health(engine, voice_id)
+            engines[f"{engine}/{voice_id}"] = {
+                'samples': count,
+                'p95_ms': round(p95_ms, 1) if p95_ms is not None else None,
+                'error_rate': round(error_rate, 3),
+            }
+        return {'voices': states, 'engines': engines}
+
+    def _probe(self, engine, voice_id):
+        try:
+            self.probe(engine, voice_id)
+        except Exception as e:
+            # Already recorded as an error by the synthesis it went through
+            logger.info(f"TTS probe of {engine} {voice_id} failed: {str(e)}")
+
+    def _transition(self, tenant, voice_id, from_engine, to_engine, reason, p95_ms, error_rate, slo_ms):
+        p95 = f"{p95_ms:.0f}ms" if p95_ms is not None else 'n/a'
+        message = (f"TTS {tenant} {voice_id}: {from_engine} -> {to_engine} ({reason}; p95 {p95}, "
+                   f"errors {error_rate:.0%}, SLO {slo_ms:.0f}ms)")
+        if to_engine == STANDARD:
+            logger.warning(message)
+        else:
+            logger.info(message)
+        metrics.incr('tts.engine_switch', engine=to_engine, reason=reason)
+
@@ -0,0 +1,272 @@
+"""
+Webhook retry deduplication for agent turns.
+
+Twilio and Connect retry a webhook that times out. Each retry used to send
+the same utterance into the same Bedrock session again: a second full
+agent turn, and a second booking when that turn confirmed one. Turns are
+keyed on (call, turn sequence, input hash):
+
+  first      runs the turn and caches its response
+  replay     a duplicate of a finished turn gets the cached response
+  coalesced  a duplicate of a turn still running waits for it and gets
+             its response
+  busy       the running turn did not finish within TURN_DEDUPE_WAIT_SECONDS;
+             the duplicate is refused rather than run a second time
+
+The turn sequence comes from the channel when it has one (Twilio's
+I-Twilio-Idempotency-Token forwarded by the webhook as turn_id, a Connect
+flow's turnId parameter, a client's turn_id); those keys and their cached
+responses live for TURN_DEDUPE_TTL_SECONDS. Without one, the same words in
+the same call may well be a new turn (a caller who says "yes" twice in a
+row), so an unsequenced turn is never replayed once it has finished: only a
+duplicate arriving while it is still running coalesces onto it. A channel
+cannot send the caller's next turn before this one has answered, so that
+duplicate can only be a retry.
+
+In-process state catches duplicates within one process (container mode,
+the media server, a warm Lambda). Lambda retries usually land on another
+execution environment, so with TURN_DEDUPE_SHARED=s3 the claims and
+responses of sequenced turns also go through S3 conditional writes
+(If-None-Match), which make the first writer the owner across containers.
+That costs two PUTs per turn, so it is kept to turns whose channel marks
+its retries (the Twilio idempotency token and its equivalents); unsequenced
+turns are deduplicated in-process only and write nothing to S3. The
+dedupe/ prefix has a lifecycle expiry for the records left behind.
+
+Only successful responses are cached; a failed turn releases its claim so
+the retry runs it again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TURN_DEDUPE_TTL_SECONDS = int(os.environ.get('TURN_DEDUPE_TTL_SECONDS', '300'))
+TURN_DEDUPE_MAX_ENTRIES = int(os.environ.get('TURN_DEDUPE_MAX_ENTRIES', '500'))
+# Lambda times out at 30 s; a duplicate gives up waiting before that
+TURN_DEDUPE_WAIT_SECONDS = float(os.environ.get('TURN_DEDUPE_WAIT_SECONDS', '25'))
+TURN_DEDUPE_SHARED = os.environ.get('TURN_DEDUPE_SHARED', '')
+SHARED_POLL_SECONDS = 0.25
+
+FIRST = 'first'
+REPLAY = 'replay'
+COALESCED = 'coalesced'
+BUSY = 'busy'
+DUPLICATE_RESULTS = (REPLAY, COALESCED, BUSY)
+
+
+class DuplicateTurnInProgress(Exception):
+    """A duplicate arrived while the original turn is still running elsewhere"""
+
+
+def turn_key(event):
+    """
+    (key, channel, sequenced) for a turn event, or (None, channel, False)
+    when the event names no call to deduplicate within.
+    """
+    if 'Details' in event:
+        contact = event['Details'].get('ContactData', {})
+        parameters = event['Details'].get('Parameters', {})
+        call_id = contact.get('ContactId')
+        sequence = parameters.get('turnId')
+        inputs = (parameters.get('userInput', ''), parameters.get('audioUrl', ''))
+        channel = 'connect'
+    else:
+        call_id = event.get('session_id')
+        sequence = event.get('turn_id')
+        inputs = (event.get('text', event.get('inputText', '')), event.get('audio_data', ''))
+        channel = event.get('channel') or ('direct' if 'audio_data' in event else 'text')
+    if not call_id:
+        return None, channel, False
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in inputs).encode('utf-8')).hexdigest()[:24]
+    return f"{call_id}:{sequence or '-'}:{digest}", channel, bool(sequence)
+
+
+class S3DedupeBackend:
+    """Cross-container claims and responses as small JSON objects, claimed with If-None-Match"""
+
+    def __init__(self, s3_client, bucket, prefix='dedupe'):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}/{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def claim(self, key, ttl_seconds):
+        """True if this invocation now owns the turn"""
+        record = {'state': 'running', 'expires_at': time.time() + ttl_seconds}
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=self._key(key), Body=json.dumps(record).encode('utf-8'),
+                               ContentType='application/json', IfNoneMatch='*')
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+
+    def get(self, key):
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(key))
+            return json.loads(response['Body'].read().decode('utf-8'))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def complete(self, key, response, ttl_seconds):
+        record = {'state': 'done', 'expires_at': time.time() + ttl_seconds, 'response': response}
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(key), Body=json.dumps(record).encode('utf-8'),
+                           ContentType='application/json')
+
+    def release(self, key):
+        self.s3.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+class _Turn:
+    __slots__ = ('done', 'response', 'expires_at')
+
+    def __init__(self, expires_at):
+        self.done = threading.Event()
+        self.response = None
+        self.expires_at = expires_at
+
+
+class TurnDedupe:
+    """Bounded TTL store of turns in flight and their responses, with an optional shared backend"""
+
+    def __init__(self, shared=None, ttl_seconds=TURN_DEDUPE_TTL_SECONDS, max_entries=TURN_DEDUPE_MAX_ENTRIES,
+                 wait_seconds=TURN_DEDUPE_WAIT_SECONDS):
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.wait_seconds = wait_seconds
+        self._turns = OrderedDict()
+        self._lock = threading.Lock()
+
+    def run(self, event, handler, succeeded=lambda response: response.get('statusCode') == 200):
+        """Run handler() for a turn event once; duplicates get the same response"""
+        key, channel, sequenced = turn_key(event)
+        if key is None:
+            return handler()
+        # Unsequenced: held only while running (a duplicate waits at most wait_seconds),
+        # and only in this process
+        ttl = self.ttl_seconds if sequenced else self.wait_seconds
+        shared = self.shared if sequenced else None
+
+        now = time.time()
+        with self._lock:
+            turn = self._turns.get(key)
+            if turn is not None and turn.expires_at <= now:
+                del self._turns[key]
+                turn = None
+            owner = turn is None
+            if owner:
+                turn = self._turns[key] = _Turn(now + ttl)
+                while len(self._turns) > self.max_entries:
+                    self._turns.popitem(last=False)
+        if not owner:
+            return self._local_duplicate(turn, key, channel)
+
+        if shared is not None:
+            try:
+                response = self._shared_duplicate(key, channel, ttl)
+            except DuplicateTurnInProgress:
+                self._forget(key, turn)
+                raise
+            if response is not None:
+                turn.response = response
+                turn.done.set()
+                return response
+
+        metrics.incr('dedupe.turn', channel=channel, result=FIRST)
+        try:
+            response = handler()
+        except Exception:
+            self._release(key, turn, shared)
+            raise
+        if not succeeded(response):
+            self._release(key, turn, shared)
+            return response
+        turn.response = response
+        turn.done.set()
+        if not sequenced:
+            # Local duplicates already hold the turn; the next identical input is a new turn
+            self._forget(key, turn)
+        if shared is not None:
+            try:
+                shared.complete(key, response, ttl)
+            except Exception as e:
+                logger.warning(f"Shared dedupe write failed for {key}: {str(e)}")
+        return response
+
+    def _local_duplicate(self, turn, key, channel):
+        result = REPLAY if turn.done.is_set() else COALESCED
+        if not turn.done.wait(self.wait_seconds) or turn.response is None:
+            metrics.incr('dedupe.turn', channel=channel, result=BUSY)
+            raise DuplicateTurnInProgress(key)
+        metrics.incr('dedupe.turn', channel=channel, result=result)
+        logger.info(f"Duplicate turn {key} ({result})")
+        return turn.response
+
+    def _shared_duplicate(self, key, channel, ttl):
+        """The owner's response when another container has the turn, else None (we own it)"""
+        try:
+            if self.shared.claim(key, ttl):
+                return None
+        except Exception as e:
+            logger.warning(f"Shared dedupe claim failed for {key}: {str(e)}")
+            return None
+        deadline = time.time() + self.wait_seconds
+        result = None
+        while True:
+            record = self.shared.get(key)
+            if record is None or record['expires_at'] <= time.time():
+                # Released after a failure, or a stale claim: run it here
+                return None
+            if record['state'] == 'done':
+                result = result or REPLAY
+                metrics.incr('dedupe.turn', channel=channel, result=result)
+                logger.info(f"Duplicate turn {key} ({result}, shared)")
+                return record['response']
+            result = COALESCED
+            if time.time() >= deadline:
+                metrics.incr('dedupe.turn', channel=channel, result=BUSY)
+                raise DuplicateTurnInProgress(key)
+            time.sleep(SHARED_POLL_SECONDS)
+
+    def _release(self, key, turn, shared):
+        """Failed turn: wake local duplicates empty-handed and let a retry run it again"""
+        self._forget(key, turn)
+        if shared is not None:
+            try:
+                shared.release(key)
+            except Exception as e:
+                logger.warning(f"Shared dedupe release failed for {key}: {str(e)}")
+
+    def _forget(self, key, turn):
+        with self._lock:
+            if self._turns.get(key) is turn:
+                del self._turns[key]
+        turn.done.set()
+
+
+def duplicate_rates():
+    """Share of turns per channel that were retries (replayed, coalesced or refused)"""
+    rates = {}
+    for dims, count in metrics.counters_by('dedupe.turn').items():
+        labels = dict(dims)
+        stats = rates.setdefault(labels.get('channel'), {'turns': 0, FIRST: 0, REPLAY: 0, COALESCED: 0, BUSY: 0})
+        stats['turns'] += count
+        stats[labels.get('result')] += count
+    for stats in rates.values():
+        stats['duplicate_rate'] = metrics.ratio(sum(stats[r] for r in DUPLICATE_RESULTS), stats['turns'])
+    return rates
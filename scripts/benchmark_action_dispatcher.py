@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cold starts per conversation, per-function actions vs the
+action dispatcher.
+
+  1. Init cost: imports each layout's code in fresh interpreters (what a
+     Lambda cold start runs before the handler) and takes the median of
+     --repeat runs. --runtime-init-ms is added for the sandbox and runtime
+     start, which an offline run cannot see.
+  2. Routing: runs one booking conversation through the dispatcher against
+     a local keep-alive appointment service and checks every action answers
+     as its own function does, with search and confirm sharing one client
+     (connections reused) and one hold table.
+  3. Cold starts: simulates conversations arriving at several rates. Each
+     makes the agent's action calls (search, sometimes a second search,
+     then confirm or a handoff) spread over a few minutes. Every deployed
+     function keeps its own execution environments, which stay warm for
+     --idle-minutes after their last call. The simulation counts cold
+     starts and added init time per conversation for both layouts.
+
+On AWS, count "Init Duration" REPORT lines per agent session to compare
+the same numbers from real traffic.
+
+Usage: python scripts/benchmark_action_dispatcher.py [--idle-minutes 10] [--hours 24]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTIONS = os.path.join(ROOT, 'lambda', 'actions')
+SHARED = os.path.join(ROOT, 'lambda', 'shared', 'python')
+sys.path[:0] = [SHARED, ACTIONS]
+FUNCTIONS = ('search_slots', 'confirm_appointment', 'handoff_human')
+DISPATCHER = 'action_dispatcher'
+
+# Handler run time per action (seconds), excluding init
+ACTION_SECONDS = {'search_slots': 0.3, 'confirm_appointment': 0.3, 'handoff_human': 0.05}
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path[:0] = [{shared!r}, {actions!r}]
+started = time.perf_counter()
+import {name}
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def init_ms(name, repeat):
+    """Median time to import lambda/actions/<name>.py (with the shared layer) in a fresh interpreter"""
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET.format(shared=SHARED, actions=ACTIONS, name=name)],
+                                capture_output=True, text=True, check=True,
+                                env=dict(os.environ, AWS_DEFAULT_REGION='us-east-1'))
+        samples.append(float(output.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+class KeepAliveService:
+    """Slot search and confirm endpoints over HTTP/1.1 keep-alive"""
+
+    def __init__(self):
+        self.connections = 0
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                service.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if self.path == '/v1/slots/search':
+                    reply = {'slots': [{'slot_id': f"clinic_a-{body['date']}-0900",
+                                        'start_time': f"{body['date']}T09:00:00", 'doctor_name': 'Dr. Patel'}]}
+                else:
+                    reply = {'status': 'BOOKED', 'confirmation_ref': 'CLIN-0001'}
+                data = json.dumps(reply).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def action_event(api_path, session_id, **params):
+    return {
+        'actionGroup': 'AppointmentActions',
+        'apiPath': api_path,
+        'httpMethod': 'POST',
+        'sessionId': session_id,
+        'requestBody': {'content': {'application/json': {'properties': [
+            {'name': name, 'value': value} for name, value in params.items()
+        ]}}},
+        'sessionAttributes': {}
+    }
+
+
+def check_routing():
+    """One conversation through the dispatcher: (checks, pool stats, server connections)"""
+    import builtins
+    service = KeepAliveService()
+    quiet, builtins.print = builtins.print, lambda *a, **k: None
+    try:
+        import action_dispatcher as dispatcher
+        import confirm_appointment as confirm
+        import search_slots as search
+        search.appointments.base_url = service.url
+
+        events = [
+            action_event('/searchSlots', 'conv-1', tenant_id='clinic_a', date='2026-10-21',
+                         time_preference='morning', max_results='1', widen_days='1'),
+            action_event('/searchSlots', 'conv-1', tenant_id='clinic_a', date='2026-10-22',
+                         time_preference='morning', max_results='1', widen_days='1'),
+        ]
+        searches = [dispatcher.handler(events[0], None)]
+        slot_id = json.loads(searches[0]['response']['responseBody']['application/json']['body'])['slots'][0]['slot_id']
+        # The hold search placed is visible to confirm in the same container
+        held = confirm.holds.owner(slot_id)
+        searches.append(dispatcher.handler(events[1], None))
+        booked = dispatcher.handler(action_event('/confirmAppointment', 'conv-1', tenant_id='clinic_a',
+                                                 slot_id=slot_id, patient_name='Sam Lee',
+                                                 patient_email='sam@example.com'), None)
+        handoff = dispatcher.handler(action_event('/handoffToHuman', 'conv-2', reason='asked for a person'), None)
+        unknown = dispatcher.handler(action_event('/cancelAppointment', 'conv-2'), None)
+        direct = search.handler(events[0], None)
+    finally:
+        builtins.print = quiet
+        service.server.shutdown()
+
+    def body(response):
+        return json.loads(response['response']['responseBody']['application/json']['body'])
+
+    pool = search.appointments.pool.stats()
+    checks = [
+        ('Search routed', searches[0]['response']['apiPath'] == '/searchSlots' and body(searches[0])['slots']),
+        ('Dispatcher imports the handler modules themselves',
+         dispatcher.ACTION_FUNCTIONS['/searchSlots'] is search
+         and dispatcher.ACTION_FUNCTIONS['/confirmAppointment'] is confirm),
+        ('Dispatcher answers as the function itself', body(searches[0]) == body(direct)),
+        ('Confirm routed and booked', body(booked)['status'] == 'BOOKED'),
+        ('Handoff routed', body(handoff)['action'] == 'TRANSFER_TO_HUMAN'),
+        ('Unknown action answered 404', unknown['response']['httpStatusCode'] == 404),
+        ('Search and confirm share one client and hold table',
+         search.appointments is confirm.appointments and search.holds is confirm.holds and held == 'conv-1'),
+        ('Keep-alive connection reused', pool['reused'] > 0 and service.connections < pool['opened'] + pool['reused']),
+    ]
+    return checks, pool, service.connections
+
+
+def conversation(rng, start):
+    """(time, function) action calls of one agent conversation"""
+    t = start + rng.uniform(15, 40)
+    calls = [(t, 'search_slots')]
+    if rng.random() < 0.4:
+        t += rng.uniform(10, 30)
+        calls.append((t, 'search_slots'))
+    if rng.random() < 0.1:
+        calls.append((t + rng.uniform(5, 20), 'handoff_human'))
+    elif rng.random() < 0.85:
+        calls.append((t + rng.uniform(30, 90), 'confirm_appointment'))
+    return calls
+
+
+def simulate(rate_per_hour, hours, idle_seconds, init_seconds, layout, seed):
+    """Per conversation: (cold starts, added init seconds)"""
+    rng = random.Random(seed)
+    calls = []
+    t = 0.0
+    conversations = 0
+    while True:
+        t += rng.expovariate(rate_per_hour / 3600)
+        if t > hours * 3600:
+            break
+        calls.extend((when, conversations, fn) for when, fn in conversation(rng, t))
+        conversations += 1
+
+    environments = {}
+    cold = [0] * conversations
+    added = [0.0] * conversations
+    for when, conv, fn in sorted(calls):
+        target = DISPATCHER if layout == 'dispatcher' else fn
+        envs = environments.setdefault(target, [])
+        # Environments idle past the keep-warm window are reclaimed
+        envs[:] = [env for env in envs if when - env['busy_until'] <= idle_seconds]
+        free = [env for env in envs if env['busy_until'] <= when]
+        duration = ACTION_SECONDS[fn]
+        if free:
+            env = max(free, key=lambda e: e['busy_until'])
+        else:
+            env = {'busy_until': when}
+            envs.append(env)
+            cold[conv] += 1
+            added[conv] += init_seconds[target]
+            duration += init_seconds[target]
+        env['busy_until'] = when + duration
+    return cold, added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold starts per conversation: per-function vs dispatcher')
+    parser.add_argument('--rates', default='2,10,60,300', help='Conversations per hour to simulate')
+    parser.add_argument('--hours', type=float, default=24, help='Simulated hours per rate')
+    parser.add_argument('--idle-minutes', type=float, default=10, help='How long an idle environment stays warm')
+    parser.add_argument('--runtime-init-ms', type=float, default=250,
+                        help='Sandbox and runtime start added to every cold start')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh-interpreter imports per layout')
+    args = parser.parse_args()
+
+    print("📊 Action dispatcher benchmark")
+    print("----------------------------------------")
+    imports = {name: init_ms(name, args.repeat) for name in FUNCTIONS + (DISPATCHER,)}
+    init_seconds = {name: (ms + args.runtime_init_ms) / 1000 for name, ms in imports.items()}
+    print(f"   Code init (median of {args.repeat} fresh imports), plus {args.runtime_init_ms:.0f} ms runtime start:")
+    for name, ms in imports.items():
+        print(f"   {name:<21} {ms:>6.1f} ms")
+    print()
+
+    checks, pool, connections = check_routing()
+    print(f"   Dispatcher conversation: {pool['opened']} connections opened, {pool['reused']} reused "
+          f"({connections} accepted by the service)")
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    print()
+
+    print(f"   Simulated {args.hours:g} h per rate, environments warm for {args.idle_minutes:g} min")
+    print(f"   {'conv/hour':>9} {'layout':<13} {'cold/conv':>10} {'convs hit':>10} {'init ms/conv':>13}")
+    results = {}
+    for rate in [float(r) for r in args.rates.split(',')]:
+        for layout in ('per-function', 'dispatcher'):
+            cold, added = simulate(rate, args.hours, args.idle_minutes * 60, init_seconds, layout, seed=11)
+            results[(rate, layout)] = sum(cold) / len(cold)
+            print(f"   {rate:>9g} {layout:<13} {sum(cold) / len(cold):>10.3f} "
+                  f"{sum(1 for c in cold if c) / len(cold):>9.1%} {sum(added) / len(added) * 1000:>13.0f}")
+    print()
+
+    fewer = all(results[(rate, 'dispatcher')] <= results[(rate, 'per-function')]
+                for rate in {rate for rate, _ in results})
+    print(f"   {'✅' if fewer else '❌'} Dispatcher has no more cold starts per conversation at any rate")
+    success = fewer and all(ok for _, ok in checks)
+    print()
+    print("✅ Action dispatcher benchmark passed" if success else "❌ Action dispatcher benchmark failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
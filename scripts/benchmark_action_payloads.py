@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full vs compact searchSlots response bodies.
+
+Runs the search-slots Lambda handler offline against a deterministic fake
+appointment service and compares the payload the Bedrock Agent has to read
+in each response mode. Tokens are estimated at ~4 characters per token
+(close enough for Claude-family tokenizers on JSON) so no tokenizer
+dependency is needed.
+
+Usage: python scripts/benchmark_action_payloads.py [--slots 10] [--runs 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'actions'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+
+def fake_search(count):
+    """Slots shaped like the Go appointment service returns them"""
+    doctors = [('dr_smith', 'Dr. Sarah Smith'), ('dr_johnson', 'Dr. Michael Johnson')]
+    base = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+
+    def search(tenant_id, date, time_preference):
+        slots = []
+        for i in range(count):
+            doctor_id, doctor_name = doctors[i % 2]
+            start = base + timedelta(minutes=30 * (i // 2))
+            slots.append({
+                'slot_id': f"{tenant_id}-{doctor_id}-{start.strftime('%Y%m%d-%H%M')}",
+                'tenant_id': tenant_id,
+                'doctor_id': doctor_id,
+                'doctor_name': doctor_name,
+                'start_time': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'end_time': (start + timedelta(minutes=30)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'available': True
+            })
+        return slots
+
+    return search
+
+
+def make_event(response_format, max_results):
+    return {
+        'actionGroup': 'AppointmentActions',
+        'apiPath': '/searchSlots',
+        'httpMethod': 'POST',
+        'requestBody': {'content': {'application/json': {'properties': [
+            {'name': 'tenant_id', 'value': 'downtown_medical'},
+            {'name': 'date', 'value': 'tomorrow'},
+            {'name': 'time_preference', 'value': 'any'},
+            {'name': 'max_results', 'value': str(max_results)},
+            {'name': 'response_format', 'value': response_format}
+        ]}}},
+        'sessionAttributes': {}
+    }
+
+
+def measure(module, response_format, max_results, runs):
+    event = make_event(response_format, max_results)
+    response = module.handler(event, None)
+    body = response['response']['responseBody']['application/json']['body']
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        module.handler(event, None)
+    elapsed = (time.perf_counter() - started) / runs
+
+    return {
+        'body_bytes': len(body.encode('utf-8')),
+        'envelope_bytes': len(json.dumps(response).encode('utf-8')),
+        'est_tokens': (len(body) + 3) // 4,
+        'handler_us': elapsed * 1e6,
+        'response': response
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare full vs compact action-group payloads')
+    parser.add_argument('--slots', type=int, default=10, help='Slots returned by the fake service')
+    parser.add_argument('--runs', type=int, default=2000, help='Handler invocations to time')
+    args = parser.parse_args()
+
+    import search_slots as search
+    import confirm_appointment as confirm
+    search.search_slots = fake_search(args.slots)
+    search.print = lambda *a, **k: None
+    confirm.print = lambda *a, **k: None
+
+    print(f"📦 searchSlots payload benchmark ({args.slots} slots from service, {args.runs} runs)")
+    print()
+
+    # Full mode with every slot, full mode cut to the same top-k, and compact mode
+    cases = [
+        ('full', 'full', args.slots),
+        (f"full@{search.COMPACT_TOP_K}", 'full', search.COMPACT_TOP_K),
+        ('compact', 'compact', args.slots),
+    ]
+    results = {}
+    for label, mode, max_results in cases:
+        results[label] = r = measure(search, mode, max_results, args.runs)
+        print(f"   {label:<8} body={r['body_bytes']:>5} B  envelope={r['envelope_bytes']:>5} B  "
+              f"~tokens={r['est_tokens']:>4}  handler={r['handler_us']:.1f} µs")
+
+    compact = results['compact']
+    print()
+    for label, _, _ in cases[:2]:
+        baseline = results[label]
+        print(f"   vs {label:<8} body -{100 * (1 - compact['body_bytes'] / baseline['body_bytes']):.1f}%  "
+              f"tokens -{100 * (1 - compact['est_tokens'] / baseline['est_tokens']):.1f}%")
+
+    # Handles must resolve back to the full slot id in confirmAppointment
+    session_attributes = compact['response']['sessionAttributes']
+    handles = json.loads(session_attributes['slot_handles'])
+    resolved = confirm.resolve_slot_handle({'sessionAttributes': session_attributes}, 'S1')
+    status = '✅' if resolved and resolved == handles['S1'] else '❌'
+    print(f"   {status} Handle S1 resolves to {resolved}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CPU cost per second of audio for the audio_codec operations.
+
+Times each conversion the call paths use over several seconds of synthetic
+speech-band audio and reports microseconds of CPU per second of audio (and
+how many real-time streams one core could sustain). Per-frame rows feed
+20 ms chunks, the way the media server sees telephony audio. A pure-Python
+table-driven G.711 codec (what the media server used before) and, where the
+interpreter still ships it, the stdlib audioop module are timed as baselines.
+Then checks resampler quality: voice-band level and the rejection of tones
+above the output Nyquist that would otherwise alias into the call.
+
+Usage: python scripts/benchmark_audio_codec.py [--seconds 10] [--repeat 5]
+"""
+
+import argparse
+import array
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+import audio_codec  # noqa: E402
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:  # removed in Python 3.13
+        audioop = None
+
+FRAME_MS = 20
+
+
+def speech_like(seconds, rate, channels=1, seed=3):
+    """Harmonic tone with a syllable envelope plus a little noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)
+    signal = envelope * (np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 720 * t))
+    signal = 6000 * signal + rng.normal(0, 100, t.size)
+    samples = np.clip(signal, -32768, 32767).astype(np.int16)
+    return np.repeat(samples, channels) if channels > 1 else samples
+
+
+def frames_of(data, rate, width):
+    size = rate * FRAME_MS // 1000 * width
+    return [data[i:i + size] for i in range(0, len(data) - size + 1, size)]
+
+
+# Pure-Python baseline (per-sample table lookups)
+_PY_ULAW_DECODE = array.array('h', audio_codec.ulaw_decode(bytes(range(256))).tolist())
+_PY_ULAW_ENCODE = bytes(np.frombuffer(audio_codec.ulaw_encode(np.arange(-32768, 32768, dtype=np.int16)), np.uint8))
+
+
+def py_ulaw_decode(data):
+    table = _PY_ULAW_DECODE
+    return array.array('h', [table[b] for b in data]).tobytes()
+
+
+def py_ulaw_encode(data):
+    samples = array.array('h')
+    samples.frombytes(data)
+    table = _PY_ULAW_ENCODE
+    return bytes(table[s + 32768] for s in samples)
+
+
+def tone_level_db(frequency, from_rate, to_rate, seconds=1.0):
+    """Level of a resampled full-scale-ish tone relative to its input level"""
+    t = np.arange(int(seconds * from_rate)) / from_rate
+    tone = (10000 * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+    out = audio_codec.resample(tone, from_rate, to_rate).astype(np.float64)
+    out = out[out.size // 4:]  # skip the filter's start-up
+    level = np.sqrt(np.mean(out ** 2)) / (10000 / np.sqrt(2))
+    return 20 * np.log10(max(level, 1e-12))
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.process_time()
+        func()
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU cost per second of audio for audio_codec')
+    parser.add_argument('--seconds', type=float, default=10.0, help='Seconds of audio per run')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per operation (best is reported)')
+    args = parser.parse_args()
+
+    pcm8 = speech_like(args.seconds, 8000)
+    pcm16k = speech_like(args.seconds, 16000)
+    pcm22 = speech_like(args.seconds, 22050)
+    stereo44 = speech_like(args.seconds, 44100, channels=2)
+    ulaw = audio_codec.ulaw_encode(pcm8)
+    alaw = audio_codec.alaw_encode(pcm8)
+    pcm8_bytes = pcm8.tobytes()
+    ulaw_frames = frames_of(ulaw, 8000, 1)
+    pcm8_frames = frames_of(pcm8_bytes, 8000, 2)
+    pcm22_frames = frames_of(pcm22.tobytes(), 22050, 2)
+    wav16 = audio_codec.wav_bytes(pcm16k, 16000)
+
+    def stream(resampler, frames):
+        for frame in frames:
+            resampler.process(frame)
+
+    cases = [
+        ('ulaw decode', lambda: audio_codec.ulaw_decode(ulaw)),
+        ('ulaw encode', lambda: audio_codec.ulaw_encode(pcm8)),
+        ('alaw decode', lambda: audio_codec.alaw_decode(alaw)),
+        ('alaw encode', lambda: audio_codec.alaw_encode(pcm8)),
+        ('ulaw decode, 20 ms frames', lambda: [audio_codec.ulaw_decode(f) for f in ulaw_frames]),
+        ('ulaw encode, 20 ms frames', lambda: [audio_codec.ulaw_encode(f) for f in pcm8_frames]),
+        ('rms, 20 ms frames', lambda: [audio_codec.rms(f) for f in pcm8_frames]),
+        ('resample 8k -> 16k', lambda: audio_codec.resample(pcm8, 8000, 16000)),
+        ('resample 16k -> 8k', lambda: audio_codec.resample(pcm16k, 16000, 8000)),
+        ('resample 22.05k -> 8k', lambda: audio_codec.resample(pcm22, 22050, 8000)),
+        ('resample 22.05k -> 8k, frames', lambda: stream(audio_codec.Resampler(22050, 8000), pcm22_frames)),
+        ('downmix 44.1k stereo', lambda: audio_codec.downmix(stereo44, 2)),
+        ('normalize 8k', lambda: audio_codec.normalize(pcm8)),
+        ('WAV frame + parse 16k', lambda: audio_codec.read_wav(audio_codec.wav_bytes(pcm16k, 16000))),
+        ('to_wav 16k -> 8k (Transcribe)', lambda: audio_codec.to_wav(wav16, 'wav', 16000, target_rate=8000)),
+        ('baseline: pure-Python ulaw decode', lambda: py_ulaw_decode(ulaw)),
+        ('baseline: pure-Python ulaw encode', lambda: py_ulaw_encode(pcm8_bytes)),
+    ]
+    if audioop is not None:
+        cases += [
+            ('baseline: audioop ulaw decode', lambda: audioop.ulaw2lin(ulaw, 2)),
+            ('baseline: audioop ulaw encode', lambda: audioop.lin2ulaw(pcm8_bytes, 2)),
+            ('baseline: audioop ratecv 22.05k -> 8k', lambda: audioop.ratecv(pcm22.tobytes(), 2, 1, 22050, 8000, None)),
+        ]
+
+    print(f"🎚️  audio_codec benchmark ({args.seconds:.0f} s of audio, best of {args.repeat})")
+    print()
+    print(f"   {'operation':<40} {'µs CPU / audio s':>17} {'streams / core':>15}")
+    for label, func in cases:
+        func()  # warm tables and filter caches
+        per_second = timed(func, args.repeat) / args.seconds
+        streams = 1.0 / per_second if per_second else float('inf')
+        print(f"   {label:<40} {per_second * 1e6:>17.1f} {streams:>15,.0f}")
+
+    print()
+    print(f"   {'resampler quality':<26} {'3.4 kHz':>9} {'4.5 kHz':>9} {'5 kHz':>9} {'7 kHz':>9}")
+    checks = []
+    for from_rate, to_rate in ((16000, 8000), (22050, 8000), (24000, 8000), (8000, 16000)):
+        # Tones above 4 kHz only exist in the input when downsampling to 8 kHz
+        frequencies = (3400, 4500, 5000, 7000) if to_rate < from_rate else (3400,)
+        levels = [tone_level_db(f, from_rate, to_rate) for f in frequencies]
+        label = f"{from_rate / 1000:g}k -> {to_rate / 1000:g}k"
+        print(f"   {label:<26} " + ' '.join(f"{db:>6.1f} dB" for db in levels))
+        checks.append(levels[0] > -1.0)
+        if len(levels) > 1:
+            checks.append(max(levels[1:]) < -60.0)
+    ok = all(checks)
+    print(f"   {'✅' if ok else '❌'} Voice band within 1 dB; 4.5-7 kHz at least 60 dB down before aliasing into 8 kHz")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
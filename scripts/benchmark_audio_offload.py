@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: audio stages inline vs on the offload process pool.
+
+Runs direct-API turns the way container mode does: each turn is a handler
+call on a thread pool behind an asyncio loop. A turn base64-decodes a
+client upload (--upload-seconds of 48 kHz WAV), frames and resamples it
+for Transcribe, waits on a fake agent, then finishes and base64-encodes a
+telephony reply. A probe coroutine sleeps 10 ms at a time and records how
+late it wakes: that lag is what every other call's frames and timers see.
+
+For each concurrency level it reports turns/s, event-loop lag (p50 / p99 /
+max) and the call capacity at one turn per --turn-interval seconds, with
+AUDIO_OFFLOAD off and on. Worker processes only add capacity with spare
+cores; on one core the gain is the loop lag.
+
+Usage: python scripts/benchmark_audio_offload.py [--calls 8,32,96] [--turns 3] [--workers N]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+import audio_codec  # noqa: E402
+from audio_offload import AUDIO_OFFLOAD_WORKERS, AudioOffload  # noqa: E402
+
+PROBE_MS = 10
+AGENT_SECONDS = 0.2
+
+
+def speech_like(seconds, rate, seed=3):
+    """Harmonic tone with a syllable envelope plus a little noise"""
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    tone = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 720, 1440)))
+    noise = np.random.default_rng(seed).normal(0, 0.05, t.size)
+    return (np.clip(envelope * tone * 0.4 + noise, -1, 1) * 12000).astype(np.int16)
+
+
+def direct_turn(offload, upload_b64, reply_pcm):
+    """The CPU-bound stages of handle_direct_voice_call around a fake agent"""
+    audio = offload.run('b64decode', upload_b64)
+    offload.run('transcribe_wav', audio, 'wav', 48000, 16000)
+    time.sleep(AGENT_SECONDS)
+    reply = offload.run('finish_audio', reply_pcm, 'connect')
+    return offload.run('b64encode', reply)
+
+
+async def probe(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_MS / 1000)
+        lags.append((time.perf_counter() - started) * 1000 - PROBE_MS)
+
+
+async def run_level(offload, calls, turns, upload_b64, reply_pcm):
+    loop = asyncio.get_running_loop()
+    lags = []
+    stop = asyncio.Event()
+    prober = asyncio.ensure_future(probe(lags, stop))
+    with ThreadPoolExecutor(max_workers=calls, thread_name_prefix='voice') as executor:
+        async def call():
+            for _ in range(turns):
+                await loop.run_in_executor(executor, direct_turn, offload, upload_b64, reply_pcm)
+
+        started = time.time()
+        await asyncio.gather(*(call() for _ in range(calls)))
+        elapsed = time.time() - started
+    stop.set()
+    await prober
+    lags.sort()
+    return {
+        'turns_per_s': calls * turns / elapsed,
+        'lag_p50': lags[len(lags) // 2],
+        'lag_p99': lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+        'lag_max': lags[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Audio stages inline vs offloaded to worker processes')
+    parser.add_argument('--calls', default='8,32,96', help='Comma-separated concurrency levels')
+    parser.add_argument('--turns', type=int, default=3, help='Turns per call')
+    parser.add_argument('--upload-seconds', type=float, default=8.0, help='Seconds of caller audio per turn')
+    parser.add_argument('--workers', type=int, default=AUDIO_OFFLOAD_WORKERS, help='Offload worker processes')
+    parser.add_argument('--turn-interval', type=float, default=6.0, help='Seconds between a call\'s turns')
+    args = parser.parse_args()
+
+    upload = audio_codec.wav_bytes(speech_like(args.upload_seconds, 48000), 48000)
+    upload_b64 = base64.b64encode(upload).decode('ascii')
+    reply_pcm = speech_like(4.0, 8000).tobytes()
+
+    print("📊 Audio offload benchmark")
+    print("----------------------------------------")
+    print(f"   Upload {len(upload_b64) / 1024:.0f} KB base64 ({args.upload_seconds:.0f} s of 48 kHz WAV), "
+          f"reply 4 s of 8 kHz; agent {AGENT_SECONDS * 1000:.0f} ms; {os.cpu_count()} CPU(s), "
+          f"{args.workers} worker(s)")
+    print()
+    print(f"   {'mode':<8} {'calls':>6} {'turns/s':>8} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} {'capacity':>9}")
+
+    offloads = {'inline': AudioOffload(mode='off'), 'process': AudioOffload(mode='process', workers=args.workers)}
+    offloads['process'].start()
+    try:
+        for calls in (int(c) for c in args.calls.split(',')):
+            for mode, offload in offloads.items():
+                result = asyncio.run(run_level(offload, calls, args.turns, upload_b64, reply_pcm))
+                capacity = result['turns_per_s'] * args.turn_interval
+                print(f"   {mode:<8} {calls:>6} {result['turns_per_s']:>8.1f} {result['lag_p50']:>7.1f}ms "
+                      f"{result['lag_p99']:>7.1f}ms {result['lag_max']:>7.1f}ms {capacity:>9.0f}")
+    finally:
+        offloads['process'].shutdown()
+    print()
+    print(f"   capacity = calls sustainable at one turn per {args.turn_interval:.0f} s")
+
+
+if __name__ == '__main__':
+    main()
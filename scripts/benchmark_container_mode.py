@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark: container mode vs one-invocation-per-environment Lambda.
+
+Drives the same text turns through both models with a fake Bedrock agent
+(fixed think time) and fake Polly, so the numbers measure the serving
+model rather than AWS:
+
+  container  lambda/voice-processor/server.py on localhost, all calls over
+             HTTP into one process
+  lambda     each turn needs an idle execution environment; when none is
+             idle a new one pays the cold start, measured as the time to
+             import index.py in a fresh interpreter
+
+Calls arrive together and each runs --turns turns back to back, the burst
+shape that fans out into cold starts on Lambda.
+
+Usage: python scripts/benchmark_container_mode.py [--calls 200] [--turns 3] [--agent-ms 200]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VOICE_DIR = os.path.join(ROOT, 'lambda', 'voice-processor')
+SHARED_DIR = os.path.join(ROOT, 'lambda', 'shared', 'python')
+sys.path[:0] = [SHARED_DIR, VOICE_DIR]
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('CALL_ARTIFACTS', 'off')
+
+import index  # noqa: E402
+import server  # noqa: E402
+from audio_delivery import AudioDelivery  # noqa: E402
+
+
+def measure_cold_start(runs=3):
+    """Seconds for a fresh interpreter to import the handler module"""
+    timings = []
+    for _ in range(runs):
+        started = time.time()
+        subprocess.run([sys.executable, '-c', 'import index'], cwd=VOICE_DIR, check=True,
+                       env=dict(os.environ, PYTHONPATH=SHARED_DIR),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.time() - started)
+    return min(timings)
+
+
+def install_fakes(agent_seconds):
+    def agent(session_id, text, did, caller_number=None):
+        time.sleep(agent_seconds)
+        return f"You said {text}. Tuesday at 9 works."
+
+    index.call_bedrock_agent = agent
+    index.synthesize_audio = lambda text, *args, **kwargs: b'\x00\x01' * 4000
+    index.predictor.synthesize = lambda *args: b''
+    index.audio_delivery = AudioDelivery(None, 'bench-bucket', proxy_base_url='http://localhost:8000')
+
+
+def text_event(model, call, turn):
+    # Sessions are per model so turn dedupe never replays the other model's turns
+    return {'text': f"turn {turn} of call {call}", 'did': '1001', 'session_id': f"bench-{model}-{call}"}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_container(calls, turns, workers):
+    service = server.VoiceService(workers=workers)
+    runner = web.AppRunner(service.app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    latencies = []
+
+    async def call(session, n):
+        for turn in range(turns):
+            started = time.time()
+            async with session.post(f"http://127.0.0.1:{port}/text", json=text_event('container', n, turn)) as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"turn failed with {response.status}")
+            latencies.append(time.time() - started)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.time()
+        await asyncio.gather(*(call(session, n) for n in range(calls)))
+        elapsed = time.time() - started
+    await runner.cleanup()
+    return {'elapsed': elapsed, 'latencies': latencies, 'environments': 1, 'cold_starts': 1}
+
+
+def run_lambda(calls, turns, cold_start):
+    """Each turn occupies one environment; no idle one means a new environment and a cold start"""
+    lock = threading.Lock()
+    idle = []
+    environments = [0]
+    latencies = []
+
+    def invoke(event):
+        started = time.time()
+        with lock:
+            warm = bool(idle)
+            if warm:
+                idle.pop()
+            else:
+                environments[0] += 1
+        if not warm:
+            time.sleep(cold_start)
+        index.lambda_handler(event, None)
+        with lock:
+            idle.append(True)
+        latencies.append(time.time() - started)
+
+    def call(n):
+        for turn in range(turns):
+            invoke(text_event('lambda', n, turn))
+
+    with ThreadPoolExecutor(max_workers=calls) as executor:
+        started = time.time()
+        list(executor.map(call, range(calls)))
+        elapsed = time.time() - started
+    return {'elapsed': elapsed, 'latencies': latencies, 'environments': environments[0],
+            'cold_starts': environments[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Container mode vs per-invocation Lambda throughput')
+    parser.add_argument('--calls', type=int, default=200, help='Concurrent calls')
+    parser.add_argument('--turns', type=int, default=3, help='Turns per call')
+    parser.add_argument('--agent-ms', type=int, default=200, help='Fake agent think time per turn')
+    parser.add_argument('--workers', type=int, default=server.SERVICE_WORKERS)
+    args = parser.parse_args()
+
+    print("📊 Container mode benchmark (fake agent / Polly)")
+    print("----------------------------------------")
+    cold_start = measure_cold_start()
+    print(f"   Cold start (import index.py): {cold_start * 1000:.0f} ms")
+    print(f"   {args.calls} concurrent calls x {args.turns} turns, agent {args.agent_ms} ms per turn")
+    print()
+
+    install_fakes(args.agent_ms / 1000)
+    results = {
+        'lambda': run_lambda(args.calls, args.turns, cold_start),
+        'container': asyncio.run(run_container(args.calls, args.turns, args.workers)),
+    }
+
+    print(f"   {'model':<10} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'envs':>6} {'cold':>6}")
+    for model, result in results.items():
+        latencies = result['latencies']
+        print(f"   {model:<10} {len(latencies) / result['elapsed']:>8.1f} "
+              f"{percentile(latencies, 0.5) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+              f"{max(latencies) * 1000:>8.0f} {result['environments']:>6} {result['cold_starts']:>6}")
+    print()
+    speedup = results['lambda']['elapsed'] / results['container']['elapsed']
+    print(f"   Container mode: {speedup:.2f}x the burst throughput from 1 process "
+          f"instead of {results['lambda']['environments']} environments")
+
+
+if __name__ == '__main__':
+    main()
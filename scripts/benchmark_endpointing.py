@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fixed speech timeouts vs adaptive end-of-utterance detection.
+
+Replays utterances frame by frame through each endpointing strategy and
+reports the endpoint delay (decision time minus the true end of speech) and
+the early cut-off rate (decisions made while the caller still had words to
+say). Fails if the adaptive strategy cuts any answer type off early.
+
+Utterances come from --wav-dir (16-bit mono WAV files, each with an optional
+sidecar <name>.json holding {"answer_type", "speech_end_ms", "partials":
+[[ms, text], ...]}) or, by default, from a seeded synthetic corpus of
+caller answers with realistic thinking pauses (emails spelled out, names,
+dates, yes/no, open requests) over line noise.
+
+Usage: python scripts/benchmark_endpointing.py [--per-type 100] [--wav-dir DIR]
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import statistics
+import struct
+import sys
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+from endpointing import ANSWER_PROFILES, Endpointer, frame_energy  # noqa: E402
+
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+TRAILING_SILENCE_MS = 6000
+ASR_PARTIAL_LAG_MS = 300
+
+# (word, speech ms, (min pause, max pause) after it)
+SCRIPTS = {
+    'yes_no': [
+        [('yes', 300, None)],
+        [('no', 250, None)],
+        [('yes', 300, (150, 400)), ('that works', 600, None)],
+        [('um', 300, (300, 800)), ('yes please', 600, None)],
+    ],
+    'name': [
+        [('john', 350, (100, 500)), ('smith', 400, None)],
+        [('my name is', 600, (100, 300)), ('maria', 400, (100, 400)), ('garcia', 500, None)],
+    ],
+    'date_time': [
+        [('tomorrow', 500, (200, 900)), ('morning', 400, None)],
+        [('next tuesday', 700, (200, 600)), ('at 2 pm', 600, None)],
+        [('um', 300, (400, 1000)), ('friday afternoon', 900, None)],
+    ],
+    'email': [
+        [('john', 400, (300, 1200)), ('at', 200, (200, 900)), ('gmail', 450, (200, 800)),
+         ('dot', 200, (100, 500)), ('com', 300, None)],
+        [('it\'s maria', 600, (300, 1000)), ('dot garcia', 600, (400, 1200)), ('at outlook', 600, (200, 700)),
+         ('dot com', 500, None)],
+    ],
+    'open': [
+        [('I\'d like to book', 1200, (200, 800)), ('an appointment for next week.', 1500, None)],
+        [('hi', 300, (300, 700)), ('I need to see a doctor.', 1300, None)],
+        [('can I reschedule', 1000, (300, 900)), ('my appointment.', 900, None)],
+    ],
+}
+
+
+class FixedEndpointer(Endpointer):
+    """Same VAD, but a constant silence budget regardless of context"""
+
+    def __init__(self, silence_ms):
+        self.fixed_ms = silence_ms
+        super().__init__()
+
+    def required_silence_ms(self):
+        return self.fixed_ms
+
+
+class TypeOnlyEndpointer(Endpointer):
+    """Adaptive budget from the answer type, ignoring transcripts"""
+
+    def partial(self, text):
+        pass
+
+
+STRATEGIES = [
+    ('fixed 5s (current)', lambda answer_type: FixedEndpointer(5000)),
+    ('fixed 1s', lambda answer_type: FixedEndpointer(1000)),
+    ('answer type only', lambda answer_type: TypeOnlyEndpointer(answer_type)),
+    ('adaptive', lambda answer_type: Endpointer(answer_type)),
+]
+
+
+def noise_frame(rng, level):
+    return struct.pack(f"<{FRAME_SAMPLES}h", *(int(rng.gauss(0, level)) for _ in range(FRAME_SAMPLES)))
+
+
+def speech_frame(rng, index, level):
+    # Voiced-ish: a couple of harmonics with a syllable-rate envelope
+    envelope = 0.55 + 0.45 * math.sin(2 * math.pi * 4 * index * FRAME_MS / 1000.0)
+    samples = []
+    for i in range(FRAME_SAMPLES):
+        t = (index * FRAME_SAMPLES + i) / SAMPLE_RATE
+        value = level * envelope * (math.sin(2 * math.pi * 180 * t) + 0.5 * math.sin(2 * math.pi * 360 * t))
+        samples.append(int(max(-32768, min(32767, value + rng.gauss(0, level * 0.05)))))
+    return struct.pack(f"<{FRAME_SAMPLES}h", *samples)
+
+
+def synthetic_corpus(per_type, seed):
+    """Utterances as dicts: frames, answer_type, speech_end_ms, partials"""
+    rng = random.Random(seed)
+    corpus = []
+    for answer_type, scripts in SCRIPTS.items():
+        for n in range(per_type):
+            script = scripts[n % len(scripts)]
+            noise = rng.uniform(40, 160)
+            level = rng.uniform(2500, 6000)
+            frames, partials, words = [], [], []
+            for _ in range(rng.randint(10, 25)):
+                frames.append(noise_frame(rng, noise))
+            for word, speech_ms, pause in script:
+                for _ in range(speech_ms // FRAME_MS):
+                    frames.append(speech_frame(rng, len(frames), level))
+                words.append(word)
+                partials.append((len(frames) * FRAME_MS + ASR_PARTIAL_LAG_MS, ' '.join(words)))
+                if pause:
+                    for _ in range(rng.randint(*pause) // FRAME_MS):
+                        frames.append(noise_frame(rng, noise))
+            speech_end_ms = len(frames) * FRAME_MS
+            for _ in range(TRAILING_SILENCE_MS // FRAME_MS):
+                frames.append(noise_frame(rng, noise))
+            corpus.append({'answer_type': answer_type, 'frames': frames,
+                           'speech_end_ms': speech_end_ms, 'partials': partials})
+    return corpus
+
+
+def wav_corpus(directory, seed):
+    """Recorded utterances; speech end defaults to the last loud frame"""
+    rng = random.Random(seed)
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.wav'))):
+        with wave.open(path, 'rb') as wf:
+            if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+                print(f"   ⚠️  Skipping {os.path.basename(path)} (needs 16-bit mono)")
+                continue
+            rate = wf.getframerate()
+            pcm = wf.readframes(wf.getnframes())
+        frame_bytes = rate * FRAME_MS // 1000 * 2
+        frames = [pcm[i:i + frame_bytes] for i in range(0, len(pcm) - frame_bytes + 1, frame_bytes)]
+
+        meta = {}
+        sidecar = os.path.splitext(path)[0] + '.json'
+        if os.path.exists(sidecar):
+            with open(sidecar) as f:
+                meta = json.load(f)
+        speech_end_ms = meta.get('speech_end_ms')
+        if speech_end_ms is None:
+            loud = [i for i, frame in enumerate(frames) if frame_energy(frame) >= 500]
+            speech_end_ms = (loud[-1] + 1) * FRAME_MS if loud else 0
+
+        silence = struct.pack(f"<{frame_bytes // 2}h", *(int(rng.gauss(0, 60)) for _ in range(frame_bytes // 2)))
+        frames.extend([silence] * (TRAILING_SILENCE_MS // FRAME_MS))
+        corpus.append({'answer_type': meta.get('answer_type', 'open'), 'frames': frames,
+                       'speech_end_ms': speech_end_ms, 'partials': [tuple(p) for p in meta.get('partials', [])]})
+    return corpus
+
+
+def endpoint(utterance, endpointer, energies):
+    """Milliseconds into the utterance at which the strategy ends the turn"""
+    partials = list(utterance['partials'])
+    for index, energy in enumerate(energies):
+        now_ms = (index + 1) * FRAME_MS
+        while partials and partials[0][0] <= now_ms:
+            endpointer.partial(partials.pop(0)[1])
+        if endpointer.feed(energy, FRAME_MS):
+            return now_ms
+    return None
+
+
+def summarize(rows):
+    delays = sorted(r['delay'] for r in rows if r['delay'] is not None and r['delay'] >= 0)
+    early = sum(1 for r in rows if r['delay'] is not None and r['delay'] < 0)
+    missed = sum(1 for r in rows if r['delay'] is None)
+    if not delays:
+        return None, None, None, early, missed
+    p95 = delays[min(len(delays) - 1, int(len(delays) * 0.95))]
+    return statistics.mean(delays), statistics.median(delays), p95, early, missed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Endpoint delay vs early cut-offs for endpointing strategies')
+    parser.add_argument('--per-type', type=int, default=100, help="Synthetic utterances per answer type")
+    parser.add_argument('--wav-dir', help='Directory of recorded utterances (16-bit mono WAV)')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = wav_corpus(args.wav_dir, args.seed) if args.wav_dir else synthetic_corpus(args.per_type, args.seed)
+    source = args.wav_dir or 'synthetic corpus'
+    print(f"⏱️  Endpointing benchmark: {len(corpus)} utterances from {source}")
+    print()
+
+    for utterance in corpus:
+        utterance['energies'] = [frame_energy(frame) for frame in utterance['frames']]
+
+    results = {}
+    for name, make in STRATEGIES:
+        rows = []
+        for utterance in corpus:
+            at = endpoint(utterance, make(utterance['answer_type']), utterance['energies'])
+            rows.append({'answer_type': utterance['answer_type'],
+                         'delay': None if at is None else at - utterance['speech_end_ms']})
+        results[name] = rows
+
+    print(f"   {'strategy':<20} {'mean':>7} {'p50':>7} {'p95':>7} {'early cut-offs':>15}")
+    for name, rows in results.items():
+        mean, p50, p95, early, missed = summarize(rows)
+        if mean is None:
+            print(f"   {name:<20} {'-':>7} {'-':>7} {'-':>7} {early:>8} ({100 * early / len(rows):.1f}%)")
+            continue
+        print(f"   {name:<20} {mean:>5.0f}ms {p50:>5.0f}ms {p95:>5.0f}ms {early:>8} ({100 * early / len(rows):4.1f}%)"
+              + (f"  {missed} never ended" if missed else ''))
+
+    print()
+    print("   Adaptive, per answer type:")
+    cut_early = []
+    for answer_type in ANSWER_PROFILES:
+        rows = [r for r in results['adaptive'] if r['answer_type'] == answer_type]
+        if not rows:
+            continue
+        mean, p50, p95, early, _ = summarize(rows)
+        if early:
+            cut_early.append(answer_type)
+        if mean is None:
+            continue
+        print(f"   {answer_type:<20} {mean:>5.0f}ms {p50:>5.0f}ms {p95:>5.0f}ms {early:>8} ({100 * early / len(rows):4.1f}%)")
+
+    # Ending a turn sooner is only a win if it never cuts a caller off
+    success = not cut_early
+    print()
+    print(f"   {'✅' if not cut_early else '❌'} Adaptive cuts no answer type off early"
+          + (f" (early: {', '.join(cut_early)})" if cut_early else ''))
+    print()
+    print("✅ Endpointing benchmark passed" if success else "❌ Endpointing benchmark failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tail latency with and without hedged requests.
+
+Runs the real call sites against long-tail fakes: synthesize_audio against
+a fake Polly, and the search-slots Lambda's search_slots plus the
+prefetcher's tenant lookup against a local HTTP appointment / tenant
+service. Every fake request takes --base-ms (with a little jitter), and
+--tail-pct of them stall for --tail-ms, independently of each other, the
+way one slow host or GC pause stretches a request.
+
+For each operation it prints p50 / p95 / p99 / max call latency, the hedge
+rate and the extra requests sent, with HEDGE_OPERATIONS off and on. The
+first --warmup calls per operation fill the latency window and are not
+counted.
+
+Usage: python scripts/benchmark_hedging.py [--calls 600] [--concurrency 8] [--tail-pct 3]
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'actions'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+os.environ.setdefault('CALL_ARTIFACTS', 'off')
+
+import index  # noqa: E402
+import prefetch  # noqa: E402
+from admission import Admission  # noqa: E402
+from hedging import Hedger  # noqa: E402
+
+
+class LongTail:
+    """Service time: base with jitter, plus an occasional stall"""
+
+    def __init__(self, base_ms, tail_ms, tail_pct, seed=7):
+        self.base = base_ms / 1000
+        self.tail = tail_ms / 1000
+        self.tail_pct = tail_pct
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        with self._lock:
+            self.requests += 1
+            seconds = self.base * self._random.uniform(0.8, 1.2)
+            if self._random.random() * 100 < self.tail_pct:
+                seconds += self.tail
+        time.sleep(seconds)
+
+
+class FakePolly:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def synthesize_speech(self, **kwargs):
+        self.latency.sleep()
+        return {'AudioStream': io.BytesIO(b'\x00\x01' * 800)}
+
+
+def appointment_service(latency):
+    """Local slot-search and tenant-resolve endpoints with long-tail latency"""
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, body):
+            latency.sleep()
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._reply({'slots': [{'slot_id': 's1', 'start_time': '2026-10-20T09:00:00', 'doctor_name': 'Dr. Patel'}]})
+
+        def do_GET(self):
+            self._reply({'tenant_name': 'clinic_a', 'did': '1001'})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(fn, calls, concurrency, warmup):
+    """Latencies (ms) of `calls` calls after `warmup` unmeasured ones"""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda _: fn(), range(warmup)))
+
+        def timed(_):
+            started = time.perf_counter()
+            fn()
+            return (time.perf_counter() - started) * 1000
+
+        return sorted(executor.map(timed, range(calls)))
+
+
+def pct(samples, p):
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tail latency with and without request hedging')
+    parser.add_argument('--calls', type=int, default=600, help='Measured calls per operation and mode')
+    parser.add_argument('--warmup', type=int, default=100, help='Unmeasured calls that fill the latency window')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent callers')
+    parser.add_argument('--base-ms', type=float, default=30, help='Typical service time')
+    parser.add_argument('--tail-ms', type=float, default=400, help='Extra time of a stalled request')
+    parser.add_argument('--tail-pct', type=float, default=3, help='Percent of requests that stall')
+    args = parser.parse_args()
+
+    latency = LongTail(args.base_ms, args.tail_ms, args.tail_pct)
+    server = appointment_service(latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    prefetch.TENANT_CONFIG_URL = url
+
+    import search_slots as search_slots_lambda
+    search_slots_lambda.appointments.base_url = url
+    index.polly = FakePolly(latency)
+    index.admission = Admission(enabled=False)
+
+    operations = {
+        index.POLLY_SYNTHESIZE: lambda: index.synthesize_audio('Your appointment is confirmed.', 'Joanna'),
+        search_slots_lambda.SLOTS_SEARCH: lambda: search_slots_lambda.search_slots('clinic_a', '2026-10-20', 'morning'),
+        prefetch.TENANT_RESOLVE: lambda: prefetch.fetch_tenant_config('1001'),
+    }
+
+    print("📊 Request hedging benchmark")
+    print("----------------------------------------")
+    print(f"   Service time {args.base_ms:.0f} ms, {args.tail_pct:g}% of requests stall +{args.tail_ms:.0f} ms; "
+          f"{args.calls} calls per operation, {args.concurrency} concurrent")
+    print()
+    print(f"   {'operation':<18} {'hedging':<8} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} "
+          f"{'hedge rate':>11} {'extra load':>11}")
+
+    try:
+        for operation, fn in operations.items():
+            for mode in ('off', 'on'):
+                hedger = Hedger(operations=operation if mode == 'on' else '')
+                index.hedger = prefetch.hedger = search_slots_lambda.hedger = hedger
+                requests_before = latency.requests
+                samples = run(fn, args.calls, args.concurrency, args.warmup)
+                sent = latency.requests - requests_before
+                stats = hedger.stats().get(operation, {})
+                extra = sent / (args.calls + args.warmup) - 1
+                print(f"   {operation:<18} {mode:<8} {pct(samples, 50):>5.0f}ms {pct(samples, 95):>5.0f}ms "
+                      f"{pct(samples, 99):>5.0f}ms {samples[-1]:>5.0f}ms {stats.get('hedge_rate', 0):>10.1%} "
+                      f"{extra:>10.1%}")
+                hedger.executor.shutdown(wait=True)
+    finally:
+        server.shutdown()
+    print()
+    print("   extra load = requests sent per call - 1 (hedges, including those that lost)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: next-prompt prediction hit rate and wasted synthesis per tenant.
+
+Replays simulated booking calls through the PromptPredictor with an instant
+fake synthesizer. Each tenant's agent has its own phrasing habits (with
+some variation), so the report shows how quickly learned transitions beat
+the seed prompts and what each top-N policy costs in wasted characters.
+Whole-reply prediction (Lambda channels) and sentence prediction (media
+server) are reported separately.
+
+Usage: python scripts/benchmark_prompt_prediction.py [--calls 100] [--top-n 1 2 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+import metrics  # noqa: E402
+import prompt_predictor  # noqa: E402
+from endpointing import expected_answer_type  # noqa: E402
+from prompt_predictor import PromptPredictor, predictor_stats  # noqa: E402
+
+CLINIC = {'name': 'Downtown Medical Center', 'voice_id': 'Joanna', 'engine': 'neural'}
+NAMES = ['Jane', 'Omar', 'Priya', 'Luis', 'Mei', 'Tom']
+TIMES = ['9:30 AM', '10:00 AM', '11:30 AM', '2:00 PM', '4:30 PM']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+
+# Per-tenant phrasing: (weight, text) choices for each step of the booking flow
+TENANT_PHRASING = {
+    '1001': {
+        'ask_name': [(8, "May I have your full name, please?"), (2, "Great. May I have your full name, please?")],
+        'ask_email': [(9, "Thanks, {name}. And what's the best email address for your confirmation?"),
+                      (1, "And your email address?")],
+        'wrap_up': [(10, "Is there anything else I can help you with today?")],
+    },
+    '1002': {
+        'ask_name': [(6, "Sounds good! Who will the appointment be for?"), (4, "Perfect. What's the patient's name?")],
+        'ask_email': [(7, "Got it, {name}. What email should we send the confirmation to?"),
+                      (3, "What email should we send the confirmation to?")],
+        'wrap_up': [(6, "Anything else I can do for you?"), (4, "Is there anything else I can help with?")],
+    },
+}
+
+
+def pick(rng, choices, **values):
+    total = sum(weight for weight, _ in choices)
+    roll = rng.uniform(0, total)
+    for weight, text in choices:
+        roll -= weight
+        if roll <= 0:
+            break
+    return text.format(**values)
+
+
+def call_script(rng, did):
+    """(reply, action group) for each agent turn of one booking call"""
+    phrasing = TENANT_PHRASING[did]
+    name = rng.choice(NAMES)
+    slot = f"{rng.choice(TIMES)} on {rng.choice(DAYS)}"
+    ref = f"APPT-{rng.randint(1000, 9999)}-{rng.randint(100, 999)}"
+    return [
+        (f"I have {slot}, or {rng.choice(TIMES)}. Which works best for you?", '/searchSlots'),
+        (pick(rng, phrasing['ask_name']), None),
+        (pick(rng, phrasing['ask_email'], name=name), None),
+        (f"You're all set for {slot}. Your confirmation number is {ref}.", '/confirmAppointment'),
+        (pick(rng, phrasing['wrap_up']), None),
+    ]
+
+
+def run(calls, top_n, profile, seed=11):
+    metrics.reset()
+    prompt_predictor.PREDICTION_POLICIES = {did: {'top_n': top_n} for did in TENANT_PHRASING}
+    predictor = PromptPredictor(lambda text, clinic_config, profile: b'audio')
+    rng = random.Random(seed)
+    for n in range(calls):
+        for did in TENANT_PHRASING:
+            session_id = f"bench-{did}-{n}"
+            for reply, action in call_script(rng, did):
+                state = action or expected_answer_type(reply)
+                predictor.observe(session_id, did, state, reply, CLINIC, profile)
+                time.sleep(0.001)  # the caller answering while predictions synthesize
+            predictor.end_call(session_id)
+    predictor.executor.shutdown(wait=True)
+    return predictor_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Next-prompt prediction hit rate and waste per tenant')
+    parser.add_argument('--calls', type=int, default=100, help='Simulated calls per tenant')
+    parser.add_argument('--top-n', type=int, nargs='+', default=[1, 2, 3])
+    args = parser.parse_args()
+
+    print(f"🔮 Next-prompt prediction benchmark ({args.calls} calls per tenant)")
+    for profile, label in (('web', 'whole replies (Lambda channels)'), ('stream', 'sentences (media server)')):
+        print()
+        print(f"   Predicting {label}")
+        print(f"   {'tenant':<7} {'top-N':>5} {'issued':>7} {'hits':>6} {'hit rate':>9} "
+              f"{'saved chars':>12} {'wasted chars':>13} {'waste ratio':>12}")
+        for top_n in args.top_n:
+            stats = run(args.calls, top_n, profile)
+            for did in sorted(stats):
+                s = stats[did]
+                print(f"   {did:<7} {top_n:>5} {s['issued']:>7.0f} {s['hits']:>6.0f} {s['hit_rate']:>8.0%} "
+                      f"{s['saved_chars']:>12,.0f} {s['wasted_chars']:>13,.0f} {s['waste_ratio']:>11.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: estimated spoken seconds and TTS characters before and after
+speech rendering.
+
+Runs a corpus of agent replies shaped like what the Bedrock agent actually
+returns (plain answers, markdown slot lists, long FAQ-style answers, the
+clinic name repeated) through speech_renderer.render_reply and reports the
+estimated audio seconds and synthesized characters for each, plus the
+rendering cost. Shorter audio is faster TTS, smaller payloads and shorter
+calls.
+
+Usage: python scripts/benchmark_speech_renderer.py [--max-seconds 20] [--rate 100%] [--runs 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+from speech_renderer import render_reply  # noqa: E402
+
+CLINIC_NAME = 'Downtown Medical Center'
+
+REPLIES = {
+    'plain offer': "I have 9:30 AM or 2:00 PM on Tuesday with Dr. Smith. Which works best for you?",
+    'markdown list': (
+        "Here are the available appointments at **Downtown Medical Center**:\n\n"
+        "1. **Tuesday, 9:30 AM** - Dr. Sarah Smith\n"
+        "2. **Tuesday, 10:00 AM** - Dr. Sarah Smith\n"
+        "3. **Tuesday, 2:00 PM** - Dr. Michael Johnson\n"
+        "4. **Wednesday, 9:00 AM** - Dr. Michael Johnson\n"
+        "5. **Wednesday, 3:30 PM** - Dr. Patel\n"
+        "6. **Thursday, 11:00 AM** - Dr. Patel\n\n"
+        "Which of these times works best for you?"
+    ),
+    'faq answer': (
+        "## About Downtown Medical Center\n\n"
+        "Downtown Medical Center is located at 123 Main Street, Suite 400. You can find directions at "
+        "https://downtown-medical.example.com/directions. Parking is available in the garage next door, and "
+        "we validate parking at the front desk. Downtown Medical Center also offers telehealth visits for "
+        "follow-up appointments 😊. We accept most major insurance plans, including Aetna, Blue Cross, Cigna, "
+        "Humana, and United Healthcare. Please arrive fifteen minutes before your appointment to complete "
+        "paperwork, and bring your insurance card and a photo ID. Downtown Medical Center is open Monday "
+        "through Friday from 8 AM to 6 PM.\n\nWould you like to book an appointment?"
+    ),
+    'confirmation': (
+        "✅ **You're all set!** Your appointment at Downtown Medical Center is confirmed for *Tuesday at "
+        "9:30 AM* with Dr. Smith. Your confirmation number is `DOWN-1019-123`. A confirmation email will be "
+        "sent to jane@example.com. Is there anything else I can help you with?"
+    ),
+    'name question': "May I have your full name, please?",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimated spoken seconds before and after speech rendering')
+    parser.add_argument('--max-seconds', type=float, default=20.0, help='Tenant speech budget')
+    parser.add_argument('--rate', default='100%', help='Tenant speaking rate')
+    parser.add_argument('--runs', type=int, default=2000, help='Renders per reply for timing')
+    args = parser.parse_args()
+
+    clinic = {'name': CLINIC_NAME, 'max_speech_seconds': args.max_seconds, 'speaking_rate': args.rate}
+    print(f"🗣️  Speech renderer benchmark (budget {args.max_seconds:.0f}s at {args.rate})")
+    print()
+    print(f"   {'reply':<15} {'seconds before':>15} {'after':>7} {'chars before':>13} {'after':>7} "
+          f"{'dropped':>8} {'render µs':>10}")
+
+    totals = [0.0, 0.0, 0, 0]
+    for label, text in REPLIES.items():
+        spoken = render_reply(text, clinic)
+        started = time.perf_counter()
+        for _ in range(args.runs):
+            render_reply(text, clinic)
+        render_us = (time.perf_counter() - started) * 1e6 / args.runs
+        print(f"   {label:<15} {spoken.seconds_before:>15.1f} {spoken.seconds_after:>7.1f} {len(text):>13,} "
+              f"{len(spoken.text):>7,} {spoken.dropped:>8} {render_us:>10.0f}")
+        totals[0] += spoken.seconds_before
+        totals[1] += spoken.seconds_after
+        totals[2] += len(text)
+        totals[3] += len(spoken.text)
+
+    print()
+    print(f"   Total: {totals[0]:.1f}s -> {totals[1]:.1f}s spoken "
+          f"({100 * (1 - totals[1] / totals[0]):.0f}% shorter), "
+          f"{totals[2]:,} -> {totals[3]:,} characters synthesized")
+    print()
+    for label in ('markdown list', 'faq answer'):
+        print(f"   {label}: {render_reply(REPLIES[label], clinic).text}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-turn audio bytes and downstream transcode time, before
+(22.05 kHz mp3 for every channel) and after (channel-native TTS profiles).
+
+Offline mode (default) uses speech-length synthetic PCM in place of Polly:
+PCM-based profiles are measured exactly, compressed formats are estimated
+from their nominal bitrates. The "before" transcode for telephony is what a
+phone leg must do with 22.05 kHz audio to play it at 8 kHz mu-law
+(resample, encode, frame); decoding the mp3 first would come on top and is
+not counted, so the saving shown is a lower bound.
+
+--live synthesizes the sample replies with Polly for every profile and
+reports real sizes and synthesis latency (needs AWS credentials).
+
+Usage: python scripts/benchmark_tts_profiles.py [--turns 200] [--live] [--voice Joanna]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+import audio_codec  # noqa: E402
+from tts_profiles import TTS_PROFILES, finish_audio  # noqa: E402
+
+SAMPLE_REPLIES = [
+    "Thanks for calling Downtown Medical Center. How can I help you today?",
+    "I have nine thirty AM with Dr. Smith, or two PM and four thirty PM with Dr. Johnson. Which works best?",
+    "May I have your full name, please?",
+    "And what email address should we send the confirmation to?",
+    "You're all set for Tuesday at nine thirty AM with Dr. Smith. Your confirmation number is A B 1 2 3 4.",
+]
+
+# Neural voices speak roughly 14 characters per second
+CHARS_PER_SECOND = 14.0
+
+# Nominal bitrates used for compressed formats in offline mode (bits/s)
+ESTIMATED_BITRATES = {'mp3': 48000, 'ogg_vorbis': 40000}
+
+
+def speech_pcm(seconds, rate):
+    t = np.arange(int(seconds * rate)) / rate
+    signal = (0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)) * np.sin(2 * np.pi * 180 * t)
+    return (5000 * signal).astype(np.int16).tobytes()
+
+
+def before_telephony(pcm22):
+    """22.05 kHz audio made playable on an 8 kHz mu-law leg"""
+    pcm8 = audio_codec.resample(pcm22, 22050, 8000)
+    return audio_codec.wav_bytes(audio_codec.ulaw_encode(pcm8), 8000, encoding=audio_codec.ULAW)
+
+
+def offline(turns):
+    texts = [SAMPLE_REPLIES[i % len(SAMPLE_REPLIES)] for i in range(turns)]
+    seconds = [len(t) / CHARS_PER_SECOND for t in texts]
+    pcm22 = [speech_pcm(s, 22050) for s in seconds]
+    pcm8 = [speech_pcm(s, 8000) for s in seconds]
+
+    mp3_bytes = statistics.mean(ESTIMATED_BITRATES['mp3'] * s / 8 for s in seconds)
+    print(f"   Before: every channel gets 22.05 kHz mp3 (~{mp3_bytes / 1024:.1f} KiB/turn, estimated)")
+    print()
+    print(f"   {'profile':<10} {'format':<22} {'bytes/turn':>11} {'vs before':>10} {'transcode ms/turn':>18}")
+
+    started = time.perf_counter()
+    for audio in pcm22:
+        before_telephony(audio)
+    before_ms = (time.perf_counter() - started) * 1000 / turns
+
+    for name, profile in TTS_PROFILES.items():
+        if profile['polly_format'] == 'pcm':
+            started = time.perf_counter()
+            sizes = [len(finish_audio(audio, name)) for audio in pcm8]
+            transcode_ms = (time.perf_counter() - started) * 1000 / turns
+            size = statistics.mean(sizes)
+            label = f"{profile['sample_rate'] // 1000} kHz {profile['encoding']} {profile['container']}"
+        else:
+            size = statistics.mean(ESTIMATED_BITRATES[profile['polly_format']] * s / 8 for s in seconds)
+            transcode_ms = 0.0
+            label = f"{profile['polly_format']} (est.)"
+        change = 100 * (size / mp3_bytes - 1)
+        print(f"   {name:<10} {label:<22} {size:>11,.0f} {change:>+9.0f}% {transcode_ms:>18.3f}")
+
+    print()
+    print(f"   Telephony transcode before (22.05 kHz -> 8 kHz mu-law WAV, excl. mp3 decode): {before_ms:.3f} ms/turn")
+    print("   Telephony bytes grow vs mp3 but are what the leg plays; the mp3 had to be decoded and")
+    print("   converted to the same mu-law audio, and Twilio fell back to <Say> without it.")
+
+
+def live(voice, engine):
+    import boto3
+
+    polly = boto3.client('polly', region_name='us-east-1')
+    print(f"   {'profile':<10} {'bytes/turn':>11} {'synthesis ms':>13} {'transcode ms':>13}")
+    for name, profile in [('before', {'polly_format': 'mp3', 'sample_rate': 22050})] + list(TTS_PROFILES.items()):
+        sizes, synth, transcode = [], [], []
+        for text in SAMPLE_REPLIES:
+            started = time.perf_counter()
+            response = polly.synthesize_speech(Text=text, OutputFormat=profile['polly_format'], VoiceId=voice,
+                                               Engine=engine, SampleRate=str(profile['sample_rate']))
+            audio = response['AudioStream'].read()
+            synthesized = time.perf_counter()
+            if name != 'before':
+                audio = finish_audio(audio, name)
+            transcode.append((time.perf_counter() - synthesized) * 1000)
+            synth.append((synthesized - started) * 1000)
+            sizes.append(len(audio))
+        print(f"   {name:<10} {statistics.mean(sizes):>11,.0f} {statistics.median(synth):>13.0f} "
+              f"{statistics.mean(transcode):>13.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-turn bytes and transcode time per TTS profile')
+    parser.add_argument('--turns', type=int, default=200, help='Turns to simulate offline')
+    parser.add_argument('--live', action='store_true', help='Synthesize with Amazon Polly')
+    parser.add_argument('--voice', default='Joanna')
+    parser.add_argument('--engine', default='neural')
+    args = parser.parse_args()
+
+    print(f"🔊 TTS output profile benchmark ({'live Polly' if args.live else f'offline, {args.turns} turns'})")
+    print()
+    if args.live:
+        live(args.voice, args.engine)
+    else:
+        offline(args.turns)
+
+
+if __name__ == '__main__':
+    main()
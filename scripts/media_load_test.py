@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the real-time media-stream server.
+
+Opens many concurrent Twilio Media Streams (or FreeSWITCH mod_audio_fork)
+WebSocket connections against lambda/voice-processor/media_server.py,
+streams synthetic caller audio at real-time pace (a tone burst per
+utterance followed by silence) and measures how long each reply takes to
+start arriving after the caller stops talking.
+
+    python lambda/voice-processor/media_server.py --offline --port 8080 &
+    python scripts/media_load_test.py --calls 500 --utterances 3
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import statistics
+import struct
+import time
+
+import aiohttp
+
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# Server audio gap that counts as "reply finished"
+QUIET_MS = 600
+
+
+def ulaw_encode(sample):
+    """Single-sample G.711 mu-law encoder (test client only)"""
+    sign = 0x80 if sample < 0 else 0
+    magnitude = min(abs(sample), 32635) + 0x84
+    exponent = 7
+    while exponent > 0 and not magnitude & (0x4000 >> (7 - exponent)):
+        exponent -= 1
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF
+
+
+def tone_frame(index, amplitude=6000, freq=300):
+    """One 20 ms PCM16 frame of a sine tone"""
+    step = 2 * math.pi * freq / SAMPLE_RATE
+    start = index * FRAME_SAMPLES
+    return [int(amplitude * math.sin((start + i) * step)) for i in range(FRAME_SAMPLES)]
+
+
+SPEECH_FRAMES_TWILIO = None
+SPEECH_FRAMES_PCM = None
+SILENCE_TWILIO = base64.b64encode(bytes([0xFF]) * FRAME_SAMPLES).decode('ascii')
+SILENCE_PCM = bytes(FRAME_SAMPLES * 2)
+
+
+def build_frames(utterance_ms):
+    """Pre-encode the speech burst once; every simulated caller reuses it"""
+    global SPEECH_FRAMES_TWILIO, SPEECH_FRAMES_PCM
+    frames = [tone_frame(i) for i in range(utterance_ms // FRAME_MS)]
+    SPEECH_FRAMES_TWILIO = [base64.b64encode(bytes(ulaw_encode(s) for s in f)).decode('ascii') for f in frames]
+    SPEECH_FRAMES_PCM = [struct.pack(f"<{FRAME_SAMPLES}h", *f) for f in frames]
+
+
+class SimulatedCaller:
+    def __init__(self, index, args, results):
+        self.index = index
+        self.args = args
+        self.results = results
+        self.reply_started = asyncio.Event()
+        self.reply_at = 0.0
+        self.last_audio_at = 0.0
+        self.frames_received = 0
+
+    async def run(self, session):
+        url = f"{self.args.url}/{self.args.protocol}"
+        try:
+            async with session.ws_connect(url, max_msg_size=1 << 22) as ws:
+                reader = asyncio.ensure_future(self._read(ws))
+                await self._start(ws)
+
+                # Let the greeting play out before the first utterance
+                await self._wait_for_quiet(ws, self.args.greeting_wait_ms)
+
+                for _ in range(self.args.utterances):
+                    await self._speak(ws)
+                    self.reply_started.clear()
+                    ended = time.perf_counter()
+                    waited = 0
+                    while not self.reply_started.is_set() and waited < self.args.reply_timeout_ms:
+                        await self._silence(ws, FRAME_MS)
+                        waited += FRAME_MS
+                    if self.reply_started.is_set():
+                        self.results['latencies'].append((self.reply_at - ended) * 1000)
+                    else:
+                        self.results['timeouts'] += 1
+                    # Listen to the whole reply before talking again
+                    await self._wait_for_quiet(ws, self.args.reply_timeout_ms)
+
+                await self._stop(ws)
+                reader.cancel()
+                self.results['completed'] += 1
+        except Exception as e:
+            self.results['errors'] += 1
+            if self.results['errors'] <= 5:
+                print(f"   ❌ caller {self.index}: {e}")
+        finally:
+            self.results['frames_received'] += self.frames_received
+
+    async def _read(self, ws):
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                data = json.loads(msg.data)
+                is_audio = data.get('event') == 'media' or data.get('type') == 'playAudio'
+                if is_audio:
+                    self.frames_received += 1
+                    self.last_audio_at = time.perf_counter()
+                    if not self.reply_started.is_set():
+                        self.reply_at = time.perf_counter()
+                        self.reply_started.set()
+
+    async def _start(self, ws):
+        if self.args.protocol == 'twilio':
+            await ws.send_str(json.dumps({'event': 'connected', 'protocol': 'Call'}))
+            await ws.send_str(json.dumps({
+                'event': 'start',
+                'streamSid': f"MZ{self.index:08d}",
+                'start': {
+                    'streamSid': f"MZ{self.index:08d}",
+                    'callSid': f"CA-load-{self.index}",
+                    'customParameters': {'did': self.args.did, 'caller_number': f"+1555{self.index:07d}"},
+                    'mediaFormat': {'encoding': 'audio/x-mulaw', 'sampleRate': SAMPLE_RATE, 'channels': 1}
+                }
+            }))
+        else:
+            await ws.send_str(json.dumps({
+                'uuid': f"load-{self.index}",
+                'did': self.args.did,
+                'caller_id_number': f"+1555{self.index:07d}",
+                'sample_rate': SAMPLE_RATE
+            }))
+
+    async def _stop(self, ws):
+        if self.args.protocol == 'twilio':
+            await ws.send_str(json.dumps({'event': 'stop'}))
+        await ws.close()
+
+    async def _send_frames(self, ws, frames):
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        for frame in frames:
+            if self.args.protocol == 'twilio':
+                await ws.send_str(json.dumps({
+                    'event': 'media',
+                    'media': {'track': 'inbound', 'payload': frame}
+                }))
+            else:
+                await ws.send_bytes(frame)
+            next_at += FRAME_MS / 1000.0
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+    async def _wait_for_quiet(self, ws, limit_ms):
+        """Send silence until the server has stopped sending audio for QUIET_MS"""
+        started = time.perf_counter()
+        await self._silence(ws, QUIET_MS)
+        while (time.perf_counter() - self.last_audio_at) * 1000 < QUIET_MS:
+            if (time.perf_counter() - started) * 1000 > limit_ms:
+                break
+            await self._silence(ws, FRAME_MS)
+
+    async def _speak(self, ws):
+        frames = SPEECH_FRAMES_TWILIO if self.args.protocol == 'twilio' else SPEECH_FRAMES_PCM
+        await self._send_frames(ws, frames)
+
+    async def _silence(self, ws, duration_ms):
+        silence = SILENCE_TWILIO if self.args.protocol == 'twilio' else SILENCE_PCM
+        await self._send_frames(ws, [silence] * max(1, duration_ms // FRAME_MS))
+
+
+async def run_load(args):
+    build_frames(args.utterance_ms)
+    results = {'latencies': [], 'timeouts': 0, 'errors': 0, 'completed': 0, 'frames_received': 0}
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        callers = [SimulatedCaller(i, args, results) for i in range(args.calls)]
+        started = time.perf_counter()
+        tasks = []
+        for caller in callers:
+            tasks.append(asyncio.ensure_future(caller.run(session)))
+            # Ramp up instead of opening every socket in the same tick
+            await asyncio.sleep(args.ramp_ms / 1000.0)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test for the media-stream server')
+    parser.add_argument('--url', default='ws://localhost:8080')
+    parser.add_argument('--protocol', choices=['twilio', 'freeswitch'], default='twilio')
+    parser.add_argument('--calls', type=int, default=50, help='Concurrent simulated callers')
+    parser.add_argument('--utterances', type=int, default=3, help='Utterances per caller')
+    parser.add_argument('--did', default='1001')
+    parser.add_argument('--utterance-ms', type=int, default=1200)
+    parser.add_argument('--greeting-wait-ms', type=int, default=8000)
+    parser.add_argument('--reply-timeout-ms', type=int, default=10000)
+    parser.add_argument('--ramp-ms', type=int, default=5, help='Delay between opening connections')
+    args = parser.parse_args()
+
+    print(f"📞 Media server load test: {args.calls} {args.protocol} calls x {args.utterances} utterances")
+    print(f"   Target: {args.url}")
+    print()
+
+    results, elapsed = asyncio.run(run_load(args))
+    latencies = sorted(results['latencies'])
+
+    print(f"   Completed calls:   {results['completed']}/{args.calls} ({results['errors']} errors)")
+    print(f"   Replies measured:  {len(latencies)} ({results['timeouts']} timeouts)")
+    print(f"   Frames received:   {results['frames_received']}")
+    print(f"   Wall time:         {elapsed:.1f}s")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"   Reply latency:     p50={statistics.median(latencies):.0f} ms  "
+              f"p95={p95:.0f} ms  max={latencies[-1]:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
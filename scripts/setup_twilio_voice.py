@@ -150,6 +150,7 @@ class TwilioVoiceSetup:
         print("8. In 'Voice & Fax' section:")
         print(f"   - Webhook: {webhook_url}")
         print("   - HTTP Method: POST")
+        print(f"   - Call status changes: {webhook_url} (POST) - writes each call's recording/transcript")
         print("9. Save configuration")
         
         print("\n🧪 **TEST YOUR VOICE BOT**:")
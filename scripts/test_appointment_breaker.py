@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Offline test for the appointment-service circuit breaker.
+
+Runs the search-slots and confirm-appointment handlers against a local
+fake appointment service that can be switched between up, hanging (every
+request outlives the client timeout) and refusing a taken slot:
+  1. while the service hangs, only the first few requests wait out the
+     timeout; once the breaker is open, searches answer at once
+  2. an open breaker serves the last good slots for a query, marked stale,
+     and never fabricates slots for a query it has not seen
+  3. a confirmation during the outage is queued (CONFIRM_QUEUE, a job
+     directory here) and answered PENDING, not a made-up BOOKED; with no
+     queue configured it is answered FAILED and nothing is promised
+  4. when the service recovers, a half-open probe closes the breaker; the
+     next confirm turn does not replay the queue, and two background
+     drains running at once book each queued confirmation exactly once
+  5. a slot the service refuses (HTTP 400) is reported FAILED
+  6. over keep-alive, a search whose reused connection the server drops is
+     sent again, but a dropped confirm is not (it may have been booked)
+  7. in an SQS batch, a malformed record is reported as that record's batch
+     item failure alone; the good records in the batch are still booked
+and prints the breaker's transitions, rejected calls and open duration.
+
+Usage: python scripts/test_appointment_breaker.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'actions'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+TIMEOUT = 0.3
+OPEN_SECONDS = 0.5
+
+
+class FakeAppointmentService:
+    """Slot search and confirm endpoints with a switchable failure mode"""
+
+    def __init__(self):
+        self.mode = 'up'
+        self.confirmed = []
+        self.taken = set()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if service.mode == 'hang':
+                    time.sleep(TIMEOUT * 3)
+                    return
+                status, reply = 200, {}
+                if self.path == '/v1/slots/search':
+                    reply = {'slots': [{'slot_id': f"clinic_a-{body['date']}-0900",
+                                        'start_time': f"{body['date']}T09:00:00", 'doctor_name': 'Dr. Patel'}]}
+                elif body['slotId'] in service.taken:
+                    status, reply = 400, {'status': 'FAILED', 'error': 'slot not available'}
+                else:
+                    service.confirmed.append(body['slotId'])
+                    reply = {'status': 'BOOKED', 'confirmation_ref': f"CLIN-{len(service.confirmed):04d}"}
+                data = json.dumps(reply).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except BrokenPipeError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+class DroppingService:
+    """Keep-alive service that takes each request, then closes the connection without answering"""
+
+    def __init__(self):
+        self.requests = []
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                service.requests.append(self.path)
+                if len(service.requests) > 1:
+                    self.close_connection = True
+                    return
+                data = b'{"slots": []}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def resends(path, idempotent):
+    """How many times one call was sent after its reused connection was dropped"""
+    client_module = sys.modules['appointment_client']
+    service = DroppingService()
+    client = client_module.AppointmentClient(service.url, timeout=TIMEOUT)
+    client.post('/v1/slots/search', {}, idempotent=True)  # leaves an idle keep-alive connection
+    try:
+        client.post(path, {}, idempotent=idempotent)
+    except client_module.AppointmentServiceUnavailable:
+        pass
+    service.server.shutdown()
+    return service.requests.count(path) - (path == '/v1/slots/search')
+
+
+def action_event(api_path, session_id, **params):
+    return {
+        'actionGroup': 'AppointmentActions',
+        'apiPath': api_path,
+        'httpMethod': 'POST',
+        'sessionId': session_id,
+        'requestBody': {'content': {'application/json': {'properties': [
+            {'name': name, 'value': value} for name, value in params.items()
+        ]}}},
+        'sessionAttributes': {}
+    }
+
+
+def body_of(response):
+    return json.loads(response['response']['responseBody']['application/json']['body'])
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    print("🧪 Appointment-service circuit breaker test (offline, fake service)")
+    print("----------------------------------------")
+
+    service = FakeAppointmentService()
+    os.environ['CONFIRM_QUEUE'] = tempfile.mkdtemp(prefix='confirm-queue-')
+    import search_slots as search
+    import confirm_appointment as confirm
+    for module in (search, confirm):
+        module.appointments.base_url = service.url
+        module.appointments.timeout = module.appointments.probe_timeout = TIMEOUT
+        module.appointments.breaker.open_seconds = OPEN_SECONDS
+    search.print = confirm.print = lambda *a, **k: None
+    transitions = []
+    sys.modules['appointment_client'].print = lambda message, *a, **k: transitions.append(message)
+
+    def search_event(date, session_id='call-1'):
+        return action_event('/searchSlots', session_id, tenant_id='clinic_a', date=date,
+                            time_preference='morning', max_results='1', widen_days='1')
+
+    # Healthy: the search result becomes the last known good copy
+    fresh = body_of(search.handler(search_event('2026-10-21'), None))
+
+    # Outage: the first searches wait out the timeout, then the breaker fails fast
+    service.mode = 'hang'
+    outage = [timed(search.handler, search_event('2026-10-21'), None) for _ in range(4)]
+    stale = body_of(outage[-1][0])
+    unseen = body_of(search.handler(search_event('2026-11-03'), None))
+
+    for _ in range(3):
+        timed(confirm.handler, action_event('/confirmAppointment', 'call-2', tenant_id='clinic_a',
+                                            slot_id='clinic_a-2026-10-20-1000', patient_name='Ana Ruiz',
+                                            patient_email='ana@example.com'), None)
+    queued_before = len(confirm.deferred)
+    pending, pending_seconds = timed(confirm.handler, action_event(
+        '/confirmAppointment', 'call-1', tenant_id='clinic_a', slot_id=fresh['slots'][0]['slot_id'],
+        patient_name='Sam Lee', patient_email='sam@example.com'), None)
+    pending = body_of(pending)
+    queue, confirm.deferred = confirm.deferred, None
+    unqueued = body_of(confirm.handler(action_event(
+        '/confirmAppointment', 'call-4', tenant_id='clinic_a', slot_id='clinic_a-2026-10-23-0900',
+        patient_name='Lee Park', patient_email='lee@example.com'), None))
+    confirm.deferred = queue
+    queued_after = len(confirm.deferred)
+
+    # Recovery: after the open period a probe closes the breaker and the queue drains
+    service.mode = 'up'
+    time.sleep(OPEN_SECONDS + 0.1)
+    service.taken.add('clinic_a-2026-10-22-0900')
+    refused = body_of(confirm.handler(action_event(
+        '/confirmAppointment', 'call-3', tenant_id='clinic_a', slot_id='clinic_a-2026-10-22-0900',
+        patient_name='Kim Ode', patient_email='kim@example.com'), None))
+    queued_after_turn = len(confirm.deferred)
+    drains = [threading.Thread(target=confirm.drain_deferred) for _ in range(2)]
+    for drain in drains:
+        drain.start()
+    for drain in drains:
+        drain.join()
+    stats = confirm.appointments.breaker.stats()
+    drained = len(service.confirmed)
+
+    # SQS batch with poison records: only those are reported back for redelivery
+    good = {'tenant_id': 'clinic_a', 'slot_id': 'clinic_a-2026-10-24-0900', 'patient_name': 'Ida Moss',
+            'patient_email': 'ida@example.com', 'pending_ref': 'PEND-SQS-1'}
+    batch = confirm.process_deferred({'Records': [
+        {'messageId': 'msg-good', 'body': json.dumps(good)},
+        {'messageId': 'msg-not-json', 'body': 'not json'},
+        {'messageId': 'msg-no-slot', 'body': json.dumps({'tenant_id': 'clinic_a', 'pending_ref': 'PEND-SQS-2'})},
+    ]})
+    batch_failed = [item['itemIdentifier'] for item in batch['batchItemFailures']]
+
+    search_sends = resends('/v1/slots/search', idempotent=True)
+    confirm_sends = resends('/v1/appointments/confirm', idempotent=False)
+
+    slow = [seconds for _, seconds in outage[:3]]
+    print(f"   Outage searches: {', '.join(f'{s * 1000:.0f}ms' for s in slow)} (timeouts), "
+          f"then {outage[3][1] * 1000:.1f}ms with the breaker open")
+    print(f"   Outage confirmation: {pending['status']} {pending.get('pending_ref', '')} "
+          f"in {pending_seconds * 1000:.1f}ms; queued {queued_before + 1}")
+    for message in transitions:
+        print(f"   {message}")
+    print(f"   Confirm breaker: {json.dumps(stats)}")
+    print(f"   Dropped keep-alive connection: search sent {search_sends}x, confirm sent {confirm_sends}x")
+
+    checks = [
+        ('Fresh slots served while healthy', fresh['slots'] and not fresh.get('stale')),
+        ('Breaker opens after the threshold', all(s >= TIMEOUT for s in slow) and outage[3][1] < 0.05),
+        ('Open breaker serves last good slots, marked stale',
+         stale.get('stale') and stale['slots'][0]['slot_id'] == fresh['slots'][0]['slot_id']
+         and stale['slots'][0]['stale']),
+        ('No fabricated slots for an unseen query', unseen['slots'] == [] and unseen.get('unavailable')),
+        ('Outage confirmation queued as PENDING, not BOOKED',
+         pending['status'] == 'PENDING' and pending.get('pending_ref') and queued_before == 3
+         and pending_seconds < 0.05),
+        ('Without a durable queue nothing is promised',
+         unqueued['status'] == 'FAILED' and 'pending_ref' not in unqueued and queued_after == 4),
+        ('Recovery probe closes the breaker', stats['state'] == 'closed' and stats['closed'] == 1),
+        ('Confirm turns do not replay the queue', queued_after_turn == 4),
+        ('Queued confirmations booked once by concurrent background drains',
+         len(confirm.deferred) == 0 and fresh['slots'][0]['slot_id'] in service.confirmed
+         and drained == 4),
+        ('Refused slot reported FAILED', refused['status'] == 'FAILED'),
+        ('Dropped idempotent search resent on a fresh connection', search_sends == 2),
+        ('Dropped confirm never resent', confirm_sends == 1),
+        ('Malformed SQS records fail alone; the rest of the batch is booked',
+         batch_failed == ['msg-not-json', 'msg-no-slot'] and good['slot_id'] in service.confirmed),
+        ('Open duration and rejections recorded', stats['last_open_seconds'] >= OPEN_SECONDS and stats['rejected'] > 0),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    service.server.shutdown()
+    print()
+    print("✅ Circuit breaker test passed" if success else "❌ Circuit breaker test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
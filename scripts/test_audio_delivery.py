@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Offline test for audio delivery in the voice-processor Lambda.
+
+Runs the text, direct and Connect handlers with Polly, Transcribe, the
+Bedrock agent and S3 replaced by in-process fakes, and counts S3 writes
+per turn on each path:
+  1. web/desktop text and direct turns return inline audio and never write to S3
+  2. Connect and Twilio turns get a URL; a repeated prompt is uploaded once
+     and its presigned URL reused
+  3. with a proxy base URL set, URL channels are served from memory with no
+     S3 write, and the proxy fetch returns the same bytes
+"""
+
+import base64
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+import index  # noqa: E402
+from audio_delivery import AudioDelivery  # noqa: E402
+
+TURNS = 20
+REPLIES = ["May I have your full name, please?", "And what's the best email address for your confirmation?"]
+
+
+class FakeS3:
+    def __init__(self):
+        self.puts = 0
+        self.signed = 0
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.puts += 1
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self.signed += 1
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?sig={self.signed}"
+
+
+def fake_polly(text, voice_id, engine='neural', output_format='mp3', sample_rate='22050', text_type='text'):
+    if output_format == 'pcm':
+        return b'\x00\x01' * (len(text) * 40)
+    return b'ID3' + text.encode('utf-8')
+
+
+def run_turns(handler, make_event):
+    s3 = index.audio_delivery.s3
+    before = s3.puts
+    bodies = []
+    for turn in range(TURNS):
+        index.call_bedrock_agent = lambda *args, turn=turn: REPLIES[turn % len(REPLIES)]
+        response = handler(make_event(turn), None)
+        bodies.append(json.loads(response['body']) if 'body' in response else response)
+    return (s3.puts - before) / TURNS, bodies
+
+
+def main():
+    print("🧪 Audio delivery test (offline, fake Polly / agent / S3)")
+    print("----------------------------------------")
+
+    index.synthesize_audio = fake_polly
+    index.transcribe_audio_bytes = lambda *args: "I'd like an appointment"
+    index.predictor.synthesize = lambda *args: b''  # keep prediction out of the counts
+    s3 = FakeS3()
+    index.audio_delivery = AudioDelivery(s3, 'test-bucket', proxy_base_url='')
+
+    connect_event = lambda turn: {'Details': {'ContactData': {  # noqa: E731
+        'ContactId': 'contact-1', 'SystemEndpoint': {'Address': '+15550001001'},
+        'CustomerEndpoint': {'Address': '+15551234567'}}, 'Parameters': {'userInput': 'hello'}}}
+
+    results = {}
+    results['text (web)'] = run_turns(index.handle_text_call,
+                                      lambda turn: {'text': 'hi', 'did': '1001', 'session_id': 'text-1'})
+    results['direct (desktop)'] = run_turns(index.handle_direct_voice_call, lambda turn: {
+        'audio_data': base64.b64encode(b'RIFF').decode(), 'did': '1001', 'session_id': 'direct-1',
+        'output_profile': 'desktop'})
+    results['text (twilio)'] = run_turns(index.handle_text_call, lambda turn: {
+        'text': 'hi', 'did': '1001', 'session_id': 'twilio-CA1', 'channel': 'twilio'})
+    results['connect'] = run_turns(index.handle_connect_call, connect_event)
+
+    index.audio_delivery = AudioDelivery(s3, 'test-bucket', proxy_base_url='http://localhost:8080')
+    results['connect (proxy)'] = run_turns(index.handle_connect_call, connect_event)
+
+    print(f"   {'path':<18} {'S3 writes/turn':>15} {'before':>7}")
+    for path, (puts, _) in results.items():
+        print(f"   {path:<18} {puts:>15.2f} {1.0:>7.2f}")
+
+    inline = results['text (web)'][1] + results['direct (desktop)'][1]
+    twilio = results['text (twilio)'][1]
+    connect = results['connect'][1]
+    proxied = results['connect (proxy)'][1]
+    proxy_id = proxied[0]['audioUrl'].rsplit('/', 1)[-1]
+    fetched = index.audio_delivery.fetch(proxy_id)
+    expected = index.render_speech(REPLIES[0], 'Joanna', 'neural', 'connect', index.CLINIC_VOICES['1001'])
+
+    checks = [
+        ('Inline paths never write to S3', results['text (web)'][0] == 0 and results['direct (desktop)'][0] == 0),
+        ('Inline paths return audio_base64 only', all(b['audio_base64'] and not b['audio_url'] for b in inline)),
+        ('Twilio gets a URL for <Play>', all(b['audio_url'] for b in twilio)),
+        ('Repeated prompts uploaded once', results['connect'][0] == 0 and s3.puts == len(REPLIES)),
+        ('Presigned URLs reused', len({b['audioUrl'] for b in connect}) == len(REPLIES)),
+        ('Proxy mode writes nothing to S3', results['connect (proxy)'][0] == 0),
+        ('Proxy serves the rendered audio', fetched is not None and fetched[0] == expected),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Audio delivery test passed" if success else "❌ Audio delivery test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Offline barge-in test for the media-stream server.
+
+Starts the media server in-process with the offline backend, places a
+Twilio Media Streams call and plays synthetic caller audio that overlaps
+the agent's reply:
+  1. a short blip during playback must NOT interrupt the reply
+  2. sustained speech over the reply must clear playback, leave the rest
+     of the reply unsynthesized and be answered as the next turn
+"""
+
+import asyncio
+import base64
+import json
+import math
+import os
+import struct
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+from audio_codec import ulaw_encode  # noqa: E402
+from media_server import MediaServer, OfflineBackend  # noqa: E402
+
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+def caller_frames(duration_ms, amplitude):
+    """Base64 mu-law frames of a 300 Hz tone (amplitude 0 gives silence)"""
+    frames = []
+    for n in range(duration_ms // FRAME_MS):
+        samples = [int(amplitude * math.sin(2 * math.pi * 300 * (n * FRAME_SAMPLES + i) / SAMPLE_RATE))
+                   for i in range(FRAME_SAMPLES)]
+        pcm = struct.pack(f"<{FRAME_SAMPLES}h", *samples)
+        frames.append(base64.b64encode(ulaw_encode(pcm)).decode('ascii'))
+    return frames
+
+
+class Caller:
+    def __init__(self, ws):
+        self.ws = ws
+        self.events = []  # (time, event name)
+        self.media_frames = 0
+
+    async def read(self):
+        async for msg in self.ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                event = json.loads(msg.data).get('event')
+                self.events.append((time.perf_counter(), event))
+                if event == 'media':
+                    self.media_frames += 1
+
+    async def send(self, frames):
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        for payload in frames:
+            await self.ws.send_str(json.dumps({'event': 'media', 'media': {'track': 'inbound', 'payload': payload}}))
+            next_at += FRAME_MS / 1000.0
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+    async def wait_for_media(self, after, timeout=5.0):
+        """Send silence until the server starts sending audio after a point in time"""
+        silence = caller_frames(FRAME_MS, 0)
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if any(t > after and e == 'media' for t, e in self.events):
+                return True
+            await self.send(silence)
+        return False
+
+    def count(self, name, after=0.0):
+        return sum(1 for t, e in self.events if e == name and t > after)
+
+
+async def run_test():
+    server = MediaServer(OfflineBackend(), workers=4)
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    results = {}
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f"ws://127.0.0.1:{port}/twilio") as ws:
+                caller = Caller(ws)
+                reader = asyncio.ensure_future(caller.read())
+                await ws.send_str(json.dumps({'event': 'start', 'start': {
+                    'streamSid': 'MZbarge', 'callSid': 'CA-barge', 'customParameters': {'did': '1001'}}}))
+
+                # Let the greeting start, then talk over it for real
+                await caller.wait_for_media(0.0)
+                await caller.send(caller_frames(1000, 6000))
+                await caller.send(caller_frames(1200, 0))
+
+                # Wait for the reply to the first utterance
+                asked_at = time.perf_counter()
+                if not await caller.wait_for_media(asked_at):
+                    print("❌ No reply to the first utterance")
+                    return False
+
+                # 1. A 100 ms blip over the reply is not a barge-in
+                blip_at = time.perf_counter()
+                await caller.send(caller_frames(100, 6000))
+                await caller.send(caller_frames(400, 0))
+                results['blip_ignored'] = caller.count('clear', after=blip_at) == 0
+
+                # 2. Sustained overlapping speech interrupts the reply
+                barge_at = time.perf_counter()
+                await caller.send(caller_frames(900, 6000))
+                results['cleared'] = caller.count('clear', after=barge_at) == 1
+                frames_at_barge = caller.media_frames
+                await caller.send(caller_frames(1200, 0))
+                results['answered'] = await caller.wait_for_media(barge_at + 1.0)
+
+                reader.cancel()
+                results['frames_after_barge'] = caller.media_frames - frames_at_barge
+    finally:
+        await runner.cleanup()
+        server.executor.shutdown(wait=False)
+
+    stats = server.stats
+    print(f"   Stats: barge_ins={stats['barge_ins']} saved_chars={stats['saved_chars']} "
+          f"dropped_frames={stats['dropped_frames']} utterances={stats['utterances']}")
+
+    checks = [
+        ('Short blip during playback ignored', results.get('blip_ignored')),
+        ('Sustained overlap sends clear', results.get('cleared')),
+        ('Barge-ins counted (greeting + reply)', stats['barge_ins'] == 2),
+        ('Unsynthesized characters counted', stats['saved_chars'] > 0),
+        ('Queued frames dropped', stats['dropped_frames'] > 0),
+        ('Interruption answered as the next turn', results.get('answered')),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+
+def main():
+    print("🧪 Barge-in test (offline media server, synthetic overlapping audio)")
+    print("----------------------------------------")
+    success = asyncio.run(run_test())
+    print()
+    print("✅ Barge-in test passed" if success else "❌ Barge-in test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
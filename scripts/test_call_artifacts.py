@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Offline test for per-call recording and transcript artifacts.
+
+Runs call setup, direct voice turns, text turns and the end-of-call event
+through the voice-processor Lambda with Polly, Transcribe, the Bedrock
+agent and S3 replaced by in-process fakes, and the artifact writer on the
+local-filesystem backend:
+  1. a whole call is one artifact; its index, JSONL transcript and per-turn
+     audio read back intact (caller audio round-trips through mu-law)
+  2. every turn is durable when its invocation returns (a fragment), and
+     the fragments are merged and removed at call end
+  3. turns spread over several containers, including one recycled before
+     the call ends, still make one artifact with every turn in order
+  4. a long call is merged with a multipart upload and reads back the same
+  5. the index is readable from the artifact's tail alone (ranged read)
+  6. Twilio's status callback ends the call in the voice processor, and the
+     Transcribe input upload is deleted once its job is done
+
+Usage: python scripts/test_call_artifacts.py
+"""
+
+import base64
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import urllib.parse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+import audio_codec  # noqa: E402
+import index  # noqa: E402
+from call_artifacts import (  # noqa: E402
+    CallArtifactWriter, LocalArtifactBackend, fragment_prefix, read_artifact, read_index, turn_audio
+)
+
+TURNS = 12
+REPLIES = ["May I have your full name, please?", "And what's the best email address for your confirmation?"]
+
+
+class CountingBackend(LocalArtifactBackend):
+    def __init__(self, root):
+        super().__init__(root)
+        self.requests = {'put': 0, 'start': 0, 'part': 0, 'complete': 0}
+
+    def put(self, key, data):
+        self.requests['put'] += 1
+        super().put(key, data)
+
+    def start(self, key):
+        self.requests['start'] += 1
+        return super().start(key)
+
+    def upload_part(self, key, upload_id, number, data):
+        self.requests['part'] += 1
+        return super().upload_part(key, upload_id, number, data)
+
+    def complete(self, key, upload_id, etags):
+        self.requests['complete'] += 1
+        super().complete(key, upload_id, etags)
+
+
+class FakeS3:
+    """put/delete only, for the Transcribe input upload"""
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.puts += 1
+        self.objects[Key] = Body
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class RecordingLambda:
+    """boto3 Lambda client that records the webhook's invocations"""
+
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, FunctionName, Payload, InvocationType='RequestResponse'):
+        self.invocations.append((InvocationType, json.loads(Payload)))
+        return {'StatusCode': 202}
+
+
+def load_lambda(name):
+    """Import lambda/<name>/index.py under a unique module name"""
+    directory = os.path.join(ROOT, 'lambda', name)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(directory, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fake_polly(text, voice_id, engine='neural', output_format='mp3', sample_rate='22050', text_type='text'):
+    if output_format == 'pcm':
+        return b'\x00\x01' * (len(text) * 40)
+    return b'ID3' + text.encode('utf-8')
+
+
+def caller_wav(seconds, rate=16000):
+    t = np.arange(int(seconds * rate)) / rate
+    pcm = (4000 * np.sin(2 * np.pi * 300 * t)).astype(np.int16)
+    return audio_codec.wav_bytes(pcm, rate), pcm
+
+
+def text_turn(session_id, text):
+    index.call_bedrock_agent = lambda *args: f"You said {text}."
+    index.handle_text_call({'text': text, 'did': '1001', 'session_id': session_id, 'output_profile': 'stream'}, None)
+
+
+def run_call(session_id, turns, caller_seconds):
+    """One call: setup, alternating direct-voice and text turns, hang-up"""
+    index.handle_call_setup({'action': 'start_call', 'did': '1001', 'session_id': session_id,
+                             'output_profile': 'stream'}, None)
+    wav, pcm = caller_wav(caller_seconds)
+    for turn in range(turns):
+        index.call_bedrock_agent = lambda *args, turn=turn: REPLIES[turn % len(REPLIES)]
+        if turn % 2 == 0:
+            index.handle_direct_voice_call({'audio_data': base64.b64encode(wav).decode(), 'did': '1001',
+                                            'session_id': session_id, 'output_profile': 'stream'}, None)
+        else:
+            index.handle_text_call({'text': 'jane@example.com', 'did': '1001', 'session_id': session_id,
+                                    'output_profile': 'stream'}, None)
+    ended = index.handle_call_end({'action': 'end_call', 'did': '1001', 'session_id': session_id}, None)
+    return ended['artifactKey'], pcm
+
+
+def stored(root, sub):
+    return sorted(os.path.relpath(os.path.join(path, f), root) for path, _, files in os.walk(os.path.join(root, sub))
+                  for f in files)
+
+
+def main():
+    print("🧪 Call artifact test (offline, fake Polly / agent / Transcribe, local backend)")
+    print("----------------------------------------")
+
+    transcribe_audio_bytes = index.transcribe_audio_bytes
+    index.synthesize_audio = fake_polly
+    index.transcribe_audio_bytes = lambda *args: "I'd like an appointment"
+    index.predictor.synthesize = lambda *args: b''
+    index.prefetcher.start = lambda *args: {}
+    index.prefetcher.wait = lambda futures: []
+    index.prefetcher.store = None
+
+    with tempfile.TemporaryDirectory() as root:
+        backend = CountingBackend(root)
+        index.call_artifacts = CallArtifactWriter(backend, part_bytes=256 * 1024, fragments=True)
+
+        # A fragment per turn, durable before the call ends
+        index.handle_call_setup({'action': 'start_call', 'did': '1001', 'session_id': 'direct-1001-greeting',
+                                 'output_profile': 'stream'}, None)
+        after_setup = len(backend.list(fragment_prefix('direct-1001-greeting')))
+        index.handle_call_end({'action': 'end_call', 'did': '1001', 'session_id': 'direct-1001-greeting'}, None)
+        for name in backend.requests:
+            backend.requests[name] = 0
+        key, pcm = run_call('direct-1001-short', TURNS, caller_seconds=1.0)
+        short_requests = dict(backend.requests)
+        data = backend.get(key)
+        meta, transcript = read_artifact(data)
+        caller_turns = [t for t in transcript if t['role'] == 'caller']
+        agent_turns = [t for t in transcript if t['role'] == 'agent']
+        heard = audio_codec.read_wav(turn_audio(data, caller_turns[0]))
+        decoded = audio_codec.decode(heard[0], heard[3])
+        expected = audio_codec.resample(pcm, 16000, 8000)
+        error = np.abs(decoded.astype(np.int32) - expected.astype(np.int32)).max()
+        short_left = stored(root, 'calls/fragments')
+
+        # Turns spread over three containers; the first is recycled before the call ends
+        containers = [CallArtifactWriter(backend, fragments=True) for _ in range(3)]
+        spread = 'twilio-CA-spread'
+        for turn, words in enumerate(['book a checkup', 'Tuesday', 'morning', 'Sam Lee', 'yes please', 'thanks']):
+            index.call_artifacts = containers[turn % 2]
+            text_turn(spread, words)
+        containers[0] = None
+        index.call_artifacts = containers[2]
+        spread_key = index.handle_call_end({'action': 'end_call', 'did': '1001', 'session_id': spread}, None)[
+            'artifactKey']
+        _, spread_transcript = read_artifact(backend.get(spread_key))
+        spread_artifacts = [f for f in stored(root, 'calls') if spread in f]
+
+        # Long call: merged with a multipart upload
+        index.call_artifacts = CallArtifactWriter(backend, part_bytes=256 * 1024, fragments=True)
+        for name in backend.requests:
+            backend.requests[name] = 0
+        long_key, _ = run_call('direct-1001-long', TURNS * 4, caller_seconds=4.0)
+        long_requests = dict(backend.requests)
+        long_data = backend.get(long_key)
+        long_meta, long_transcript = read_artifact(long_data)
+        long_audio = [turn_audio(long_data, t) for t in long_transcript if 'audio_offset' in t]
+
+        tail = data[-4096:] if len(data) > 4096 else data
+        partial_files = any(f.endswith('.partial') for _, _, files in os.walk(root) for f in files)
+        leftover_fragments = stored(root, 'calls/fragments')
+
+    # Twilio status callback -> end_call
+    webhook = load_lambda('twilio-webhook')
+    voice = RecordingLambda()
+    webhook.voice_client = lambda: voice
+    form = {'CallSid': 'CA-ended', 'From': '+15551234567', 'To': '+15550001001', 'CallStatus': 'completed'}
+    hangup = webhook.lambda_handler({'body': urllib.parse.urlencode(form), 'rawPath': '/voice'}, None)['body']
+
+    # Transcribe input upload
+    fake_s3 = FakeS3()
+    index.s3 = fake_s3
+    index.transcribe_audio_from_url = lambda url, media_format='wav': 'I need an appointment'
+    heard_text = transcribe_audio_bytes(caller_wav(0.5)[0], 'wav', 16000)
+
+    print(f"   Short call: {len(transcript)} turns, {len(data):,} bytes in {key}")
+    print(f"   Short call writes: {short_requests} (a fragment per turn, then the artifact)")
+    print(f"   Spread call: {len(spread_transcript)} turns from 2 containers, merged in {spread_key}")
+    print(f"   Long call: {len(long_transcript)} turns, {len(long_data):,} bytes, requests {long_requests}")
+    print(f"   Status callback: {voice.invocations}")
+
+    checks = [
+        ('Greeting durable once setup returns', after_setup == 1),
+        ('Every turn durable when its invocation returns',
+         short_requests['put'] == 1 + TURNS + 1 and short_requests['start'] == 0),
+        ('One artifact per call, fragments removed', key.startswith('calls/2') and short_left == []),
+        ('Transcript has every turn in order',
+         [t['turn'] for t in transcript] == list(range(1 + 2 * TURNS))),
+        ('Greeting, caller and agent turns recorded',
+         transcript[0]['text'] == index.CLINIC_VOICES['1001']['greeting']
+         and len(caller_turns) == TURNS and len(agent_turns) == TURNS + 1),
+        ('Index matches transcript', meta['turns'] == transcript and meta['session_id'] == 'direct-1001-short'),
+        ('Text-only turns carry no audio',
+         all('audio_offset' not in t for t in caller_turns[1::2])),
+        ('Caller audio round-trips through mu-law', len(decoded) == len(expected) and error < 2000),
+        ('Agent speech recorded', all(t.get('audio_bytes') for t in agent_turns)),
+        ('Turns from several containers make one artifact',
+         len(spread_artifacts) == 1 and [t['text'] for t in spread_transcript if t['role'] == 'caller']
+         == ['book a checkup', 'Tuesday', 'morning', 'Sam Lee', 'yes please', 'thanks']),
+        ('Recycled container loses no turns', len(spread_transcript) == 12),
+        ('Long call merged with multipart upload',
+         long_requests['start'] == 1 and long_requests['part'] > 1 and long_requests['complete'] == 1),
+        ('Long call reads back intact',
+         len(long_transcript) == 1 + 8 * TURNS and all(audio for audio in long_audio)
+         and long_meta['transcript']['offset'] + long_meta['transcript']['length'] < len(long_data)),
+        ('Index readable from the tail alone', read_index(tail) == meta),
+        ('No partial files or fragments left', not partial_files and leftover_fragments == []),
+        ('Twilio hang-up ends the call in the voice processor',
+         voice.invocations == [('Event', {'action': 'end_call', 'did': '1001', 'session_id': 'twilio-CA-ended',
+                                          'channel': 'twilio'})] and '<Response/>' in hangup),
+        ('Transcribe input deleted after its job', heard_text == 'I need an appointment'
+         and fake_s3.puts == 1 and fake_s3.objects == {}),
+    ]
+
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Call artifact test passed" if success else "❌ Call artifact test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
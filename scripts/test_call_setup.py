@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Offline test for Twilio call setup across Lambda containers.
+
+  1. the Twilio webhook runs the voice processor's call setup as a normal
+     (request/response) invocation and <Play>s the clinic's synthesized
+     greeting inside the first <Gather>; the generic <Say> greeting is
+     only a fallback when setup fails
+  2. the prefetches made by the container that ran the setup are saved per
+     call and loaded by a different container (its own call cache) on the
+     call's first turn there, read at most once, and dropped at call end
+  3. call setup returns the greeting without waiting for the prefetches:
+     a Lambda hands them to an asynchronous invocation of itself, another
+     process runs them in the background; a turn that arrives before they
+     are saved tries again on its next turn
+  4. the slot days are searched concurrently
+
+Usage: python scripts/test_call_setup.py
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+os.environ.setdefault('CALL_ARTIFACTS', 'off')
+
+import index  # noqa: E402
+import prefetch  # noqa: E402
+from call_cache import CallCache  # noqa: E402
+from prefetch import SETUP_RESTORED, TENANT_CONFIG, UPCOMING_SLOTS, CallPrefetcher  # noqa: E402
+
+PREFETCH_SECONDS = 1.0
+SLOT_SEARCH_SECONDS = 0.3
+
+GREETING_URL = 'https://clinic-voice-processing.s3.amazonaws.com/speech/greeting-1001.wav'
+SESSION = 'twilio-CA-setup'
+
+
+def load_lambda(name):
+    """Import lambda/<name>/index.py under a unique module name"""
+    directory = os.path.join(ROOT, 'lambda', name)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(directory, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakePayload:
+    def __init__(self, body):
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class FakeVoiceProcessor:
+    """boto3 Lambda client whose call setup answers with a greeting URL (or fails)"""
+
+    def __init__(self):
+        self.invocations = []
+        self.fail = False
+
+    def invoke(self, FunctionName, Payload, InvocationType='RequestResponse'):
+        self.invocations.append((InvocationType, json.loads(Payload)))
+        if self.fail:
+            result = {'statusCode': 500, 'error': 'Polly unavailable'}
+        else:
+            result = {'statusCode': 200, 'audioUrl': GREETING_URL, 'agentResponse': 'Hello'}
+        return {'Payload': FakePayload(json.dumps(result).encode())}
+
+
+class FakeStore:
+    """The setup store's S3 object per call, with request counts"""
+
+    def __init__(self):
+        self.objects = {}
+        self.gets = 0
+
+    def put(self, session_id, values):
+        self.objects[session_id] = json.loads(json.dumps(values))
+
+    def get(self, session_id):
+        self.gets += 1
+        return self.objects.get(session_id)
+
+    def delete(self, session_id):
+        self.objects.pop(session_id, None)
+
+
+class RecordingLambda:
+    """boto3 Lambda client for the voice processor's own asynchronous invocations"""
+
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, FunctionName, Payload, InvocationType='RequestResponse'):
+        self.invocations.append((InvocationType, json.loads(Payload)))
+        return {'StatusCode': 202}
+
+
+def slow_tenant(did):
+    time.sleep(PREFETCH_SECONDS)
+    return {'tenant_name': f"clinic_{did}"}
+
+
+def slow_slots(tenant_id):
+    time.sleep(PREFETCH_SECONDS)
+    return [{'slot_id': f"{tenant_id}-0900", 'start_time': '2026-10-21T09:00:00'}]
+
+
+def slot_search(url, payload=None, timeout=None):
+    time.sleep(SLOT_SEARCH_SECONDS)
+    return {'slots': [{'start_time': f"{payload['date']}T09:00:00"}]}
+
+
+def start_call_event(session_id):
+    return {'action': 'start_call', 'did': '1001', 'session_id': session_id, 'output_profile': 'stream'}
+
+
+def connect_event(call_sid):
+    form = {'CallSid': call_sid, 'From': '+15551234567', 'To': '+15550001001', 'CallStatus': 'ringing'}
+    return {'body': urllib.parse.urlencode(form), 'rawPath': '/voice'}
+
+
+def main():
+    print("🧪 Call setup test (offline, fake voice processor and S3)")
+    print("----------------------------------------")
+
+    # 1. Greeting
+    webhook = load_lambda('twilio-webhook')
+    voice = FakeVoiceProcessor()
+    webhook.voice_client = lambda: voice
+    greeted = webhook.lambda_handler(connect_event('CA-setup'), None)['body']
+    invocation_type, setup_event = voice.invocations[-1]
+    voice.fail = True
+    fallback = webhook.lambda_handler(connect_event('CA-setup-2'), None)['body']
+    gather = greeted[greeted.index('<Gather'):greeted.index('</Gather>')]
+    print(f"   Setup invoked as {invocation_type}: {setup_event}")
+
+    # 2. Prefetches across containers
+    store = FakeStore()
+    tenant = {'tenant_name': 'clinic_a'}
+    slots = [{'slot_id': 'clinic_a-2026-10-21-0900', 'start_time': '2026-10-21T09:00:00'}]
+    setup_cache, turn_cache = CallCache(), CallCache()
+    setup = CallPrefetcher(setup_cache, store=store)
+    setup_cache.put(SESSION, TENANT_CONFIG, tenant, prefetched=True)
+    setup_cache.put(SESSION, UPCOMING_SLOTS, slots, prefetched=True)
+    setup.save(SESSION)
+
+    turns = CallPrefetcher(turn_cache, store=store)
+    turns.restore(SESSION)
+    restored = (turn_cache.get(SESSION, TENANT_CONFIG), turn_cache.get(SESSION, UPCOMING_SLOTS))
+    turns.restore(SESSION)  # second turn in the same container
+    gets_after_two_turns = store.gets
+    setup.restore(SESSION)  # the setup container already has them
+    turns.forget(SESSION)
+
+    # 3. Setup does not wait for the prefetches
+    index.synthesize_audio = lambda text, *args, **kwargs: b'\x00\x01' * 800
+    index.prefetcher.store = None
+    index.prefetcher.warmers = {}
+    fetch_upcoming_slots = prefetch.fetch_upcoming_slots
+    prefetch.tenant_snapshot, prefetch.fetch_upcoming_slots = slow_tenant, slow_slots
+    started = time.time()
+    local_setup = index.lambda_handler(start_call_event('direct-local'), None)
+    local_seconds = time.time() - started
+    while not index.call_cache.has('direct-local', UPCOMING_SLOTS) and time.time() - started < 5:
+        time.sleep(0.05)
+    background = index.call_cache.get('direct-local', UPCOMING_SLOTS)
+
+    index.SETUP_FUNCTION_NAME, index.lambda_client = 'voice-processor', RecordingLambda()
+    started = time.time()
+    lambda_setup = index.lambda_handler(start_call_event('direct-lambda'), None)
+    lambda_seconds = time.time() - started
+    deferred = index.lambda_client.invocations
+    index.prefetcher.store = FakeStore()
+    prefetched = index.lambda_handler(deferred[0][1], None) if deferred else {}
+    saved = index.prefetcher.store.objects.get('direct-lambda', {})
+
+    early_store = FakeStore()
+    early = CallPrefetcher(CallCache(), store=early_store)
+    early.restore(SESSION)  # first turn, before the prefetches are saved
+    early_store.put(SESSION, {TENANT_CONFIG: tenant})
+    early.restore(SESSION)  # next turn
+    late_restore = early.cache.get(SESSION, TENANT_CONFIG)
+
+    # 4. Concurrent slot days
+    prefetch.fetch_json = slot_search
+    started = time.time()
+    days = fetch_upcoming_slots('clinic_a', days=3)
+    days_seconds = time.time() - started
+    print(f"   Three slot days ({SLOT_SEARCH_SECONDS:.1f}s each) fetched in {days_seconds:.2f}s")
+    print(f"   Setup returned in {local_seconds:.2f}s (process) / {lambda_seconds:.2f}s (Lambda) "
+          f"with {PREFETCH_SECONDS:.1f}s prefetches")
+
+    checks = [
+        ('Call setup is a request/response invocation, not fire-and-forget', invocation_type != 'Event'
+         and setup_event['action'] == 'start_call' and setup_event['session_id'] == 'twilio-CA-setup'),
+        ("Clinic's synthesized greeting played inside the first <Gather>",
+         f"<Play>{GREETING_URL}</Play>" in gather and '<Say' not in gather),
+        ('Generic <Say> greeting only when setup fails', fallback == webhook.WELCOME_TWIML),
+        ("Another container's turn sees the setup's prefetches", restored == (tenant, slots)),
+        ('Saved prefetches read at most once per container', gets_after_two_turns == 1
+         and turn_cache.has(SESSION, SETUP_RESTORED)),
+        ('Setup container does not re-read its own prefetches', store.gets == 1),
+        ('Saved prefetches dropped at call end', SESSION not in store.objects),
+        ('Greeting returned before the prefetches finish',
+         local_setup['statusCode'] == 200 and local_seconds < PREFETCH_SECONDS
+         and lambda_setup['statusCode'] == 200 and lambda_seconds < PREFETCH_SECONDS),
+        ('Prefetches finish in the background outside Lambda', background is not None),
+        ('Lambda hands the prefetches to an asynchronous self-invocation',
+         [(kind, event['action'], event['session_id']) for kind, event in deferred]
+         == [('Event', 'prefetch_call', 'direct-lambda')]),
+        ('Deferred prefetches saved for the call',
+         prefetched.get('statusCode') == 200 and set(saved) == {TENANT_CONFIG, UPCOMING_SLOTS}),
+        ('A turn before the save picks the prefetches up on its next turn',
+         late_restore == tenant and early_store.gets == 2),
+        ('Slot days searched concurrently',
+         days_seconds < 2 * SLOT_SEARCH_SECONDS and [slot['start_time'] for slot in days]
+         == sorted(slot['start_time'] for slot in days) and len(days) == 3),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Call setup test passed" if success else "❌ Call setup test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Offline test for the returning-caller profile cache.
+
+Runs two "containers" (CallerProfileCache instances) against one in-memory
+S3 that issues ETags and honours If-Match / If-None-Match:
+  1. an opt-out recorded by one container is seen by the other once its
+     local copy expires, and remember() never overwrites it, even from a
+     container that still holds the old profile
+  2. concurrent updates from two containers are merged, not lost
+  3. an opt-out outlives the profile TTL: it is never deleted, re-learned,
+     or tagged for the bucket's profile lifecycle expiry
+  4. a caller identified by caller ID alone gets no name or email in the
+     agent's context until they say the stored name; after that the rest
+     of the call has them
+
+Usage: python scripts/test_caller_profiles.py
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+os.environ.setdefault('CALL_ARTIFACTS', 'off')
+
+import index  # noqa: E402
+from caller_profiles import (  # noqa: E402
+    PROFILE_OBJECT_TAG, CallerProfileCache, S3ProfileBackend, confirms_identity
+)
+
+CALLER = '+1 (555) 123-4567'
+LOCAL_TTL_SECONDS = 0.2
+
+
+class FakeS3:
+    """Just enough S3 for the profile backend, with ETags and conditional puts"""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    class _Body:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self):
+            return self.data
+
+    def __init__(self):
+        self.objects = {}
+        self.tags = {}
+        self.puts = 0
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfMatch=None, IfNoneMatch=None, Tagging=None):
+        current = self.objects.get(Key)
+        if (IfNoneMatch == '*' and current) or (IfMatch and (not current or current[1] != IfMatch)):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        self.puts += 1
+        self.objects[Key] = (Body, f'"{hashlib.md5(Body + str(self.puts).encode()).hexdigest()}"')
+        self.tags[Key] = Tagging
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        body, etag = self.objects[Key]
+        return {'Body': self._Body(body), 'ETag': etag}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class RacingBackend(S3ProfileBackend):
+    """Lets another container write between this one's read and its write, once"""
+
+    def __init__(self, s3, bucket, race):
+        super().__init__(s3, bucket)
+        self.race = race
+
+    def put(self, *args, **kwargs):
+        race, self.race = self.race, None
+        if race:
+            race()
+        return super().put(*args, **kwargs)
+
+
+def main():
+    print("🧪 Caller profile test (offline, two containers over a fake S3)")
+    print("----------------------------------------")
+    checks = []
+
+    # 1. Opt-out from another container
+    s3 = FakeS3()
+    a, b = (CallerProfileCache(backend=S3ProfileBackend(s3, 'test-bucket'), local_ttl_seconds=LOCAL_TTL_SECONDS)
+            for _ in range(2))
+    a.remember('1001', CALLER, patient_name='Sam Lee', patient_email='sam@example.com')
+    seen_before = b.get('1001', CALLER)
+    b.forget('1001', CALLER)
+    stale = a.get('1001', CALLER)  # a's local copy is still fresh
+    relearned = a.remember('1001', CALLER, preferred_time='morning')
+    time.sleep(LOCAL_TTL_SECONDS * 1.5)
+    after_ttl = a.get('1001', CALLER)
+    checks += [
+        ('Profile shared across containers', seen_before and seen_before['patient_name'] == 'Sam Lee'),
+        ('Local copy lives for minutes, not the profile TTL', a.local_ttl_seconds < 3600),
+        ("remember() does not overwrite another container's opt-out", relearned is None),
+        ('Opt-out seen once the local copy expires', stale is not None and after_ttl is None),
+    ]
+
+    # 2. Concurrent updates merge
+    s3 = FakeS3()
+    other = CallerProfileCache(backend=S3ProfileBackend(s3, 'test-bucket'))
+    racing = CallerProfileCache(backend=RacingBackend(
+        s3, 'test-bucket', race=lambda: other.remember('1001', CALLER, preferred_doctor='Dr. Patel')))
+    racing.remember('1001', CALLER, patient_name='Sam Lee')
+    merged = CallerProfileCache(backend=S3ProfileBackend(s3, 'test-bucket')).get('1001', CALLER) or {}
+    # Opt-out racing a remember(): the opt-out wins
+    racing.backend.race = lambda: other.forget('1001', CALLER)
+    lost_race = racing.remember('1001', CALLER, preferred_time='afternoon')
+    checks += [
+        ('Concurrent updates merged', merged.get('patient_name') == 'Sam Lee'
+         and merged.get('preferred_doctor') == 'Dr. Patel'),
+        ('Opt-out written mid-update is not overwritten',
+         lost_race is None and other.get('1001', CALLER) is None and racing.get('1001', CALLER) is None),
+    ]
+
+    # 3. Opt-out older than the profile TTL
+    s3 = FakeS3()
+    short = CallerProfileCache(backend=S3ProfileBackend(s3, 'test-bucket'), ttl_seconds=LOCAL_TTL_SECONDS,
+                               local_ttl_seconds=0)
+    short.remember('1001', CALLER, patient_name='Ann Park')
+    profile_tag = next(iter(s3.tags.values()))
+    short.forget('1001', CALLER)
+    time.sleep(LOCAL_TTL_SECONDS * 1.5)
+    old_opt_out = short.get('1001', CALLER)
+    relearned_after_ttl = short.remember('1001', CALLER, patient_name='Ann Park')
+    stored = [json.loads(body) for body, _ in s3.objects.values()]
+    checks += [
+        ('Opt-out older than the TTL is kept', stored == [stored[0]] and stored[0].get('opted_out') is True),
+        ('Opt-out older than the TTL is not re-learned', old_opt_out is None and relearned_after_ttl is None),
+        ('Only profiles carry the lifecycle expiry tag',
+         profile_tag == PROFILE_OBJECT_TAG and list(s3.tags.values()) == [None]),
+    ]
+
+    # 4. Name and email only after the caller confirms who they are
+    s3 = FakeS3()
+    index.caller_profiles = CallerProfileCache(backend=S3ProfileBackend(s3, 'test-bucket'))
+    index.prefetcher.store = None
+    index.caller_profiles.remember('1001', CALLER, patient_name='Sam Lee', patient_email='sam@example.com',
+                                   preferred_doctor='Dr. Patel')
+    session = 'twilio-CA-profile'
+    first = index.build_prompt_attributes(session, '1001', CALLER, "Hi, I'd like to book a checkup")
+    wrong = index.build_prompt_attributes(session, '1001', CALLER, "It's Sam")
+    named = index.build_prompt_attributes(session, '1001', CALLER, "Yes, this is Sam Lee")
+    later = index.build_prompt_attributes(session, '1001', CALLER, 'Tuesday morning works')
+    index.forget_caller(session, '1001', CALLER)
+    opted_out = index.build_prompt_attributes(session, '1001', CALLER, 'Tuesday morning works')
+    index.call_cache.end_call(session)
+    for label, attrs in (('caller ID only', first), ('first name only', wrong), ('said the name', named),
+                         ('later turn', later), ('opted out', opted_out)):
+        print(f"   {label:<16} {sorted(attrs)}")
+    checks += [
+        ('Caller ID alone: no name or email in agent context',
+         first.get('caller_identity') == 'unconfirmed' and 'patient_name' not in first
+         and 'patient_email' not in first and first.get('preferred_doctor') == 'Dr. Patel'),
+        ('A partial name does not confirm', 'patient_name' not in wrong and not confirms_identity(
+            {'patient_name': 'Sam Lee'}, "It's Sam")),
+        ('Saying the stored name confirms', named.get('caller_identity') == 'confirmed'
+         and named.get('patient_email') == 'sam@example.com'),
+        ('Confirmation lasts for the call', later.get('patient_name') == 'Sam Lee'),
+        ('Opt-out drops the profile from the call', opted_out == {}),
+    ]
+
+    print()
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Caller profile test passed" if success else "❌ Caller profile test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Offline test for concatenative slot-offer rendering.
+
+Builds a fragment library with a fake synthesizer (a tone per fragment with
+Polly-like lead-in and trailing silence), then renders the slot offers the
+search-slots Lambda actually produces plus confirmation-number readbacks:
+  1. every offer and readback is covered by fragments
+  2. anything outside the vocabulary falls back (render returns None)
+  3. fragments are trimmed and joined without clipping
+  4. rendering stays in the low milliseconds
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'actions'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+from fragments import FragmentLibrary, vocabulary  # noqa: E402
+
+SAMPLE_RATE = 8000
+DOCTORS = ['Dr. Sarah Smith', 'Dr. Michael Johnson', 'Dr. Patel']
+
+
+class FakePolly:
+    """8 kHz PCM: 50 ms silence, a tone sized to the text, 40 ms silence"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, ssml):
+        self.calls += 1
+        seconds = 0.15 + 0.04 * len(ssml.split('>', 2)[-1])
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        tone = (9000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+        lead, tail = np.zeros(400, np.int16), np.zeros(320, np.int16)
+        return np.concatenate([lead, tone, tail]).tobytes()
+
+
+def slot_offers(search_slots, count, seed=7):
+    """Offers as search-slots phrases them, over random days, times and doctors"""
+    rng = random.Random(seed)
+    offers = []
+    for _ in range(count):
+        day = datetime(2026, 10, 19) + timedelta(days=rng.randint(1, 10))
+        slots = []
+        for _ in range(rng.randint(1, 3)):
+            start = day + timedelta(days=rng.choice([0, 0, 1]), hours=rng.randint(8, 16), minutes=rng.choice([0, 30]))
+            slots.append({'start_time': start.strftime('%Y-%m-%dT%H:%M:%SZ'), 'doctor_name': rng.choice(DOCTORS)})
+        slots.sort(key=lambda s: s['start_time'])
+        doctors = []
+        for slot in slots:
+            if slot['doctor_name'] not in doctors:
+                doctors.append(slot['doctor_name'])
+        offers.append(search_slots.speech_summary(slots, doctors) + ' Which works best for you?')
+        offers.append(f"I have {search_slots.format_slots_for_agent(slots)}.")
+    return offers
+
+
+def main():
+    print("🧪 Fragment rendering test (offline, fake synthesizer)")
+    print("----------------------------------------")
+
+    import search_slots
+    polly = FakePolly()
+    library = FragmentLibrary(polly, SAMPLE_RATE)
+    started = time.perf_counter()
+    added = library.warm(vocabulary(DOCTORS))
+    print(f"   Library: {added} fragments, {polly.calls} synthesis calls, "
+          f"{time.perf_counter() - started:.2f}s to warm")
+
+    offers = slot_offers(search_slots, 200)
+    readbacks = [f"Your confirmation number is DOWN-{1000 + i}-{i % 1000:03d}." for i in range(50)]
+    uncovered = [
+        "Sure, let me check that for you.",
+        "I have 9:30 AM with Dr. Who.",
+        "I have 11:15 PM on Tuesday.",
+        "Email me at jane@example.com",
+    ]
+
+    rendered, latencies = [], []
+    for text in offers + readbacks:
+        began = time.perf_counter()
+        audio = library.render(text)
+        latencies.append((time.perf_counter() - began) * 1000)
+        rendered.append(audio)
+    fallbacks = [library.render(text) for text in uncovered]
+
+    covered = [audio for audio in rendered if audio is not None]
+    missed = [text for text, audio in zip(offers + readbacks, rendered) if audio is None]
+    for text in missed[:5]:
+        print(f"   not covered: {text}")
+
+    peaks = [int(np.abs(np.frombuffer(a, np.int16).astype(np.int32)).max()) for a in covered]
+    polly_calls_after_warm = polly.calls - added
+    p50 = statistics.median(latencies)
+    p95 = sorted(latencies)[int(0.95 * len(latencies)) - 1]
+    print(f"   Rendered {len(covered)}/{len(rendered)} offers and readbacks; "
+          f"render p50 {p50:.2f} ms, p95 {p95:.2f} ms")
+
+    checks = [
+        ('Every slot offer covered', all(rendered[:len(offers)])),
+        ('Every confirmation readback covered', all(rendered[len(offers):])),
+        ('Uncovered text falls back to Polly', all(a is None for a in fallbacks)),
+        ('No synthesis at render time', polly_calls_after_warm == 0),
+        ('Joins do not clip', max(peaks) < 32767),
+        ('Render p95 under 10 ms', p95 < 10.0),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Fragment rendering test passed" if success else "❌ Fragment rendering test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -54,18 +54,19 @@ cat > /tmp/search-slots-event.json <<EOF
 EOF
 
 # Run Lambda function locally using Python
-cd lambda/search-slots
+cd lambda/actions
 export APPOINTMENT_SERVICE_URL="http://localhost:7002"
+export PYTHONPATH="../shared/python"
 
 echo "Running search-slots handler..."
 python3 -c "
 import json
-import index
+import search_slots
 
 with open('/tmp/search-slots-event.json', 'r') as f:
     event = json.load(f)
 
-result = index.handler(event, None)
+result = search_slots.handler(event, None)
 print(json.dumps(result, indent=2))
 
 # Validate response
@@ -124,18 +125,19 @@ cat > /tmp/confirm-appointment-event.json <<EOF
 EOF
 
 # Run Lambda function locally
-cd lambda/confirm-appointment
+cd lambda/actions
 export APPOINTMENT_SERVICE_URL="http://localhost:7002"
+export PYTHONPATH="../shared/python"
 
 echo "Running confirm-appointment handler..."
 python3 -c "
 import json
-import index
+import confirm_appointment
 
 with open('/tmp/confirm-appointment-event.json', 'r') as f:
     event = json.load(f)
 
-result = index.handler(event, None)
+result = confirm_appointment.handler(event, None)
 print(json.dumps(result, indent=2))
 
 # Validate response
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Offline test for turn taking in the media-stream server.
+
+Drives a CallSession with synthetic caller audio and a scripted streaming
+ASR that finalizes each utterance after a chosen delay, so the ASR final
+and the session's endpointer race for every utterance:
+  1. ASR final before the endpointer fires
+  2. endpointer before the ASR final
+  3. the two orderings alternating within one call
+In every case each utterance must reach the agent exactly once, in order:
+no repeated turn and no dropped one.
+
+Usage: python scripts/test_media_turns.py
+"""
+
+import asyncio
+import math
+import os
+import struct
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+
+import audio_codec  # noqa: E402
+from media_server import CallSession, MediaServer, OfflineBackend, OfflineTranscriber  # noqa: E402
+
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+UTTERANCES = ['utterance 1.', 'utterance 2.', 'utterance 3.']
+FAST_ASR_MS = 200  # final well before the endpointer's budget
+SLOW_ASR_MS = 1500  # final well after it
+
+
+def frame(amplitude):
+    """One PCM16 frame of a 300 Hz tone (amplitude 0 gives silence)"""
+    samples = [int(amplitude * math.sin(2 * math.pi * 300 * i / SAMPLE_RATE)) for i in range(FRAME_SAMPLES)]
+    return struct.pack(f"<{FRAME_SAMPLES}h", *samples)
+
+
+class ScriptedTranscriber(OfflineTranscriber):
+    """One phrase per utterance, each finalized after its own trailing-silence delay"""
+
+    def __init__(self, sample_rate, delays_ms):
+        super().__init__(sample_rate, silence_ms=delays_ms[0])
+        self._script = list(zip(UTTERANCES, delays_ms))
+
+    async def feed(self, pcm16):
+        if not self._in_speech and self._script and audio_codec.rms(pcm16) >= self.threshold:
+            self.phrase, self.silence_ms = self._script.pop(0)
+        await super().feed(pcm16)
+
+
+class RecordingBackend(OfflineBackend):
+    """Offline backend that remembers what the agent was asked and speaks silently"""
+
+    def __init__(self, delays_ms):
+        super().__init__()
+        self.delays_ms = delays_ms
+        self.asked = []
+
+    def reply(self, session_id, text, did, caller_number):
+        self.asked.append(text)
+        return super().reply(session_id, text, did, caller_number)
+
+    def synthesize(self, text, clinic, sample_rate, did=None):
+        return b''
+
+    def transcriber(self, sample_rate):
+        return ScriptedTranscriber(sample_rate, self.delays_ms)
+
+
+class SilentAdapter:
+    channel = 'test'
+    sample_rate = SAMPLE_RATE
+    frame_ms = FRAME_MS
+
+    async def send_audio(self, pcm16):
+        pass
+
+    async def end_of_reply(self):
+        pass
+
+    async def clear(self):
+        pass
+
+
+async def call(delays_ms):
+    """Agent inputs and stats for one call of len(delays_ms) utterances"""
+    backend = RecordingBackend(delays_ms)
+    server = MediaServer(backend, workers=2)
+    session = CallSession(server, SilentAdapter(), {'session_id': 'turns', 'did': '1001', 'caller_number': ''})
+    await session.start()
+    speech, silence = frame(6000), frame(0)
+
+    async def send(pcm, count):
+        for _ in range(count):
+            await session.feed(pcm)
+            # Let the ASR results land as they would between 20 ms frames
+            for _ in range(3):
+                await asyncio.sleep(0)
+
+    try:
+        for _ in delays_ms:
+            await send(speech, 40)
+            await send(silence, (SLOW_ASR_MS + 500) // FRAME_MS)
+        for _ in range(50):
+            if len(backend.asked) >= len(delays_ms) and session.turns.empty():
+                break
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.1)
+    finally:
+        await session.close()
+        server.executor.shutdown(wait=True)
+    return backend.asked, server.stats
+
+
+def main():
+    print("🧪 Media-server turn test (offline, scripted ASR)")
+    print("----------------------------------------")
+    scenarios = [
+        ('ASR final first', [FAST_ASR_MS] * 3, 0),
+        ('Endpointer first', [SLOW_ASR_MS] * 3, 3),
+        ('Orderings alternating', [FAST_ASR_MS, SLOW_ASR_MS, FAST_ASR_MS], 1),
+    ]
+    checks = []
+    for label, delays_ms, early in scenarios:
+        asked, stats = asyncio.run(call(delays_ms))
+        print(f"   {label:<22} agent heard {asked} (early endpoints: {stats['early_endpoints']})")
+        checks.append((f"{label}: each utterance answered once, in order", asked == UTTERANCES))
+        checks.append((f"{label}: {early} answered by the endpointer", stats['early_endpoints'] == early))
+    print()
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Media-server turn test passed" if success else "❌ Media-server turn test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
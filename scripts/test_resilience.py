@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Offline test for throttling-aware retries and adaptive concurrency.
+
+A fake Polly serves a few requests at a time and throttles the rest
+(ThrottlingException, like the real account quota), and can inject
+transient (503) and fatal (ValidationException) errors:
+  1. sustained load far above the fake's capacity completes with the AIMD
+     limit settling near that capacity, and with far fewer throttled
+     requests than naive immediate retries
+  2. retries stay inside the retry budget
+  3. transient errors are retried, fatal errors are not
+  4. an always-throttling service gives up by the turn's deadline
+  5. Bedrock turns are retried when throttled before streaming, but not
+     after the agent has streamed output
+and prints attempts, throttles and retries for both strategies.
+
+Usage: python scripts/test_resilience.py
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+
+from botocore.exceptions import ClientError, EventStreamError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+os.environ.setdefault('CALL_ARTIFACTS', 'off')
+
+import index  # noqa: E402
+import metrics  # noqa: E402
+from admission import Admission  # noqa: E402
+from resilience import (  # noqa: E402
+    RETRY_BUDGET_MAX,
+    RETRY_BUDGET_MIN_PER_SECOND,
+    RETRY_BUDGET_RATIO,
+    Resilience,
+    deadline_scope,
+    resilience_stats,
+)
+
+CAPACITY = 4
+SERVICE_SECONDS = 0.1
+CALLERS = 16
+CALLS_EACH = 12
+
+
+def client_error(code, status=400, operation='SynthesizeSpeech'):
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}},
+                       operation)
+
+
+class FakePolly:
+    """Serves CAPACITY requests at once; the rest are throttled"""
+
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0
+        self.inflight = 0
+        self.always_throttle = False
+        self.transient_once = set()
+        self._lock = threading.Lock()
+
+    def synthesize_speech(self, Text, **kwargs):
+        with self._lock:
+            self.requests += 1
+            if 'invalid' in Text:
+                raise client_error('ValidationException')
+            if Text in self.transient_once:
+                self.transient_once.discard(Text)
+                raise client_error('ServiceUnavailableException', 503)
+            if self.always_throttle or self.inflight >= CAPACITY:
+                self.throttled += 1
+                raise client_error('ThrottlingException')
+            self.inflight += 1
+        try:
+            time.sleep(SERVICE_SECONDS)
+            return {'AudioStream': io.BytesIO(b'\x00\x01' * 100)}
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+
+class FakeBedrock:
+    """Throttles the first invoke, or fails mid-stream after a trace event"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.invokes = 0
+
+    def invoke_agent(self, **kwargs):
+        self.invokes += 1
+        if self.mode == 'throttle_first' and self.invokes == 1:
+            raise client_error('ThrottlingException', operation='InvokeAgent')
+
+        def completion():
+            yield {'trace': {'trace': {}}}
+            if self.mode == 'fail_mid_stream':
+                raise EventStreamError({'Error': {'Code': 'throttlingException', 'Message': 'slow down'}},
+                                       'InvokeAgent')
+            yield {'chunk': {'bytes': b'Tuesday at 9 is open.'}}
+
+        return {'completion': completion()}
+
+
+def load(fn):
+    """CALLERS threads each making CALLS_EACH calls back to back, one turn deadline per call"""
+    results = []
+    lock = threading.Lock()
+
+    def run(caller):
+        for call in range(CALLS_EACH):
+            with deadline_scope(budget_seconds=8):
+                try:
+                    result = fn(f"prompt {caller}-{call}")
+                except Exception as e:
+                    result = e
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def naive(polly):
+    """Immediate retries, up to 4 attempts: what a plain retry loop does"""
+    def synthesize(text):
+        for attempt in range(4):
+            try:
+                return polly.synthesize_speech(Text=text)['AudioStream'].read()
+            except ClientError:
+                if attempt == 3:
+                    raise
+    return synthesize
+
+
+def main():
+    print("🧪 Resilience test (offline, throttling fake Polly / Bedrock)")
+    print("----------------------------------------")
+
+    index.admission = Admission(enabled=False)
+    index.prefetcher.store = None  # no S3 offline
+    limits = {service: {'initial': 32, 'min': 1} for service in ('bedrock', 'polly', 'transcribe')}
+    total = CALLERS * CALLS_EACH
+    metrics.reset()
+
+    # Naive retries against the fake
+    polly = FakePolly()
+    started = time.time()
+    naive_results = load(naive(polly))
+    naive_stats = {'ok': sum(isinstance(r, bytes) for r in naive_results), 'requests': polly.requests,
+                   'throttled': polly.throttled, 'seconds': time.time() - started}
+
+    # The resilience layer, through the Lambda's own synthesize_audio
+    polly = FakePolly()
+    index.polly = polly
+    index.resilience = Resilience(limits=limits)
+    started = time.time()
+    # The limit is a sawtooth, and it climbs once the last callers finish: sample it under load
+    samples, running = [], threading.Event()
+    running.set()
+
+    def sample_limit():
+        while running.is_set():
+            samples.append(index.resilience.limits['polly'].limit)
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample_limit)
+    sampler.start()
+    results = load(lambda text: index.synthesize_audio(text, 'Joanna'))
+    running.clear()
+    sampler.join()
+    settled = sorted(samples[len(samples) // 4:])
+    settled_limit = settled[len(settled) // 2]
+    layer_stats = {'ok': sum(isinstance(r, bytes) for r in results), 'requests': polly.requests,
+                   'throttled': polly.throttled, 'seconds': time.time() - started}
+    stats = resilience_stats(index.resilience)['polly']
+    retry_allowance = RETRY_BUDGET_RATIO * total + RETRY_BUDGET_MAX + RETRY_BUDGET_MIN_PER_SECOND * layer_stats['seconds']
+
+    print(f"   {'strategy':<10} {'ok':>4} {'requests':>9} {'throttled':>10} {'seconds':>8}")
+    for name, row in (('naive', naive_stats), ('resilient', layer_stats)):
+        print(f"   {name:<10} {row['ok']:>4} {row['requests']:>9} {row['throttled']:>10} {row['seconds']:>8.2f}")
+    print(f"   AIMD limit {settled_limit:.1f} under load (median; fake capacity {CAPACITY}), "
+          f"{stats['retries']:.0f} retries, "
+          f"retry budget left {stats['retry_budget']}")
+
+    # Transient retried, fatal not
+    index.resilience = Resilience(limits=limits)
+    polly.transient_once.add('flaky prompt')
+    before = polly.requests
+    with deadline_scope(budget_seconds=5):
+        transient_ok = bool(index.synthesize_audio('flaky prompt', 'Joanna'))
+    transient_requests = polly.requests - before
+    before = polly.requests
+    try:
+        with deadline_scope(budget_seconds=5):
+            index.synthesize_audio('invalid <speak', 'Joanna')
+        fatal_raised = False
+    except ClientError:
+        fatal_raised = True
+    fatal_requests = polly.requests - before
+
+    # Always throttled: gives up by the deadline
+    polly.always_throttle = True
+    index.resilience = Resilience(limits=limits)
+    started = time.time()
+    try:
+        with deadline_scope(budget_seconds=0.5):
+            index.synthesize_audio('one more prompt', 'Joanna')
+    except ClientError:
+        pass
+    deadline_seconds = time.time() - started
+
+    # Bedrock: retry before streaming, never after
+    index.resilience = Resilience(limits=limits)
+    retried_agent = FakeBedrock('throttle_first')
+    index.bedrock_agent = retried_agent
+    retried_reply = index.call_bedrock_agent('res-1', 'any time Tuesday', '1001')
+    streamed_agent = FakeBedrock('fail_mid_stream')
+    index.bedrock_agent = streamed_agent
+    index.call_bedrock_agent('res-2', 'book the 9am', '1001')
+
+    checks = [
+        ('Most calls complete under throttling', layer_stats['ok'] >= 0.9 * total),
+        ('AIMD limit settles near capacity', settled_limit <= 2 * CAPACITY),
+        ('Fewer throttled requests than naive retries', layer_stats['throttled'] < naive_stats['throttled'] / 2),
+        ('Retries stay inside the retry budget', stats['retries'] <= retry_allowance),
+        ('Transient error retried', transient_ok and transient_requests == 2),
+        ('Fatal error not retried', fatal_raised and fatal_requests == 1),
+        ('Gives up by the turn deadline', deadline_seconds < 0.7),
+        ('Agent throttled before streaming is retried',
+         retried_agent.invokes == 2 and retried_reply == 'Tuesday at 9 is open.'),
+        ('Agent failing mid-stream is not retried', streamed_agent.invokes == 1),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Resilience test passed" if success else "❌ Resilience test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Offline test for slot holds shared across Lambda execution environments.
+
+Runs several "containers" (SlotHolds instances, each with its own
+S3HoldBackend) against one in-memory S3 that issues ETags and honours
+If-Match / If-None-Match:
+  1. a hold placed on one container is seen on another: its search skips
+     the slot and its confirm cannot convert it; the owner's confirm can
+  2. a write that loses the race to another container is re-run against
+     the fresh table, so neither container's hold is lost
+  3. callers on separate containers racing for one slot: exactly one holds it
+  4. lookups that change nothing write nothing
+  5. HOLD_STORE=s3://... selects the S3 store; a Lambda left on process
+     memory says so at start
+
+Usage: python scripts/test_slot_holds.py
+"""
+
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+from slot_holds import MemoryHoldBackend, S3HoldBackend, SlotHolds, build_hold_backend  # noqa: E402
+
+SLOT = 'clinic_a-2026-10-21-0900'
+CONTAINERS = 6
+READ_SECONDS = 0.01
+
+
+class FakeS3:
+    """Just enough S3 for the hold backend, with ETags and conditional puts"""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    class _Body:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self):
+            return self.data
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+        self.conflicts = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfMatch=None, IfNoneMatch=None):
+        with self._lock:
+            current = self.objects.get(Key)
+            if (IfNoneMatch == '*' and current) or (IfMatch and (not current or current[1] != IfMatch)):
+                self.conflicts += 1
+                raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+            self.puts += 1
+            self.objects[Key] = (Body, f'"{hashlib.md5(Body + str(self.puts).encode()).hexdigest()}"')
+
+    def get_object(self, Bucket, Key):
+        with self._lock:
+            current = self.objects.get(Key)
+        time.sleep(READ_SECONDS)  # widen the read-to-write window so racing containers collide
+        if current is None:
+            raise self.exceptions.NoSuchKey(Key)
+        return {'Body': self._Body(current[0]), 'ETag': current[1]}
+
+
+class RacingBackend(S3HoldBackend):
+    """Lets another container write between this one's read and its write, once"""
+
+    def __init__(self, s3, race):
+        super().__init__('test-bucket', s3=s3)
+        self.race = race
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with super().transaction() as state:
+            yield state
+            race, self.race = self.race, None
+            if race:
+                race()
+
+
+def container(s3):
+    return SlotHolds(S3HoldBackend('test-bucket', s3=s3))
+
+
+def main():
+    print("🧪 Slot hold test (offline, containers over a fake S3)")
+    print("----------------------------------------")
+    checks = []
+
+    # 1. Holds visible across containers
+    s3 = FakeS3()
+    a, b = container(s3), container(s3)
+    placed = a.place('conv-a', [SLOT, 'clinic_a-2026-10-21-0930'])
+    hidden = b.held_by_others('conv-b')
+    skipped = b.place('conv-b', [SLOT])
+    stolen = b.convert('conv-b', SLOT)
+    booked = a.convert('conv-a', SLOT)
+    checks += [
+        ('Hold placed on one container is seen on another', hidden == set(placed) and skipped == []),
+        ("Another container cannot book a held slot", not stolen),
+        ("The holder's container books it", booked and b.owner(SLOT) is None),
+    ]
+
+    # 2. A lost write is re-run, not dropped
+    s3 = FakeS3()
+    other = container(s3)
+    racing = SlotHolds(RacingBackend(s3, race=lambda: other.place('conv-other', ['clinic_a-2026-10-22-1000'])))
+    racing.place('conv-racing', ['clinic_a-2026-10-22-1100'])
+    both = container(s3)
+    checks += [
+        ('Write that lost the race is re-run against the fresh table',
+         s3.conflicts == 1 and both.owner('clinic_a-2026-10-22-1000') == 'conv-other'
+         and both.owner('clinic_a-2026-10-22-1100') == 'conv-racing'),
+    ]
+
+    # 3. Callers on separate containers racing for one slot
+    s3 = FakeS3()
+    results = [None] * CONTAINERS
+    start = threading.Barrier(CONTAINERS)
+
+    def search(i):
+        holds = container(s3)
+        start.wait()
+        results[i] = holds.place(f'conv-{i}', [SLOT])
+
+    threads = [threading.Thread(target=search, args=(i,)) for i in range(CONTAINERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    winners = [i for i, held in enumerate(results) if held]
+    stats = container(s3).stats()
+    print(f"   {CONTAINERS} containers racing for one slot: {len(winners)} hold it, "
+          f"{s3.conflicts} conditional writes lost and re-run")
+    checks += [
+        ('Exactly one of the racing containers holds the slot',
+         len(winners) == 1 and container(s3).owner(SLOT) == f'conv-{winners[0]}'
+         and stats['placed'] == 1 and stats['active'] == 1 and s3.conflicts > 0),
+    ]
+
+    # 4. Lookups write nothing
+    puts = s3.puts
+    reader = container(s3)
+    reader.held_by_others('conv-reader')
+    reader.owner(SLOT)
+    reader.stats()
+    checks += [('Lookups that change nothing write nothing', s3.puts == puts)]
+
+    # 5. Configuration
+    s3_backend = build_hold_backend('s3://holds-bucket/holds')
+    os.environ['AWS_LAMBDA_FUNCTION_NAME'] = 'ivr-search-slots'
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        memory_backend = build_hold_backend()
+    del os.environ['AWS_LAMBDA_FUNCTION_NAME']
+    checks += [
+        ('HOLD_STORE=s3:// selects the shared store',
+         isinstance(s3_backend, S3HoldBackend) and s3_backend.bucket == 'holds-bucket'
+         and s3_backend.key == 'holds/holds.json'),
+        ('A Lambda on process-memory holds warns at start',
+         isinstance(memory_backend, MemoryHoldBackend) and 'HOLD_STORE' in output.getvalue()),
+    ]
+
+    print()
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Slot hold test passed" if success else "❌ Slot hold test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
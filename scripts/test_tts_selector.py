@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Offline test for latency-aware TTS engine fallback.
+
+Runs render_speech turns for one clinic against a fake Polly whose neural
+engine can be switched between fast, slow (over the clinic's TTS SLO),
+borderline (under the SLO but above the recovery threshold) and
+throttling, while the standard engine stays fast:
+  1. a healthy neural engine is used for every turn
+  2. once neural breaks the SLO, turns switch to the standard engine after
+     a handful of slow ones
+  3. a borderline neural engine does not switch back (hysteresis), and
+     nothing flaps while the neural engine is slow
+  4. background probes notice the recovery and turns return to neural
+  5. a throttling neural engine fails over to standard inside the turn,
+     then switches the voice over (its errors and retried calls break
+     the SLO)
+  6. every turn has audio
+and prints the engine used per phase and the logged transitions.
+
+Usage: python scripts/test_tts_selector.py
+"""
+
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+os.environ.setdefault('CALL_ARTIFACTS', 'off')
+
+import index  # noqa: E402
+from admission import Admission  # noqa: E402
+from resilience import Resilience, deadline_scope  # noqa: E402
+from tts_selector import TTSSelector  # noqa: E402
+
+SLO_MS = 100
+HOLD_SECONDS = 0.6
+PROBE_SECONDS = 0.1
+WINDOW_SECONDS = 1.5
+NEURAL_MS = {'fast': 20, 'slow': 200, 'borderline': 85}
+STANDARD_MS = 10
+
+
+class FakePolly:
+    """Standard is always fast; neural follows `mode`"""
+
+    def __init__(self):
+        self.mode = 'fast'
+        self.requests = {'neural': 0, 'standard': 0}
+        self._lock = threading.Lock()
+
+    def synthesize_speech(self, Engine, **kwargs):
+        with self._lock:
+            self.requests[Engine] += 1
+        if Engine == 'neural' and self.mode == 'throttle':
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}}, 'SynthesizeSpeech')
+        milliseconds = NEURAL_MS[self.mode] if Engine == 'neural' else STANDARD_MS
+        time.sleep(milliseconds / 1000)
+        return {'AudioStream': io.BytesIO(b'\x00\x01' * 800)}
+
+
+class Transitions(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        if ' -> ' in record.getMessage():
+            self.messages.append(record.getMessage())
+
+
+def main():
+    print("🧪 Latency-aware TTS fallback test (offline, fake Polly)")
+    print("----------------------------------------")
+
+    polly = FakePolly()
+    index.polly = polly
+    index.admission = Admission(enabled=False)
+    index.resilience = Resilience()
+    index.tts_selector = TTSSelector(probe=index.tts_selector.probe, slo_ms=SLO_MS, window_seconds=WINDOW_SECONDS,
+                                     min_samples=4, hold_seconds=HOLD_SECONDS, probe_seconds=PROBE_SECONDS)
+    transitions = Transitions()
+    logging.getLogger('tts_selector').addHandler(transitions)
+    logging.getLogger('tts_selector').propagate = False
+    clinic = index.CLINIC_VOICES['1001']
+    counter = iter(range(100000))
+
+    def turns(count, pause=0.0):
+        """Engines used by `count` uncached turns; None for a turn without audio"""
+        used = []
+        for _ in range(count):
+            before = dict(polly.requests)
+            with deadline_scope(budget_seconds=0.3):
+                audio = index.render_speech(f"Your reply number {next(counter)} is ready.", clinic['voice_id'],
+                                            clinic['engine'], 'connect', clinic)
+            sent = [engine for engine in ('standard', 'neural') if polly.requests[engine] > before[engine]]
+            used.append(sent[0] if audio and sent else None)
+            time.sleep(pause)
+        return used
+
+    phases = {}
+    phases['healthy'] = turns(8)
+    polly.mode = 'slow'
+    phases['slow'] = turns(12)
+    polly.mode = 'borderline'
+    phases['borderline'] = turns(20, pause=0.05)
+    transitions_before_recovery = len(transitions.messages)
+    polly.mode = 'fast'
+    phases['recovered'] = turns(40, pause=0.05)
+    polly.mode = 'throttle'
+    phases['throttle'] = turns(12)
+    index.tts_selector.executor.shutdown(wait=True)
+
+    for name, used in phases.items():
+        summary = ' '.join('N' if engine == 'neural' else 'S' if engine == 'standard' else '-' for engine in used)
+        print(f"   {name:<11} {summary}")
+    print("   (N neural, S standard, - no audio)")
+    for message in transitions.messages:
+        print(f"   {message}")
+
+    slow, recovered, throttle = phases['slow'], phases['recovered'], phases['throttle']
+    checks = [
+        ('Healthy neural engine used', all(engine == 'neural' for engine in phases['healthy'])),
+        ('Slow neural engine falls back to standard within a few turns',
+         'standard' in slow and slow.index('standard') <= 5 and all(e == 'standard' for e in slow[6:])),
+        ('Borderline latency does not switch back (hysteresis)',
+         all(engine == 'standard' for engine in phases['borderline']) and transitions_before_recovery == 1),
+        ('Probes detect recovery and turns return to neural', recovered[-1] == 'neural'
+         and 'neural' in recovered and all(e == 'neural' for e in recovered[recovered.index('neural'):])),
+        ('Throttled neural fails over inside the turn', throttle[0] == 'standard'),
+        ('Throttling neural engine switches the voice over',
+         len(transitions.messages) == 3 and 'neural -> standard' in transitions.messages[-1]
+         and all(engine == 'standard' for engine in throttle)),
+        ('Every turn has audio', all(engine for used in phases.values() for engine in used)),
+        ('No flapping: one switch per incident', len(transitions.messages) == 3),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ TTS fallback test passed" if success else "❌ TTS fallback test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
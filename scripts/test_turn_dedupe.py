@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Offline test for webhook retry deduplication in the voice-processor Lambda.
+
+Drives lambda_handler with a slow fake Bedrock agent that counts turns,
+fake Polly, and an in-memory S3 that honours If-None-Match:
+  1. a retry of a finished turn replays its response without a second agent turn
+  2. concurrent duplicates coalesce onto the turn in flight
+  3. without a turn sequence, a duplicate still coalesces onto the turn in
+     flight, but the same words said again on the next turn ("yes" ... "yes")
+     run as a new turn
+  4. a different turn sequence with the same words runs normally
+  5. a failed turn is not cached, so its retry runs again
+  6. with the shared S3 backend, a retry landing on another container
+     waits for and replays the first container's response
+  7. unsequenced turns never touch the shared backend, so the hot path pays
+     no S3 writes for them
+and prints the duplicate rate per channel.
+
+Usage: python scripts/test_turn_dedupe.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'voice-processor'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+import index  # noqa: E402
+import metrics  # noqa: E402
+from audio_delivery import AudioDelivery  # noqa: E402
+from turn_dedupe import S3DedupeBackend, TurnDedupe, duplicate_rates  # noqa: E402
+
+AGENT_SECONDS = 0.3
+
+
+class FakeAgent:
+    def __init__(self):
+        self.turns = 0
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def __call__(self, session_id, text, did, caller_number=None):
+        with self._lock:
+            self.turns += 1
+        time.sleep(AGENT_SECONDS)
+        if self.fail:
+            raise RuntimeError('agent unavailable')
+        return f"Booked: {text} (turn {self.turns})"
+
+
+class FakeS3:
+    """Just enough S3 for the dedupe backend, with conditional puts"""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    class _Body:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self):
+            return self.data
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfNoneMatch=None):
+        with self._lock:
+            if IfNoneMatch == '*' and Key in self.objects:
+                raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+            self.puts += 1
+            self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        with self._lock:
+            if Key not in self.objects:
+                raise self.exceptions.NoSuchKey(Key)
+            return {'Body': self._Body(self.objects[Key])}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objects.pop(Key, None)
+
+
+def text_event(session_id, text, turn_id=None):
+    event = {'text': text, 'did': '1001', 'session_id': session_id}
+    if session_id.startswith('twilio-'):
+        event['channel'] = 'twilio'
+    if turn_id:
+        event['turn_id'] = turn_id
+    return event
+
+
+def connect_event(contact_id, text, turn_id):
+    return {'Details': {'ContactData': {
+        'ContactId': contact_id, 'SystemEndpoint': {'Address': '+15550001001'},
+        'CustomerEndpoint': {'Address': '+15551234567'}},
+        'Parameters': {'userInput': text, 'turnId': turn_id}}}
+
+
+def concurrently(events, handler=None):
+    handler = handler or index.lambda_handler
+    results = [None] * len(events)
+
+    def run(i):
+        results[i] = handler(events[i], None)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(events))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    print("🧪 Turn dedupe test (offline, fake agent / Polly / S3)")
+    print("----------------------------------------")
+
+    agent = FakeAgent()
+    index.call_bedrock_agent = agent
+    index.synthesize_audio = lambda text, *args, **kwargs: b'\x00\x01' * 400
+    index.predictor.synthesize = lambda *args: b''
+    index.audio_delivery = AudioDelivery(None, 'test-bucket', proxy_base_url='http://localhost:8080')
+    index.turn_dedupe = TurnDedupe()
+    metrics.reset()
+
+    first = index.lambda_handler(text_event('twilio-CA1', 'Tuesday at 9', 'idem-1'), None)
+    retry = index.lambda_handler(text_event('twilio-CA1', 'Tuesday at 9', 'idem-1'), None)
+    sequential_turns = agent.turns
+
+    agent.turns = 0
+    burst = concurrently([text_event('twilio-CA2', 'Wednesday at 3', 'idem-2')] * 5)
+    burst_turns = agent.turns
+
+    agent.turns = 0
+    unsequenced_burst = concurrently([text_event('text-1', 'yes')] * 3)
+    burst_unsequenced_turns = agent.turns
+
+    agent.turns = 0
+    repeated = [index.lambda_handler(text_event('text-2', 'yes'), None) for _ in range(2)]
+    repeated_turns = agent.turns
+
+    agent.turns = 0
+    index.lambda_handler(text_event('twilio-CA3', 'yes', 'idem-3'), None)
+    index.lambda_handler(text_event('twilio-CA3', 'yes', 'idem-4'), None)
+    distinct_turns = agent.turns
+
+    agent.turns = 0
+    agent.fail = True
+    failed = index.lambda_handler(text_event('twilio-CA4', 'Friday', 'idem-5'), None)
+    agent.fail = False
+    recovered = index.lambda_handler(text_event('twilio-CA4', 'Friday', 'idem-5'), None)
+    failure_turns = agent.turns
+
+    # Two "containers" sharing S3: the retry lands on the second one mid-turn
+    agent.turns = 0
+    s3 = FakeS3()
+    containers = [TurnDedupe(shared=S3DedupeBackend(s3, 'test-bucket')) for _ in range(2)]
+    event = connect_event('contact-9', 'book it', 'flow-turn-3')
+
+    def on_container(n):
+        return lambda event, context: containers[n].run(event, lambda: index.handle_connect_call(event, context))
+
+    original = {}
+    thread = threading.Thread(target=lambda: original.update(r=on_container(0)(event, None)))
+    thread.start()
+    time.sleep(AGENT_SECONDS / 3)
+    shared_retry = on_container(1)(event, None)
+    thread.join()
+    shared_late = on_container(1)(event, None)
+    shared_turns = agent.turns
+    sequenced_puts = s3.puts
+
+    # Unsequenced turns stay in-process even with the shared backend configured
+    s3.puts = 0
+    shared_unsequenced = TurnDedupe(shared=S3DedupeBackend(s3, 'test-bucket'))
+    for text in ('yes', 'no', 'yes'):
+        event = text_event('text-3', text)
+        shared_unsequenced.run(event, lambda: index.handle_text_call(event, None))
+    unsequenced_puts = s3.puts
+
+    print(f"   {'channel':<9} {'turns':>6} {'first':>6} {'replay':>7} {'coalesced':>10} {'busy':>5} {'dup rate':>9}")
+    for channel, stats in sorted(duplicate_rates().items()):
+        print(f"   {channel:<9} {stats['turns']:>6.0f} {stats['first']:>6.0f} {stats['replay']:>7.0f} "
+              f"{stats['coalesced']:>10.0f} {stats['busy']:>5.0f} {stats['duplicate_rate']:>8.0%}")
+
+    checks = [
+        ('Retry replays the finished turn', sequential_turns == 1 and retry == first),
+        ('Concurrent duplicates coalesce', burst_turns == 1 and all(r == burst[0] for r in burst)),
+        ('Unsequenced duplicates in flight coalesce',
+         burst_unsequenced_turns == 1 and all(r == unsequenced_burst[0] for r in unsequenced_burst)),
+        ('Same words on consecutive unsequenced turns run twice',
+         repeated_turns == 2 and repeated[0] != repeated[1]
+         and all(r['statusCode'] == 200 for r in repeated)),
+        ('New turn sequence runs again', distinct_turns == 2),
+        ('Failed turn is retried, not replayed',
+         failure_turns == 2 and failed['statusCode'] == 500 and recovered['statusCode'] == 200),
+        ('Shared backend coalesces across containers',
+         shared_turns == 1 and shared_retry == original['r'] and shared_late == original['r']),
+        ('Sequenced turn and its retries write one claim and one response', sequenced_puts == 2),
+        ('Unsequenced turns write nothing to S3', unsequenced_puts == 0),
+        ('Duplicate rates reported per channel', set(duplicate_rates()) >= {'twilio', 'text', 'connect'}),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Turn dedupe test passed" if success else "❌ Turn dedupe test failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
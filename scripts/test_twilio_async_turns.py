@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Offline test for asynchronous hold-and-poll Twilio turns.
+
+Loads the twilio-webhook Lambda in async mode with the in-process queue
+and result store, and a fake voice processor whose turns take a set time:
+  1. every turn, fast or slow, is answered at once with a hold (<Pause> +
+     <Redirect>) without waiting on the result store; a fast turn's reply is
+     served by the first poll
+  2. for a slow turn the result endpoint holds again until the reply is
+     ready, then serves it
+  3. polling gives up with an apology after TURN_MAX_POLLS
+  4. the local-file queue and store stand-ins carry a turn end to end
+
+Usage: python scripts/test_twilio_async_turns.py
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.update(TURN_MODE='async', TURN_QUEUE='memory', TURN_STORE='memory', TURN_MAX_POLLS='3')
+
+AUDIO_URL = 'https://clinic-voice-processing.s3.amazonaws.com/speech/abc.wav'
+
+
+def load_lambda(name):
+    """Import lambda/<name>/index.py under a unique module name"""
+    directory = os.path.join(ROOT, 'lambda', name)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(directory, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakePayload:
+    def __init__(self, body):
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class FakeVoiceProcessor:
+    """Stands in for both boto3.client('lambda') and the voice-processor turn"""
+
+    def __init__(self):
+        self.turn_seconds = 0.0
+
+    def client(self, service):
+        return self
+
+    def invoke(self, FunctionName, Payload, InvocationType='RequestResponse'):
+        time.sleep(self.turn_seconds)
+        text = json.loads(Payload)['text']
+        body = {'agent_response': f"You said {text}.", 'audio_url': AUDIO_URL,
+                'gather': {'speechTimeout': 'auto'}}
+        return {'Payload': FakePayload(json.dumps({'statusCode': 200, 'body': json.dumps(body)}).encode())}
+
+
+def webhook_event(call_sid, speech=None, path='/voice', query=None):
+    form = {'CallSid': call_sid, 'From': '+15551234567', 'To': '+15550001001', 'CallStatus': 'in-progress'}
+    if speech is not None:
+        form['SpeechResult'] = speech
+    return {'body': urllib.parse.urlencode(form), 'rawPath': path, 'queryStringParameters': query}
+
+
+def redirect_query(twiml):
+    """Query parameters of the <Redirect> in a hold response"""
+    start = twiml.index('<Redirect')
+    url = twiml[twiml.index('>', start) + 1:twiml.index('</Redirect>')].replace('&amp;', '&')
+    return dict(urllib.parse.parse_qsl(urllib.parse.urlparse(url).query))
+
+
+def timed(webhook, event):
+    started = time.time()
+    twiml = webhook.lambda_handler(event, None)['body']
+    return twiml, time.time() - started
+
+
+def main():
+    print("🧪 Twilio async turn test (offline, fake voice processor)")
+    print("----------------------------------------")
+
+    webhook = load_lambda('twilio-webhook')
+    voice = FakeVoiceProcessor()
+    webhook.boto3 = voice
+
+    voice.turn_seconds = 0.1
+    fast_hold, fast_seconds = timed(webhook, webhook_event('CA-fast', 'I need an appointment'))
+    time.sleep(webhook.TURN_HOLD_SECONDS)
+    fast = webhook.lambda_handler(
+        webhook_event('CA-fast', path=webhook.RESULT_PATH, query=redirect_query(fast_hold)), None)['body']
+
+    voice.turn_seconds = 2.0
+    hold, hold_seconds = timed(webhook, webhook_event('CA-slow', 'Tuesday morning'))
+    polls = []
+    query = redirect_query(hold)
+    twiml = hold
+    while '<Redirect' in twiml and len(polls) < 10:
+        time.sleep(webhook.TURN_HOLD_SECONDS)  # Twilio plays the <Pause> before redirecting
+        twiml, seconds = timed(webhook, webhook_event('CA-slow', path=webhook.RESULT_PATH, query=query))
+        polls.append(seconds)
+        if '<Redirect' in twiml:
+            query = redirect_query(twiml)
+    slow_reply = twiml
+    leftover = webhook.turn_store.get('CA-slow', redirect_query(hold)['turn'])
+
+    voice.turn_seconds = 10.0
+    stuck = webhook.lambda_handler(webhook_event('CA-stuck', 'hello'), None)['body']
+    query = redirect_query(stuck)
+    for _ in range(webhook.TURN_MAX_POLLS):
+        stuck = webhook.lambda_handler(webhook_event('CA-stuck', path=webhook.RESULT_PATH, query=query), None)['body']
+        if '<Redirect' not in stuck:
+            break
+        query = redirect_query(stuck)
+
+    with tempfile.TemporaryDirectory() as root:
+        from turn_queue import FileResultStore, FileTurnQueue
+        voice.turn_seconds = 0.0
+        webhook.turn_store = FileResultStore(os.path.join(root, 'results'))
+        webhook.turn_queue = FileTurnQueue(os.path.join(root, 'jobs'))
+        file_hold = webhook.lambda_handler(webhook_event('CA-file', 'cancel my visit'), None)['body']
+        drained = webhook.turn_queue.drain(webhook.run_queued_turn)
+        file_reply = webhook.lambda_handler(
+            webhook_event('CA-file', path=webhook.RESULT_PATH, query=redirect_query(file_hold)), None)['body']
+
+    print(f"   Fast turn (0.1s): webhook answered in {fast_seconds:.2f}s")
+    print(f"   Slow turn (2.0s): webhook answered in {hold_seconds:.2f}s, "
+          f"then {len(polls)} polls ({', '.join(f'{p:.2f}s' for p in polls)})")
+
+    checks = [
+        ('Fast turn held without waiting on the store', '<Redirect' in fast_hold and fast_seconds < 0.05),
+        ('Fast turn served by the first poll', '<Play>' in fast and '<Redirect' not in fast),
+        ('Slow turn held at once', '<Pause' in hold and '<Redirect' in hold and hold_seconds < 0.05),
+        ('First hold speaks the filler', webhook.TURN_FILLER in hold),
+        ('Result endpoint serves the reply',
+         'You said Tuesday morning.' not in hold and '<Play>' in slow_reply and '<Gather' in slow_reply),
+        ('Every poll answers quickly', polls and max(polls) < 0.5),
+        ('Served result removed from the store', leftover is None),
+        ('Gives up after TURN_MAX_POLLS', 'taking longer than expected' in stuck and '<Gather' in stuck),
+        ('File queue and store carry a turn', drained == 1 and '<Play>' in file_reply),
+    ]
+    for label, ok in checks:
+        print(f"   {'✅' if ok else '❌'} {label}")
+    success = all(ok for _, ok in checks)
+    print()
+    print("✅ Twilio async turn test passed" if success else "❌ Twilio async turn test failed")
+    os._exit(0 if success else 1)  # don't wait for the stuck turn's worker thread
+
+
+if __name__ == '__main__':
+    main()
@@ -9,12 +9,18 @@ import wave
 import json
 import base64
 import requests
-import threading
 import time
 import io
+import os
+import select
+import sys
 from datetime import datetime
 import argparse
 
+# Shared end-of-utterance detection from the voice processor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda', 'voice-processor'))
+from endpointing import Endpointer, expected_answer_type, frame_energy
+
 try:
     import pygame
     PYGAME_AVAILABLE = True
@@ -22,6 +28,17 @@ except ImportError:
     PYGAME_AVAILABLE = False
     print("Warning: pygame not available. Audio playback may not work.")
 
+def enter_pressed():
+    """True if Enter was typed, without blocking; the typed line is consumed"""
+    if os.name == 'nt':
+        import msvcrt
+        return msvcrt.kbhit() and msvcrt.getwch() in '\r\n'
+    readable, _, _ = select.select([sys.stdin], [], [], 0)
+    if readable:
+        sys.stdin.readline()
+        return True
+    return False
+
 class VoiceClient:
     def __init__(self, api_endpoint, tenant_did='1001'):
         self.api_endpoint = api_endpoint
@@ -33,7 +50,8 @@ class VoiceClient:
         self.format = pyaudio.paInt16
         self.channels = 1
         self.rate = 16000
-        self.record_seconds = 5  # Max recording length
+        self.record_seconds = 15  # Max recording length; endpointing usually stops sooner
+        self.expected_answer = 'open'  # What the agent's last reply asked for
         
         # Initialize PyAudio
         self.audio = pyaudio.PyAudio()
@@ -56,7 +74,7 @@ class VoiceClient:
     
     def record_audio(self):
         """Record audio from microphone"""
-        print("🎤 Recording... (speak now, press Enter when done)")
+        print(f"🎤 Recording... (speak now, stops when you pause; expecting: {self.expected_answer})")
         
         stream = self.audio.open(
             format=self.format,
@@ -67,22 +85,20 @@ class VoiceClient:
         )
         
         frames = []
-        recording = True
-        
-        def stop_recording():
-            nonlocal recording
-            input()  # Wait for Enter key
-            recording = False
         
-        # Start thread to listen for Enter key
-        stop_thread = threading.Thread(target=stop_recording)
-        stop_thread.daemon = True
-        stop_thread.start()
+        endpointer = Endpointer(self.expected_answer)
+        chunk_ms = 1000.0 * self.chunk / self.rate
         
         start_time = time.time()
-        while recording and (time.time() - start_time) < self.record_seconds:
+        while (time.time() - start_time) < self.record_seconds:
             data = stream.read(self.chunk, exception_on_overflow=False)
             frames.append(data)
+            if endpointer.feed(frame_energy(data), chunk_ms):
+                print(f"⏹️  End of speech detected after {time.time() - start_time:.1f}s")
+                break
+            # Polled between chunks: no reader is left behind to swallow the next prompt's input
+            if enter_pressed():
+                break
         
         stream.stop_stream()
         stream.close()
@@ -157,6 +173,9 @@ class VoiceClient:
                 print(f"✅ Response received:")
                 print(f"   Text: {result.get('responseText', 'No text')}")
                 
+                # Endpoint the next recording for the kind of answer just asked for
+                self.expected_answer = result.get('expected_answer') or expected_answer_type(result.get('responseText', ''))
+                
                 # Play audio response
                 if 'responseAudio' in result:
                     response_audio = base64.b64decode(result['responseAudio'])
@@ -178,7 +197,7 @@ class VoiceClient:
         print("Instructions:")
         print("- Press Enter to start recording")
         print("- Speak your message")
-        print("- Press Enter again to stop recording")
+        print("- Recording stops when you pause (or press Enter)")
         print("- Type 'quit' to exit")
         print("=" * 50)
         